@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+بنچمارک بایگانی داغ/سرد: روی یک کپی از دیتابیس بنچمارک، زمان جدول تماس‌ها/پیگیری‌ها (بدون بازه و با بازه قدیمی)
+قبل و بعد از انتقال ردیف‌های قدیمی‌تر از افق به crm_archive.db، زمان خود انتقال، و اندازه دیتابیس اصلی
+(بعد از VACUUM، یعنی اندازه بکاپ) قبل و بعد.
+
+    python benchmarks/archive.py
+    python benchmarks/archive.py --contacts 100k --horizon-days 180
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen  # noqa: E402
+
+
+def vacuumed_size(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    conn.execute("VACUUM;")
+    conn.close()
+    return os.path.getsize(db_path)
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--contacts", default="10k")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--horizon-days", type=int, default=180)
+    args = ap.parse_args()
+
+    src = datagen.ensure_db(datagen.parse_scale(args.contacts), args.seed)
+    work = tempfile.mkdtemp(prefix="crm_archive_")
+    db_path = os.path.join(work, "crm.db")
+    shutil.copyfile(src, db_path)
+    sys.path.insert(0, datagen.ROOT)
+    import crm_core as crm
+    crm.config.set_db_path(db_path)
+    try:
+        crm.init_db()
+        old = date.today() - timedelta(days=args.horizon_days + 60)
+        cases = {
+            "calls (no range)": lambda: crm.df_calls_by_filters(None, [], None, None, None, None),
+            "calls (old range)": lambda: crm.df_calls_by_filters(None, [], old, old + timedelta(days=30), None, None),
+            "followups (no range)": lambda: crm.df_followups_by_filters(None, [], None, None, None, None),
+        }
+        before = {k: timed(fn) for k, fn in cases.items()}
+        rows_before = {k: len(fn()) for k, fn in cases.items()}
+        size_before = vacuumed_size(db_path)
+
+        t0 = time.perf_counter()
+        moved = crm.archive_old_rows(args.horizon_days)
+        move_ms = (time.perf_counter() - t0) * 1000
+        print(f"archive: {move_ms:7.0f}ms  moved {moved}", file=sys.stderr)
+
+        for k, fn in cases.items():
+            print(f"{k:21}: {before[k]:7.1f}ms → {timed(fn):7.1f}ms  rows {rows_before[k]} → {len(fn())}",
+                  file=sys.stderr)
+        size_after = vacuumed_size(db_path)
+        print(f"main db (vacuumed): {size_before / 1e6:.1f}MB → {size_after / 1e6:.1f}MB  "
+              f"archive file: {os.path.getsize(crm.config.archive_db_path()) / 1e6:.1f}MB", file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+بنچمارک شناسایی تماس‌گیرنده (caller_lookup): ساخت نگاشت E.164 در حافظه، زمان هر جست‌وجو برای شماره شناخته‌شده
+(با قالب‌های مختلف: 0912…، ‎+98 912…، ارقام فارسی) و ناشناس، و تازه شدن افزایشی بعد از نوشتن روی یک کپی از دیتابیس.
+
+    python benchmarks/caller_lookup.py
+    python benchmarks/caller_lookup.py --contacts 100k --lookups 20000
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen  # noqa: E402
+
+FA_DIGITS = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
+
+
+def variants(e164: str):
+    """قالب‌هایی که کارشناس‌ها واقعاً وارد کرده‌اند"""
+    national = "0" + e164[3:]
+    return [national, e164, e164[1:], f"+98 {e164[3:6]} {e164[6:9]} {e164[9:]}",
+            f"{national[:4]}-{national[4:7]}-{national[7:]}", national.translate(FA_DIGITS)]
+
+
+def timed(fn, args_list):
+    out = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        out.append((time.perf_counter() - t0) * 1e6)
+    out.sort()
+    return {"p50_us": round(statistics.median(out), 1), "p99_us": round(out[int(0.99 * (len(out) - 1))], 1),
+            "max_us": round(out[-1], 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--contacts", default="10k")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--lookups", type=int, default=5000)
+    args = ap.parse_args()
+
+    src = datagen.ensure_db(datagen.parse_scale(args.contacts), args.seed)
+    work = tempfile.mkdtemp(prefix="crm_caller_")
+    db_path = os.path.join(work, "crm.db")
+    shutil.copyfile(src, db_path)
+    sys.path.insert(0, datagen.ROOT)
+    import crm_core as crm
+    crm.config.set_db_path(db_path)
+    try:
+        crm.init_db()
+        conn = crm.get_conn()
+        phones = [r[0] for r in conn.execute("SELECT phone_e164 FROM users WHERE phone_e164 IS NOT NULL;")]
+        conn.close()
+        rnd = random.Random(args.seed)
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        directory = crm.phone_directory()
+        directory.refresh()
+        load_ms = (time.perf_counter() - t0) * 1000
+        mem_kb = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+        print(f"load: {load_ms:.0f}ms  entries: {directory.size()}  memory: {mem_kb / 1024:.1f}MB", file=sys.stderr)
+
+        known = [(rnd.choice(variants(rnd.choice(phones))),) for _ in range(args.lookups)]
+        unknown = [(f"0990{rnd.randrange(10 ** 7):07d}",) for _ in range(args.lookups)]
+        hits = sum(bool(crm.caller_lookup(p)["contacts"]) for (p,) in known[:200])
+        print(f"known:   {timed(crm.caller_lookup, known)}  (hit {hits}/200)", file=sys.stderr)
+        print(f"unknown: {timed(crm.caller_lookup, unknown)}", file=sys.stderr)
+
+        # نوشتن از مسیر عادی برنامه و جست‌وجوی بلافاصله بعد از آن (تازه‌سازی افزایشی، نه بارگذاری کامل)
+        fresh = []
+        for i in range(50):
+            phone = f"0999 {i:03d} {rnd.randrange(10 ** 4):04d}"
+            crm.create_user("بنچ", f"تماس {i}", phone, "", None, "", "بدون وضعیت", "", "", "هیچکدام", None, None)
+            fresh.append((phone.replace(" ", "-"),))
+        loads = directory.stats["full_loads"]
+        res = timed(crm.caller_lookup, fresh[:1])
+        found = sum(bool(crm.caller_lookup(p)["contacts"]) for (p,) in fresh)
+        print(f"after 50 writes: first lookup {res['max_us']:.0f}us, found {found}/50, "
+              f"full reloads {directory.stats['full_loads'] - loads}", file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
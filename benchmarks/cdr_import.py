@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+بنچمارک ایمپورت CDR: ساخت یک فایل روزانه مصنوعی (پیش‌فرض ۵۰ هزار ردیف، قالب Master.csv یا با سرستون) از شماره‌های
+مخاطبان دیتابیس بنچمارک با قالب‌های مختلف + شماره‌های ناشناس و داخلی، سپس زمان اولین ایمپورت و اجرای دوباره
+همان فایل (باید تقریباً هیچ درجی نداشته باشد) روی یک کپی از دیتابیس.
+
+    python benchmarks/cdr_import.py
+    python benchmarks/cdr_import.py --contacts 100k --rows 50000 --header
+"""
+import argparse
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen  # noqa: E402
+
+DISPOSITIONS = ["ANSWERED"] * 6 + ["NO ANSWER"] * 3 + ["BUSY", "FAILED"]
+
+
+def write_cdr(path: str, phones, rows: int, seed: int, header: bool):
+    rnd = random.Random(seed)
+    day = datetime(2025, 10, 13, 8, 0)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        if header:
+            w.writerow(["calldate", "src", "dst", "duration", "billsec", "disposition", "uniqueid"])
+        for i in range(rows):
+            start = day + timedelta(seconds=rnd.randrange(12 * 3600))
+            ext = str(rnd.randrange(101, 140))
+            e164 = rnd.choice(phones)
+            outside = rnd.choice(["0" + e164[3:], e164, e164[1:], f"0{rnd.randrange(21 * 10 ** 8, 22 * 10 ** 8)}"])
+            src, dst = (ext, outside) if rnd.random() < 0.7 else (outside, ext)
+            disp = rnd.choice(DISPOSITIONS)
+            billsec = rnd.randrange(5, 600) if disp == "ANSWERED" else 0
+            stamp = start.strftime("%Y-%m-%d %H:%M:%S")
+            if header:
+                w.writerow([stamp, src, dst, billsec + 10, billsec, disp, f"{1697000000 + i}.{i}"])
+            else:
+                w.writerow(["", src, dst, "from-internal", f'"{src}" <{src}>', f"SIP/{ext}-{i:08x}", "", "Dial",
+                            "", stamp, stamp, stamp, billsec + 10, billsec, disp, "DOCUMENTATION",
+                            f"{1697000000 + i}.{i}", ""])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--contacts", default="10k")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--header", action="store_true", help="فایل با سرستون به‌جای Master.csv خام")
+    args = ap.parse_args()
+
+    src = datagen.ensure_db(datagen.parse_scale(args.contacts), args.seed)
+    work = tempfile.mkdtemp(prefix="crm_cdr_")
+    db_path = os.path.join(work, "crm.db")
+    cdr_path = os.path.join(work, "Master.csv")
+    shutil.copyfile(src, db_path)
+    sys.path.insert(0, datagen.ROOT)
+    import crm_core as crm
+    crm.config.set_db_path(db_path)
+    try:
+        crm.init_db()
+        conn = crm.get_conn()
+        phones = [r[0] for r in conn.execute("SELECT phone_e164 FROM users WHERE phone_e164 > '';")]
+        calls_before = conn.execute("SELECT COUNT(*) FROM calls;").fetchone()[0]
+        conn.close()
+        write_cdr(cdr_path, phones, args.rows, args.seed, args.header)
+        print(f"cdr file: {args.rows} rows, {os.path.getsize(cdr_path) / 1e6:.1f}MB", file=sys.stderr)
+
+        for label in ("first run", "re-run"):
+            t0 = time.perf_counter()
+            rep = crm.import_cdr(cdr_path, None)
+            ms = (time.perf_counter() - t0) * 1000
+            rep.pop("msgs")
+            print(f"{label:9}: {ms:7.0f}ms  {rep}", file=sys.stderr)
+
+        conn = crm.get_conn()
+        added = conn.execute("SELECT COUNT(*) FROM calls;").fetchone()[0] - calls_before
+        conn.close()
+        print(f"calls added: {added}", file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
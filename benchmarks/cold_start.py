@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+زمان شروع سرد: import لایه داده و اولین اجرای هر صفحه، هر مورد در یک پروسه تازه (مثل اولین بازدید بعد از deploy).
+
+برای هر صفحه: اولین اجرای اسکریپت (صفحه ورود یا داشبورد)، اولین رفتن به آن صفحه و یک rerun گرم، به‌علاوه اینکه
+ماژول‌های سنگین (pandas، pyarrow، openpyxl، persiantools) تا آن لحظه بارگذاری شده‌اند یا نه. اجرا با
+streamlit.testing (AppTest) است، پس زمان‌ها سربار ثابت خود AppTest را هم دارند؛ برای مقایسه دو نسخه مناسب‌اند.
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --contacts 100k --pages کاربران,شرکت‌ها --out cold.json
+"""
+import argparse
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen  # noqa: E402
+
+ROOT = datagen.ROOT
+HEAVY_MODULES = ("pandas", "pyarrow", "openpyxl", "persiantools.jdatetime")
+PAGES = ["داشبورد", "شرکت‌ها", "کاربران", "تماس‌ها", "پیگیری‌ها", "سفارشات", "محصولات", "مدیریت دسترسی"]
+LOGIN = "ورود"
+
+
+def _loaded() -> Dict[str, bool]:
+    return {m: m in sys.modules for m in HEAVY_MODULES}
+
+
+def measure_import() -> Dict[str, Any]:
+    """زمان import crm_core بدون Streamlit"""
+    sys.path.insert(0, ROOT)
+    t0 = time.perf_counter()
+    importlib.import_module("crm_core")  # خود import زمان‌گیری می‌شود؛ ماژول لازم نیست
+    return {"import_ms": round((time.perf_counter() - t0) * 1000, 1), "loaded": _loaded(),
+            "streamlit": "streamlit" in sys.modules}
+
+
+def measure_page(page: str, db_path: str) -> Dict[str, Any]:
+    """اولین اجرای اسکریپت، سپس اولین بازدید صفحه و یک rerun (همه در همین پروسه تازه)"""
+    os.environ["CRM_DB_PATH"] = db_path
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, "crm.py"), default_timeout=120)
+    if page != LOGIN:
+        at.session_state["auth"] = {"id": 1, "username": "admin", "role": "admin", "linked_user_id": None}
+    t0 = time.perf_counter()
+    at.run()
+    out: Dict[str, Any] = {"first_run_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    if page not in (LOGIN, PAGES[0]):
+        t0 = time.perf_counter()
+        at.sidebar.radio[0].set_value(page).run()
+        out["page_first_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    t0 = time.perf_counter()
+    at.run()
+    out["rerun_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    out["loaded"] = _loaded()
+    if at.exception:
+        out["exception"] = str(at.exception[0].message)
+    return out
+
+
+def _child(args: List[str]) -> Dict[str, Any]:
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), *args], capture_output=True, text=True)
+    marker = proc.stdout.rfind("@@RESULT@@")
+    if proc.returncode != 0 or marker < 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        sys.exit(f"cold start measurement {args} failed")
+    return json.loads(proc.stdout[marker + len("@@RESULT@@"):])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--contacts", default="10k")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--pages", default=",".join([LOGIN] + PAGES), help="صفحه‌ها با کاما")
+    ap.add_argument("--out", help="فایل JSON خروجی")
+    ap.add_argument("--_child", help=argparse.SUPPRESS)
+    ap.add_argument("--_db", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args._child:
+        os.chdir(os.path.dirname(args._db) if args._db else tempfile.gettempdir())
+        res = measure_import() if args._child == "import" else measure_page(args._child, args._db)
+        sys.stdout.write("\n@@RESULT@@" + json.dumps(res, ensure_ascii=False) + "\n")
+        return
+
+    src = datagen.ensure_db(datagen.parse_scale(args.contacts), args.seed)
+    work = tempfile.mkdtemp(prefix="crm_cold_")
+    db_path = os.path.join(work, "crm.db")
+    try:
+        report: Dict[str, Any] = {"import": _child(["--_child", "import"]), "pages": {}}
+        imp = report["import"]
+        print(f"import crm_core: {imp['import_ms']:.0f}ms  loaded: "
+              f"{', '.join(m for m, v in imp['loaded'].items() if v) or '-'}", file=sys.stderr)
+        print(f"{'page':16} {'first_run':>10} {'page_first':>11} {'rerun':>8}  loaded", file=sys.stderr)
+        for page in [p for p in args.pages.split(",") if p.strip()]:
+            shutil.copyfile(src, db_path)
+            r = report["pages"][page] = _child(["--_child", page, "--_db", db_path])
+            loaded = ", ".join(m for m, v in r["loaded"].items() if v) or "-"
+            print(f"{page:16} {r['first_run_ms']:>10.0f} {r.get('page_first_ms', 0):>11.0f} {r['rerun_ms']:>8.0f}  "
+                  f"{loaded}{'  EXC ' + r['exception'] if 'exception' in r else ''}", file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+تولید دیتابیس مصنوعی واقع‌گرایانه برای بنچمارک‌ها.
+
+به ازای N مخاطب: N/12 شرکت، 3N تماس، 0.6N پیگیری (حدود ۴۰٪ باز) و 0.1N سفارش؛ نام‌های فارسی،
+توزیع کارشناس فروش چوله (Zipf — چند کارشناس بیشتر مخاطبین را دارند) و توزیع تماس‌ها هم چوله
+(مخاطبین فعال تماس‌های بیشتری دارند). اسکیمای دیتابیس همان init_db لایه داده (crm_core) است.
+
+    python benchmarks/datagen.py --contacts 100k --out /tmp/crm_100k.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+
+FIRST_NAMES = ["علی", "محمد", "حسین", "رضا", "مهدی", "امیر", "سعید", "حمید", "مجید", "احسان", "مریم", "زهرا",
+               "فاطمه", "سارا", "نرگس", "الهام", "مینا", "لیلا", "شیما", "نازنین", "کاوه", "بهرام", "آرش", "پویا",
+               "سینا", "نیما", "فرهاد", "کامران", "یاسمن", "هانیه", "مهسا", "پریسا", "رویا", "ترانه", "بابک", "جواد"]
+LAST_NAMES = ["محمدی", "احمدی", "حسینی", "رضایی", "کریمی", "موسوی", "جعفری", "صادقی", "رحیمی", "کاظمی",
+              "قاسمی", "نوری", "مرادی", "اکبری", "سلطانی", "حیدری", "یوسفی", "شریفی", "عباسی", "ملکی",
+              "امینی", "پرویزی", "جباری", "مجد", "نجفی", "طاهری", "فراهانی", "زمانی", "باقری", "تهرانی"]
+COMPANY_WORDS = ["پارس", "آریا", "نوین", "صنعت", "پویا", "سپهر", "البرز", "دماوند", "کیان", "آسیا", "تابان",
+                 "مهر", "سازه", "پلاستیک", "بسته‌بندی", "غذایی", "دارو", "شیمی", "فولاد", "تجارت"]
+PROVINCES = ["تهران", "اصفهان", "فارس", "خراسان رضوی", "آذربایجان شرقی", "قم", "البرز", "گیلان", "مازندران",
+             "خوزستان", "کرمان", "یزد", "همدان", "مرکزی"]
+DOMAINS = ["صنعتی", "غذایی", "دارویی", "آرایشی", "کشاورزی", "ساختمانی", "خودرو", "پوشاک"]
+CALL_NOTES = ["", "", "پیگیری قیمت", "درخواست کاتالوگ؛ قرار شد هفته بعد تماس بگیریم و نمونه ارسال شود.",
+              "مسئول خرید در جلسه بود", "سفارش آزمایشی را تایید کرد، منتظر پیش‌فاکتور است. " * 3]
+
+CHUNK = 20000
+
+
+def parse_scale(text: str) -> int:
+    """'10k' → 10000 ، '1m' → 1000000"""
+    t = text.strip().lower()
+    mult = {"k": 1000, "m": 1000000}.get(t[-1:], 1)
+    return int(float(t[:-1] if mult > 1 else t) * mult)
+
+
+def scale_label(n: int) -> str:
+    return f"{n // 1000000}m" if n % 1000000 == 0 else (f"{n // 1000}k" if n % 1000 == 0 else str(n))
+
+
+def _zipf_weights(n: int, s: float = 1.1) -> List[float]:
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def _chunks(it: Iterator[tuple], size: int = CHUNK) -> Iterator[List[tuple]]:
+    buf: List[tuple] = []
+    for row in it:
+        buf.append(row)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def _insert(conn: sqlite3.Connection, sql: str, rows: Iterator[tuple]):
+    for chunk in _chunks(rows):
+        conn.executemany(sql, chunk)
+
+
+def generate(db_path: str, contacts: int, seed: int = 1, today: Optional[date] = None) -> Dict[str, int]:
+    """دیتابیس را از صفر می‌سازد و تعداد ردیف هر جدول را برمی‌گرداند."""
+    rnd = random.Random(seed)
+    today = today or date.today()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    sys.path.insert(0, ROOT)
+    import crm_core as crm
+    crm.config.set_db_path(db_path)
+    crm.init_db()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=OFF;")
+    # تریگرهای آمار و فید تغییرات موقتاً برداشته می‌شوند؛ بعد از درج، آمار بازسازی و تریگرها با init_db برمی‌گردند
+    triggers = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger';")]
+    for name in triggers:
+        conn.execute(f"DROP TRIGGER {name};")
+
+    n_agents = max(5, min(60, contacts // 5000))
+    n_companies = max(1, contacts // 12)
+    n_calls, n_followups, n_orders = contacts * 3, contacts * 6 // 10, contacts // 10
+    n_products = 40
+    start = datetime.combine(today - timedelta(days=730), datetime.min.time())
+
+    conn.executemany("INSERT INTO app_users (username, password_sha256, role) VALUES (?,?,'agent');",
+                     [(f"agent{i:02d}", crm.sha256("agent")) for i in range(1, n_agents + 1)])
+    agent_ids = [r[0] for r in conn.execute("SELECT id FROM app_users ORDER BY id;")]
+    owner_weights = _zipf_weights(len(agent_ids))
+
+    def ts(days_back_max: int = 730) -> str:
+        dt = start + timedelta(minutes=rnd.randint(0, days_back_max * 24 * 60))
+        return dt.isoformat(timespec="minutes")
+
+    _insert(conn, "INSERT INTO companies (name, phone, status, level, created_at, created_by) VALUES (?,?,?,?,?,?);",
+            ((f"{rnd.choice(COMPANY_WORDS)} {rnd.choice(COMPANY_WORDS)} {i}", f"021{i:08d}",
+              rnd.choice(crm.COMPANY_STATUSES), rnd.choice(crm.LEVELS), ts().replace("T", " ") + ":00",
+              rnd.choice(agent_ids)) for i in range(1, n_companies + 1)))
+
+    def users():
+        for i in range(1, contacts + 1):
+            fn, ln = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+            yield (fn, ln, f"{fn} {ln}", f"09{i:09d}", rnd.choice(["", "مدیر خرید", "کارشناس فنی", "مدیرعامل"]),
+                   rnd.randint(1, n_companies) if rnd.random() < 0.85 else None,
+                   rnd.choice(["", "", "مشتری قدیمی", "نیاز به نمونه رایگان دارد؛ حساس به قیمت. " * 4]),
+                   rnd.choices(crm.USER_STATUSES, weights=[50, 25, 10, 10, 5])[0],
+                   rnd.choice(DOMAINS), rnd.choice(PROVINCES), rnd.choice(crm.LEVELS),
+                   rnd.choices(agent_ids, weights=owner_weights)[0], ts().replace("T", " ") + ":00",
+                   rnd.choice(agent_ids))
+    _insert(conn, "INSERT INTO users (first_name, last_name, full_name, phone, role, company_id, note, status, "
+                  "domain, province, level, owner_id, created_at, created_by) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?);",
+            users())
+
+    # تماس‌ها: ۲۰٪ مخاطبین «فعال» حدود ۶۰٪ تماس‌ها را دارند
+    active = max(1, contacts // 5)
+    def pick_user() -> int:
+        return rnd.randint(1, active) if rnd.random() < 0.6 else rnd.randint(1, contacts)
+    _insert(conn, "INSERT INTO calls (user_id, call_datetime, status, description, created_by) VALUES (?,?,?,?,?);",
+            ((pick_user(), ts(), rnd.choices(crm.CALL_STATUSES, weights=[30, 45, 15, 10])[0],
+              rnd.choice(CALL_NOTES), rnd.choices(agent_ids, weights=owner_weights)[0]) for _ in range(n_calls)))
+    def followups():
+        for _ in range(n_followups):
+            due = today + timedelta(days=rnd.randint(-90, 60))
+            done = rnd.random() >= 0.4
+            # بسته‌شده‌ها: بیشتر به‌موقع، بقیه تا دو هفته با تأخیر
+            closed_at = (datetime.combine(min(today, due + timedelta(days=rnd.choice([-3, -1, 0, 0, 2, 9]))),
+                                          datetime.min.time()) + timedelta(minutes=rnd.randint(480, 1080))
+                         ).isoformat(timespec="minutes") if done else None
+            yield (pick_user(), rnd.choice(["ارسال پیش‌فاکتور", "تماس مجدد", "ارسال نمونه", "جلسه حضوری"]),
+                   rnd.choice(CALL_NOTES), due.isoformat(), "پایان یافته" if done else "در حال انجام",
+                   rnd.choices(agent_ids, weights=owner_weights)[0], closed_at)
+    _insert(conn, "INSERT INTO followups (user_id, title, details, due_date, status, created_by, closed_at) "
+                  "VALUES (?,?,?,?,?,?,?);", followups())
+    conn.executemany("INSERT INTO products (category, name) VALUES (?,?);",
+                     [(f"دسته {i % 6 + 1}", f"محصول {i}") for i in range(1, n_products + 1)])
+    _insert(conn, "INSERT INTO orders (user_id, company_id, product_id, order_date, status, total_amount, created_at) "
+                  "VALUES (?,?,?,?,?,?,?);",
+            ((pick_user(), rnd.randint(1, n_companies), rnd.randint(1, n_products),
+              (today - timedelta(days=rnd.randint(0, 730))).isoformat(), rnd.choice(crm.ORDER_STATUSES),
+              rnd.randint(1, 5000) * 100000, ts().replace("T", " ") + ":00") for _ in range(n_orders)))
+
+    crm.rebuild_status_history(conn)
+    crm.rebuild_daily_stats(conn)
+    crm.rebuild_order_stats(conn)
+    conn.commit(); conn.close()
+    crm.init_db()  # تریگرها دوباره ساخته می‌شوند
+
+    conn = sqlite3.connect(db_path)
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t};").fetchone()[0]
+              for t in ("app_users", "companies", "users", "calls", "followups", "products", "orders")}
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    conn.close()
+    return counts
+
+
+def ensure_db(contacts: int, seed: int = 1, data_dir: str = DATA_DIR) -> str:
+    """دیتابیس هر مقیاس یک بار ساخته و در benchmarks/.data نگه داشته می‌شود."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"crm_{scale_label(contacts)}_s{seed}.db")
+    if not os.path.exists(path):
+        generate(path, contacts, seed)
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--contacts", default="10k", help="تعداد مخاطبین، مثل 10k یا 1m")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="مسیر فایل خروجی (پیش‌فرض: benchmarks/.data)")
+    args = ap.parse_args()
+    n = parse_scale(args.contacts)
+    out = args.out or os.path.join(DATA_DIR, f"crm_{scale_label(n)}_s{args.seed}.db")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    t0 = time.perf_counter()
+    counts = generate(out, n, args.seed)
+    print(out, counts, f"{time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
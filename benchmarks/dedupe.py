@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+بنچمارک پیدا کردن و ادغام تکراری‌ها: روی یک کپی از دیتابیس بنچمارک، درصدی از شرکت‌ها با نام «دست‌کاری‌شده»
+(ي/ك عربی، نیم‌فاصله، «شرکت»، ارقام فارسی) و درصدی از مخاطبان با همان شماره در قالب دیگر دوباره درج می‌شوند؛
+سپس زمان پیدا کردن خوشه‌ها، تعداد تکراری‌های کاشته‌شده که پیدا شدند، و زمان ادغام گروهی.
+
+    python benchmarks/dedupe.py
+    python benchmarks/dedupe.py --contacts 100k --dup-rate 0.02
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen  # noqa: E402
+
+FA_DIGITS = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
+
+
+def mangle_company(name: str, rnd: random.Random) -> str:
+    name = name.replace("ی", "ي") if rnd.random() < 0.5 else name.replace("ک", "ك")
+    if rnd.random() < 0.5:
+        name = "شرکت " + name
+    if rnd.random() < 0.5:
+        name = name.translate(FA_DIGITS)
+    return name.replace(" ", "‌", 1) if rnd.random() < 0.3 else name
+
+
+def plant(db_path: str, rate: float, seed: int):
+    """تکراری‌های مصنوعی با sqlite3 مستقیم (بدون بررسی phone_exists)؛ خروجی: (شرکت‌ها، مخاطبان) کاشته‌شده"""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    companies = conn.execute("SELECT id, name FROM companies;").fetchall()
+    users = conn.execute("SELECT id, full_name, phone, company_id FROM users;").fetchall()
+    pc = rnd.sample(companies, max(1, int(len(companies) * rate)))
+    pu = rnd.sample(users, max(1, int(len(users) * rate)))
+    conn.executemany("INSERT INTO companies (name, phone) VALUES (?, '');",
+                     [(mangle_company(name, rnd),) for _, name in pc])
+    conn.executemany("INSERT INTO users (full_name, phone, company_id) VALUES (?,?,?);",
+                     [(name, f"+98 {phone[1:4]} {phone[4:]}", cid) for _, name, phone, cid in pu])
+    conn.commit()
+    conn.close()
+    return {cid for cid, _ in pc}, {uid for uid, *_ in pu}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--contacts", default="10k")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--dup-rate", type=float, default=0.01)
+    args = ap.parse_args()
+
+    src = datagen.ensure_db(datagen.parse_scale(args.contacts), args.seed)
+    work = tempfile.mkdtemp(prefix="crm_dedupe_")
+    db_path = os.path.join(work, "crm.db")
+    shutil.copyfile(src, db_path)
+    sys.path.insert(0, datagen.ROOT)
+    import crm_core as crm
+    crm.config.set_db_path(db_path)
+    try:
+        crm.init_db()
+        planted = dict(zip(("companies", "contacts"), plant(db_path, args.dup_rate, args.seed)))
+        for kind, finder in (("companies", crm.find_duplicate_companies), ("contacts", crm.find_duplicate_contacts)):
+            t0 = time.perf_counter()
+            clusters = finder()
+            find_ms = (time.perf_counter() - t0) * 1000
+            found = sum(bool(planted[kind] & set(c["ids"])) for c in clusters)
+            t0 = time.perf_counter()
+            removed, msgs = crm.merge_clusters(kind, clusters)
+            merge_ms = (time.perf_counter() - t0) * 1000
+            print(f"{kind:9}: find {find_ms:6.0f}ms  clusters {len(clusters):5}  planted found "
+                  f"{found}/{len(planted[kind])}  merge {merge_ms:6.0f}ms  removed {removed}  errors {len(msgs)}",
+                  file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+بنچمارک حافظه و حجم/زمان سریال‌سازی Arrow برای DataFrameهای جدول‌ها.
+
+روی یک دیتابیس مصنوعی (benchmarks/datagen.py، در پوشه موقت) نتیجه df_users_advanced و df_orders_by_filters را با dtypeهای فشرده
+(category + رشته Arrow + مبلغ عددی) با همان داده در حالت قدیمی (همه ستون‌ها object و مبلغ به‌صورت رشته)
+مقایسه می‌کند. سریال‌سازی همان تابعی است که Streamlit برای ارسال جدول به مرورگر در هر rerun صدا می‌زند.
+
+اجرا:
+    python benchmarks/grid_payload.py --users 80k
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen  # noqa: E402
+
+
+def legacy_repr(df):
+    """نمایش قبلی: متن‌ها object و مبلغ به شکل رشته با جداکننده هزارگان"""
+    out = df.copy()
+    for c in out.columns:
+        if c == "مبلغ_کل":
+            out[c] = out[c].apply(lambda x: f"{float(x):,.0f}")
+        if out[c].dtype.kind not in "iuf":
+            out[c] = out[c].astype(object)
+    return out
+
+
+def to_arrow_bytes(df) -> bytes:
+    try:
+        from streamlit.dataframe_util import convert_pandas_df_to_arrow_bytes
+        return convert_pandas_df_to_arrow_bytes(df)
+    except ImportError:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as w:
+            w.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def measure(df, repeat: int):
+    mem = int(df.memory_usage(deep=True).sum())
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        payload = to_arrow_bytes(df)
+        best = min(best, time.perf_counter() - t0)
+    return mem, len(payload), best * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", default="80k", help="تعداد مخاطبین (سفارش‌ها یک‌دهم آن)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="crm_bench_")
+    os.chdir(tmp)
+    datagen.generate(os.path.join(tmp, "crm.db"), datagen.parse_scale(args.users), args.seed)
+    import crm_core as crm  # datagen مسیر دیتابیس موقت را روی همین بسته تنظیم کرده
+    frames = {
+        "users": crm.df_users_advanced(None, None, None, None, None, None, None, None, [], None, None),
+        "orders": crm.df_orders_by_filters(),
+    }
+    print(f"{'grid':8} {'repr':8} {'rows':>7} {'memory_KB':>10} {'arrow_KB':>9} {'serialize_ms':>13}")
+    for name, df in frames.items():
+        results = {}
+        for label, frame in (("legacy", legacy_repr(df)), ("compact", df)):
+            results[label] = measure(frame, args.repeat)
+            mem, size, ms = results[label]
+            print(f"{name:8} {label:8} {len(frame):>7} {mem / 1024:>10.0f} {size / 1024:>9.0f} {ms:>13.1f}")
+        (m0, s0, t0), (m1, s1, t1) = results["legacy"], results["compact"]
+        print(f"{name:8} {'saving':8} {'':>7} {100 * (1 - m1 / m0):>9.0f}% {100 * (1 - s1 / s0):>8.0f}% "
+              f"{100 * (1 - t1 / t0):>12.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+بررسی پلن کوئری‌های جدول‌ها: هر تابع df_* با ماتریسی از ترکیب فیلترها روی دیتابیس مصنوعی (datagen) اجرا و
+EXPLAIN QUERY PLAN همان SQL ساخته‌شده (با همان پارامترها) بررسی می‌شود. خطا وقتی:
+
+- ایندکسِ مورد انتظار یک فیلتر در پلن نباشد (مثلاً date() دور ستون یا COALESCE جلوی ایندکس را گرفته باشد)؛
+- جدول اصلی صفحه با وجود فیلتر قابل‌ایندکس SCAN شود؛
+- یک جدول بزرگ داخل زیرپرس‌وجوی همبسته (به ازای هر ردیف) SCAN شود.
+
+SQL و پلن از لایه پایش کوئری خود برنامه (QUERY_STATS با آستانه صفر) گرفته می‌شود، پس دقیقاً همان چیزی است که
+صفحه اجرا می‌کند. خروجی غیرصفر یعنی پسرفت:
+
+    python benchmarks/plan_check.py
+    python benchmarks/plan_check.py --contacts 100k --show
+"""
+import argparse
+import itertools
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import date, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen  # noqa: E402
+
+LARGE_TABLES = {"users", "companies", "calls", "followups", "orders"}
+
+
+class Filter(NamedTuple):
+    """kwargs فیلتر؛ indexes: ایندکس‌هایی که باید در پلن باشند؛ drives: اگر True جدول اصلی نباید SCAN شود"""
+    kwargs: dict
+    indexes: Tuple[str, ...] = ()
+    drives: bool = False
+
+
+class Grid(NamedTuple):
+    fn: Callable
+    base: dict
+    driver: str            # نام مستعار جدول اصلی در SQL
+    filters: Dict[str, Filter]
+
+
+def grids(crm, owner: int, user_id: int, company_id: int, product_id: int) -> Dict[str, Grid]:
+    today = date.today()
+    return {
+        "users": Grid(crm.df_users_advanced, dict(
+            first_q=None, last_q=None, domain_q=None, created_from=None, created_to=None, has_open_task=None,
+            last_call_from=None, last_call_to=None, statuses=[], owner_ids_filter=None, enforce_owner=None), "u", {
+            "first_name": Filter(dict(first_q="علی")),
+            "status": Filter(dict(statuses=["مشتری شد"])),
+            "created_range": Filter(dict(created_from=today - timedelta(days=90), created_to=today),
+                                    ("idx_users_created",), True),
+            "open_task": Filter(dict(has_open_task=True), ("idx_followups_status_user",)),
+            "no_open_task": Filter(dict(has_open_task=False), ("idx_followups_status_user",)),
+            "called_since": Filter(dict(last_call_from=today - timedelta(days=7)), ("idx_calls_datetime",), True),
+            "silent_since": Filter(dict(last_call_to=today - timedelta(days=30)),
+                                   ("idx_calls_datetime", "idx_calls_user_datetime"), True),
+            "owner": Filter(dict(enforce_owner=owner), ("idx_users_owner",), True),
+            "owners": Filter(dict(owner_ids_filter=[owner, owner + 1]), ("idx_users_owner",), True),
+            "only_ids": Filter(dict(only_ids=[1, 2, 3]), (), True),
+        }),
+        "companies": Grid(crm.df_companies_advanced, dict(
+            q_name=None, f_status=[], f_level=[], created_from=None, created_to=None, has_open_task=None,
+            owner_ids_filter=None, enforce_owner=None), "c", {
+            "name": Filter(dict(q_name="پارس")),
+            "status": Filter(dict(f_status=[crm.COMPANY_STATUSES[0]])),
+            "created_range": Filter(dict(created_from=today - timedelta(days=90), created_to=today),
+                                    ("idx_companies_created",), True),
+            "open_task": Filter(dict(has_open_task=True), ("idx_users_company", "idx_followups_status_user")),
+            "owner": Filter(dict(enforce_owner=owner), ("idx_users_owner",), True),
+            "owners": Filter(dict(owner_ids_filter=[owner, owner + 1]), ("idx_users_owner",), True),
+            "only_ids": Filter(dict(only_ids=[1, 2]), (), True),
+        }),
+        "calls": Grid(crm.df_calls_by_filters, dict(
+            name_query="", statuses=[], start=None, end=None, owner_ids_filter=None, enforce_owner=None), "cl", {
+            "name": Filter(dict(name_query="محمدی")),
+            "status": Filter(dict(statuses=["موفق"])),
+            "range": Filter(dict(start=today - timedelta(days=7), end=today), ("idx_calls_datetime",), True),
+            "owner": Filter(dict(enforce_owner=owner), ("idx_users_owner", "idx_calls_user_datetime"), True),
+        }),
+        "followups": Grid(crm.df_followups_by_filters, dict(
+            name_query="", statuses=[], start=None, end=None, owner_ids_filter=None, enforce_owner=None), "f", {
+            "name": Filter(dict(name_query="محمدی")),
+            "open": Filter(dict(statuses=["در حال انجام"]), ("idx_followups_status_user",), True),
+            "range": Filter(dict(start=today, end=today + timedelta(days=7)), ("idx_followups_due",), True),
+            "owner": Filter(dict(enforce_owner=owner), ("idx_users_owner", "idx_followups_user_due"), True),
+        }),
+        "orders": Grid(crm.df_orders_by_filters, {}, "o", {
+            "status": Filter(dict(status_filter=crm.ORDER_STATUSES[0])),
+            "user": Filter(dict(user_filter=user_id), ("idx_orders_user",), True),
+            "company": Filter(dict(company_filter=company_id), ("idx_orders_company",), True),
+            "product": Filter(dict(product_filter=product_id), ("idx_orders_product",), True),
+        }),
+    }
+
+
+def combinations(filters: Dict[str, Filter]) -> List[Tuple[str, ...]]:
+    """بدون فیلتر، هر فیلتر تنها و همه جفت‌ها"""
+    names = list(filters)
+    return [()] + [(n,) for n in names] + list(itertools.combinations(names, 2))
+
+
+_ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_SQL_WORDS = {"WHERE", "ON", "LEFT", "JOIN", "INNER", "GROUP", "ORDER", "LIMIT", "AND", "OR"}
+
+
+def alias_map(sql: str) -> Dict[str, str]:
+    out = {}
+    for table, alias in _ALIAS.findall(sql):
+        out[table] = table
+        if alias and alias.upper() not in _SQL_WORDS:
+            out[alias] = table
+    return out
+
+
+def check_plan(sql: str, plan: str, grid: Grid, combo: Tuple[str, ...]) -> List[str]:
+    nodes = {}
+    for line in plan.splitlines():
+        node_id, parent, detail = line.split("|", 2)
+        nodes[int(node_id)] = (int(parent), detail.strip())
+
+    def correlated(node_id: int) -> bool:
+        parent = nodes[node_id][0]
+        while parent in nodes:
+            if nodes[parent][1].startswith("CORRELATED"):
+                return True
+            parent = nodes[parent][0]
+        return False
+
+    tables = alias_map(sql)
+    filters = [grid.filters[n] for n in combo]
+    problems = []
+    for node_id, (_, detail) in nodes.items():
+        m = re.match(r"SCAN (\w+)", detail)
+        if not m or tables.get(m.group(1)) not in LARGE_TABLES:
+            continue
+        if correlated(node_id):
+            problems.append(f"SCAN داخل زیرپرس‌وجوی همبسته: {detail}")
+        elif m.group(1) == grid.driver and any(f.drives for f in filters):
+            problems.append(f"جدول اصلی با وجود فیلتر ایندکس‌دار SCAN شد: {detail}")
+    used = set(re.findall(r"INDEX (\w+)", plan))
+    for name, f in zip(combo, filters):
+        missing = [ix for ix in f.indexes if ix not in used]
+        # از چند فیلتر «راننده» فقط یکی جدول را می‌راند؛ ایندکس بقیه الزامی نیست
+        if missing and not (f.drives and sum(g.drives for g in filters) > 1):
+            problems.append(f"فیلتر {name}: ایندکس {', '.join(missing)} استفاده نشد")
+    return problems
+
+
+def run(crm, show: bool) -> int:
+    conn = crm.get_conn()
+    owner = conn.execute("SELECT owner_id FROM users GROUP BY owner_id ORDER BY COUNT(*) DESC LIMIT 1;").fetchone()[0]
+    user_id = conn.execute("SELECT user_id FROM orders WHERE user_id IS NOT NULL LIMIT 1;").fetchone()[0]
+    company_id = conn.execute("SELECT company_id FROM orders WHERE company_id IS NOT NULL LIMIT 1;").fetchone()[0]
+    product_id = conn.execute("SELECT product_id FROM orders LIMIT 1;").fetchone()[0]
+    conn.close()
+
+    qs = crm.QUERY_STATS
+    qs.enabled, qs.slow_ms = True, 0.0
+    failures = checked = 0
+    for grid_name, grid in grids(crm, owner, user_id, company_id, product_id).items():
+        for combo in combinations(grid.filters):
+            kwargs = dict(grid.base)
+            for n in combo:
+                kwargs.update(grid.filters[n].kwargs)
+            qs.reset()
+            grid.fn(**kwargs)
+            # خواندن افق بایگانی از app_meta (یک بار بعد از هر تغییر) جزو کوئری جدول نیست
+            selects = [e for e in qs.slow if e["sql"].upper().startswith(("SELECT", "WITH"))
+                       and "FROM app_meta" not in e["sql"]]
+            label = f"{grid_name}[{'+'.join(combo) or 'all'}]"
+            if not selects:
+                print(f"FAIL {label}: کوئری SELECT ثبت نشد"); failures += 1
+                continue
+            for e in selects:
+                checked += 1
+                problems = check_plan(e["sql"], e["plan"], grid, combo)
+                if problems or show:
+                    print(f"{'FAIL' if problems else 'ok  '} {label}  ({e['caller']})")
+                    for p in problems:
+                        print(f"     - {p}")
+                    if show or problems:
+                        print("       " + e["plan"].replace("\n", "\n       "))
+                failures += bool(problems)
+    print(f"{checked} پلن بررسی شد، {failures} خطا")
+    return 1 if failures else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--contacts", default="10k", help="مقیاس دیتابیس مصنوعی (پلن بدون ANALYZE به حجم وابسته نیست)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--db", help="به جای دیتابیس مصنوعی، یک کپی از این فایل بررسی شود")
+    ap.add_argument("--show", action="store_true", help="پلن همه کوئری‌ها چاپ شود")
+    args = ap.parse_args(argv)
+
+    src = args.db or datagen.ensure_db(datagen.parse_scale(args.contacts), args.seed)
+    work = tempfile.mkdtemp(prefix="crm_plan_")
+    db_path = os.path.join(work, "crm.db")
+    shutil.copyfile(src, db_path)
+    os.chdir(work)
+    sys.path.insert(0, datagen.ROOT)
+    logging.getLogger("crm.slow_query").setLevel(logging.ERROR)
+    import crm_core as crm
+    crm.config.set_db_path(db_path)
+    crm.init_db()  # ایندکس‌های نسخه فعلی روی کپی ساخته می‌شوند
+    try:
+        return run(crm, args.show)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+اجرای بنچمارک همه مسیرهای کوئری برنامه روی دیتابیس‌های مصنوعی (benchmarks/datagen.py) در چند مقیاس.
+
+هر مقیاس در یک پروسه جدا اجرا می‌شود (مسیر دیتابیس و استخر خواننده/نویسنده crm_core برای کل پروسه‌اند). خروجی JSON است
+تا نتیجه دو نسخه با --compare مقایسه شود:
+
+    python benchmarks/run.py --scales 10k,100k --out bench_new.json
+    python benchmarks/run.py --scales 10k --compare bench_old.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datagen  # noqa: E402
+
+ROOT = datagen.ROOT
+
+
+def _timeit(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    out: Dict[str, Any] = {"ms_min": round(min(times), 2), "ms_median": round(statistics.median(times), 2)}
+    if isinstance(result, (bytes, bytearray)):
+        out["bytes"] = len(result)
+    else:
+        out["rows"] = len(result) if hasattr(result, "__len__") else None
+    return out
+
+
+def cases(crm, conn: sqlite3.Connection) -> List[tuple]:
+    """(گروه، نام، تابع) — ترکیب فیلترهای رایج هر صفحه"""
+    today = date.today()
+    top_owner = conn.execute("SELECT owner_id FROM users GROUP BY owner_id ORDER BY COUNT(*) DESC LIMIT 1;").fetchone()[0]
+    small_owner = conn.execute("SELECT owner_id FROM users GROUP BY owner_id ORDER BY COUNT(*) LIMIT 1;").fetchone()[0]
+    order_user = conn.execute("SELECT user_id FROM orders WHERE user_id IS NOT NULL LIMIT 1;").fetchone()[0]
+
+    def users(**kw):
+        args = dict(first_q=None, last_q=None, domain_q=None, created_from=None, created_to=None,
+                    has_open_task=None, last_call_from=None, last_call_to=None, statuses=[],
+                    owner_ids_filter=None, enforce_owner=None)
+        args.update(kw)
+        return lambda: crm.df_users_advanced(**args)
+
+    def companies(**kw):
+        args = dict(q_name=None, f_status=[], f_level=[], created_from=None, created_to=None,
+                    has_open_task=None, owner_ids_filter=None, enforce_owner=None)
+        args.update(kw)
+        return lambda: crm.df_companies_advanced(**args)
+
+    def calls(name="", statuses=(), start=None, end=None, owners=None, enforce=None):
+        return lambda: crm.df_calls_by_filters(name, list(statuses), start, end, owners, enforce)
+
+    def followups(name="", statuses=(), start=None, end=None, owners=None, enforce=None):
+        return lambda: crm.df_followups_by_filters(name, list(statuses), start, end, owners, enforce)
+
+    return [
+        ("users", "all", users()),
+        ("users", "first_name_like", users(first_q="علی")),
+        ("users", "status_customer", users(statuses=["مشتری شد"])),
+        ("users", "has_open_task", users(has_open_task=True)),
+        ("users", "no_call_30d", users(last_call_to=today - timedelta(days=30))),
+        ("users", "called_last_7d", users(last_call_from=today - timedelta(days=7))),
+        ("users", "agent_top_owner", users(enforce_owner=top_owner)),
+        ("users", "agent_small_owner", users(enforce_owner=small_owner)),
+        ("users", "created_last_90d", users(created_from=today - timedelta(days=90))),
+        ("companies", "all", companies()),
+        ("companies", "name_like", companies(q_name="پارس")),
+        ("companies", "has_open_task", companies(has_open_task=True)),
+        ("companies", "agent_top_owner", companies(enforce_owner=top_owner)),
+        ("calls", "all", calls()),
+        ("calls", "last_7d", calls(start=today - timedelta(days=7), end=today)),
+        ("calls", "success_agent", calls(statuses=["موفق"], enforce=top_owner)),
+        ("calls", "name_like", calls(name="محمدی")),
+        ("followups", "all", followups()),
+        ("followups", "open", followups(statuses=["در حال انجام"])),
+        ("followups", "due_next_7d", followups(start=today, end=today + timedelta(days=7))),
+        ("orders", "all", lambda: crm.df_orders_by_filters()),
+        ("orders", "status", lambda: crm.df_orders_by_filters(status_filter="تایید شده")),
+        ("orders", "user", lambda: crm.df_orders_by_filters(user_filter=order_user)),
+        ("dashboard", "all", lambda: crm.dashboard_metrics(today)),
+        ("dashboard", "agent", lambda: crm.dashboard_metrics(today, [top_owner])),
+    ]
+
+
+def _import_frame(crm, n_rows: int):
+    import pandas as pd
+    return pd.DataFrame([{
+        "FirstName": "مهمان", "LastName": f"ایمپورت{i}", "Phone": f"0990{i:07d}", "Role": "",
+        "Company": f"شرکت ایمپورت {i % 50}", "Status": crm.USER_STATUSES[i % len(crm.USER_STATUSES)],
+        "Level": "هیچکدام", "Domain": "", "Province": "تهران", "OwnerUsername": "agent01", "Note": "",
+    } for i in range(n_rows)])
+
+
+def run_scale(contacts: int, seed: int, repeat: int, import_rows: int) -> Dict[str, Any]:
+    """اجرا در پروسه فرزند: روی یک کپی از دیتابیس مقیاس (ایمپورت دیتابیس را تغییر می‌دهد)."""
+    t0 = time.perf_counter()
+    src = datagen.ensure_db(contacts, seed)
+    gen_s = time.perf_counter() - t0
+    work = tempfile.mkdtemp(prefix="crm_bench_")
+    db_path = os.path.join(work, "crm.db")
+    shutil.copyfile(src, db_path)
+    os.chdir(work)
+    sys.path.insert(0, ROOT)
+    import crm_core as crm
+    crm.config.set_db_path(db_path)  # ensure_db ممکن است همین پروسه را روی دیتابیس منبع تنظیم کرده باشد
+    import pandas as pd
+
+    conn = sqlite3.connect(db_path)
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t};").fetchone()[0]
+              for t in ("companies", "users", "calls", "followups", "orders")}
+    results = []
+    for group, name, fn in cases(crm, conn):
+        fn()  # گرم کردن کش صفحات SQLite
+        results.append({"group": group, "name": name, **_timeit(fn, repeat)})
+    conn.close()
+
+    # ایمپورت اکسل: ساخت فایل، خواندن با read_excel و ثبت از صف نویسنده
+    n_imp = min(import_rows, max(100, contacts // 10))
+    buf = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False, dir=work)
+    _import_frame(crm, n_imp).to_excel(buf.name, index=False, engine="openpyxl")
+    t0 = time.perf_counter()
+    df_imp = pd.read_excel(buf.name)
+    read_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    ok, skip, _ = crm.import_contacts_df(df_imp, None)
+    write_ms = (time.perf_counter() - t0) * 1000
+    results.append({"group": "import", "name": f"excel_{n_imp}_rows", "rows": ok,
+                    "ms_min": round(read_ms + write_ms, 2), "ms_median": round(read_ms + write_ms, 2),
+                    "read_ms": round(read_ms, 2), "write_ms": round(write_ms, 2), "skipped": skip})
+
+    # بکاپ: همان مسیر دکمه‌های دانلود
+    for name, fn in (("backup_db", lambda: crm.backup_db_bytes(db_path)),
+                     ("backup_zip", lambda: crm.zip_db_bytes(crm.backup_db_bytes(db_path), "crm.db"))):
+        results.append({"group": "backup", "name": name, **_timeit(fn, max(1, repeat // 2))})
+
+    shutil.rmtree(work, ignore_errors=True)
+    return {"contacts": contacts, "counts": counts, "dataset_s": round(gen_s, 2), "results": results}
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+def compare(new: Dict[str, Any], old: Dict[str, Any]):
+    print(f"{'scale':6} {'case':34} {'old_ms':>9} {'new_ms':>9} {'ratio':>7}")
+    for scale, data in new["scales"].items():
+        old_scale = old.get("scales", {}).get(scale)
+        if not old_scale:
+            continue
+        old_idx = {(r["group"], r["name"]): r for r in old_scale["results"]}
+        for r in data["results"]:
+            o = old_idx.get((r["group"], r["name"]))
+            if not o:
+                continue
+            ratio = r["ms_median"] / o["ms_median"] if o["ms_median"] else float("inf")
+            flag = "  ▲" if ratio > 1.2 else ("  ▼" if ratio < 0.8 else "")
+            print(f"{scale:6} {r['group'] + '.' + r['name']:34} {o['ms_median']:>9.1f} {r['ms_median']:>9.1f} "
+                  f"{ratio:>6.2f}x{flag}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="10k", help="مقیاس‌ها با کاما، مثل 10k,100k,1m")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--import-rows", type=int, default=2000)
+    ap.add_argument("--out", help="فایل JSON خروجی (پیش‌فرض: stdout)")
+    ap.add_argument("--compare", help="JSON نسخه قبلی برای مقایسه")
+    ap.add_argument("--_child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args._child:
+        res = run_scale(datagen.parse_scale(args._child), args.seed, args.repeat, args.import_rows)
+        sys.stdout.write("\n@@RESULT@@" + json.dumps(res, ensure_ascii=False) + "\n")
+        return
+
+    import pandas as pd
+    report: Dict[str, Any] = {
+        "meta": {"git_rev": _git_rev(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                 "pandas": pd.__version__, "platform": platform.platform(), "repeat": args.repeat,
+                 "seed": args.seed},
+        "scales": {},
+    }
+    for scale in [s for s in args.scales.split(",") if s.strip()]:
+        n = datagen.parse_scale(scale)
+        print(f"… {datagen.scale_label(n)}", file=sys.stderr)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--_child", scale, "--seed", str(args.seed),
+                               "--repeat", str(args.repeat), "--import-rows", str(args.import_rows)],
+                              capture_output=True, text=True)
+        marker = proc.stdout.rfind("@@RESULT@@")
+        if proc.returncode != 0 or marker < 0:
+            sys.stderr.write(proc.stderr[-4000:])
+            sys.exit(f"benchmark for {scale} failed")
+        report["scales"][datagen.scale_label(n)] = json.loads(proc.stdout[marker + len("@@RESULT@@"):])
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
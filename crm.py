@@ -1,383 +1,169 @@
 # -*- coding: utf-8 -*-
 """
 FardaPack Mini-CRM — Streamlit + SQLite (Streamlit 1.50 friendly)
-- فونت Vazirmatn + RTL
+- استایل RTL از static/crm.css (بدون Google Fonts)؛ Vazirmatn فقط اگر روی سیستم کاربر نصب باشد، وگرنه Tahoma
 - نشست پایدار با توکن (عدم خروج بعد از رفرش)
 - تاریخ/ساعت شمسی در همه جدول‌ها
 - ستون «کارشناس فروش» در همه جدول‌ها + فیلتر سراسری
 - دیالوگ‌های پروفایل/ویرایش/ثبت تماس/پیگیری
-- صفحات: داشبورد، شرکت‌ها، کاربران، تماس‌ها، پیگیری‌ها، مدیریت دسترسی (برای مدیر)
+- صفحات: داشبورد، شرکت‌ها، کاربران، تماس‌ها، پیگیری‌ها، عملکرد کارشناسان، تحلیل فروش، قیف فروش، تکراری‌ها و مدیریت دسترسی (برای مدیر)
 - 📥 ایمپورت اکسل مخاطبین در صفحه کاربران
+- 📞 ایمپورت CDR مرکز تلفن (ثبت خودکار تماس‌ها) در صفحه تماس‌ها
 - ✅ عملیات گروهی در صفحه کاربران (تغییر کارشناس فروشِ چندتایی)
 - ♻️ بازیابی دیتابیس از بکاپ (.db یا .zip)
+- 🗄️ بایگانی تماس‌ها/پیگیری‌های قدیمی در crm_archive.db (داشبورد مدیر)
+- 🧹 نگه‌داری خودکار دیتابیس (ANALYZE، checkpoint ‏WAL، incremental vacuum) + وضعیت فایل برای مدیر
 - 🛒 بخش سفارشات و محصولات
+- لایه داده (دیتابیس، کوئری‌ها، قالب‌بندی) در بسته crm_core و بدون وابستگی به Streamlit؛ این فایل فقط رابط کاربری است
 """
+from __future__ import annotations
 
 import sqlite3
+import logging
+import json
+import tracemalloc
+from contextlib import contextmanager
+from collections import deque
 from datetime import datetime, date, timedelta
-from typing import Optional, List, Tuple, Dict
+from typing import Optional, List, Tuple, Dict, Callable
 
-import pandas as pd
 import streamlit as st
-import hashlib
-import uuid
+from streamlit.errors import StreamlitAPIException
 
 # 👇 اضافه شد
-import os, io, zipfile, shutil
-
-# ====================== صفحه و CSS ======================
-st.set_page_config(page_title="FardaPack Mini-CRM", page_icon="📇", layout="wide")
-st.markdown(
-    """
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Vazirmatn:wght@300;400;600;700&display=swap" rel="stylesheet">
-    <style>
-      html, body, [data-testid="stAppViewContainer"]{
-        direction: rtl; text-align: right !important;
-        font-family: "Vazirmatn", sans-serif !important;
-      }
-      [data-testid="stSidebar"] * { font-family: "Vazirmatn", sans-serif !important; }
-      /* جداول RTL + هدر بولد */
-      [data-testid="stDataFrame"], [data-testid="stDataEditor"]{ direction: rtl !important; }
-      [data-testid="stDataFrame"] div[role="columnheader"],
-      [data-testid="stDataEditor"] div[role="columnheader"]{
-        text-align: right !important; justify-content: flex-end !important; font-weight: 700 !important;
-      }
-      [data-testid="stDataFrame"] div[role="gridcell"],
-      [data-testid="stDataEditor"] div[role="gridcell"]{
-        text-align: right !important; justify-content: flex-end !important;
-      }
-    </style>
-    """,
-    unsafe_allow_html=True
+import os, zlib
+import importlib.util
+
+# لایه داده (بدون Streamlit): ذخیره‌سازی، کوئری‌ها و قالب‌بندی
+from crm_core import config
+from crm_core.config import CALL_STATUSES, TASK_STATUSES, USER_STATUSES, COMPANY_STATUSES, LEVELS, ORDER_STATUSES
+from crm_core.dates import (today_jalali_str, jalali_str_to_date, dt_to_jalali_str, plain_date_to_jalali_str,
+                            format_gregorian_with_weekday)
+from crm_core.profiling import PROFILE_PHASES, PROFILE_LOG_PATH, PROFILE_KEEP, prof_phase, profiled, profile_run
+from crm_core.monitor import QUERY_STATS, query_stats
+from crm_core.db import get_conn, sha256
+from crm_core.schema import init_db
+from crm_core.stats import dashboard_metrics
+from crm_core.changes import change_feed
+from crm_core.workers import read_executor, db_writer, run_write
+from crm_core.crud import (
+    create_session, get_session_user, delete_session, auth_check, list_sales_accounts_including_admins,
+    search_users_basic, search_companies, get_user_name, get_company_name, create_company, update_company,
+    create_user, update_user, update_followup_status, create_call, create_followup, bulk_update_users_owner,
+    import_contacts_df, import_template_xlsx, list_products, create_product, update_product, create_order, update_order_status,
+    update_order,
 )
+from crm_core.grids import (
+    USERS_GRID, LIVE_GRIDS, LIVE_PATCH_MAX, LIVE_POLL_SECONDS, PROFILE_PAGE_SIZE, grid_restore_dtypes,
+    df_companies_advanced, df_users_advanced, df_calls_by_filters, df_followups_by_filters, df_orders_by_filters,
+    profile_user_header, profile_company_header, df_profile_calls, df_profile_followups, df_company_members,
+    call_detail, followup_detail,
+)
+from crm_core.cdr import import_cdr
+from crm_core.dedupe import (
+    find_duplicate_contacts, find_duplicate_companies, df_duplicate_contacts, df_duplicate_companies, merge_contacts,
+    merge_companies, merge_clusters,
+)
+from crm_core.funnel import funnel_data, funnel_report
+from crm_core.revenue import REVENUE_DIMENSIONS, order_cube, revenue_breakdown, revenue_totals, revenue_trend
+from crm_core.leaderboard import agent_daily_stats, agent_performance, agent_trend, leaderboard, period_labels
+from crm_core.maintenance import MAINTENANCE_TASKS, db_file_stats, maintenance_scheduler, recent_maintenance, run_maintenance
+from crm_core.archive import ARCHIVE_HORIZON_DAYS, archive_horizons, archive_old_rows, archive_summary
+from crm_core.backup import backup_db_bytes, zip_db_bytes, extract_db_from_zip, validate_db_file, restore_db_file
+from crm_core.lazy import LazyModule
 
-# ====================== تاریخ شمسی ======================
-try:
-    from persiantools.jdatetime import JalaliDate, JalaliDateTime
-except Exception:
-    JalaliDate = None
-    JalaliDateTime = None
-
-def _jalali_supported() -> bool:
-    return JalaliDate is not None
-
-def today_jalali_str() -> str:
-    return JalaliDate.today().strftime("%Y/%m/%d") if _jalali_supported() else ""
-
-def jalali_str_to_date(s: str) -> Optional[date]:
-    if not s or not _jalali_supported():
-        return None
-    try:
-        g = JalaliDate.strptime(s.strip(), "%Y/%m/%d").to_gregorian()
-        return date(g.year, g.month, g.day)
-    except Exception:
-        return None
-
-def date_to_jalali_str(d: date) -> str:
-    if not d or not _jalali_supported():
-        return ""
-    try:
-        return JalaliDate.fromgregorian(date=d).strftime("%Y/%m/%d")
-    except Exception:
-        return ""
-
-def dt_to_jalali_str(dt_iso_or_none: Optional[str]) -> str:
-    """yyyy-mm-dd[ hh:mm[:ss]] → 'YYYY/MM/DD HH:MM' شمسی"""
-    if not dt_iso_or_none or not _jalali_supported():
-        return dt_iso_or_none or ""
-    try:
-        if "T" in dt_iso_or_none:
-            gdt = datetime.fromisoformat(dt_iso_or_none)
-        else:
-            try:
-                gdt = datetime.strptime(dt_iso_or_none, "%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                try:
-                    gdt = datetime.strptime(dt_iso_or_none, "%Y-%m-%d %H:%M")
-                except ValueError:
-                    gdt = datetime.strptime(dt_iso_or_none, "%Y-%m-%d")
-        jdt = JalaliDateTime.fromgregorian(datetime=gdt)
-        return jdt.strftime("%Y/%m/%d %H:%M")
-    except Exception:
-        return dt_iso_or_none
-
-def plain_date_to_jalali_str(maybe_date: str) -> str:
-    """
-    🛠️ مبدل مقاوم برای تاریخ‌های ستونی (مانند due_date):
-    - 'YYYY-MM-DD' → 'YYYY/MM/DD' (شمسی)
-    - اگر فرمت دیگری بود، همان را برمی‌گرداند
-    """
-    if not maybe_date:
-        return ""
-    try:
-        d = datetime.strptime(str(maybe_date).strip(), "%Y-%m-%d").date()
-        return date_to_jalali_str(d)
-    except Exception:
-        return str(maybe_date)
-
-# ====================== فرمت تاریخ میلادی با روز هفته ======================
-def format_gregorian_with_weekday(dt_str: str) -> str:
-    """تبدیل رشته تاریخ به فرمت میلادی با روز هفته"""
-    if not dt_str:
-        return ""
-    
-    try:
-        # تبدیل رشته به datetime
-        if "T" in dt_str:
-            dt = datetime.fromisoformat(dt_str)
-        else:
-            try:
-                dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                try:
-                    dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
-                except ValueError:
-                    dt = datetime.strptime(dt_str, "%Y-%m-%d")
-        
-        # نام روزهای هفته به فارسی
-        weekdays = {
-            0: "دوشنبه",
-            1: "سه‌شنبه", 
-            2: "چهارشنبه",
-            3: "پنجشنبه",
-            4: "جمعه",
-            5: "شنبه",
-            6: "یکشنبه"
-        }
-        
-        weekday = weekdays[dt.weekday()]
-        return f"{dt.strftime('%Y-%m-%d')} ({weekday})"
-    
-    except Exception:
-        return dt_str
+# pandas فقط وقتی صفحه‌ای جدول می‌سازد بارگذاری می‌شود (صفحه ورود و داشبورد به آن نیازی ندارند)
+pd = LazyModule("pandas")
 
-def format_date_only_with_weekday(date_str: str) -> str:
-    """تبدیل تاریخ فقط (بدون زمان) به فرمت میلادی با روز هفته"""
-    if not date_str:
-        return ""
-    
+# ====================== صفحه و CSS ======================
+st.set_page_config(page_title="FardaPack Mini-CRM", page_icon="📇", layout="wide")
+# استایل از static/crm.css (سرو با server.enableStaticServing در .streamlit/config.toml) خوانده می‌شود، نه از
+# Google Fonts. با st.html + اسکریپت یک <link> یک بار در هر نشست به <head> صفحه اضافه می‌شود و با rerunها
+# پاک نمی‌شود؛ نسخه (?v=) از اندازه/زمان تغییر فایل‌هاست تا کش مرورگر بعد از deploy به‌روز شود.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+APP_CSS_PATH = os.path.join(STATIC_DIR, "crm.css")
+
+def _static_version() -> str:
+    parts = []
+    for root, _, files in os.walk(STATIC_DIR):
+        for name in sorted(files):
+            info = os.stat(os.path.join(root, name))
+            parts.append(f"{name}:{info.st_size}:{int(info.st_mtime)}")
+    return format(zlib.crc32("|".join(sorted(parts)).encode()), "08x")
+
+def inject_app_css():
+    if st.session_state.get("_app_css_injected"):
+        return
+    if st.get_option("server.enableStaticServing"):
+        try:
+            st.html(f"""<script>
+              (() => {{
+                const doc = window.parent.document;
+                if (doc.getElementById("crm-app-css")) return;
+                const link = doc.createElement("link");
+                link.id = "crm-app-css"; link.rel = "stylesheet";
+                link.href = new URL("app/static/crm.css?v={_static_version()}", doc.baseURI).href;
+                doc.head.appendChild(link);
+              }})();
+            </script>""", unsafe_allow_javascript=True)
+            st.session_state["_app_css_injected"] = True
+            return
+        except TypeError:
+            pass  # Streamlit قدیمی‌تر از unsafe_allow_javascript
+    # بدون سرو استاتیک یا اجرای اسکریپت: همان CSS در هر rerun
+    with open(APP_CSS_PATH, encoding="utf-8") as f:
+        css = f.read()
+    st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+
+inject_app_css()
+
+def page_profiling_enabled() -> bool:
+    return st.session_state.get("page_profiling", os.environ.get("CRM_PAGE_PROFILING", "") in ("1", "true", "yes"))
+
+@contextmanager
+def page_profile(page: str):
+    """دور اجرای یک صفحه؛ وقتی پروفایل خاموش است هیچ کاری نمی‌کند."""
+    if not page_profiling_enabled():
+        if tracemalloc.is_tracing() and st.session_state.pop("_tracemalloc_owner", False):
+            tracemalloc.stop()
+        yield
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        st.session_state["_tracemalloc_owner"] = True
+    prof, completed = None, False
     try:
-        dt = datetime.strptime(str(date_str).strip(), "%Y-%m-%d")
-        
-        # نام روزهای هفته به فارسی
-        weekdays = {
-            0: "دوشنبه",
-            1: "سه‌شنبه", 
-            2: "چهارشنبه",
-            3: "پنجشنبه",
-            4: "جمعه",
-            5: "شنبه",
-            6: "یکشنبه"
-        }
-        
-        weekday = weekdays[dt.weekday()]
-        return f"{dt.strftime('%Y-%m-%d')} ({weekday})"
-    
-    except Exception:
-        return date_str
-
-# ====================== ثوابت و DB ======================
-DB_PATH = "crm.db"
-CALL_STATUSES = ["ناموفق", "موفق", "خاموش", "رد تماس"]
-TASK_STATUSES = ["در حال انجام", "پایان یافته"]
-# 🔧 1- اضافه کردن وضعیت "لغو" به وضعیت‌های کاربر
-USER_STATUSES = ["بدون وضعیت", "در حال پیگیری", "پیش فاکتور", "مشتری شد", "لغو"]
-COMPANY_STATUSES = ["بدون وضعیت", "در حال پیگیری", "پیش فاکتور", "مشتری شد"]
-LEVELS = ["هیچکدام", "طلایی", "نقره‌ای", "برنز"]
-ORDER_STATUSES = ["در حال پیگیری", "تایید شده", "کنسل شده", "رد شده"]
-
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    conn.execute("PRAGMA journal_mode=WAL;")
-    return conn
-
-def sha256(txt: str) -> str:
-    return hashlib.sha256((txt or "").encode("utf-8")).hexdigest()
-
-def _column_exists(conn: sqlite3.Connection, table: str, col: str) -> bool:
-    rows = conn.execute(f"PRAGMA table_info({table});").fetchall()
-    return any(r[1] == col for r in rows)
-
-def init_db():
-    conn = get_conn(); cur = conn.cursor()
-
-    # ---- companies ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS companies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            phone TEXT,
-            address TEXT,
-            note TEXT,
-            level TEXT NOT NULL DEFAULT 'هیچکدام',
-            status TEXT NOT NULL DEFAULT 'بدون وضعیت',
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            created_by INTEGER
-        );
-    """)
-    if not _column_exists(conn, "companies", "status"):
-        cur.execute("ALTER TABLE companies ADD COLUMN status TEXT NOT NULL DEFAULT 'بدون وضعیت';")
-    if not _column_exists(conn, "companies", "level"):
-        cur.execute("ALTER TABLE companies ADD COLUMN level TEXT NOT NULL DEFAULT 'هیچکدام';")
-
-    # ---- users ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            first_name TEXT,
-            last_name TEXT,
-            full_name TEXT NOT NULL,
-            phone TEXT UNIQUE,
-            role TEXT,
-            company_id INTEGER,
-            note TEXT,
-            status TEXT NOT NULL DEFAULT 'بدون وضعیت',
-            domain TEXT,
-            province TEXT,
-            level TEXT NOT NULL DEFAULT 'هیچکدام',
-            owner_id INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            created_by INTEGER,
-            FOREIGN KEY(company_id) REFERENCES companies(id) ON DELETE SET NULL
-        );
-    """)
-    for col, default in [
-        ("first_name", None), ("last_name", None), ("domain", None), ("province", None),
-        ("level", "'هیچکدام'"), ("owner_id", None)
-    ]:
-        if not _column_exists(conn, "users", col):
-            cur.execute(f"ALTER TABLE users ADD COLUMN {col} TEXT" + (f" DEFAULT {default}" if default else "") + ";")
-
-    # ---- calls ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS calls (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            call_datetime TEXT NOT NULL,
-            status TEXT NOT NULL CHECK(status IN ('ناموفق','موفق','خاموش','رد تماس')),
-            description TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            created_by INTEGER,
-            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-        );
-    """)
-
-    # ---- followups ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS followups (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            details TEXT,
-            due_date TEXT NOT NULL,
-            status TEXT NOT NULL CHECK(status IN ('در حال انجام','پایان یافته')) DEFAULT 'در حال انجام',
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            created_by INTEGER,
-            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-        );
-    """)
-
-    # ---- app_users ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS app_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_sha256 TEXT NOT NULL,
-            role TEXT NOT NULL CHECK(role IN ('admin','agent')) DEFAULT 'agent',
-            linked_user_id INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(linked_user_id) REFERENCES users(id) ON DELETE SET NULL
-        );
-    """)
-
-    # ---- sessions (برای لاگین پایدار) ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            token TEXT PRIMARY KEY,
-            app_user_id INTEGER NOT NULL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            expires_at TEXT,
-            FOREIGN KEY(app_user_id) REFERENCES app_users(id) ON DELETE CASCADE
-        );
-    """)
-
-    # ---- products ----
-    cur.execute(""" 
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            category TEXT NOT NULL,
-            name TEXT NOT NULL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-
-    # ---- orders ----
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            company_id INTEGER,
-            product_id INTEGER,
-            order_date TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'در حال پیگیری',
-            total_amount REAL NOT NULL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE SET NULL,
-            FOREIGN KEY(company_id) REFERENCES companies(id) ON DELETE SET NULL,
-            FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE SET NULL
-        );
-    """)
-
-    # Indexes
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_company ON users(company_id);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_owner ON users(owner_id);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_calls_user_datetime ON calls(user_id, call_datetime);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_followups_user_due ON followups(user_id, due_date);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(app_user_id);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_company ON orders(company_id);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_product ON orders(product_id);")
-
-    # Seed admin
-    if cur.execute("SELECT COUNT(*) FROM app_users;").fetchone()[0] == 0:
-        cur.execute("INSERT INTO app_users (username, password_sha256, role) VALUES (?,?,?);",
-                    ("admin", sha256("admin123"), "admin"))
-    conn.commit(); conn.close()
-
-# ====================== ابزار نشست پایدار ======================
-def create_session(app_user_id: int, days_valid: int = 30) -> str:
-    token = uuid.uuid4().hex
-    expires = (datetime.utcnow() + timedelta(days=days_valid)).strftime("%Y-%m-%d %H:%M:%S")
-    conn = get_conn()
-    conn.execute("INSERT INTO sessions (token, app_user_id, expires_at) VALUES (?,?,?);",
-                 (token, app_user_id, expires))
-    conn.commit(); conn.close()
-    return token
-
-def get_session_user(token: str):
-    if not token:
-        return None
-    conn = get_conn()
-    row = conn.execute("""
-        SELECT au.id, au.username, au.role, au.linked_user_id
-        FROM sessions s
-        JOIN app_users au ON au.id = s.app_user_id
-        WHERE s.token=? AND (s.expires_at IS NULL OR s.expires_at >= datetime('now'));
-    """, (token,)).fetchone()
-    conn.close()
-    if not row:
-        return None
-    uid, uname, role, linked_user_id = row
-    return {"id": uid, "username": uname, "role": role, "linked_user_id": linked_user_id}
-
-def delete_session(token: str):
-    if not token: return
-    conn = get_conn()
-    conn.execute("DELETE FROM sessions WHERE token=?;", (token,))
-    conn.commit(); conn.close()
+        with profile_run(page) as prof:
+            yield
+            completed = True
+    finally:
+        rec = {"ts": datetime.now().isoformat(timespec="seconds"),
+               "user": (st.session_state.get("auth") or {}).get("username"), "page": page,
+               "total_ms": prof.total_ms,
+               **{f"{k}_ms": round(v * 1000, 1) for k, v in prof.phases.items()},
+               "peak_kb": prof.peak_kb,
+               "completed": completed}  # False یعنی با st.rerun/st.stop یا خطا قطع شد
+        st.session_state.setdefault("_page_profiles", deque(maxlen=PROFILE_KEEP)).append(rec)
+        try:
+            with open(PROFILE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.getLogger("crm.profile").warning("profile log not written: %s", e)
+
+def page_profile_panel():
+    """پنل نوار کناری: آخرین اجرای هر صفحه به تفکیک مرحله"""
+    recs = list(st.session_state.get("_page_profiles", ()))
+    with st.expander("⏱ پروفایل صفحه", expanded=True):
+        if not recs:
+            st.caption("بعد از اجرای بعدی صفحه نمایش داده می‌شود.")
+            return
+        last = recs[-1]
+        st.caption(f"{last['page']} — کل {last['total_ms']:,.0f}ms — اوج حافظه {last['peak_kb']:,.0f}KB")
+        st.bar_chart(pd.DataFrame({"ms": [last[f"{k}_ms"] for k in PROFILE_PHASES]}, index=list(PROFILE_PHASES)),
+                     horizontal=True, height=160)
+        df = pd.DataFrame(recs[::-1])[["page", "total_ms", *[f"{k}_ms" for k in PROFILE_PHASES], "peak_kb"]]
+        st.dataframe(df, use_container_width=True, hide_index=True, height=220)
+        st.caption(f"لاگ: {PROFILE_LOG_PATH}")
 
 def set_url_token(token: str):
     # Streamlit 1.50
@@ -420,151 +206,6 @@ def clear_url_token():
         except Exception:
             pass
 
-# ====================== CRUD ======================
-def list_companies(_: Optional[int]) -> List[Tuple[int, str]]:
-    conn = get_conn()
-    rows = conn.execute("SELECT id, name FROM companies ORDER BY name COLLATE NOCASE;").fetchall()
-    conn.close(); return rows
-
-def list_sales_accounts_including_admins() -> List[Tuple[int, str, str]]:
-    conn = get_conn()
-    rows = conn.execute("SELECT id, username, role FROM app_users WHERE role IN ('agent','admin') ORDER BY role DESC, username;").fetchall()
-    conn.close(); return rows
-
-def list_users_basic(only_owner_appuser: Optional[int]) -> List[Tuple[int, str, Optional[int]]]:
-    conn = get_conn()
-    if only_owner_appuser:
-        rows = conn.execute(
-            "SELECT id, full_name, company_id FROM users WHERE owner_id=? ORDER BY full_name COLLATE NOCASE;",
-            (only_owner_appuser,)
-        ).fetchall()
-    else:
-        rows = conn.execute("SELECT id, full_name, company_id FROM users ORDER BY full_name COLLATE NOCASE;").fetchall()
-    conn.close(); return rows
-
-def phone_exists(phone: str, ignore_user_id: Optional[int] = None) -> bool:
-    ph = (phone or "").strip()
-    if not ph:
-        return False
-    conn = get_conn()
-    if ignore_user_id:
-        row = conn.execute("SELECT 1 FROM users WHERE phone=? AND id<>?;", (ph, ignore_user_id)).fetchone()
-    else:
-        row = conn.execute("SELECT 1 FROM users WHERE phone=?;", (ph,)).fetchone()
-    conn.close(); return row is not None
-
-def create_company(name, phone, address, note, level, status, creator_id):
-    conn = get_conn()
-    conn.execute(
-        "INSERT INTO companies (name, phone, address, note, level, status, created_by) VALUES (?,?,?,?,?,?,?);",
-        ((name or "").strip(), (phone or "").strip(), (address or "").strip(), (note or "").strip(), level, status, creator_id)
-    )
-    conn.commit(); conn.close()
-
-def update_company(company_id: int, **fields):
-    sets, params = [], []
-    for k, v in fields.items():
-        sets.append(f"{k}=?"); params.append(v)
-    if not sets:
-        return True, "بدون تغییر"
-    params.append(company_id)
-    conn = get_conn()
-    conn.execute(f"UPDATE companies SET {', '.join(sets)} WHERE id=?;", params)
-    conn.commit(); conn.close(); return True, "ذخیره شد."
-
-def create_user(first_name, last_name, phone, job_role, company_id, note,
-                status, domain, province, level, owner_id, creator_id) -> Tuple[bool, str]:
-    if phone and phone_exists(phone):
-        return False, "شماره تماس تکراری است."
-    full_name = f"{(first_name or '').strip()} {(last_name or '').strip()}".strip()
-    if not full_name:
-        return False, "نام و نام خانوادگی اجباری است."
-    conn = get_conn()
-    conn.execute("""INSERT INTO users
-        (first_name,last_name,full_name,phone,role,company_id,note,status,domain,province,level,owner_id,created_by)
-        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?);""",
-        ((first_name or "").strip(),
-         (last_name or "").strip(),
-         full_name,
-         (phone or "").strip(),
-         (job_role or "").strip(),
-         company_id,
-         (note or "").strip(),
-         status,
-         (domain or "").strip(),
-         (province or "").strip(),
-         level,
-         owner_id,
-         creator_id))
-    conn.commit(); conn.close(); return True, "کاربر ثبت شد."
-
-def update_user(user_id: int, **fields):
-    if "phone" in fields and phone_exists(fields.get("phone"), ignore_user_id=user_id):
-        return False, "شماره تماس تکراری است."
-    sets, params = [], []
-    for k, v in fields.items():
-        sets.append(f"{k}=?"); params.append(v)
-    if not sets:
-        return True, "بدون تغییر"
-    params.append(user_id)
-    conn = get_conn()
-    conn.execute(f"UPDATE users SET {', '.join(sets)} WHERE id=?;", params)
-    conn.commit(); conn.close(); return True, "ذخیره شد."
-
-def update_followup_status(task_id: int, new_status: str):
-    conn = get_conn(); conn.execute("UPDATE followups SET status=? WHERE id=?;", (new_status, task_id))
-    conn.commit(); conn.close()
-
-def create_call(user_id, call_dt: datetime, status, description, creator_id):
-    conn = get_conn()
-    conn.execute("INSERT INTO calls (user_id, call_datetime, status, description, created_by) VALUES (?,?,?,?,?);",
-                 (user_id, call_dt.isoformat(timespec="minutes"), status, (description or "").strip(), creator_id))
-    conn.commit(); conn.close()
-
-def create_followup(user_id, title, details, due_date_val: date, status, creator_id):
-    conn = get_conn()
-    conn.execute("INSERT INTO followups (user_id, title, details, due_date, status, created_by) VALUES (?,?,?,?,?,?);",
-                 (user_id, (title or "").strip(), (details or "").strip(), due_date_val.isoformat(), status, creator_id))
-    conn.commit(); conn.close()
-
-# ======= 🧰 عملیات گروهی روی کاربران (Bulk) =======
-def bulk_update_users_owner(user_ids: List[int], new_owner_id: Optional[int]) -> int:
-    """owner_id را برای لیست user_ids به‌صورت گروهی تغییر می‌دهد. مقدار برگشتی تعداد ردیف‌های تغییر کرده است."""
-    if not user_ids:
-        return 0
-    conn = get_conn()
-    placeholders = ",".join(["?"] * len(user_ids))
-    params: List = [new_owner_id] + [int(x) for x in user_ids]
-    cur = conn.execute(f"UPDATE users SET owner_id=? WHERE id IN ({placeholders});", params)
-    conn.commit(); conn.close()
-    return cur.rowcount if hasattr(cur, "rowcount") else len(user_ids)
-
-# ====================== توابع کمکی ایمپورت اکسل ======================
-def get_company_id_by_name(name: str) -> Optional[int]:
-    if not (name or "").strip():
-        return None
-    conn = get_conn()
-    row = conn.execute("SELECT id FROM companies WHERE name=?;", ((name or "").strip(),)).fetchone()
-    conn.close()
-    return row[0] if row else None
-
-def get_or_create_company(name: str, creator_id: Optional[int]) -> Optional[int]:
-    if not (name or "").strip():
-        return None
-    cid = get_company_id_by_name(name)
-    if cid:
-        return cid
-    create_company(name=name, phone="", address="", note="", level="هیچکدام", status="بدون وضعیت", creator_id=creator_id)
-    return get_company_id_by_name(name)
-
-def get_app_user_id_by_username(username: str) -> Optional[int]:
-    if not (username or "").strip():
-        return None
-    conn = get_conn()
-    row = conn.execute("SELECT id FROM app_users WHERE username=?;", ((username or "").strip(),)).fetchone()
-    conn.close()
-    return row[0] if row else None
-
 # ====================== فیلتر سراسری کارشناس فروش ======================
 def sales_filter_widget(disabled: bool, preselected_ids: List[int], key: str = "sales_filter") -> List[int]:
     sales_accounts = list_sales_accounts_including_admins()
@@ -576,298 +217,92 @@ def sales_filter_widget(disabled: bool, preselected_ids: List[int], key: str = "
         return preselected_ids
     return [label_to_id[l] for l in selected_labels]
 
-# ====================== DataFrames برای صفحات ======================
-def df_companies_advanced(q_name, f_status, f_level, created_from, created_to,
-                         has_open_task, owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int]):
-    """تابع جدید برای فیلتر کردن شرکت‌ها"""
-    conn = get_conn(); params, where = [], []
-    
-    if q_name: 
-        where.append("c.name LIKE ?"); params.append(f"%{q_name.strip()}%")
-    if f_status: 
-        where.append("c.status IN (" + ",".join(["?"]*len(f_status)) + ")"); params += f_status
-    if f_level: 
-        where.append("c.level IN (" + ",".join(["?"]*len(f_level)) + ")"); params += f_level
-    if created_from: 
-        where.append("date(c.created_at) >= ?"); params.append(created_from.isoformat())
-    if created_to:   
-        where.append("date(c.created_at) <= ?"); params.append(created_to.isoformat())
-    
-    # فیلتر کارشناس فروش
-    if enforce_owner:
-        where.append("EXISTS (SELECT 1 FROM users u WHERE u.company_id=c.id AND u.owner_id=?)")
-        params.append(enforce_owner)
-    if owner_ids_filter:
-        placeholders = ",".join(["?"]*len(owner_ids_filter))
-        where.append(f"EXISTS (SELECT 1 FROM users u WHERE u.company_id=c.id AND u.owner_id IN ({placeholders}))")
-        params += owner_ids_filter
-
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-    # 🚑 فیکس اینجا: DISTINCT را به زیربرگزیده منتقل کردیم تا با جداکننده سفارشی سازگار باشد.
-    df = pd.read_sql_query(f"""
-      SELECT
-        c.id AS ID,
-        c.name AS نام_شرکت,
-        COALESCE(c.phone,'') AS تلفن,
-        COALESCE(c.status,'') AS وضعیت_شرکت,
-        COALESCE(c.level,'') AS سطح_شرکت,
-        c.created_at AS تاریخ_ایجاد,
-        EXISTS(SELECT 1 FROM users u JOIN followups f ON f.user_id=u.id 
-               WHERE u.company_id=c.id AND f.status='در حال انجام') AS پیگیری_باز_دارد,
-        (
-          SELECT GROUP_CONCAT(username, '، ')
-          FROM (
-            SELECT DISTINCT au.username AS username
-            FROM users u 
-            LEFT JOIN app_users au ON au.id=u.owner_id 
-            WHERE u.company_id=c.id AND au.username IS NOT NULL
-          ) AS d
-        ) AS کارشناس_فروش
-      FROM companies c
-      {where_sql}
-      ORDER BY c.created_at DESC, c.id DESC
-    """, conn, params=params)
-
-    # فیلتر پیگیری باز
-    if has_open_task is not None:
-        df = df[df["پیگیری_باز_دارد"] == (1 if has_open_task else 0)]
-
-    # تبدیل تاریخ‌ها به فرمت میلادی با روز هفته
-    if "تاریخ_ایجاد" in df.columns:
-        df["تاریخ_ایجاد"] = df["تاریخ_ایجاد"].apply(format_gregorian_with_weekday)
-
-    # نمایش سفارشی برای «پیگیری_باز_دارد»
-    def _open_followup_display(row):
-        return "دارد" if int(row.get("پیگیری_باز_دارد", 0)) == 1 else "ندارد"
-
-    df["پیگیری_باز_دارد"] = df.apply(_open_followup_display, axis=1)
-
-    conn.close(); return df
-
-def df_users_advanced(first_q, last_q, domain_q, created_from, created_to,
-                      has_open_task, last_call_from, last_call_to,
-                      statuses, owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int]):
-    conn = get_conn(); params, where = [], []
-    if first_q: where.append("u.first_name LIKE ?"); params.append(f"%{first_q.strip()}%")
-    if last_q:  where.append("u.last_name  LIKE ?"); params.append(f"%{last_q.strip()}%")
-    # 🔧 2- اضافه کردن فیلتر حوزه فعالیت
-    if domain_q: where.append("u.domain LIKE ?"); params.append(f"%{domain_q.strip()}%")
-    if created_from: where.append("date(u.created_at) >= ?"); params.append(created_from.isoformat())
-    if created_to:   where.append("date(u.created_at) <= ?"); params.append(created_to.isoformat())
-    if statuses: where.append("u.status IN (" + ",".join(["?"]*len(statuses)) + ")"); params += statuses
-    if enforce_owner:
-        where.append("u.owner_id=?"); params.append(enforce_owner)
-    if owner_ids_filter:
-        where.append("u.owner_id IN (" + ",".join(["?"]*len(owner_ids_filter)) + ")"); params += owner_ids_filter
-
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-    df = pd.read_sql_query(f"""
-      SELECT
-        u.id AS ID,
-        u.first_name AS نام,
-        u.last_name AS نام_خانوادگی,
-        u.full_name AS نام_کامل,
-        COALESCE(c.name,'') AS شرکت,
-        COALESCE(u.phone,'') AS تلفن,
-        COALESCE(u.status,'') AS وضعیت_کاربر,
-        COALESCE(u.level,'') AS سطح_کاربر,
-        COALESCE(u.domain,'') AS حوزه_فعالیت,
-        COALESCE(u.province,'') AS استان,
-        u.created_at AS تاریخ_ایجاد,
-        (SELECT MAX(call_datetime) FROM calls cl WHERE cl.user_id=u.id) AS آخرین_تماس,
-        EXISTS(SELECT 1 FROM followups f WHERE f.user_id=u.id AND f.status='در حال انجام') AS پیگیری_باز_دارد,
-        (SELECT MAX(f2.due_date) FROM followups f2 WHERE f2.user_id=u.id AND f2.status='در حال انجام') AS آخرین_پیگیری_باز,
-        COALESCE(au.username,'') AS کارشناس_فروش
-      FROM users u
-      LEFT JOIN companies c ON c.id=u.company_id
-      LEFT JOIN app_users au ON au.id=u.owner_id
-      {where_sql}
-      ORDER BY u.created_at DESC, u.id DESC
-    """, conn, params=params)
-
-    # فیلترها
-    if has_open_task is not None:
-        df = df[df["پیگیری_باز_دارد"] == (1 if has_open_task else 0)]
-    if last_call_from:
-        df = df[(df["آخرین_تماس"].notna()) & (pd.to_datetime(df["آخرین_تماس"]).dt.date >= last_call_from)]
-    if last_call_to:
-        df = df[(df["آخرین_تماس"].notna()) & (pd.to_datetime(df["آخرین_تماس"]).dt.date <= last_call_to)]
-
-    # تبدیل تاریخ‌ها به فرمت میلادی با روز هفته
-    if "تاریخ_ایجاد" in df.columns:
-        df["تاریخ_ایجاد"] = df["تاریخ_ایجاد"].apply(format_gregorian_with_weekday)
-    if "آخرین_تماس" in df.columns:
-        df["آخرین_تماس"] = df["آخرین_تماس"].apply(format_gregorian_with_weekday)
-
-    # نمایش سفارشی برای «پیگیری_باز_دارد»
-    def _open_followup_display(row):
-        if int(row.get("پیگیری_باز_دارد", 0)) == 0 or pd.isna(row.get("آخرین_پیگیری_باز")):
-            return "ندارد"
-        return format_date_only_with_weekday(row.get("آخرین_پیگیری_باز"))
-
-    df["وضعیت_پیگیری_باز"] = df.apply(_open_followup_display, axis=1)
-
-    conn.close(); return df
-
-def df_calls_by_filters(name_query, statuses, start, end,
-                        owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int]):
-    conn = get_conn(); params, where = [], ["1=1"]
-    if name_query:
-        where.append("(u.full_name LIKE ? OR c.name LIKE ?)"); q=f"%{name_query.strip()}%"; params += [q,q]
-    if statuses: where.append("cl.status IN (" + ",".join(["?"]*len(statuses)) + ")"); params += statuses
-    if start: where.append("date(cl.call_datetime) >= ?"); params.append(start.isoformat())
-    if end:   where.append("date(cl.call_datetime) <= ?"); params.append(end.isoformat())
-    if enforce_owner: where.append("u.owner_id=?"); params.append(enforce_owner)
-    if owner_ids_filter: where.append("u.owner_id IN (" + ",".join(["?"]*len(owner_ids_filter)) + ")"); params += owner_ids_filter
-
-    df = pd.read_sql_query(f"""
-        SELECT cl.id AS ID, u.full_name AS نام_کاربر, COALESCE(c.name,'') AS شرکت,
-               cl.call_datetime AS تاریخ_و_زمان, cl.status AS وضعیت, COALESCE(cl.description,'') AS توضیحات,
-               COALESCE(au.username,'') AS کارشناس_فروش
-        FROM calls cl
-        JOIN users u ON u.id=cl.user_id
-        LEFT JOIN companies c ON c.id=u.company_id
-        LEFT JOIN app_users au ON au.id=u.owner_id
-        WHERE {' AND '.join(where)}
-        ORDER BY cl.call_datetime DESC, cl.id DESC
-    """, conn, params=params)
-
-    if "تاریخ_و_زمان" in df.columns:
-        df["تاریخ_و_زمان"] = df["تاریخ_و_زمان"].apply(format_gregorian_with_weekday)
-    conn.close(); return df
-
-def df_followups_by_filters(name_query, statuses, start, end,
-                            owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int]):
-    conn = get_conn(); params, where = [], ["1=1"]
-    if name_query:
-        where.append("(u.full_name LIKE ? OR c.name LIKE ?)"); q=f"%{name_query.strip()}%"; params += [q,q]
-    if statuses: where.append("f.status IN (" + ",".join(["?"]*len(statuses)) + ")"); params += statuses
-    if start: where.append("date(f.due_date) >= ?"); params.append(start.isoformat())
-    if end:   where.append("date(f.due_date) <= ?"); params.append(end.isoformat())
-    if enforce_owner: where.append("u.owner_id=?"); params.append(enforce_owner)
-    if owner_ids_filter: where.append("u.owner_id IN (" + ",".join(["?"]*len(owner_ids_filter)) + ")"); params += owner_ids_filter
-
-    df = pd.read_sql_query(f"""
-        SELECT f.id AS ID, u.full_name AS نام_کاربر, COALESCE(c.name,'') AS شرکت,
-               f.title AS عنوان, COALESCE(f.details,'') AS جزئیات,
-               f.due_date AS تاریخ_پیگیری, f.status AS وضعیت,
-               COALESCE(au.username,'') AS کارشناس_فروش
-        FROM followups f
-        JOIN users u ON u.id=f.user_id
-        LEFT JOIN companies c ON c.id=u.company_id
-        LEFT JOIN app_users au ON au.id=u.owner_id
-        WHERE {' AND '.join(where)}
-        ORDER BY f.due_date DESC, f.id DESC
-    """, conn, params=params)
-
-    if "تاریخ_پیگیری" in df.columns:
-        df["تاریخ_پیگیری"] = df["تاریخ_پیگیری"].apply(format_date_only_with_weekday)
-
-    conn.close(); return df
-
-# ====================== توابع جدید برای سفارشات و محصولات ======================
-def list_products() -> List[Tuple[int, str, str]]:
-    """لیست تمام محصولات"""
-    conn = get_conn()
-    rows = conn.execute("SELECT id, category, name FROM products ORDER BY category, name;").fetchall()
-    conn.close()
-    return rows
-
-def create_product(category: str, name: str):
-    """ایجاد محصول جدید"""
-    conn = get_conn()
-    conn.execute("INSERT INTO products (category, name) VALUES (?, ?);", (category.strip(), name.strip()))
-    conn.commit()
-    conn.close()
-
-def update_product(product_id: int, category: str, name: str):
-    """ویرایش محصول"""
-    conn = get_conn()
-    conn.execute("UPDATE products SET category=?, name=? WHERE id=?;", (category.strip(), name.strip(), product_id))
-    conn.commit()
-    conn.close()
-
-def create_order(user_id: Optional[int], company_id: Optional[int], product_id: int, 
-                order_date: date, status: str, total_amount: float):
-    """ایجاد سفارش جدید"""
-    conn = get_conn()
-    conn.execute("""
-        INSERT INTO orders (user_id, company_id, product_id, order_date, status, total_amount)
-        VALUES (?, ?, ?, ?, ?, ?);
-    """, (user_id, company_id, product_id, order_date.isoformat(), status, total_amount))
-    conn.commit()
-    conn.close()
-
-def update_order_status(order_id: int, new_status: str):
-    """به‌روزرسانی وضعیت سفارش"""
-    conn = get_conn()
-    conn.execute("UPDATE orders SET status=? WHERE id=?;", (new_status, order_id))
-    conn.commit()
-    conn.close()
-
-def update_order(order_id: int, **fields):
-    """به‌روزرسانی سفارش"""
-    sets, params = [], []
-    for k, v in fields.items():
-        sets.append(f"{k}=?"); params.append(v)
-    if not sets:
-        return True, "بدون تغییر"
-    params.append(order_id)
-    conn = get_conn()
-    conn.execute(f"UPDATE orders SET {', '.join(sets)} WHERE id=?;", params)
-    conn.commit(); conn.close(); return True, "ذخیره شد."
-
-def df_orders_by_filters(user_filter: Optional[int] = None, company_filter: Optional[int] = None,
-                        product_filter: Optional[int] = None, status_filter: Optional[str] = None):
-    """فیلتر کردن سفارشات"""
-    conn = get_conn()
-    params, where = [], ["1=1"]
-    
-    if user_filter:
-        where.append("o.user_id = ?"); params.append(user_filter)
-    if company_filter:
-        where.append("o.company_id = ?"); params.append(company_filter)
-    if product_filter:
-        where.append("o.product_id = ?"); params.append(product_filter)
-    if status_filter and status_filter != "همه":
-        where.append("o.status = ?"); params.append(status_filter)
-
-    where_sql = "WHERE " + " AND ".join(where)
-
-    df = pd.read_sql_query(f"""
-        SELECT 
-            o.id AS ID,
-            COALESCE(u.full_name, '—') AS کاربر,
-            COALESCE(c.name, '—') AS شرکت,
-            p.name AS محصول,
-            p.category AS دسته_بندی,
-            o.order_date AS تاریخ_سفارش,
-            o.total_amount AS مبلغ_کل,
-            o.status AS وضعیت,
-            o.created_at AS تاریخ_ایجاد
-        FROM orders o
-        LEFT JOIN users u ON u.id = o.user_id
-        LEFT JOIN companies c ON c.id = o.company_id
-        LEFT JOIN products p ON p.id = o.product_id
-        {where_sql}
-        ORDER BY o.created_at DESC;
-    """, conn, params=params)
-
-    # تبدیل تاریخ‌ها
-    if "تاریخ_سفارش" in df.columns:
-        df["تاریخ_سفارش"] = df["تاریخ_سفارش"].apply(format_date_only_with_weekday)
-    if "تاریخ_ایجاد" in df.columns:
-        df["تاریخ_ایجاد"] = df["تاریخ_ایجاد"].apply(format_gregorian_with_weekday)
-
-    # 🔧 4- فرمت کردن مبلغ کل با جداکننده هزارگان
-    if "مبلغ_کل" in df.columns:
-        df["مبلغ_کل"] = df["مبلغ_کل"].apply(lambda x: f"{float(x):,.0f}" if pd.notna(x) else "")
-
-    conn.close()
+# ====================== انتخابگر تایپ‌شونده (مخاطب/شرکت) ======================
+def entity_picker(label: str, key: str, search_fn, name_fn,
+                  selected_id: Optional[int] = None, none_label: str = "— انتخاب —") -> Optional[int]:
+    """
+    به جای selectbox با کل لیست: کاربر چند حرف تایپ می‌کند و فقط حداکثر PICKER_LIMIT گزینه از دیتابیس خوانده می‌شود.
+    search_fn(q) → [(id, نام)] ، name_fn(id) → نام ؛ خروجی: ID انتخاب‌شده یا None
+    """
+    id_key = f"{key}_id"
+    if id_key not in st.session_state:
+        st.session_state[id_key] = selected_id
+    current = st.session_state[id_key]
+
+    q = st.text_input(f"جستجوی {label}", key=f"{key}_q", placeholder="چند حرف اول نام یا شماره تلفن…")
+    labels: Dict[Optional[int], str] = {None: none_label}
+    if current:
+        labels[current] = name_fn(current) or f"ID {current}"
+    for i, n in search_fn(q):
+        labels.setdefault(i, n)
+
+    options = list(labels.keys())
+    chosen = st.selectbox(label, options, index=options.index(current) if current in options else 0,
+                          format_func=lambda i: labels[i] if i is None else f"{labels[i]} (ID {i})",
+                          key=f"{key}_sel_{q}")
+    st.session_state[id_key] = chosen
+    return chosen
+
+def user_picker(label: str, key: str, only_owner: Optional[int] = None,
+                selected_id: Optional[int] = None, none_label: str = "— انتخاب کاربر —") -> Optional[int]:
+    return entity_picker(label, key,
+                         lambda q: [(i, n) for i, n, _ in search_users_basic(q, only_owner)],
+                         get_user_name, selected_id=selected_id, none_label=none_label)
+
+def company_picker(label: str, key: str, selected_id: Optional[int] = None,
+                   none_label: str = "— انتخاب شرکت —") -> Optional[int]:
+    return entity_picker(label, key, search_companies, get_company_name,
+                         selected_id=selected_id, none_label=none_label)
+
+# ====================== جدول‌های زنده (وصله افزایشی از change_log) ======================
+# نتیجه هر جدول با کلید فیلترها در session_state نگه داشته می‌شود. در rerun بعدی اگر seq فید جلو رفته باشد،
+# فقط ردیف‌های متأثر (با همان فیلترها و only_ids) دوباره خوانده و جایگزین می‌شوند؛ ردیفی که دیگر با فیلتر
+# جور نیست یا حذف شده از جدول بیرون می‌رود. تغییرات خیلی زیاد (مثلاً ایمپورت) → بارگذاری کامل.
+def live_grid(name: str, key: tuple, load: Callable[[Optional[List[int]]], pd.DataFrame]) -> pd.DataFrame:
+    """
+    load(only_ids) همان کوئری صفحه است (only_ids=None یعنی همه). ستون‌های ID و _created_at لازم‌اند
+    تا ردیف‌های وصله‌شده با همان ترتیب SQL (created_at DESC, id DESC) مرتب شوند.
+    """
+    feed = change_feed()
+    head = feed.head()  # قبل از خواندن: تغییری که وسط خواندن برسد دفعه بعد دوباره وصله می‌شود
+    tables, affected = LIVE_GRIDS[name]
+    grids = st.session_state.setdefault("_live_grids", {})
+    slot = grids.get(name)
+    if slot and slot["key"] == key and slot["epoch"] == feed.epoch and slot["seq"] <= head:
+        if slot["seq"] == head:
+            return slot["df"]
+        changes = feed.since(slot["seq"], tables, LIVE_PATCH_MAX)
+        if changes is not None and len(changes) <= LIVE_PATCH_MAX:
+            df = slot["df"]
+            ids = affected(changes)
+            if ids:
+                fresh = load(sorted(ids))
+                df = grid_restore_dtypes(pd.concat([df[~df["ID"].isin(ids)], fresh], ignore_index=True), slot["df"])
+                df = df.sort_values(["_created_at", "ID"], ascending=False, na_position="last",
+                                    kind="stable").reset_index(drop=True)
+            slot.update(df=df, seq=head, patched=slot.get("patched", 0) + len(ids))
+            return df
+    df = load(None)
+    grids[name] = {"key": key, "epoch": feed.epoch, "seq": head, "df": df, "patched": 0}
     return df
 
+@st.fragment(run_every=LIVE_POLL_SECONDS)
+def live_refresh_poller(name: str):
+    """اگر نشست دیگری جدول این صفحه را تغییر داده باشد، صفحه rerun می‌شود تا live_grid ردیف‌ها را وصله کند."""
+    if not st.session_state.get("live_refresh", True):
+        return
+    slot = st.session_state.get("_live_grids", {}).get(name)
+    feed = change_feed()
+    if not slot or slot["epoch"] != feed.epoch:
+        return
+    head = feed.head()
+    if head > slot["seq"]:
+        changes = feed.since(slot["seq"], LIVE_GRIDS[name][0], 0)
+        if changes is None or changes:  # None: فید هرس شده، live_grid بارگذاری کامل می‌کند
+            st.rerun()
+        else:
+            slot["seq"] = head  # فقط جداول نامربوط تغییر کرده‌اند
+
 # ====================== احراز هویت ======================
 if "auth" not in st.session_state:
     st.session_state.auth = None
@@ -881,16 +316,6 @@ def current_user_id() -> Optional[int]:
 def is_admin() -> bool:
     return bool(st.session_state.auth and st.session_state.auth["role"] == "admin")
 
-def auth_check(username: str, password: str):
-    conn = get_conn()
-    row = conn.execute("SELECT id, username, password_sha256, role, linked_user_id FROM app_users WHERE username=?;",
-                       ((username or "").strip(),)).fetchone()
-    conn.close()
-    if not row:
-        return None
-    uid, uname, pwh, role, linked_user_id = row
-    return {"id": uid, "username": uname, "role": role, "linked_user_id": linked_user_id} if sha256(password) == pwh else None
-
 def try_autologin_from_url_token():
     if st.session_state.auth:
         return
@@ -940,44 +365,32 @@ def header_userbox():
 
 # تلاش برای لاگین خودکار از URL
 init_db()
+maintenance_scheduler().start()  # ANALYZE / checkpoint / vacuum در بیکاری (یک نخ برای کل پروسه)
 try_autologin_from_url_token()
 
-# ====================== 🔐 پشتیبان‌گیری و بازیابی دیتابیس ======================
-def extract_db_from_zip(zip_bytes: bytes) -> Optional[bytes]:
-    try:
-        with zipfile.ZipFile(io.BytesIO(zip_bytes), "r") as zf:
-            # اولین فایل .db
-            for info in zf.infolist():
-                if info.filename.lower().endswith(".db"):
-                    return zf.read(info)
-    except Exception:
-        return None
-    return None
+# ====================== دانلود با ساخت تنبل ======================
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
-def validate_db_file(path: str) -> Tuple[bool, str]:
+def deferred_download_button(label: str, build: Callable[[], bytes], file_name: str, mime: str, key: str, **kwargs):
+    """
+    دکمه دانلودی که محتوا را فقط هنگام کلیک می‌سازد (data=callable در Streamlit جدید، روی نخ جدا).
+    نسخه‌های قدیمی‌تر callable نمی‌پذیرند؛ آنجا اول «آماده‌سازی» زده می‌شود و نتیجه در session_state می‌ماند.
+    """
     try:
-        conn = sqlite3.connect(path, timeout=5)
-        cur = conn.cursor()
-        # سلامت دیتابیس
-        chk = cur.execute("PRAGMA integrity_check;").fetchone()
-        if not chk or str(chk[0]).lower() != "ok":
-            conn.close()
-            return False, f"integrity_check ناموفق: {chk[0] if chk else 'نامشخص'}"
-        # جداول ضروری
-        required = {"companies","users","calls","followups","app_users","sessions","products","orders"}
-        rows = cur.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
-        have = {r[0] for r in rows}
-        missing = required - have
-        conn.close()
-        if missing:
-            # اگر فقط sessions نبود، init_db بعداً آن را می‌سازد؛ ولی app_users/others ضروری‌اند
-            if missing - {"sessions"}:
-                return False, f"جدول(های) ضروری موجود نیست: {', '.join(sorted(missing))}"
-        return True, "ok"
-    except Exception as e:
-        return False, str(e)
-
-def db_download_ui(db_path: str = DB_PATH):
+        return st.download_button(label, data=build, file_name=file_name, mime=mime, key=key, **kwargs)
+    except StreamlitAPIException:
+        pass
+    ready = st.session_state.get(f"_dl_{key}")
+    if ready is None:
+        if st.button(f"آماده‌سازی: {label}", key=f"{key}_prepare", **kwargs):
+            st.session_state[f"_dl_{key}"] = build()
+            st.rerun()
+        return False
+    return st.download_button(label, data=ready, file_name=file_name, mime=mime, key=f"{key}_ready", **kwargs)
+
+# ====================== 🔐 پشتیبان‌گیری و بازیابی دیتابیس ======================
+def db_download_ui(db_path: Optional[str] = None):
+    db_path = db_path or config.DB_PATH
     st.markdown("### 🛡️ پشتیبان‌گیری دیتابیس")
     if not os.path.exists(db_path):
         st.warning("فایل دیتابیس پیدا نشد. مسیر فعلی: `{}`".format(os.path.abspath(db_path)))
@@ -987,31 +400,27 @@ def db_download_ui(db_path: str = DB_PATH):
     mtime = datetime.fromtimestamp(os.path.getmtime(db_path)).strftime("%Y-%m-%d %H:%M:%S")
     st.caption(f"نام: `{os.path.basename(db_path)}` — اندازه: {size:,} بایت — آخرین تغییر: {mtime}")
 
-    with open(db_path, "rb") as f:
-        db_bytes = f.read()
-
+    # نسخه بکاپ فقط با کلیک ساخته می‌شود؛ قبلاً کل دیتابیس در هر rerun داشبورد کپی و zip می‌شد
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 
     col1, col2 = st.columns(2)
     with col1:
-        st.download_button(
-            label="⬇️ دانلود مستقیم crm.db",
-            data=db_bytes,
-            file_name=f"crm_{ts}.db",
-            mime="application/octet-stream",
+        deferred_download_button(
+            "⬇️ دانلود مستقیم crm.db",
+            lambda: backup_db_bytes(db_path),
+            f"crm_{ts}.db",
+            "application/octet-stream",
+            key="dl_backup_db",
             use_container_width=True
         )
 
     with col2:
-        zip_buf = io.BytesIO()
-        with zipfile.ZipFile(zip_buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr(f"crm_{ts}.db", db_bytes)
-        zip_buf.seek(0)
-        st.download_button(
-            label="📦 دانلود نسخه فشرده (ZIP)",
-            data=zip_buf.getvalue(),
-            file_name=f"crm_{ts}.zip",
-            mime="application/zip",
+        deferred_download_button(
+            "📦 دانلود نسخه فشرده (ZIP)",
+            lambda: zip_db_bytes(backup_db_bytes(db_path), f"crm_{ts}.db"),
+            f"crm_{ts}.zip",
+            "application/zip",
+            key="dl_backup_zip",
             use_container_width=True
         )
 
@@ -1057,13 +466,14 @@ def db_download_ui(db_path: str = DB_PATH):
         try:
             ts2 = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_name = f"crm_before_restore_{ts2}.db"
-            shutil.copyfile(DB_PATH, backup_name)
+            with open(backup_name, "wb") as f:  # با API بکاپ، نه کپی خام .db (تغییرات هنوز در -wal را هم دارد)
+                f.write(backup_db_bytes(db_path))
         except Exception as e:
             st.warning(f"نتوانستم از دیتابیس فعلی بکاپ بگیرم: {e}")
 
-        # جایگزینی اتمیک تا حد ممکن
+        # نوشتن روی دیتابیس زنده با API بکاپ (از صف نویسنده)
         try:
-            os.replace(tmp_path, DB_PATH)
+            restore_db_file(tmp_path, db_path)
         except Exception as e:
             st.error(f"جایگزینی دیتابیس ناموفق بود: {e}")
             try:
@@ -1076,26 +486,105 @@ def db_download_ui(db_path: str = DB_PATH):
         st.success("بازیابی با موفقیت انجام شد. برنامه ری‌ران می‌شود تا اسکیمای لازم هم اعمال شود (ممکن است لازم باشد دوباره وارد شوید). 🔁")
         st.rerun()
 
+ARCHIVE_TABLE_LABELS = {"calls": "تماس‌ها", "followups": "پیگیری‌های بسته‌شده"}
+
+def archive_ui():
+    st.markdown("### 🗄️ بایگانی داده‌های قدیمی")
+    info = archive_summary()
+    st.caption("تماس‌ها و پیگیری‌های بسته‌شده قدیمی‌تر از افق به فایل جدا منتقل می‌شوند تا جدول‌ها و بکاپ "
+               "دیتابیس اصلی کوچک بمانند؛ جدول تماس‌ها/پیگیری‌ها با «از تاریخ» قبل از افق، بایگانی را هم نشان می‌دهند. "
+               "(فایل بایگانی در بکاپ بالا نیست.)")
+    if info["exists"]:
+        st.caption(f"فایل: `{info['path']}` — اندازه: {info['size']:,} بایت — " + " — ".join(
+            f"{ARCHIVE_TABLE_LABELS[t]}: {info['rows'].get(t, 0):,} ردیف قبل از "
+            f"{plain_date_to_jalali_str(info['horizons'][t]) if t in info['horizons'] else '—'}"
+            for t in ARCHIVE_TABLE_LABELS))
+    c1, c2 = st.columns([1, 2])
+    days = c1.number_input("افق (روز)", min_value=30, value=ARCHIVE_HORIZON_DAYS, step=30, key="archive_days")
+    c2.write("")
+    if c2.button("انتقال به بایگانی", use_container_width=True, key="archive_run"):
+        with st.spinner("در حال انتقال…"):
+            moved = archive_old_rows(int(days))
+        st.success("بایگانی انجام شد. " + " | ".join(
+            f"{ARCHIVE_TABLE_LABELS[t]}: {n:,}" for t, n in moved.items()))
+
+def maintenance_ui():
+    st.markdown("### 🧹 نگه‌داری دیتابیس")
+    if st.button("اجرای همه کارها همین حالا", key="maint_run", use_container_width=True):
+        with st.spinner("در حال نگه‌داری…"):
+            done = run_maintenance()
+        st.success(" | ".join(f"{MAINTENANCE_TASKS[r['task']].label}: {r['duration_ms']:,.0f}ms" for r in done))
+    fs = db_file_stats()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("حجم دیتابیس", f"{fs['db_bytes'] / 1e6:,.1f} MB")
+    c2.metric("حجم WAL", f"{fs['wal_bytes'] / 1e6:,.1f} MB")
+    c3.metric("صفحات آزاد", f"{fs['freelist_count']:,}", f"{fs['freelist_ratio']:.1%}", delta_color="off")
+    c4.metric("auto_vacuum", fs["auto_vacuum"])
+    every = {t: (f"{int(m.interval.total_seconds() // 3600)} ساعت" if m.interval.total_seconds() % 3600 == 0
+                 else f"{int(m.interval.total_seconds() // 60)} دقیقه") for t, m in MAINTENANCE_TASKS.items()}
+    st.caption("کارها خودکار و فقط وقتی صف نوشتن بیکار است اجرا می‌شوند: "
+               + " — ".join(f"{m.label}: هر {every[t]}" for t, m in MAINTENANCE_TASKS.items()))
+    rows = recent_maintenance()
+    if rows:
+        df = pd.DataFrame(rows)
+        df["task"] = df["task"].map(lambda t: MAINTENANCE_TASKS[t].label if t in MAINTENANCE_TASKS else t)
+        for col in ("db_bytes", "wal_bytes"):
+            df[col] = ((df[f"{col}_before"] / 1e6).round(1).astype(str) + " → "
+                       + (df[f"{col}_after"] / 1e6).round(1).astype(str) + " MB")
+        df["freelist"] = df["freelist_before"].astype(str) + " → " + df["freelist_after"].astype(str)
+        df = df[["started_at", "task", "reason", "duration_ms", "db_bytes", "wal_bytes", "freelist", "detail", "error"]]
+        df.columns = ["زمان", "کار", "دلیل", "مدت (ms)", "دیتابیس", "WAL", "صفحات آزاد", "نتیجه", "خطا"]
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
+def archive_caption(table: str, start_date: Optional[date]):
+    """یادآوری زیر فیلترها وقتی بازه انتخاب‌شده به داده بایگانی‌شده نمی‌رسد"""
+    horizon = archive_horizons().get(table)
+    if horizon and (start_date is None or start_date.isoformat() >= horizon):
+        st.caption(f"🗄️ موارد قبل از {plain_date_to_jalali_str(horizon)} بایگانی شده‌اند؛ "
+                   "برای دیدنشان «از تاریخ» را قبل از آن بگذار.")
+
 # ====================== دیالوگ‌ها: کاربران ======================
+def _page_limit(limit_key: str) -> int:
+    return st.session_state.get(limit_key, PROFILE_PAGE_SIZE)
+
+def _bounded_table(df: pd.DataFrame, limit_key: str, drop_cols: Optional[List[str]] = None):
+    """
+    نمایش جدول با سقف ردیف و دکمه «نمایش بیشتر».
+    df باید با limit=_page_limit(limit_key) خوانده شده باشد (حداکثر limit+1 ردیف)؛ ردیف اضافه فقط نشانه وجود ادامه است.
+    """
+    limit = _page_limit(limit_key)
+    has_more = len(df) > limit
+    df = df.head(limit)
+    if drop_cols:
+        df = df.drop(columns=[c for c in drop_cols if c in df.columns])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    if has_more and st.button("نمایش بیشتر", key=f"{limit_key}_more"):
+        st.session_state[limit_key] = limit + PROFILE_PAGE_SIZE
+        st.rerun(scope="fragment")
+
 @st.dialog("پروفایل کاربر")
 def dlg_profile(user_id: int):
-    conn = get_conn()
-    u = conn.execute("""
-      SELECT u.id, u.first_name, u.last_name, COALESCE(u.full_name,''), COALESCE(c.name,''), COALESCE(u.phone,''),
-             COALESCE(u.role,''), COALESCE(u.status,''), COALESCE(u.level,''), COALESCE(u.domain,''), COALESCE(u.province,''),
-             COALESCE(u.note,''), u.created_at, u.company_id, COALESCE(au.username,'') AS sales_user
-      FROM users u
-      LEFT JOIN companies c ON c.id=u.company_id
-      LEFT JOIN app_users au ON au.id=u.owner_id
-      WHERE u.id=?;
-    """, (user_id,)).fetchone()
-    conn.close()
+    # فقط سربرگ + تب انتخاب‌شده خوانده می‌شوند، هر دو هم‌زمان روی استخر خواننده‌ها
+    tab = st.radio("بخش", ["اطلاعات کاربر", "تماس‌ها", "پیگیری‌ها", "هم‌شرکتی‌ها"],
+                   horizontal=True, label_visibility="collapsed", key=f"prof_tab_{user_id}")
+    limit_key = {"تماس‌ها": f"prof_calls_limit_{user_id}", "پیگیری‌ها": f"prof_fu_limit_{user_id}",
+                 "هم‌شرکتی‌ها": f"prof_members_limit_{user_id}"}.get(tab)
+    jobs: Dict[str, tuple] = {"header": (profile_user_header, user_id)}
+    if tab == "تماس‌ها":
+        jobs["tab"] = (df_profile_calls, user_id, None, _page_limit(limit_key))
+    elif tab == "پیگیری‌ها":
+        jobs["tab"] = (df_profile_followups, user_id, None, _page_limit(limit_key))
+    elif tab == "هم‌شرکتی‌ها":
+        jobs["tab"] = (df_company_members, None, _page_limit(limit_key), user_id)
+    with prof_phase("query"):
+        res = read_executor().gather(jobs, label="dlg_profile")
+
+    u = res["header"]
     if not u:
         st.warning("کاربر یافت نشد.")
         return
 
-    tabs = st.tabs(["اطلاعات کاربر", "تماس‌ها", "پیگیری‌ها", "هم‌شرکتی‌ها"])
-    with tabs[0]:
+    if tab == "اطلاعات کاربر":
         st.write("**نام:**", u[1]); st.write("**نام خانوادگی:**", u[2]); st.write("**نام کامل:**", u[3])
         st.write("**شرکت:**", u[4]); st.write("**تلفن:**", u[5]); st.write("**سمت:**", u[6])
         st.write("**وضعیت:**", u[7]); st.write("**سطح:**", u[8])
@@ -1103,59 +592,10 @@ def dlg_profile(user_id: int):
         st.write("**یادداشت:**", u[11])
         st.write("**تاریخ ایجاد:**", format_gregorian_with_weekday(u[12]))
         st.write("**کارشناس فروش:**", u[14])
-
-    with tabs[1]:
-        conn = get_conn()
-        dfc = pd.read_sql_query("""
-           SELECT cl.id AS ID,
-                  cl.call_datetime AS تاریخ_و_زمان,
-                  cl.status AS وضعیت,
-                  COALESCE(cl.description,'') AS توضیحات,
-                  COALESCE(au.username,'') AS کارشناس_فروش
-           FROM calls cl
-           LEFT JOIN users uu ON uu.id=cl.user_id
-           LEFT JOIN app_users au ON au.id=uu.owner_id
-           WHERE cl.user_id=?
-           ORDER BY cl.call_datetime DESC, cl.id DESC;
-        """, conn, params=(user_id,))
-        conn.close()
-        if "تاریخ_و_زمان" in dfc.columns:
-            dfc["تاریخ_و_زمان"] = dfc["تاریخ_و_زمان"].apply(format_gregorian_with_weekday)
-        st.dataframe(dfc, use_container_width=True)
-
-    with tabs[2]:
-        conn = get_conn()
-        dff = pd.read_sql_query("""
-           SELECT f.id AS ID, f.title AS عنوان, COALESCE(f.details,'') AS جزئیات,
-                  f.due_date AS تاریخ_پیگیری, f.status AS وضعیت,
-                  COALESCE(au.username,'') AS کارشناس_فروش
-           FROM followups f
-           LEFT JOIN users uu ON uu.id=f.user_id
-           LEFT JOIN app_users au ON au.id=uu.owner_id
-           WHERE f.user_id=?
-           ORDER BY f.due_date DESC, f.id DESC;
-        """, conn, params=(user_id,))
-        conn.close()
-        if "تاریخ_پیگیری" in dff.columns:
-            dff["تاریخ_پیگیری"] = dff["تاریخ_پیگیری"].apply(format_date_only_with_weekday)
-        st.dataframe(dff, use_container_width=True)
-
-    with tabs[3]:
-        company_id = u[13]
-        if not company_id:
-            st.info("شرکت ثبت نشده است.")
-            return
-        conn = get_conn()
-        dcol = pd.read_sql_query("""
-            SELECT uu.id AS ID, uu.full_name AS نام_کامل, COALESCE(uu.phone,'') AS تلفن,
-                   COALESCE(uu.role,'') AS سمت, COALESCE(au.username,'') AS کارشناس_فروش
-            FROM users uu
-            LEFT JOIN app_users au ON au.id=uu.owner_id
-            WHERE uu.company_id=?
-            ORDER BY uu.full_name;
-        """, conn, params=(company_id,))
-        conn.close()
-        st.dataframe(dcol, use_container_width=True)
+    elif tab == "هم‌شرکتی‌ها" and not u[13]:
+        st.info("شرکت ثبت نشده است.")
+    else:
+        _bounded_table(res["tab"], limit_key, drop_cols=["نام_کاربر"])
 
 @st.dialog("ویرایش پروفایل")
 def dlg_edit_user(user_id: int):
@@ -1164,10 +604,6 @@ def dlg_edit_user(user_id: int):
         SELECT first_name,last_name,phone,role,company_id,note,status,domain,province,level,owner_id
         FROM users WHERE id=?;""", (user_id,)).fetchone()
 
-    companies = list_companies(None)
-    comp_map: Dict[str, Optional[int]] = {"— بدون شرکت —": None}
-    comp_map.update({n: i for i, n in companies})
-
     owners = list_sales_accounts_including_admins()
     owner_map: Dict[str, Optional[int]] = {"— بدون کارشناس —": None}
     owner_map.update({f"{u} ({r})": i for i, u, r in owners})
@@ -1177,6 +613,8 @@ def dlg_edit_user(user_id: int):
         return
 
     fn, ln, ph, rl, comp_id, note, stt, dom, prov, lvl, own = row
+    company_id_val = company_picker("شرکت", key=f"eu_company_{user_id}", selected_id=comp_id,
+                                    none_label="— بدون شرکت —")
     with st.form(f"edit_user_{user_id}", clear_on_submit=False):
         c1, c2, c3 = st.columns(3)
         with c1: first_name = st.text_input("نام *", value=fn or "")
@@ -1184,9 +622,6 @@ def dlg_edit_user(user_id: int):
         with c3: phone      = st.text_input("تلفن *", value=ph or "")
         role = st.text_input("سمت", value=rl or "")
 
-        comp_label = next((k for k, v in comp_map.items() if v == comp_id), "— بدون شرکت —")
-        company_label = st.selectbox("شرکت", list(comp_map.keys()), index=list(comp_map.keys()).index(comp_label))
-
         note_v = st.text_area("یادداشت", value=note or "")
         s1, s2, s3 = st.columns(3)
         with s1: status_v = st.selectbox("وضعیت", USER_STATUSES, index=USER_STATUSES.index(stt) if stt in USER_STATUSES else 0)
@@ -1201,7 +636,7 @@ def dlg_edit_user(user_id: int):
             ok, msg = update_user(
                 user_id,
                 first_name=first_name, last_name=last_name, full_name=f"{first_name} {last_name}".strip(),
-                phone=phone, role=role, company_id=comp_map[company_label], note=note_v,
+                phone=phone, role=role, company_id=company_id_val, note=note_v,
                 status=status_v, domain=dom_v, province=prov_v, level=level_v, owner_id=owner_map[owner_label]
             )
             if ok:
@@ -1247,17 +682,25 @@ def dlg_quick_followup(user_id: int):
 # ====================== دیالوگ‌ها: شرکت‌ها ======================
 @st.dialog("پروفایل شرکت")
 def dlg_company_view(company_id: int):
-    conn = get_conn()
-    c = conn.execute("""
-       SELECT id, name, COALESCE(phone,''), COALESCE(address,''), COALESCE(note,''),
-              COALESCE(level,''), COALESCE(status,''), created_at
-       FROM companies WHERE id=?;
-    """, (company_id,)).fetchone()
+    tab = st.radio("بخش", ["اطلاعات شرکت", "کاربران شرکت", "تماس‌ها", "پیگیری‌ها"],
+                   horizontal=True, label_visibility="collapsed", key=f"comp_tab_{company_id}")
+    limit_key = {"کاربران شرکت": f"comp_members_limit_{company_id}", "تماس‌ها": f"comp_calls_limit_{company_id}",
+                 "پیگیری‌ها": f"comp_fu_limit_{company_id}"}.get(tab)
+    jobs: Dict[str, tuple] = {"header": (profile_company_header, company_id)}
+    if tab == "کاربران شرکت":
+        jobs["tab"] = (df_company_members, company_id, _page_limit(limit_key))
+    elif tab == "تماس‌ها":
+        jobs["tab"] = (df_profile_calls, None, company_id, _page_limit(limit_key))
+    elif tab == "پیگیری‌ها":
+        jobs["tab"] = (df_profile_followups, None, company_id, _page_limit(limit_key))
+    with prof_phase("query"):
+        res = read_executor().gather(jobs, label="dlg_company_view")
+
+    c = res["header"]
     if not c:
-        conn.close(); st.warning("شرکت یافت نشد."); return
+        st.warning("شرکت یافت نشد."); return
 
-    tabs = st.tabs(["اطلاعات شرکت","کاربران شرکت","تماس‌ها","پیگیری‌ها"])
-    with tabs[0]:
+    if tab == "اطلاعات شرکت":
         st.write("**نام شرکت:**", c[1])
         st.write("**تلفن:**", c[2])
         st.write("**آدرس:**", c[3])
@@ -1265,61 +708,9 @@ def dlg_company_view(company_id: int):
         st.write("**سطح:**", c[5])
         st.write("**وضعیت:**", c[6])
         st.write("**تاریخ ایجاد:**", format_gregorian_with_weekday(c[7]))
-
-        experts = pd.read_sql_query("""
-            SELECT GROUP_CONCAT(x.username, '، ') AS experts
-            FROM (
-              SELECT DISTINCT au.username AS username
-              FROM users ux
-              LEFT JOIN app_users au ON au.id=ux.owner_id
-              WHERE ux.company_id=?
-                AND au.username IS NOT NULL
-            ) AS x;
-        """, conn, params=(company_id,))
-        ex = (experts.iloc[0]["experts"] or "").strip() if not experts.empty else ""
-        st.write("**کارشناسان فروش مرتبط:**", ex or "—")
-
-    with tabs[1]:
-        dusers = pd.read_sql_query("""
-          SELECT uu.id AS ID, uu.full_name AS نام_کامل, COALESCE(uu.phone,'') AS تلفن,
-                 COALESCE(uu.role,'') AS سمت, COALESCE(au.username,'') AS کارشناس_فروش
-          FROM users uu
-          LEFT JOIN app_users au ON au.id=uu.owner_id
-          WHERE uu.company_id=?
-          ORDER BY uu.full_name;
-        """, conn, params=(company_id,))
-        st.dataframe(dusers, use_container_width=True)
-
-    with tabs[2]:
-        dcalls = pd.read_sql_query("""
-          SELECT cl.id AS ID, u.full_name AS نام‌کاربر, cl.call_datetime AS تاریخ‌و‌زمان,
-                 cl.status AS وضعیت, COALESCE(cl.description,'') AS توضیحات,
-                 COALESCE(au.username,'') AS کارشناس‌فروش
-          FROM calls cl
-          JOIN users u ON u.id=cl.user_id
-          LEFT JOIN app_users au ON au.id=u.owner_id
-          WHERE u.company_id=?
-          ORDER BY cl.call_datetime DESC, cl.id DESC;
-        """, conn, params=(company_id,))
-        if "تاریخ‌و‌زمان" in dcalls.columns:
-            dcalls["تاریخ‌و‌زمان"] = dcalls["تاریخ‌و‌زمان"].apply(format_gregorian_with_weekday)
-        st.dataframe(dcalls, use_container_width=True)
-
-    with tabs[3]:
-        dfu = pd.read_sql_query("""
-          SELECT f.id AS ID, u.full_name AS نام‌کاربر, f.title AS عنوان,
-                 COALESCE(f.details,'') AS جزئیات, f.due_date AS تاریخ_پیگیری,
-                 f.status AS وضعیت, COALESCE(au.username,'') AS کارشناس‌فروش
-          FROM followups f
-          JOIN users u ON u.id=f.user_id
-          LEFT JOIN app_users au ON au.id=u.owner_id
-          WHERE u.company_id=?
-          ORDER BY f.due_date DESC, f.id DESC;
-        """, conn, params=(company_id,))
-        if "تاریخ_پیگیری" in dfu.columns:
-            dfu["تاریخ_پیگیری"] = dfu["تاریخ_پیگیری"].apply(format_date_only_with_weekday)
-        st.dataframe(dfu, use_container_width=True)
-    conn.close()
+        st.write("**کارشناسان فروش مرتبط:**", (c[8] or "").strip() or "—")
+    else:
+        _bounded_table(res["tab"], limit_key)
 
 @st.dialog("ویرایش شرکت")
 def dlg_company_edit(company_id: int):
@@ -1395,6 +786,33 @@ def dlg_company_quick_fu(company_id: int):
             create_followup(options[user_label], title, details, d, "در حال انجام", current_user_id())
             st.toast("پیگیری ثبت شد.", icon="✅")
 
+# ====================== دیالوگ‌ها: جزئیات تماس و پیگیری ======================
+@st.dialog("جزئیات تماس")
+def dlg_call_detail(call_id: int):
+    with prof_phase("query"):
+        r, _ = read_executor().submit(call_detail, call_id).result()
+    if not r:
+        st.warning("تماس یافت نشد.")
+        return
+    st.write("**کاربر:**", r[1]); st.write("**شرکت:**", r[2] or "—")
+    st.write("**تاریخ و زمان:**", dt_to_jalali_str(r[3])); st.write("**وضعیت:**", r[4])
+    st.write("**ثبت‌کننده:**", r[6] or "—")
+    st.markdown("**توضیحات:**")
+    st.text(r[5] or "—")
+
+@st.dialog("جزئیات پیگیری")
+def dlg_followup_detail(task_id: int):
+    with prof_phase("query"):
+        r, _ = read_executor().submit(followup_detail, task_id).result()
+    if not r:
+        st.warning("پیگیری یافت نشد.")
+        return
+    st.write("**کاربر:**", r[1]); st.write("**شرکت:**", r[2] or "—")
+    st.write("**عنوان:**", r[3]); st.write("**تاریخ پیگیری:**", plain_date_to_jalali_str(r[5]))
+    st.write("**وضعیت:**", r[6]); st.write("**ثبت‌کننده:**", r[7] or "—")
+    st.markdown("**جزئیات:**")
+    st.text(r[4] or "—")
+
 # ====================== دیالوگ‌های سفارشات ======================
 @st.dialog("ویرایش سفارش")
 def dlg_edit_order(order_id: int):
@@ -1411,49 +829,36 @@ def dlg_edit_order(order_id: int):
 
     user_id, company_id, product_id, order_date, status, total_amount = row
 
-    # لیست‌های مورد نیاز
-    users = list_users_basic(None)
-    companies = list_companies(None)
+    # فقط لیست محصولات کامل خوانده می‌شود؛ کاربر/شرکت با جستجوی تایپ‌شونده انتخاب می‌شوند
     products = list_products()
 
-    user_choices = {"— انتخاب کاربر —": None}
-    user_choices.update({f"{user[1]}": user[0] for user in users})
-
-    company_choices = {"— انتخاب شرکت —": None}
-    company_choices.update({f"{company[1]}": company[0] for company in companies})
-
     product_choices = {"— انتخاب محصول —": None}
     product_choices.update({f"{product[1]} ({product[2]})": product[0] for product in products})
 
+    # انتخاب نوع سفارش و کاربر/شرکت بیرون از فرم تا با تایپ، گزینه‌ها به‌روز شوند
+    order_type = st.radio("نوع سفارش", ["کاربر", "شرکت"], index=0 if company_id is None else 1,
+                          horizontal=True, key=f"eo_type_{order_id}")
+    if order_type == "کاربر":
+        user_id_val = user_picker("انتخاب کاربر", key=f"eo_user_{order_id}", selected_id=user_id)
+        company_id_val = None
+    else:
+        company_id_val = company_picker("انتخاب شرکت", key=f"eo_company_{order_id}", selected_id=company_id)
+        user_id_val = None
+
     with st.form(f"edit_order_{order_id}", clear_on_submit=False):
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            order_type = st.radio("نوع سفارش", ["کاربر", "شرکت"])
-            
-            if order_type == "کاربر":
-                selected_user = next((k for k, v in user_choices.items() if v == user_id), "— انتخاب کاربر —")
-                user_label = st.selectbox("انتخاب کاربر", list(user_choices.keys()), 
-                                        index=list(user_choices.keys()).index(selected_user) if selected_user in user_choices else 0)
-                user_id_val = user_choices[user_label]
-                company_id_val = None
-            else:
-                selected_company = next((k for k, v in company_choices.items() if v == company_id), "— انتخاب شرکت —")
-                company_label = st.selectbox("انتخاب شرکت", list(company_choices.keys()),
-                                           index=list(company_choices.keys()).index(selected_company) if selected_company in company_choices else 0)
-                company_id_val = company_choices[company_label]
-                user_id_val = None
+        # تبدیل تاریخ از رشته به datetime
+        try:
+            order_date_val = datetime.strptime(order_date, "%Y-%m-%d").date()
+        except:
+            order_date_val = datetime.today().date()
 
-        with col2:
-            # تبدیل تاریخ از رشته به datetime
-            try:
-                order_date_val = datetime.strptime(order_date, "%Y-%m-%d").date()
-            except:
-                order_date_val = datetime.today().date()
-                
+        col1, col2, col3 = st.columns(3)
+        with col1:
             order_date_v = st.date_input("تاریخ سفارش", order_date_val)
+        with col2:
             status_v = st.selectbox("وضعیت سفارش", ORDER_STATUSES, 
                                   index=ORDER_STATUSES.index(status) if status in ORDER_STATUSES else 0)
+        with col3:
             total_amount_v = st.number_input("مبلغ کل سفارش", min_value=0.0, step=1000.0, value=float(total_amount))
 
         # انتخاب محصول
@@ -1484,18 +889,46 @@ def dlg_edit_order(order_id: int):
                     st.error(msg)
 
 # ====================== صفحات ======================
+@profiled("query")
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_dashboard_metrics(today_iso: str, seq: int, owner_ids: Optional[Tuple[int, ...]] = None) -> Dict[str, int]:
+    """seq (سر فید change_log) جزو کلید کش است: هر نوشتنی، از هر پروسه‌ای، کش را باطل می‌کند."""
+    return dashboard_metrics(date.fromisoformat(today_iso), list(owner_ids) if owner_ids else None)
+
+def query_stats_ui():
+    qs = query_stats()
+    with st.expander("🐢 پایش کوئری‌ها (زمان، p95، کوئری‌های کند)", expanded=False):
+        c1, c2, c3 = st.columns([1, 1, 1])
+        enabled = c1.toggle("ثبت زمان همه کوئری‌ها", value=qs.enabled,
+                            help="وقتی خاموش است connectionها معمولی‌اند و هزینه‌ای ندارد.")
+        qs.slow_ms = c2.number_input("آستانه کوئری کند (ms)", min_value=0.0, value=float(qs.slow_ms), step=50.0)
+        if c3.button("پاک کردن آمار"):
+            qs.reset()
+        if enabled != qs.enabled:
+            qs.enabled = enabled
+            # connectionهای باز نخ‌ها با کارخانه جدید دوباره ساخته می‌شوند
+            read_executor().reset(); db_writer().reset()
+            st.rerun()
+        if not qs.enabled and not qs.by_shape:
+            st.caption("پایش خاموش است (یا با متغیر محیطی CRM_QUERY_PROFILING=1 از ابتدا روشن کنید).")
+            return
+        top = qs.top(20)
+        if top:
+            st.markdown("**پرهزینه‌ترین کوئری‌ها (مجموع زمان)**")
+            st.dataframe(pd.DataFrame(top), use_container_width=True, hide_index=True)
+        if qs.slow:
+            st.markdown(f"**کوئری‌های کندتر از {qs.slow_ms:,.0f}ms**")
+            for e in list(qs.slow)[::-1][:20]:
+                st.markdown(f"`{e['at']}` — **{e['ms']:,.1f}ms**، {e['rows']:,} ردیف — صفحه: {e['page'] or '-'} — {e['caller']}")
+                st.code(e["sql"] + ("\n-- plan:\n" + e["plan"] if e["plan"] else ""), language="sql")
+
 def page_dashboard():
     st.subheader("داشبورد")
-    conn = get_conn()
-    calls_today = conn.execute("SELECT COUNT(*) FROM calls WHERE date(call_datetime)=date('now');").fetchone()[0]
-    calls_success_today = conn.execute("SELECT COUNT(*) FROM calls WHERE date(call_datetime)=date('now') AND status='موفق';").fetchone()[0]
-    last7 = conn.execute("SELECT COUNT(*) FROM calls WHERE date(call_datetime) >= date('now','-7 day');").fetchone()[0]
-    overdue = conn.execute("SELECT COUNT(*) FROM followups WHERE status='در حال انجام' AND date(due_date) < date('now');").fetchone()[0]
-    total_companies = conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
-    total_users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-    total_orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
-    total_products = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
-    conn.close()
+    m = cached_dashboard_metrics(date.today().isoformat(), change_feed().head())
+    calls_today, calls_success_today = m["calls_today"], m["calls_success_today"]
+    last7, overdue = m["calls_last7"], m["overdue_followups"]
+    total_companies, total_users = m["total_companies"], m["total_users"]
+    total_orders, total_products = m["total_orders"], m["total_products"]
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("تماس‌های امروز", calls_today)
     c2.metric("موفقِ امروز", calls_success_today)
@@ -1507,8 +940,27 @@ def page_dashboard():
     c7.metric("تعداد سفارشات", total_orders)
     c8.metric("تعداد محصولات", total_products)
 
+    if is_admin():
+        ex = read_executor()
+        tot = ex.totals
+        with st.expander("⏱ آمار خواندن موازی و صف نوشتن", expanded=False):
+            st.caption(f"دسته‌ها: {tot['batches']:,} — کوئری‌ها: {tot['queries']:,} — "
+                       f"زمان دیواری: {tot['wall_ms']:,.1f}ms — مجموع سریالی: {tot['serial_ms']:,.1f}ms — "
+                       f"صرفه‌جویی: {tot['serial_ms'] - tot['wall_ms']:,.1f}ms")
+            if ex.recent:
+                st.dataframe(pd.DataFrame(list(ex.recent)[::-1]), use_container_width=True, hide_index=True)
+            w = db_writer().snapshot()
+            st.caption(f"صف نوشتن — عمق فعلی: {w['queue_depth']} (بیشینه {w['max_queue_depth']}) — "
+                       f"کارها: {w['jobs']:,} در {w['batches']:,} تراکنش (میانگین {w['avg_batch_size']}) — "
+                       f"انتظار قفل: میانگین {w['avg_lock_wait_ms']}ms، بیشینه {w['lock_wait_ms_max']:.1f}ms — "
+                       f"p95 تأخیر: {w['p95_latency_ms']}ms — خطا: {w['errors']} (قفل: {w['busy_errors']})")
+        query_stats_ui()
+
     st.divider()
-    db_download_ui(DB_PATH)
+    db_download_ui()
+    if is_admin():
+        archive_ui()
+        maintenance_ui()
 
 def page_companies():
     st.subheader("ثبت و مدیریت شرکت‌ها")
@@ -1552,8 +1004,13 @@ def page_companies():
     created_to   = jalali_str_to_date(to_j) if to_j else None
     has_open = None if has_open_opt == "— مهم نیست —" else (True if has_open_opt == "بله" else False)
 
-    dfc = df_companies_advanced(q_name, f_status, f_level, created_from, created_to, has_open,
-                                owner_ids_filter if owner_ids_filter else None, only_owner)
+    owner_ids = owner_ids_filter if owner_ids_filter else None
+    dfc = live_grid(
+        "companies",
+        (q_name, tuple(f_status), tuple(f_level), created_from, created_to, has_open, tuple(owner_ids or ()), only_owner),
+        lambda ids: df_companies_advanced(q_name, f_status, f_level, created_from, created_to, has_open,
+                                          owner_ids, only_owner, only_ids=ids))
+    live_refresh_poller("companies")
 
     # --- جدول با ستون‌های اقدام ---
     if not dfc.empty:
@@ -1609,23 +1066,19 @@ def page_users():
     preselect = [only_owner] if only_owner else []
     owner_ids_filter = sales_filter_widget(disabled=not is_admin(), preselected_ids=preselect, key="sf_users")
 
-    companies = list_companies(only_owner)
-    company_options = {"— بدون شرکت —": None}
-    for cid, cname in companies:
-        company_options[cname] = cid
     owners = list_sales_accounts_including_admins()
     owner_map = {"— بدون کارشناس —": None}
     for i, u, r in owners:
         owner_map[f"{u} ({r})"] = i
 
     with st.expander("➕ افزودن کاربر (رابط)", expanded=False):
+        new_company_id = company_picker("شرکت", key="new_user_company", none_label="— بدون شرکت —")
         with st.form("user_form", clear_on_submit=True):
             c1, c2, c3 = st.columns(3)
             first_name = c1.text_input("نام *")
             last_name  = c2.text_input("نام خانوادگی *")
             phone      = c3.text_input("تلفن (یکتا) *")
             role = st.text_input("سمت/نقش")
-            company_label = st.selectbox("شرکت", list(company_options.keys()))
             row1, row2, row3 = st.columns(3)
             user_status = row1.selectbox("وضعیت کاربر", USER_STATUSES, index=0)
             level = row2.selectbox("سطح کاربر", LEVELS, index=0)
@@ -1640,7 +1093,7 @@ def page_users():
                     st.warning("نام، نام‌خانوادگی و تلفن اجباری هستند.")
                 else:
                     ok, msg = create_user(first_name, last_name, phone, role,
-                                          company_options[company_label], note,
+                                          new_company_id, note,
                                           user_status, domain, province, level,
                                           owner_map[owner_label], current_user_id())
                     if ok:
@@ -1653,20 +1106,10 @@ def page_users():
     with st.expander("📥 ایمپورت اکسل مخاطبین", expanded=False):
         st.caption("ستون‌های الزامی: FirstName, LastName, Phone — ستون‌های اختیاری: Role, Company, Status, Level, Domain, Province, OwnerUsername, Note")
 
-        tpl = pd.DataFrame([{
-            "FirstName":"علی","LastName":"محمدی","Phone":"09120000000","Role":"مدیر خرید",
-            "Company":"شرکت نمونه","Status":"بدون وضعیت","Level":"هیچکدام",
-            "Domain":"صنعتی","Province":"تهران","OwnerUsername":"admin","Note":""
-        }])
-        sample = io.BytesIO()
-        try:
-            tpl.to_excel(sample, index=False, engine="openpyxl")
-        except Exception:
-            sample = io.BytesIO(b"")
-        else:
-            sample.seek(0)
-
-        st.download_button("دانلود الگوی اکسل", data=sample.getvalue(), file_name="contacts_template.xlsx", disabled=(sample.getbuffer().nbytes==0))
+        # الگو فقط با کلیک ساخته می‌شود (openpyxl و pandas در هر رندر صفحه بارگذاری نمی‌شوند)
+        deferred_download_button("دانلود الگوی اکسل", import_template_xlsx, "contacts_template.xlsx",
+                                 XLSX_MIME, key="dl_import_template",
+                                 disabled=importlib.util.find_spec("openpyxl") is None)
 
         up = st.file_uploader("فایل اکسل (xlsx)", type=["xlsx"])
         if up is not None:
@@ -1688,47 +1131,7 @@ def page_users():
                     st.warning("ستون‌های الزامی FirstName, LastName, Phone باید موجود باشند.")
                 else:
                     if st.button("شروع ایمپورت", use_container_width=True):
-                        ok_cnt, skip_cnt = 0, 0
-                        msgs: List[str] = []
-                        for idx, row in df_imp.iterrows():
-                            def getv(key):
-                                cc = col(key)
-                                if cc is None: return ""
-                                v = row.get(cc)
-                                return "" if (pd.isna(v) or v is None) else str(v).strip()
-
-                            first_name = getv("FirstName")
-                            last_name  = getv("LastName")
-                            phone      = getv("Phone")
-                            if not first_name or not last_name or not phone:
-                                skip_cnt += 1; msgs.append(f"رد شد ردیف {idx+2}: فیلد الزامی خالی.")
-                                continue
-
-                            job_role   = getv("Role")
-                            company_n  = getv("Company")
-                            status_v   = getv("Status")
-                            level_v    = getv("Level")
-                            domain_v   = getv("Domain")
-                            province_v = getv("Province")
-                            owner_u    = getv("OwnerUsername")
-                            note_v     = getv("Note")
-
-                            status_v = status_v if status_v in USER_STATUSES else "بدون وضعیت"
-                            level_v  = level_v  if level_v  in LEVELS        else "هیچکدام"
-
-                            company_id = get_or_create_company(company_n, current_user_id()) if company_n else None
-                            owner_id   = get_app_user_id_by_username(owner_u) if owner_u else None
-
-                            ok, msg = create_user(
-                                first_name, last_name, phone, job_role, company_id, note_v,
-                                status_v, domain_v, province_v, level_v, owner_id, current_user_id()
-                            )
-                            if ok:
-                                ok_cnt += 1
-                            else:
-                                skip_cnt += 1
-                                msgs.append(f"ردیف {idx+2}: {msg}")
-
+                        ok_cnt, skip_cnt, msgs = import_contacts_df(df_imp, current_user_id())
                         st.success(f"ایمپورت پایان یافت. ✅ موفق: {ok_cnt} | ❌ ناموفق: {skip_cnt}")
                         if msgs:
                             with st.expander("جزئیات موارد ناموفق"):
@@ -1758,24 +1161,19 @@ def page_users():
     last_call_to   = jalali_str_to_date(last_call_to_j) if last_call_to_j else None
     has_open = None if has_open_opt == "— مهم نیست —" else (True if has_open_opt == "بله" else False)
 
-    df_all = df_users_advanced(first_q, last_q, domain_q, created_from, created_to, has_open,
-                               last_call_from, last_call_to, h_stat,
-                               owner_ids_filter if owner_ids_filter else None,
-                               only_owner)
+    owner_ids = owner_ids_filter if owner_ids_filter else None
+    df_all = live_grid(
+        "users",
+        (first_q, last_q, domain_q, created_from, created_to, has_open, last_call_from, last_call_to,
+         tuple(h_stat), tuple(owner_ids or ()), only_owner),
+        lambda ids: df_users_advanced(first_q, last_q, domain_q, created_from, created_to, has_open,
+                                      last_call_from, last_call_to, h_stat, owner_ids, only_owner, only_ids=ids))
+    live_refresh_poller("users")
 
-    # نگاشت user_id برای هر نام کامل
-    conn = get_conn()
-    id_map = pd.read_sql_query("SELECT id, full_name FROM users;", conn)
-    conn.close()
-    name_to_id = dict(zip(id_map["full_name"], id_map["id"]))
-    df_all["user_id"] = df_all["نام_کامل"].map(name_to_id)
-
-    # ✅ (5) ستون‌های «تاریخ_ایجاد» و «حوزه_فعالیت» نمایش داده نشوند
-    # ✅ (3) ستون «پیگیری_باز_دارد» به‌صورت «ندارد / تاریخ آخرین پیگیری باز» نمایش داده شود
-    show_cols = ["نام","نام_خانوادگی","شرکت","تلفن","وضعیت_کاربر","سطح_کاربر","آخرین_تماس","استان","وضعیت_پیگیری_باز","کارشناس_فروش"]
-    show_cols = [c for c in show_cols if c in df_all.columns]
-
-    base = df_all[show_cols + ["user_id"]].copy()
+    # ستون‌ها از USERS_GRID می‌آیند؛ شناسه هر ردیف همان ستون ID است (نه نگاشت از روی نام کامل)
+    show_cols = [c for c in USERS_GRID if c not in ("ID", "_created_at")]
+    base = df_all[show_cols].copy()
+    base["user_id"] = df_all["ID"]
 
     # 👇 ستون‌های انتخاب/اکشن
     base["✅ انتخاب"] = False
@@ -1876,23 +1274,38 @@ def page_calls():
     preselect = [only_owner] if only_owner else []
     owner_ids_filter = sales_filter_widget(disabled=not is_admin(), preselected_ids=preselect, key="sf_calls")
 
-    users = list_users_basic(only_owner)
-    user_map = {f"{u[1]} (ID {u[0]})": u[0] for u in users}
-    if users:
-        with st.expander("➕ افزودن تماس", expanded=False):
-            with st.form("call_form", clear_on_submit=True):
-                user_label = st.selectbox("کاربر *", list(user_map.keys()))
-                j_date = st.text_input("تاریخ تماس (شمسی YYYY/MM/DD) *", value=today_jalali_str())
-                t = st.time_input("زمان تماس *", datetime.now().time().replace(second=0, microsecond=0))
-                status = st.selectbox("وضعیت تماس *", CALL_STATUSES)
-                desc = st.text_area("توضیحات")
-                if st.form_submit_button("ثبت تماس"):
-                    d = jalali_str_to_date(j_date)
-                    if not d:
-                        st.warning("فرمت تاریخ صحیح نیست.")
-                    else:
-                        create_call(user_map[user_label], datetime.combine(d, t), status, desc, current_user_id())
-                        st.toast("تماس ثبت شد.", icon="✅")
+    with st.expander("➕ افزودن تماس", expanded=False):
+        call_user_id = user_picker("کاربر *", key="call_form_user", only_owner=only_owner)
+        with st.form("call_form", clear_on_submit=True):
+            j_date = st.text_input("تاریخ تماس (شمسی YYYY/MM/DD) *", value=today_jalali_str())
+            t = st.time_input("زمان تماس *", datetime.now().time().replace(second=0, microsecond=0))
+            status = st.selectbox("وضعیت تماس *", CALL_STATUSES)
+            desc = st.text_area("توضیحات")
+            if st.form_submit_button("ثبت تماس"):
+                d = jalali_str_to_date(j_date)
+                if not call_user_id:
+                    st.warning("ابتدا کاربر را انتخاب کن.")
+                elif not d:
+                    st.warning("فرمت تاریخ صحیح نیست.")
+                else:
+                    create_call(call_user_id, datetime.combine(d, t), status, desc, current_user_id())
+                    st.toast("تماس ثبت شد.", icon="✅")
+    if is_admin():
+        with st.expander("📞 ایمپورت CDR مرکز تلفن", expanded=False):
+            st.caption("فایل CSV ریز تماس‌ها (Master.csv خام یا با سرستون calldate, src, dst, billsec, disposition). "
+                       "تماس‌ها با شماره به مخاطب وصل و به نام کارشناس مالک ثبت می‌شوند؛ "
+                       "تماس تکراری (همان مخاطب در همان دقیقه) دوباره ثبت نمی‌شود.")
+            up = st.file_uploader("فایل CDR (csv)", type=["csv", "txt"], key="cdr_upload")
+            if up is not None and st.button("شروع ایمپورت CDR", use_container_width=True):
+                try:
+                    rep = import_cdr(up, current_user_id())
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.success(f"ایمپورت پایان یافت. ✅ ثبت‌شده: {rep['inserted']} | ♻️ تکراری: {rep['duplicates']} | "
+                               f"❔ بدون مخاطب: {rep['unmatched']} | ❌ نامعتبر: {rep['invalid']}")
+                    for m in rep["msgs"]:
+                        st.write("•", m)
     c1, c2, c3, c4 = st.columns(4)
     name_q = c1.text_input("جستجو نام/شرکت")
     st_statuses = c2.multiselect("وضعیت", CALL_STATUSES, default=[])
@@ -1902,7 +1315,16 @@ def page_calls():
     end_date   = jalali_str_to_date(end_j) if end_j else None
     df = df_calls_by_filters(name_q, st_statuses, start_date, end_date,
                              owner_ids_filter if owner_ids_filter else None, only_owner)
-    st.dataframe(df, use_container_width=True)
+    archive_caption("calls", start_date)
+    st.caption("برای دیدن متن کامل توضیحات، ردیف را انتخاب کن.")
+    event = st.dataframe(df, use_container_width=True, on_select="rerun", selection_mode="single-row",
+                         key="calls_grid_widget")
+    # دیالوگ فقط وقتی انتخاب عوض شده باز می‌شود (نه در هر rerun بعدی)
+    rows = event.selection.rows if event else []
+    sel = int(df.iloc[rows[0]]["ID"]) if rows else None
+    if sel is not None and sel != st.session_state.get("calls_grid_prev"):
+        dlg_call_detail(sel)
+    st.session_state["calls_grid_prev"] = sel
 
 def page_followups():
     only_owner = None if is_admin() else current_user_id()
@@ -1911,25 +1333,24 @@ def page_followups():
     preselect = [only_owner] if only_owner else []
     owner_ids_filter = sales_filter_widget(disabled=not is_admin(), preselected_ids=preselect, key="sf_followups")
 
-    users = list_users_basic(only_owner)
-    user_map = {f"{u[1]} (ID {u[0]})": u[0] for u in users}
-    if users:
-        with st.expander("➕ افزودن پیگیری", expanded=False):
-            with st.form("fu_form", clear_on_submit=True):
-                user_label = st.selectbox("کاربر *", list(user_map.keys()))
-                title = st.text_input("عنوان *")
-                details = st.text_area("جزئیات")
-                j_due = st.text_input("تاریخ پیگیری (شمسی YYYY/MM/DD) *", value=today_jalali_str())
-                if st.form_submit_button("ثبت پیگیری"):
-                    if not title.strip():
-                        st.warning("عنوان اجباری است.")
+    with st.expander("➕ افزودن پیگیری", expanded=False):
+        fu_user_id = user_picker("کاربر *", key="fu_form_user", only_owner=only_owner)
+        with st.form("fu_form", clear_on_submit=True):
+            title = st.text_input("عنوان *")
+            details = st.text_area("جزئیات")
+            j_due = st.text_input("تاریخ پیگیری (شمسی YYYY/MM/DD) *", value=today_jalali_str())
+            if st.form_submit_button("ثبت پیگیری"):
+                if not fu_user_id:
+                    st.warning("ابتدا کاربر را انتخاب کن.")
+                elif not title.strip():
+                    st.warning("عنوان اجباری است.")
+                else:
+                    d = jalali_str_to_date(j_due)
+                    if not d:
+                        st.warning("فرمت تاریخ صحیح نیست.")
                     else:
-                        d = jalali_str_to_date(j_due)
-                        if not d:
-                            st.warning("فرمت تاریخ صحیح نیست.")
-                        else:
-                            create_followup(user_map[user_label], title, details, d, "در حال انجام", current_user_id())
-                            st.toast("پیگیری ثبت شد.", icon="✅")
+                        create_followup(fu_user_id, title, details, d, "در حال انجام", current_user_id())
+                        st.toast("پیگیری ثبت شد.", icon="✅")
     c1, c2, c3, c4 = st.columns(4)
     name_q = c1.text_input("جستجو نام/شرکت", key="fu_q")
     st_statuses = c2.multiselect("وضعیت", TASK_STATUSES, default=[], key="fu_st")
@@ -1939,12 +1360,15 @@ def page_followups():
     end_date   = jalali_str_to_date(end_j) if end_j else None
     df = df_followups_by_filters(name_q, st_statuses, start_date, end_date,
                                  owner_ids_filter if owner_ids_filter else None, only_owner)
+    archive_caption("followups", start_date)
 
     # ✅ (4) امکان تغییر وضعیت پیگیری از داخل جدول
     # نسخه «قبل از ویرایش» را نگه می‌داریم تا تغییرات را تشخیص دهیم
     original_df = df.copy()
+    df["🔎 جزئیات"] = False
     colcfg = {
-        "وضعیت": st.column_config.SelectboxColumn("وضعیت", options=TASK_STATUSES, required=True, help="برای تغییر وضعیت کلیک کنید")
+        "وضعیت": st.column_config.SelectboxColumn("وضعیت", options=TASK_STATUSES, required=True, help="برای تغییر وضعیت کلیک کنید"),
+        "🔎 جزئیات": st.column_config.CheckboxColumn("جزئیات", help="نمایش متن کامل پیگیری", width="small"),
     }
     edited_df = st.data_editor(
         df, use_container_width=True, key="followups_editor_widget",
@@ -1952,11 +1376,19 @@ def page_followups():
         hide_index=True
     )
 
+    # متن کامل جزئیات فقط با تیک «جزئیات» خوانده می‌شود (جدول فقط پیش‌نمایش دارد)
+    prev_detail = st.session_state.get("followups_detail_prev", set())
+    curr_detail = set(edited_df.loc[edited_df["🔎 جزئیات"] == True, "ID"].astype(int))
+    for tid in curr_detail - prev_detail:
+        dlg_followup_detail(tid)
+        break
+    st.session_state["followups_detail_prev"] = curr_detail
+
     # اعمال تغییر وضعیت‌ها
     try:
         if "ID" in edited_df.columns and "وضعیت" in edited_df.columns:
             merged = edited_df[["ID","وضعیت"]].merge(original_df[["ID","وضعیت"]], on="ID", suffixes=("_new","_old"))
-            changed = merged[merged["وضعیت_new"] != merged["وضعیت_old"]]
+            changed = merged[merged["وضعیت_new"].astype(str) != merged["وضعیت_old"].astype(str)]
             any_change = False
             for _, row in changed.iterrows():
                 update_followup_status(int(row["ID"]), str(row["وضعیت_new"]))
@@ -1970,6 +1402,8 @@ def page_followups():
 def page_orders():
     """صفحه سفارشات"""
     st.subheader("🛒 مدیریت سفارشات")
+    # لیست محصولات (برای فرم و فیلتر) در پس‌زمینه خوانده می‌شود، هم‌زمان با جستجوهای انتخابگرها
+    products_future = read_executor().submit(list_products)
 
     # --- افزودن سفارش جدید ---
     with st.expander("➕ افزودن سفارش جدید", expanded=False):
@@ -1979,18 +1413,10 @@ def page_orders():
             order_type = st.radio("نوع سفارش", ["کاربر", "شرکت"])
             
             if order_type == "کاربر":
-                users = list_users_basic(None)
-                user_choices = {"— انتخاب کاربر —": None}
-                user_choices.update({f"{user[1]}": user[0] for user in users})
-                selected_user = st.selectbox("انتخاب کاربر", list(user_choices.keys()))
-                user_id = user_choices[selected_user]
+                user_id = user_picker("انتخاب کاربر", key="new_order_user")
                 company_id = None
             else:
-                companies = list_companies(None)
-                company_choices = {"— انتخاب شرکت —": None}
-                company_choices.update({f"{company[1]}": company[0] for company in companies})
-                selected_company = st.selectbox("انتخاب شرکت", list(company_choices.keys()))
-                company_id = company_choices[selected_company]
+                company_id = company_picker("انتخاب شرکت", key="new_order_company")
                 user_id = None
 
         with col2:
@@ -1999,7 +1425,8 @@ def page_orders():
             total_amount = st.number_input("مبلغ کل سفارش", min_value=0.0, step=1000.0, value=0.0)
 
         # انتخاب محصول
-        products = list_products()
+        with prof_phase("query"):
+            products, _ = products_future.result()
         product_choices = {"— انتخاب محصول —": None}
         product_choices.update({f"{product[1]} ({product[2]})": product[0] for product in products})
         selected_product = st.selectbox("انتخاب محصول", list(product_choices.keys()))
@@ -2021,19 +1448,12 @@ def page_orders():
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        users = list_users_basic(None)
-        user_filter_choices = {"همه": None}
-        user_filter_choices.update({f"{user[1]}": user[0] for user in users})
-        filter_user = st.selectbox("فیلتر بر اساس کاربر", list(user_filter_choices.keys()))
+        filter_user_id = user_picker("فیلتر بر اساس کاربر", key="orders_filter_user", none_label="همه")
     
     with col2:
-        companies = list_companies(None)
-        company_filter_choices = {"همه": None}
-        company_filter_choices.update({f"{company[1]}": company[0] for company in companies})
-        filter_company = st.selectbox("فیلتر بر اساس شرکت", list(company_filter_choices.keys()))
+        filter_company_id = company_picker("فیلتر بر اساس شرکت", key="orders_filter_company", none_label="همه")
     
     with col3:
-        products = list_products()
         product_filter_choices = {"همه": None}
         product_filter_choices.update({f"{product[1]} ({product[2]})": product[0] for product in products})
         filter_product = st.selectbox("فیلتر بر اساس محصول", list(product_filter_choices.keys()))
@@ -2043,8 +1463,8 @@ def page_orders():
 
     # نمایش سفارشات
     df_orders = df_orders_by_filters(
-        user_filter=user_filter_choices[filter_user],
-        company_filter=company_filter_choices[filter_company],
+        user_filter=filter_user_id,
+        company_filter=filter_company_id,
         product_filter=product_filter_choices[filter_product],
         status_filter=filter_status if filter_status != "همه" else None
     )
@@ -2059,7 +1479,7 @@ def page_orders():
         
         colcfg = {
             "✏ ویرایش": st.column_config.CheckboxColumn("ویرایش", help="ویرایش سفارش", width="small"),
-            "مبلغ_کل": st.column_config.TextColumn("مبلغ کل", help="مبلغ سفارش با جداکننده هزارگان"),
+            "مبلغ_کل": st.column_config.NumberColumn("مبلغ کل", help="مبلغ سفارش با جداکننده هزارگان", format="localized"),
         }
         
         edited = st.data_editor(
@@ -2170,28 +1590,202 @@ def page_access():
     if not is_admin():
         st.info("این بخش فقط برای مدیر در دسترس است.")
         return
-    all_users = list_users_basic(None)
-    map_users = {"— بدون لینک —": None}
-    for u in all_users:
-        map_users[f"{u[1]} (ID {u[0]})"] = u[0]
     with st.expander("➕ ایجاد کاربر ورود", expanded=False):
+        linked_user_id = user_picker("لینک به کدام 'کاربر (رابط)'؟", key="new_app_user_link", none_label="— بدون لینک —")
         with st.form("new_app_user", clear_on_submit=True):
             username = st.text_input("نام کاربری *")
             password = st.text_input("رمز عبور *", type="password")
             role_sel = st.selectbox("نقش *", ["agent","admin"], index=0)
-            link_label = st.selectbox("لینک به کدام 'کاربر (رابط)'؟", list(map_users.keys()))
             if st.form_submit_button("ایجاد"):
                 if not username or not password:
                     st.warning("نام کاربری و رمز عبور اجباری است.")
                 else:
                     try:
-                        conn = get_conn()
-                        conn.execute("INSERT INTO app_users (username,password_sha256,role,linked_user_id) VALUES (?,?,?,?);",
-                                     ((username or "").strip(), sha256(password), role_sel, map_users[link_label]))
-                        conn.commit(); conn.close(); st.toast("کاربر ایجاد شد.", icon="✅"); st.rerun()
+                        run_write(lambda conn: conn.execute(
+                            "INSERT INTO app_users (username,password_sha256,role,linked_user_id) VALUES (?,?,?,?);",
+                            ((username or "").strip(), sha256(password), role_sel, linked_user_id)).lastrowid)
+                        st.toast("کاربر ایجاد شد.", icon="✅"); st.rerun()
                     except sqlite3.IntegrityError:
                         st.error("این نام کاربری قبلاً وجود دارد.")
 
+LEADERBOARD_PERIODS = {"هفتگی": ("week", 12), "ماهانه": ("month", 12)}
+LEADERBOARD_TREND_COLUMNS = ["فروش", "تماس", "تماس_در_روز", "نرخ_موفقیت٪", "به‌موقع٪", "پیگیری_عقب‌افتاده",
+                             "مشتری_شده", "سفارش"]
+
+@profiled("query")
+@st.cache_data(ttl=300, show_spinner=False, max_entries=16)
+def cached_agent_performance(today_iso: str, seq: int, period: str, n_periods: int) -> pd.DataFrame:
+    """seq (سر فید change_log) جزو کلید کش است: هر نوشتنی، از هر پروسه‌ای، کش را باطل می‌کند."""
+    today = date.fromisoformat(today_iso)
+    days = (7 if period == "week" else 31) * n_periods
+    perf = agent_performance(agent_daily_stats(today - timedelta(days=days), today), today, period)
+    return perf[perf["period"].isin(period_labels(perf)[:n_periods])]
+
+def page_leaderboard():
+    if not is_admin():
+        st.info("این بخش فقط برای مدیر در دسترس است.")
+        return
+    st.subheader("🏆 عملکرد کارشناسان")
+    c1, c2 = st.columns([1, 2])
+    period, n_periods = LEADERBOARD_PERIODS[c1.radio("دوره", list(LEADERBOARD_PERIODS), horizontal=True,
+                                                     key="lb_period")]
+    perf = cached_agent_performance(date.today().isoformat(), change_feed().head(), period, n_periods)
+    labels = period_labels(perf)
+    all_label = f"همه {len(labels)} دوره اخیر"
+    sel = c2.selectbox("بازه جدول", [all_label] + labels, key=f"lb_sel_{period}")
+    accounts = {i: u for i, u, _ in list_sales_accounts_including_admins()}
+    st.dataframe(leaderboard(perf, None if sel == all_label else [sel], accounts), use_container_width=True,
+                 column_config={"فروش": st.column_config.NumberColumn(format="localized")})
+    st.caption("فروش = جمع مبلغ سفارش‌های تأییدشده و به کارشناس فعلی مخاطب تعلق دارد؛ تماس و پیگیری به ثبت‌کننده. "
+               "روز_فعال = روزهای دارای تماس. به‌موقع٪ فقط پیگیری‌هایی که زمان بستنشان ثبت شده را می‌شمارد.")
+    col = st.selectbox("روند", LEADERBOARD_TREND_COLUMNS, key="lb_trend")
+    trend = agent_trend(perf, col, accounts)
+    st.line_chart(trend.sort_index())
+    st.dataframe(trend, use_container_width=True)
+
+REVENUE_RANGES = {"۶ ماه": 6, "۱۲ ماه": 12, "۲۴ ماه": 24}
+REVENUE_DIM_LABELS = {v: k for k, v in REVENUE_DIMENSIONS.items()}
+
+@profiled("query")
+@st.cache_data(ttl=300, show_spinner=False, max_entries=8)
+def cached_order_cube(today_iso: str, seq: int, n_months: int) -> pd.DataFrame:
+    """seq (سر فید change_log) جزو کلید کش است: هر نوشتنی، از هر پروسه‌ای، کش را باطل می‌کند."""
+    today = date.fromisoformat(today_iso)
+    cube = order_cube(today - timedelta(days=31 * n_months), today)
+    return cube[cube["month"].isin(sorted(cube["month"].unique())[-n_months:])]
+
+def page_revenue():
+    if not is_admin():
+        st.info("این بخش فقط برای مدیر در دسترس است.")
+        return
+    st.subheader("💰 تحلیل فروش سفارش‌ها")
+    c1, c2, c3 = st.columns([1, 2, 2])
+    n_months = REVENUE_RANGES[c1.selectbox("بازه", list(REVENUE_RANGES), index=1, key="rev_range")]
+    statuses = c2.multiselect("وضعیت سفارش", ORDER_STATUSES, default=[ORDER_STATUSES[1]], key="rev_statuses")
+    cube = cached_order_cube(date.today().isoformat(), change_feed().head(), n_months)
+    if cube.empty:
+        st.info("هیچ سفارشی در این بازه ثبت نشده است.")
+        return
+    months = c3.multiselect("ماه (شمسی)", sorted(cube["month"].unique(), reverse=True), key="rev_months")
+
+    tot = revenue_totals(cube, statuses, months)
+    m1, m2, m3 = st.columns(3)
+    m1.metric("جمع فروش", f"{tot['revenue']:,.0f}")
+    m2.metric("تعداد سفارش", f"{tot['orders']:,}")
+    m3.metric("میانگین هر سفارش", f"{tot['avg']:,.0f}")
+
+    dim = REVENUE_DIM_LABELS[st.radio("به تفکیک", list(REVENUE_DIM_LABELS), horizontal=True, key="rev_dim")]
+    money = {c: st.column_config.NumberColumn(format="localized") for c in ("فروش", "میانگین_سفارش")}
+    st.dataframe(revenue_breakdown(cube, dim, statuses, months), use_container_width=True, column_config=money)
+
+    st.markdown(f"**روند ماهانه فروش به تفکیک {REVENUE_DIMENSIONS[dim]}** (پرفروش‌ترین‌ها؛ بقیه در «سایر»)")
+    trend = revenue_trend(cube, dim, statuses)
+    st.line_chart(trend)
+    with st.expander("جدول روند"):
+        st.dataframe(revenue_trend(cube, None, statuses).join(trend), use_container_width=True)
+    st.caption("از جدول تجمیعی order_stats (به‌روزرسانی با هر ثبت/ویرایش سفارش)؛ کارشناس = کارشناس فعلی مخاطب سفارش.")
+
+FUNNEL_ENTITIES = {"مخاطبین": "users", "شرکت‌ها": "companies", "سفارشات": "orders"}
+
+@profiled("query")
+@st.cache_data(ttl=86400, show_spinner=False, max_entries=8)
+def cached_funnel_data(today_iso: str, entity: str) -> Dict[str, pd.DataFrame]:
+    """کش روزانه (today_iso جزو کلید است)؛ گزارش روند است و تغییرات لحظه‌ای لازم ندارد."""
+    return funnel_data(entity)
+
+def page_funnel():
+    if not is_admin():
+        st.info("این بخش فقط برای مدیر در دسترس است.")
+        return
+    st.subheader("📉 قیف فروش و سرعت مراحل")
+    c1, c2 = st.columns([3, 1])
+    entity = FUNNEL_ENTITIES[c1.radio("موجودیت", list(FUNNEL_ENTITIES), horizontal=True, key="funnel_entity")]
+    if c2.button("🔄 محاسبه دوباره"):
+        cached_funnel_data.clear()
+    with st.spinner("در حال محاسبه قیف..."):
+        data = cached_funnel_data(date.today().isoformat(), entity)
+    st.caption("از تاریخچه تغییر وضعیت‌ها؛ رکوردهای قبل از فعال شدن تاریخچه فقط با وضعیت فعلی‌شان وارد شده‌اند. "
+               "روزی یک بار محاسبه می‌شود. کارشناس شرکت‌ها = ایجادکننده شرکت.")
+    c1, c2 = st.columns(2)
+    with c1:
+        owner_ids = sales_filter_widget(False, [], key="funnel_owners")
+    months = c2.multiselect("ماه ورود (شمسی)", sorted(set(data["reached"]["cohort_month"]), reverse=True),
+                            key=f"funnel_months_{entity}")
+    names = {i: u for i, u, _ in list_sales_accounts_including_admins()}
+    rep = funnel_report(entity, data, owner_ids or None, months or None, names)
+    if rep["stages"].empty:
+        st.info("داده‌ای برای این فیلترها نیست.")
+        return
+    st.markdown("**مراحل** (ورود، ماندگار، خروج و میانگین روز ماندن تا خروج)")
+    st.dataframe(rep["stages"], use_container_width=True)
+    st.markdown("**درصد تبدیل** (سطر: مرحله فعلی، ستون: مرحله بعدی)")
+    st.dataframe(rep["conversion"], use_container_width=True)
+    st.markdown("**درصد رسیدن به هر مرحله به تفکیک کارشناس** (ورودی = رکوردهای ثبت‌شده به نام او)")
+    st.dataframe(rep["by_agent"], use_container_width=True)
+    st.markdown("**درصد رسیدن به هر مرحله به تفکیک ماه ورود**")
+    st.dataframe(rep["by_month"], use_container_width=True)
+
+DEDUPE_KINDS = {
+    "مخاطبین": ("contacts", find_duplicate_contacts, df_duplicate_contacts, merge_contacts),
+    "شرکت‌ها": ("companies", find_duplicate_companies, df_duplicate_companies, merge_companies),
+}
+DEDUPE_REASONS = {"phone": "شماره", "name": "نام"}
+
+def page_duplicates():
+    if not is_admin():
+        st.info("این بخش فقط برای مدیر در دسترس است.")
+        return
+    st.subheader("🧬 مخاطبین و شرکت‌های تکراری")
+    kind_label = st.radio("نوع", list(DEDUPE_KINDS), horizontal=True, key="dedupe_kind")
+    kind, finder, details, merge = DEDUPE_KINDS[kind_label]
+    st.caption("تکراری: شماره یکسان (با هر قالبی) یا نام مشابه (ي/ك عربی، نیم‌فاصله، «شرکت» و ... نادیده گرفته می‌شوند)؛ "
+               "مخاطبان با نام مشابه فقط وقتی در یک شرکت باشند. در ادغام، تماس‌ها، پیگیری‌ها، سفارش‌ها و مخاطبان شرکت "
+               "به رکورد ماندنی منتقل و بقیه حذف می‌شوند.")
+    if st.button("🔍 جست‌وجوی تکراری‌ها"):
+        with st.spinner("در حال جست‌وجو..."):
+            st.session_state["dedupe"] = {"kind": kind, "clusters": finder()}
+    found = st.session_state.get("dedupe")
+    if not found or found["kind"] != kind:
+        return
+    clusters = found["clusters"]
+    if not clusters:
+        st.success("تکراری پیدا نشد.")
+        return
+    st.write(f"**{len(clusters)}** خوشه، **{sum(len(c['ids']) - 1 for c in clusters)}** رکورد اضافه.")
+
+    def label(i):
+        c = clusters[i]
+        return f"خوشه {i + 1} — {len(c['ids'])} رکورد — {'، '.join(DEDUPE_REASONS[r] for r in c['reasons'])}"
+    idx = st.selectbox("خوشه", range(len(clusters)), format_func=label, key=f"dedupe_cluster_{kind}")
+    df = details(clusters[idx]["ids"])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    if len(df) < 2:
+        st.info("این خوشه دیگر تکراری ندارد (احتمالاً قبلاً ادغام یا حذف شده).")
+    else:
+        names = dict(zip(df["ID"], df["نام"]))
+        keep = st.radio("رکورد ماندنی", list(names), format_func=lambda x: f"{x} — {names[x]}", horizontal=True,
+                        key=f"dedupe_keep_{kind}_{idx}")
+        if st.button("ادغام این خوشه", type="primary"):
+            try:
+                removed = merge(int(keep), [int(x) for x in names if x != keep])
+            except (sqlite3.Error, ValueError) as e:
+                st.error(f"ادغام انجام نشد: {e}")
+            else:
+                clusters.pop(idx)
+                st.toast(f"{removed} رکورد در {keep} ادغام شد.", icon="✅")
+                st.rerun()
+
+    st.divider()
+    sure = st.checkbox(f"ادغام گروهی همه {len(clusters)} خوشه (در هر خوشه قدیمی‌ترین رکورد می‌ماند)",
+                       key=f"dedupe_bulk_{kind}")
+    if st.button("ادغام همه", disabled=not sure):
+        with st.spinner("در حال ادغام..."):
+            removed, msgs = merge_clusters(kind, clusters)
+        st.session_state.pop("dedupe", None)
+        st.success(f"ادغام پایان یافت. {removed} رکورد حذف شد.")
+        for m in msgs:
+            st.write("•", m)
+
 # ====================== اجرا ======================
 if not st.session_state.auth:
     login_view()
@@ -2202,23 +1796,42 @@ else:
         role = st.session_state.auth["role"]
         page_options = ["داشبورد", "شرکت‌ها", "کاربران", "تماس‌ها", "پیگیری‌ها", "سفارشات", "محصولات"]
         if role == "admin":
-            page_options.append("مدیریت دسترسی")
+            page_options += ["عملکرد کارشناسان", "تحلیل فروش", "قیف فروش", "تکراری‌ها", "مدیریت دسترسی"]
         
         page = st.radio("منو", page_options, index=0)
-
-    if page == "داشبورد":
-        page_dashboard()
-    elif page == "شرکت‌ها":
-        page_companies()
-    elif page == "کاربران":
-        page_users()
-    elif page == "تماس‌ها":
-        page_calls()
-    elif page == "پیگیری‌ها":
-        page_followups()
-    elif page == "سفارشات":
-        page_orders()
-    elif page == "محصولات":
-        page_products()
-    elif page == "مدیریت دسترسی":
-        page_access()
+        st.toggle("🔄 به‌روزرسانی خودکار جدول‌ها", value=True, key="live_refresh",
+                  help="وقتی همکار دیگری تغییری ثبت کند، فقط ردیف‌های تغییرکرده در جدول به‌روز می‌شوند.")
+        if role == "admin":
+            st.toggle("⏱ پروفایل صفحه", value=page_profiling_enabled(), key="page_profiling",
+                      help="زمان هر اجرای صفحه به تفکیک کوئری/پردازش/رندر/عملیات و اوج حافظه؛ در فایل JSONL هم ثبت می‌شود.")
+
+    QUERY_STATS.page.set(page)
+    with page_profile(page):
+        if page == "داشبورد":
+            page_dashboard()
+        elif page == "شرکت‌ها":
+            page_companies()
+        elif page == "کاربران":
+            page_users()
+        elif page == "تماس‌ها":
+            page_calls()
+        elif page == "پیگیری‌ها":
+            page_followups()
+        elif page == "سفارشات":
+            page_orders()
+        elif page == "محصولات":
+            page_products()
+        elif page == "عملکرد کارشناسان":
+            page_leaderboard()
+        elif page == "تحلیل فروش":
+            page_revenue()
+        elif page == "قیف فروش":
+            page_funnel()
+        elif page == "تکراری‌ها":
+            page_duplicates()
+        elif page == "مدیریت دسترسی":
+            page_access()
+
+    if role == "admin" and page_profiling_enabled():
+        with st.sidebar:
+            page_profile_panel()
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+API فقط‌خواندنی JSON/HTTP روی لایه داده (crm_core) برای یکپارچه‌سازی‌ها — سرویس ASGI جدا، کنار اپ Streamlit.
+
+    python crm_api.py token admin --days 90          # توکن نشست (همان جدول sessions ورود با لینک)
+    python crm_api.py serve --port 8600
+    curl -G -H "Authorization: Bearer <token>" --data-urlencode "status=لغو" "http://127.0.0.1:8600/api/contacts?limit=50"
+    curl -H "Authorization: Bearer <token>" -H "Accept: application/x-ndjson" "http://127.0.0.1:8600/api/calls"
+
+- کوئری‌ها همان سازنده‌های SQL جدول‌های UI هستند (users_query، calls_query، ...)، با LIMIT/OFFSET صفحه‌بندی می‌شوند.
+- دامنه دسترسی مثل UI: کارشناس فقط مخاطبان خودش را می‌بیند؛ مدیر می‌تواند با owner= فیلتر کند.
+- ETag ضعیف از نسخه جدول‌های درگیر (آخرین seq آن‌ها در change_log) + کاربر + پارامترها ساخته می‌شود؛
+  If-None-Match برابر → 304 بدون اجرای کوئری. (تغییر نام حساب‌های app_users در فید ثبت نمی‌شود.)
+- format=ndjson یا Accept: application/x-ndjson → همه ردیف‌ها جریانی (بدون صفحه‌بندی و بدون نگه داشتن کل نتیجه در حافظه).
+- تماس‌ها/پیگیری‌ها با from= قبل از افق بایگانی، از crm_archive.db هم خوانده می‌شوند (بدون from فقط داده داغ).
+- ‎/api/caller?phone=… برای یکپارچه‌سازی تلفنی در هر زنگ: مخاطب، شرکت، کارشناس و آخرین تماس (caller_lookup).
+"""
+import argparse
+import hashlib
+import json
+import sys
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from crm_core import (
+    attach_archive_for, caller_lookup, calls_query, change_feed, config, create_session, followups_query, get_app_user_id_by_username,
+    get_session_user, init_db, orders_query, read_pool, users_query,
+)
+
+API_PAGE_DEFAULT = 100
+API_PAGE_MAX = 1000
+NDJSON_MIME = "application/x-ndjson"
+STREAM_BATCH = 500
+
+# ====================== پارامترهای درخواست ======================
+class Params:
+    """خواندن پارامترهای query string با خطای ValueError خوانا (→ 400)"""
+
+    def __init__(self, request: Request):
+        self.qp = request.query_params
+
+    def text(self, key: str) -> Optional[str]:
+        v = (self.qp.get(key) or "").strip()
+        return v or None
+
+    def list(self, key: str) -> List[str]:
+        # هم ?status=a&status=b و هم ?status=a,b
+        return [x.strip() for v in self.qp.getlist(key) for x in v.split(",") if x.strip()]
+
+    def ints(self, key: str) -> List[int]:
+        try:
+            return [int(x) for x in self.list(key)]
+        except ValueError:
+            raise ValueError(f"{key}: عدد صحیح لازم است") from None
+
+    def int(self, key: str, default: Optional[int] = None, lo: int = 0, hi: Optional[int] = None) -> Optional[int]:
+        v = self.text(key)
+        if v is None:
+            return default
+        try:
+            n = int(v)
+        except ValueError:
+            raise ValueError(f"{key}: عدد صحیح لازم است") from None
+        if n < lo or (hi is not None and n > hi):
+            raise ValueError(f"{key}: باید بین {lo} و {hi} باشد" if hi is not None else f"{key}: حداقل {lo}")
+        return n
+
+    def date(self, key: str) -> Optional[date]:
+        v = self.text(key)
+        if v is None:
+            return None
+        try:
+            return date.fromisoformat(v)
+        except ValueError:
+            raise ValueError(f"{key}: تاریخ میلادی به شکل YYYY-MM-DD لازم است") from None
+
+    def flag(self, key: str) -> Optional[bool]:
+        v = (self.text(key) or "").lower()
+        if not v:
+            return None
+        if v in ("1", "true", "yes"):
+            return True
+        if v in ("0", "false", "no"):
+            return False
+        raise ValueError(f"{key}: true یا false")
+
+# ====================== endpointها ======================
+# scope: (enforce_owner, owner_ids_filter) — همان آرگومان‌های دامنه دسترسی توابع جدول UI
+Scope = Tuple[Optional[int], Optional[List[int]]]
+
+@dataclass(frozen=True)
+class Endpoint:
+    build: Callable[[Params, Scope], Tuple[str, list]]
+    tables: Tuple[str, ...]  # جدول‌هایی که ستون‌های نتیجه از آن‌ها می‌آید (برای ETag)
+
+def _contacts(p: Params, scope: Scope):
+    return users_query(p.text("first_name"), p.text("last_name"), p.text("domain"),
+                       p.date("created_from"), p.date("created_to"), p.flag("has_open_task"),
+                       p.date("last_call_from"), p.date("last_call_to"), p.list("status"), scope[1], scope[0])
+
+def _calls(p: Params, scope: Scope):
+    return calls_query(p.text("q"), p.list("status"), p.date("from"), p.date("to"), scope[1], scope[0])
+
+def _followups(p: Params, scope: Scope):
+    return followups_query(p.text("q"), p.list("status"), p.date("from"), p.date("to"), scope[1], scope[0])
+
+def _orders(p: Params, scope: Scope):
+    # صفحه سفارشات UI هم دامنه کارشناس ندارد
+    return orders_query(p.int("user_id", lo=1), p.int("company_id", lo=1), p.int("product_id", lo=1),
+                        p.text("status"))
+
+ENDPOINTS = {
+    "contacts": Endpoint(_contacts, ("users", "companies", "calls", "followups")),
+    "calls": Endpoint(_calls, ("calls", "users", "companies")),
+    "followups": Endpoint(_followups, ("followups", "users", "companies")),
+    "orders": Endpoint(_orders, ("orders", "users", "companies", "products")),
+}
+
+# ====================== اجرا روی connectionهای فقط‌خواندنی ======================
+_feed_epoch: Optional[int] = None
+
+def _check_db_replaced():
+    """
+    بازیابی بکاپ در پروسه Streamlit روی همان فایل است؛ فید تغییرات آن را از restore_generation در app_meta
+    می‌فهمد و epoch را بالا می‌برد (ETag و نگاشت تلفن‌ها از نو). این‌جا connectionهای خواندنی هم دوباره باز می‌شوند.
+    """
+    global _feed_epoch
+    feed = change_feed()
+    feed.head()
+    if _feed_epoch is not None and feed.epoch != _feed_epoch:
+        read_pool().reset()
+    _feed_epoch = feed.epoch
+
+def _etag(ep: Endpoint, user: dict, request: Request) -> str:
+    feed = change_feed()
+    versions = feed.table_versions(ep.tables)
+    query = sorted((k, v) for k, v in request.query_params.multi_items() if k != "token")
+    key = json.dumps([feed.epoch, versions, user["id"], user["role"], request.url.path, query],
+                     ensure_ascii=False)
+    return 'W/"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:20] + '"'
+
+def _fetch_page(sql: str, params: list, limit: int, offset: int) -> Tuple[List[str], list]:
+    with read_pool().connection() as conn:
+        attach_archive_for(conn, sql)
+        cur = conn.execute(f"{sql} LIMIT ? OFFSET ?", [*params, limit + 1, offset])
+        cols = [d[0] for d in cur.description]
+        return cols, cur.fetchall()
+
+def _stream_rows(sql: str, params: list) -> Iterator[bytes]:
+    """یک connection از استخر تا پایان جریان نگه داشته می‌شود؛ ردیف‌ها دسته‌دسته با fetchmany خوانده می‌شوند."""
+    with read_pool().connection() as conn:
+        attach_archive_for(conn, sql)
+        cur = conn.execute(sql, params)
+        cols = [d[0] for d in cur.description]
+        try:
+            while True:
+                rows = cur.fetchmany(STREAM_BATCH)
+                if not rows:
+                    break
+                yield "".join(json.dumps(dict(zip(cols, r)), ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+        finally:
+            cur.close()
+
+# ====================== HTTP ======================
+def _error(status: int, message: str, **headers) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status, headers=headers or None)
+
+def _token(request: Request) -> Optional[str]:
+    auth = request.headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        return auth[7:].strip()
+    return request.query_params.get("token")
+
+def _wants_ndjson(request: Request) -> bool:
+    fmt = request.query_params.get("format")
+    if fmt:
+        return fmt == "ndjson"
+    return NDJSON_MIME in request.headers.get("accept", "")
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    tags = [t.strip() for t in inm.split(",")]
+    return "*" in tags or etag in tags or etag[2:] in tags  # مقایسه ضعیف
+
+async def api_endpoint(request: Request) -> Response:
+    ep = ENDPOINTS.get(request.path_params["name"])
+    if ep is None:
+        return _error(404, "endpoint ناشناخته؛ موجود: " + ", ".join(ENDPOINTS))
+    user = await run_in_threadpool(get_session_user, _token(request))
+    if user is None:
+        return _error(401, "توکن نامعتبر یا منقضی", **{"WWW-Authenticate": "Bearer"})
+
+    p = Params(request)
+    try:
+        if user["role"] == "admin":
+            scope: Scope = (None, p.ints("owner") or None)
+        else:
+            scope = (user["id"], None)
+        sql, params = ep.build(p, scope)
+        stream = _wants_ndjson(request)
+        limit = p.int("limit", API_PAGE_DEFAULT, lo=1, hi=API_PAGE_MAX)
+        offset = p.int("offset", 0)
+    except ValueError as e:
+        return _error(400, str(e))
+
+    _check_db_replaced()
+    etag = await run_in_threadpool(_etag, ep, user, request)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization, Accept"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if stream:
+        return StreamingResponse(_stream_rows(sql, params), media_type=NDJSON_MIME, headers=headers)
+
+    cols, rows = await run_in_threadpool(_fetch_page, sql, params, limit, offset)
+    more = len(rows) > limit
+    items = [dict(zip(cols, r)) for r in rows[:limit]]
+    return JSONResponse({"items": items, "count": len(items), "offset": offset, "limit": limit,
+                         "next_offset": offset + limit if more else None}, headers=headers)
+
+async def caller_endpoint(request: Request) -> Response:
+    user = await run_in_threadpool(get_session_user, _token(request))
+    if user is None:
+        return _error(401, "توکن نامعتبر یا منقضی", **{"WWW-Authenticate": "Bearer"})
+    phone = request.query_params.get("phone")
+    if not phone:
+        return _error(400, "phone لازم است")
+    _check_db_replaced()
+    only_owner = None if user["role"] == "admin" else user["id"]
+    result = await run_in_threadpool(caller_lookup, phone, only_owner)
+    return JSONResponse(result, headers={"Cache-Control": "no-store"})
+
+def create_app() -> Starlette:
+    init_db()
+    _check_db_replaced()
+    return Starlette(routes=[Route("/api/caller", caller_endpoint, methods=["GET"]),
+                             Route("/api/{name}", api_endpoint, methods=["GET"])])
+
+# ====================== CLI ======================
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="اجرای سرویس با uvicorn")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8600)
+    s.add_argument("--db", help="مسیر دیتابیس (پیش‌فرض CRM_DB_PATH یا crm.db)")
+    t = sub.add_parser("token", help="ساخت توکن نشست برای یک حساب")
+    t.add_argument("username")
+    t.add_argument("--days", type=int, default=30)
+    t.add_argument("--db")
+    args = ap.parse_args(argv)
+
+    if args.db:
+        config.set_db_path(args.db)
+    if args.cmd == "token":
+        init_db()
+        uid = get_app_user_id_by_username(args.username)
+        if uid is None:
+            sys.exit(f"حساب «{args.username}» پیدا نشد")
+        print(create_session(uid, days_valid=args.days))
+        return
+    import uvicorn
+    uvicorn.run(create_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
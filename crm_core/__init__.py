@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+لایه داده FardaPack Mini-CRM — ذخیره‌سازی، کوئری‌ها و قالب‌بندی، بدون وابستگی به Streamlit.
+
+رابط کاربری (crm.py)، بنچمارک‌ها و اسکریپت‌ها همه از همین بسته استفاده می‌کنند. دامنه دسترسی هر تابع
+با آرگومان صریح داده می‌شود (مثل enforce_owner / owner_ids_filter / only_owner_appuser)، نه از نشست کاربر.
+مسیر دیتابیس از CRM_DB_PATH خوانده می‌شود یا با config.set_db_path قبل از اولین connection عوض می‌شود:
+
+    import crm_core
+    crm_core.config.set_db_path("/tmp/crm.db")
+    crm_core.init_db()
+    df = crm_core.df_users_advanced(None, None, None, None, None, None, None, None, [], None, enforce_owner=3)
+"""
+from . import config
+from .archive import (
+    ARCHIVE_HORIZON_DAYS, archive_horizons, archive_old_rows, archive_summary, attach_archive, attach_archive_for,
+)
+from .backup import backup_db_bytes, extract_db_from_zip, restore_db_file, validate_db_file, zip_db_bytes
+from .cdr import CDR_DISPOSITIONS, import_cdr
+from .changes import ChangeFeed, change_feed
+from .config import CALL_STATUSES, COMPANY_STATUSES, LEVELS, ORDER_STATUSES, TASK_STATUSES, USER_STATUSES
+from .crud import (
+    auth_check, bulk_update_users_owner, create_call, create_company, create_followup, create_order, create_product,
+    create_session, create_user, delete_session, get_app_user_id_by_username, get_company_id_by_name,
+    get_company_name, get_or_create_company, get_session_user, get_user_name, import_contacts_df, list_companies,
+    list_products, list_sales_accounts_including_admins, list_users_basic, phone_exists, search_companies,
+    search_users_basic, update_company, update_followup_status, update_order, update_order_status, update_product,
+    update_user,
+)
+from .dates import (
+    date_to_jalali_str, dt_to_jalali_str, format_dates_with_weekday, jalali_month, jalali_str_to_date, jalali_week,
+    plain_date_to_jalali_str, today_jalali_str,
+)
+from .db import connect_db, get_conn, sha256
+from .dedupe import (
+    df_duplicate_companies, df_duplicate_contacts, find_duplicate_companies, find_duplicate_contacts, merge_clusters,
+    merge_companies, merge_contacts, normalize_name,
+)
+from .funnel import STATUS_HISTORY_ENTITIES, funnel_data, funnel_report, rebuild_status_history
+from .grids import (
+    LIVE_GRIDS, call_detail, calls_query, companies_query, df_calls_by_filters, df_companies_advanced,
+    df_company_members, df_followups_by_filters, df_orders_by_filters, df_profile_calls, df_profile_followups,
+    df_users_advanced, followup_detail, followups_query, grid_restore_dtypes, orders_query, profile_company_header,
+    profile_user_header, users_query,
+)
+from .leaderboard import (
+    LEADERBOARD_METRICS, agent_daily_stats, agent_performance, agent_trend, leaderboard, period_labels,
+)
+from .maintenance import (
+    MAINTENANCE_TASKS, MaintenanceScheduler, db_file_stats, due_tasks, maintenance_scheduler, recent_maintenance,
+    run_maintenance,
+)
+from .monitor import QUERY_STATS, QueryStats, query_stats
+from .phones import PhoneDirectory, caller_lookup, normalize_phone, phone_directory
+from .profiling import prof_phase, profile_run, profiled
+from .revenue import (
+    REVENUE_DIMENSIONS, order_cube, rebuild_order_stats, revenue_breakdown, revenue_totals, revenue_trend,
+)
+from .schema import init_db
+from .stats import dashboard_metrics, rebuild_daily_stats
+from .workers import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, ReadPool, db_writer, read_executor, read_pool, run_write, submit_write,
+)
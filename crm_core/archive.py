@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+بایگانی داغ/سرد: تماس‌ها و پیگیری‌های بسته‌شده قدیمی‌تر از یک افق به فایل جدا (crm_archive.db) منتقل می‌شوند تا
+جدول‌ها، ایندکس‌ها و بکاپ دیتابیس اصلی کوچک بمانند.
+
+انتقال در دسته‌های کوچک از صف نویسنده است (هر دسته یک تراکنش؛ کارهای تعاملی بین دسته‌ها اجرا می‌شوند) و در
+app_meta ثبت می‌شود که «همه ردیف‌های قدیمی‌تر از X در بایگانی‌اند». نماهای تاریخچه (جدول تماس‌ها/پیگیری‌ها، تب‌های
+پروفایل، جزئیات، API) فقط وقتی بازه خواسته‌شده به قبل از X می‌رسد بایگانی را ATTACH و با UNION ALL اضافه می‌کنند؛
+بدون بازه تاریخ، فقط داده داغ خوانده می‌شود. ردیف‌ها با همان id بایگانی می‌شوند (AUTOINCREMENT، بدون تداخل).
+"""
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from . import config
+from .changes import change_feed
+from .profiling import profiled
+from .stats import ARCHIVING_FLAG
+from .workers import PRIORITY_BULK, db_writer, read_pool
+
+ARCHIVE_SCHEMA = "archive"
+ARCHIVE_HORIZON_DAYS = 730
+ARCHIVE_BATCH_ROWS = 5000
+
+class ArchiveSpec(NamedTuple):
+    columns: str
+    date_col: str
+    closed_sql: str  # فقط ردیف‌های بسته‌شده بایگانی می‌شوند (پیگیری باز هر قدر هم قدیمی، داغ می‌ماند)
+    ddl: str
+    indexes: Tuple[str, ...]
+
+ARCHIVE_TABLES: Dict[str, ArchiveSpec] = {
+    "calls": ArchiveSpec(
+        "id, user_id, call_datetime, status, description, created_at, created_by", "call_datetime", "",
+        """CREATE TABLE IF NOT EXISTS archive.calls (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, call_datetime TEXT NOT NULL, status TEXT NOT NULL,
+            description TEXT, created_at TEXT, created_by INTEGER);""",
+        ("CREATE INDEX IF NOT EXISTS archive.idx_calls_user_datetime ON calls(user_id, call_datetime);",
+         "CREATE INDEX IF NOT EXISTS archive.idx_calls_datetime ON calls(call_datetime);")),
+    "followups": ArchiveSpec(
+        "id, user_id, title, details, due_date, status, created_at, created_by, closed_at", "due_date",
+        "AND status='پایان یافته'",
+        """CREATE TABLE IF NOT EXISTS archive.followups (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, title TEXT NOT NULL, details TEXT,
+            due_date TEXT NOT NULL, status TEXT NOT NULL, created_at TEXT, created_by INTEGER, closed_at TEXT);""",
+        ("CREATE INDEX IF NOT EXISTS archive.idx_followups_user_due ON followups(user_id, due_date);",
+         "CREATE INDEX IF NOT EXISTS archive.idx_followups_due ON followups(due_date);")),
+}
+# جدول‌هایی که با ON DELETE CASCADE به users وصل‌اند؛ در بایگانی FK نیست و ادغام/حذف مخاطب باید خودش به‌روزشان کند
+ARCHIVE_USER_TABLES = ("calls", "followups")
+
+# ====================== ATTACH ======================
+def _attached(conn: sqlite3.Connection) -> bool:
+    return any(r[1] == ARCHIVE_SCHEMA for r in conn.execute("PRAGMA database_list;"))
+
+def attach_archive(conn: sqlite3.Connection, create: bool = False) -> bool:
+    """بایگانی را روی این connection ATTACH می‌کند (اگر فایلش هست یا create)؛ خروجی: ATTACH شده یا نه"""
+    if _attached(conn):
+        return True
+    path = config.archive_db_path()
+    if not create and not os.path.exists(path):
+        return False
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA};", (path,))
+    return True
+
+def attach_archive_for(conn: sqlite3.Connection, sql: str):
+    """قبل از اجرای کوئری ساخته‌شده با history_source: ATTACH فقط اگر کوئری به بایگانی ارجاع دارد"""
+    if f"{ARCHIVE_SCHEMA}." in sql:
+        attach_archive(conn)
+
+def _archive_tables(conn: sqlite3.Connection) -> Tuple[str, ...]:
+    return tuple(r[0] for r in conn.execute(f"SELECT name FROM {ARCHIVE_SCHEMA}.sqlite_master WHERE type='table';"))
+
+def with_archive(fn: Callable[[sqlite3.Connection, Tuple[str, ...]], Any]) -> Callable[[sqlite3.Connection], Any]:
+    """
+    کار نویسنده‌ای که باید ردیف‌های بایگانی را هم در همان تراکنش تغییر دهد: بایگانی (اگر فایلش هست) بیرون از
+    تراکنش ATTACH و بعد fn(conn, جدول‌های موجود در بایگانی) داخل BEGIN IMMEDIATE اجرا می‌شود.
+    با submit(..., transactional=False) به نویسنده سپرده شود.
+    """
+    def _do(conn: sqlite3.Connection):
+        tables = _archive_tables(conn) if attach_archive(conn) else ()
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            result = fn(conn, tables)
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return result
+    return _do
+
+def archive_reassign_users(conn: sqlite3.Connection, tables: Tuple[str, ...], user_ids: List[int],
+                           new_user_id: Optional[int] = None):
+    """
+    معادل ON DELETE CASCADE جدول‌های داغ برای بایگانی: ردیف‌های user_ids به new_user_id منتقل (ادغام) یا
+    بدون آن حذف می‌شوند. tables خروجی with_archive است (خالی = بایگانی ندارد).
+    """
+    ph = ",".join("?" * len(user_ids))
+    for table in ARCHIVE_USER_TABLES:
+        if table not in tables:
+            continue
+        if new_user_id is None:
+            conn.execute(f"DELETE FROM {ARCHIVE_SCHEMA}.{table} WHERE user_id IN ({ph});", list(user_ids))
+        else:
+            conn.execute(f"UPDATE {ARCHIVE_SCHEMA}.{table} SET user_id=? WHERE user_id IN ({ph});",
+                         [new_user_id] + list(user_ids))
+
+# ====================== افق بایگانی (سمت خواندن) ======================
+# افق‌ها در app_meta هستند؛ فقط وقتی فید تغییرات جلو رفته (هر انتقال ردیف در change_log ثبت می‌شود) دوباره خوانده می‌شوند.
+_horizons_lock = threading.Lock()
+_horizons: Dict[str, object] = {"key": None, "value": {}}
+
+def archive_horizons() -> Dict[str, str]:
+    """جدول → 'YYYY-MM-DD'؛ همه ردیف‌های بایگانی‌شده آن جدول قبل از این روزند"""
+    feed = change_feed()
+    key = (feed.epoch, feed.head())
+    with _horizons_lock:
+        if _horizons["key"] != key:
+            keys = {f"archive_{t}_before": t for t in ARCHIVE_TABLES}
+            with read_pool().connection() as conn:
+                rows = conn.execute("SELECT key, value FROM app_meta WHERE key IN (" + ",".join("?" * len(keys)) + ");",
+                                    list(keys)).fetchall()
+            _horizons["value"] = {keys[k]: v for k, v in rows}
+            _horizons["key"] = key
+        return dict(_horizons["value"])
+
+def reaches_archive(table: str, start: Optional[date]) -> bool:
+    """بازه‌ای که از start شروع می‌شود به ردیف‌های بایگانی‌شده می‌رسد؟ (بدون start: فقط داده داغ)"""
+    horizon = archive_horizons().get(table)
+    return (horizon is not None and start is not None and start.isoformat() < horizon
+            and os.path.exists(config.archive_db_path()))
+
+def history_source(table: str, with_archive: bool) -> str:
+    """
+    عبارت FROM برای جدول تاریخچه: خود جدول، یا UNION ALL داغ و بایگانی. ردیفی که (بعد از بازیابی بکاپ یا قطع
+    وسط انتقال) در هر دو هست فقط از داغ خوانده می‌شود. فیلترهای بیرونی به هر دو شاخه منتقل می‌شوند (push-down).
+    """
+    if not with_archive:
+        return table
+    cols = ARCHIVE_TABLES[table].columns
+    return (f"(SELECT {cols} FROM main.{table} UNION ALL SELECT {cols} FROM {ARCHIVE_SCHEMA}.{table} a "
+            f"WHERE NOT EXISTS (SELECT 1 FROM main.{table} h WHERE h.id=a.id))")
+
+# ====================== انتقال (سمت نوشتن) ======================
+def _archive_batch_job(table: str, cutoff: str, batch_rows: int):
+    spec = ARCHIVE_TABLES[table]
+    pick = (f"SELECT id FROM main.{table} WHERE {spec.date_col} < ? {spec.closed_sql} "
+            f"ORDER BY {spec.date_col}, id LIMIT ?")
+
+    def _do(conn: sqlite3.Connection) -> int:
+        # ATTACH داخل تراکنش ممکن نیست؛ برای همین این کار «غیرتراکنشی» به نویسنده سپرده می‌شود و خودش BEGIN می‌کند
+        if not _attached(conn):
+            attach_archive(conn, create=True)
+            conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.journal_mode=WAL;")
+        conn.execute(spec.ddl)
+        for sql in spec.indexes:
+            conn.execute(sql)
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, '1');", (ARCHIVING_FLAG,))
+            conn.execute(f"INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{table} ({spec.columns}) "
+                         f"SELECT {spec.columns} FROM main.{table} WHERE id IN ({pick});", (cutoff, batch_rows))
+            moved = conn.execute(f"DELETE FROM main.{table} WHERE id IN ({pick});", (cutoff, batch_rows)).rowcount
+            conn.execute("DELETE FROM app_meta WHERE key=?;", (ARCHIVING_FLAG,))
+            conn.execute("INSERT INTO app_meta (key, value) VALUES (?, ?) "
+                         "ON CONFLICT(key) DO UPDATE SET value=MAX(value, excluded.value);",
+                         (f"archive_{table}_before", cutoff))
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return moved
+    return _do
+
+@profiled("actions")
+def archive_old_rows(horizon_days: int = ARCHIVE_HORIZON_DAYS, batch_rows: int = ARCHIVE_BATCH_ROWS,
+                     today: Optional[date] = None) -> Dict[str, int]:
+    """
+    تماس‌های قبل از (امروز − horizon_days) و پیگیری‌های بسته‌شده با سررسید قبل از آن را به بایگانی منتقل می‌کند.
+    اجرای دوباره امن است (INSERT OR REPLACE با همان id). خروجی: تعداد ردیف منتقل‌شده هر جدول.
+    """
+    cutoff = ((today or date.today()) - timedelta(days=horizon_days)).isoformat()
+    moved: Dict[str, int] = {}
+    writer = db_writer()
+    for table in ARCHIVE_TABLES:
+        moved[table] = 0
+        while True:
+            n = writer.submit(_archive_batch_job(table, cutoff, batch_rows), priority=PRIORITY_BULK,
+                              transactional=False).result()
+            moved[table] += n
+            if n < batch_rows:
+                break
+    return moved
+
+def archive_summary() -> Dict[str, object]:
+    """برای صفحه مدیر: مسیر و اندازه فایل بایگانی، افق و تعداد ردیف‌های بایگانی‌شده هر جدول"""
+    path = config.archive_db_path()
+    out: Dict[str, object] = {"path": path, "exists": os.path.exists(path), "size": 0,
+                              "horizons": archive_horizons(), "rows": {}}
+    if out["exists"]:
+        out["size"] = os.path.getsize(path) + (os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0)
+        conn = sqlite3.connect(path, timeout=10)
+        try:
+            for table in ARCHIVE_TABLES:
+                try:
+                    out["rows"][table] = conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+                except sqlite3.OperationalError:
+                    out["rows"][table] = 0
+        finally:
+            conn.close()
+    return out
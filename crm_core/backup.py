@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""بکاپ، فشرده‌سازی، اعتبارسنجی و بازگردانی فایل دیتابیس."""
+import io
+import os
+import sqlite3
+import tempfile
+import uuid
+import zipfile
+from typing import Optional, Tuple
+
+from . import config
+from .changes import RESTORE_GENERATION_KEY, change_feed
+from .workers import PRIORITY_INTERACTIVE, db_writer, read_executor, read_pool
+
+def backup_db_bytes(db_path: Optional[str] = None) -> bytes:
+    """
+    نسخه سازگار دیتابیس با API بکاپ SQLite. در حالت WAL خواندن خامِ فایل .db ممکن است تراکنش‌های
+    commit‌شده‌ای را که هنوز checkpoint نشده‌اند جا بیندازد؛ backup همه را می‌آورد و نوشتن‌ها را هم بلاک نمی‌کند.
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        src, dst = sqlite3.connect(db_path or config.DB_PATH), sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close(); src.close()
+        with open(tmp_path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(tmp_path)
+
+def zip_db_bytes(db_bytes: bytes, inner_name: str) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(inner_name, db_bytes)
+    return buf.getvalue()
+
+def extract_db_from_zip(zip_bytes: bytes) -> Optional[bytes]:
+    try:
+        with zipfile.ZipFile(io.BytesIO(zip_bytes), "r") as zf:
+            # اولین فایل .db
+            for info in zf.infolist():
+                if info.filename.lower().endswith(".db"):
+                    return zf.read(info)
+    except Exception:
+        return None
+    return None
+
+def validate_db_file(path: str) -> Tuple[bool, str]:
+    try:
+        conn = sqlite3.connect(path, timeout=5)
+        cur = conn.cursor()
+        # سلامت دیتابیس
+        chk = cur.execute("PRAGMA integrity_check;").fetchone()
+        if not chk or str(chk[0]).lower() != "ok":
+            conn.close()
+            return False, f"integrity_check ناموفق: {chk[0] if chk else 'نامشخص'}"
+        # جداول ضروری
+        required = {"companies","users","calls","followups","app_users","sessions","products","orders"}
+        rows = cur.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+        have = {r[0] for r in rows}
+        missing = required - have
+        conn.close()
+        if missing:
+            # اگر فقط sessions نبود، init_db بعداً آن را می‌سازد؛ ولی app_users/others ضروری‌اند
+            if missing - {"sessions"}:
+                return False, f"جدول(های) ضروری موجود نیست: {', '.join(sorted(missing))}"
+        return True, "ok"
+    except Exception as e:
+        return False, str(e)
+
+def restore_db_file(tmp_path: str, db_path: Optional[str] = None):
+    """
+    فایل اعتبارسنجی‌شده را با API بکاپ SQLite روی دیتابیس زنده می‌نویسد. کار غیرتراکنشی صف نویسنده است، پس هیچ
+    نوشتن دیگری وسطش اجرا نمی‌شود. جایگزین کردن خود فایل (os.replace) امن نیست: connectionهای باز نویسنده،
+    خواننده‌ها و فید هنوز -wal فایل قبلی را دارند و SQLite آن را روی فایل بازگردانده دوباره اعمال می‌کند.
+    در پایان connectionها دوباره باز می‌شوند و epoch فید بالا می‌رود (seqهای قبلی دیگر قابل مقایسه نیستند)؛
+    پروسه‌های دیگر بازیابی را از RESTORE_GENERATION_KEY در app_meta می‌فهمند.
+    """
+    path = os.path.abspath(db_path or config.DB_PATH)
+
+    def _do(conn: sqlite3.Connection):
+        src = sqlite3.connect(tmp_path)
+        try:
+            src.backup(conn)
+        finally:
+            src.close()
+        # نشانه بازیابی برای فید تغییرات پروسه‌های دیگر (API)؛ بکاپ قدیمی ممکن است app_meta نداشته باشد
+        conn.execute("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;")
+        conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?);",
+                     (RESTORE_GENERATION_KEY, uuid.uuid4().hex))
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+    writer = db_writer()
+    if os.path.abspath(writer.db_path) == path:
+        writer.submit(_do, priority=PRIORITY_INTERACTIVE, transactional=False).result()
+    else:
+        conn = sqlite3.connect(path, timeout=10)
+        try:
+            _do(conn)
+        finally:
+            conn.close()
+    os.remove(tmp_path)
+    read_executor().reset()
+    read_pool().reset()
+    writer.reset()
+    change_feed().reset()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+ایمپورت جریانی CDR (خروجی ریز تماس‌های مرکز تلفن، مثل Master.csv در Asterisk/Issabel) به جدول تماس‌ها.
+
+فایل ردیف به ردیف با csv خوانده می‌شود (بدون pandas و بدون نگه داشتن کل فایل در حافظه). شماره هر طرف با
+normalize_phone به E.164 می‌رسد و با نگاشتی که یک بار از idx_users_phone_e164 ساخته شده به مخاطب وصل می‌شود؛
+وضعیت از disposition به CALL_STATUSES ترجمه می‌شود. ردیف‌ها در دسته‌های بزرگ (هر دسته یک تراکنش) به صف نویسنده
+با اولویت «حجیم» می‌روند و درج با NOT EXISTS روی (user_id، call_datetime) در جدول داغ و بایگانی است؛ پس اجرای
+دوباره همان فایل فقط جست‌وجوی ایندکس است و چیزی درج نمی‌کند.
+"""
+import csv
+import io
+import os
+import re
+import sqlite3
+from datetime import datetime
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from .archive import with_archive
+from .dates import _jalali
+from .phones import ARABIC_DIGITS, PERSIAN_DIGITS, normalize_phone
+from .profiling import profiled
+from .workers import PRIORITY_BULK, db_writer, read_pool
+
+# ====================== نگاشت ستون‌ها و وضعیت ======================
+CDR_BATCH_ROWS = 5000
+CDR_MAX_MESSAGES = 20
+# سرستون‌های رایج خروجی مرکز تلفن‌ها (حروف کوچک)؛ اولین ستون موجود از هر گروه استفاده می‌شود
+CDR_COLUMNS = {
+    "start": ("calldate", "start", "start_time", "starttime", "call_date", "datetime", "date"),
+    "src": ("src", "source", "caller", "from", "callerid", "caller_number"),
+    "dst": ("dst", "destination", "callee", "to", "called", "called_number"),
+    "duration": ("billsec", "talk_time", "duration", "seconds"),
+    "disposition": ("disposition", "status", "result"),
+}
+# Master.csv بدون سرستون: accountcode,src,dst,dcontext,clid,channel,dstchannel,lastapp,lastdata,
+# start,answer,end,duration,billsec,disposition,amaflags,...
+ASTERISK_MASTER_COLUMNS = {"src": 1, "dst": 2, "start": 9, "duration": 13, "disposition": 14}
+CDR_DISPOSITIONS = {
+    "ANSWERED": "موفق",
+    "NO ANSWER": "ناموفق", "NOANSWER": "ناموفق", "CANCEL": "ناموفق",
+    "BUSY": "رد تماس",
+    "FAILED": "خاموش", "CONGESTION": "خاموش", "CHANUNAVAIL": "خاموش",
+}
+CDR_DEFAULT_STATUS = "ناموفق"
+DIRECTION_LABELS = {"out": "خروجی", "in": "ورودی"}
+
+_DIGITS_TRANS = {ord(ch): str(i) for digits in (PERSIAN_DIGITS, ARABIC_DIGITS) for i, ch in enumerate(digits)}
+_DATETIME_RE = re.compile(r"(\d{4})[-/](\d{1,2})[-/](\d{1,2})(?:[ T]+(\d{1,2}):(\d{2}))?")
+
+def cdr_status(disposition: str, seconds: Optional[int]) -> str:
+    """ANSWERED با مدت صفر (صندوق صوتی/IVR) مکالمه حساب نمی‌شود"""
+    status = CDR_DISPOSITIONS.get(disposition.strip().upper().replace("_", " "), CDR_DEFAULT_STATUS)
+    if status == "موفق" and seconds == 0:
+        return CDR_DEFAULT_STATUS
+    return status
+
+def parse_cdr_datetime(raw: str) -> Optional[str]:
+    """زمان شروع تماس → 'YYYY-MM-DDTHH:MM' (دقت دقیقه مثل create_call)؛ میلادی، شمسی (سال < 1700) یا epoch."""
+    s = raw.strip().translate(_DIGITS_TRANS)
+    try:
+        if s.isdigit() and len(s) >= 9:
+            return datetime.fromtimestamp(int(s)).isoformat(timespec="minutes")
+        m = _DATETIME_RE.match(s)
+        if not m:
+            return None
+        y, mo, d, hh, mm = (int(x) if x else 0 for x in m.groups())
+        if y < 1700:
+            JalaliDateTime = _jalali()[1]
+            if JalaliDateTime is None:
+                return None
+            g = JalaliDateTime(y, mo, d, hh, mm).to_gregorian()
+            return datetime(g.year, g.month, g.day, g.hour, g.minute).isoformat(timespec="minutes")
+        return datetime(y, mo, d, hh, mm).isoformat(timespec="minutes")
+    except (ValueError, OverflowError, OSError):
+        return None
+
+def _parse_seconds(raw: str) -> Optional[int]:
+    """'125'، '125.0' یا '00:02:05'"""
+    s = raw.strip().translate(_DIGITS_TRANS)
+    if not s:
+        return None
+    try:
+        if ":" in s:
+            sec = 0
+            for part in s.split(":"):
+                sec = sec * 60 + int(part)
+            return sec
+        return int(float(s))
+    except ValueError:
+        return None
+
+# ====================== خواندن جریانی فایل ======================
+def _open_text(source: Union[str, os.PathLike, IO]) -> Tuple[IO[str], bool]:
+    """(فایل متنی، آیا باید بسته شود)؛ مسیر، فایل باینری (UploadedFile استریم‌لیت) یا فایل متنی"""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, encoding="utf-8-sig", errors="replace", newline=""), True
+    if isinstance(source.read(0), bytes):
+        return io.TextIOWrapper(source, encoding="utf-8-sig", errors="replace", newline=""), False
+    return source, False
+
+def _resolve_columns(first_row: List[str]) -> Tuple[Dict[str, int], bool]:
+    """(اندیس ستون‌ها، آیا ردیف اول سرستون است)"""
+    header = {c.strip().lower(): i for i, c in enumerate(first_row)}
+    cols = {}
+    for key, aliases in CDR_COLUMNS.items():
+        idx = next((header[a] for a in aliases if a in header), None)
+        if idx is not None:
+            cols[key] = idx
+    if "start" in cols and ("src" in cols or "dst" in cols):
+        return cols, True
+    if len(first_row) > max(ASTERISK_MASTER_COLUMNS.values()):
+        return dict(ASTERISK_MASTER_COLUMNS), False
+    raise ValueError("ستون‌های CDR شناسایی نشد (سرستون calldate/src/dst یا قالب Master.csv لازم است).")
+
+def iter_cdr_rows(f: IO[str]) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """(شماره ردیف فایل، {start, src, dst, duration, disposition}) به ترتیب فایل"""
+    sample = f.read(8192)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(_chain(sample, f), dialect)
+    first = next(reader, None)
+    if first is None:
+        return
+    cols, has_header = _resolve_columns(first)
+    rows = reader if has_header else _prepend(first, reader)
+    for line_no, row in enumerate(rows, start=2 if has_header else 1):
+        if not row:
+            continue
+        yield line_no, {k: (row[i] if i < len(row) else "") for k, i in cols.items()}
+
+def _chain(sample: str, f: IO[str]) -> Iterator[str]:
+    """نمونه خوانده‌شده برای تشخیص جداکننده + بقیه فایل، خط به خط"""
+    buf = io.StringIO(sample)
+    tail = buf.readlines()
+    if tail and not tail[-1].endswith(("\n", "\r")):
+        tail[-1] += f.readline()
+    yield from tail
+    yield from f
+
+def _prepend(first: List[str], reader) -> Iterator[List[str]]:
+    yield first
+    yield from reader
+
+# ====================== درج دسته‌ای ======================
+def _phone_map() -> Dict[str, Tuple[int, Optional[int]]]:
+    """E.164 → (id مخاطب، کارشناس مالک)؛ اگر چند مخاطب یک شماره دارند، قدیمی‌ترین"""
+    out: Dict[str, Tuple[int, Optional[int]]] = {}
+    with read_pool().connection() as conn:
+        for phone, user_id, owner_id in conn.execute(
+                "SELECT phone_e164, id, owner_id FROM users INDEXED BY idx_users_phone_e164 "
+                "WHERE phone_e164 > '' ORDER BY phone_e164 DESC, id DESC;"):
+            out[phone] = (user_id, owner_id)
+    return out
+
+def _insert_batch(rows: List[Tuple[int, str, str, str, Optional[int]]]):
+    """
+    کار نویسنده (با with_archive، غیرتراکنشی): تماس‌های بایگانی‌شده هم تکراری حساب می‌شوند، وگرنه ایمپورت دوباره
+    فایل قدیمی تماس بایگانی‌شده را با id تازه در جدول داغ هم ثبت می‌کند.
+    """
+    def _do(conn: sqlite3.Connection, archive_tables: Tuple[str, ...]) -> int:
+        archived = ("AND NOT EXISTS (SELECT 1 FROM archive.calls WHERE user_id=?1 AND call_datetime=?2)"
+                    if "calls" in archive_tables else "")
+        cur = conn.executemany(f"""
+            INSERT INTO calls (user_id, call_datetime, status, description, created_by)
+            SELECT ?1, ?2, ?3, ?4, ?5
+            WHERE NOT EXISTS (SELECT 1 FROM main.calls WHERE user_id=?1 AND call_datetime=?2) {archived};""", rows)
+        return cur.rowcount
+    return with_archive(_do)
+
+@profiled("actions")
+def import_cdr(source: Union[str, os.PathLike, IO], creator_id: Optional[int],
+               batch_rows: int = CDR_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    ایمپورت فایل CDR (مسیر یا فایل باز). تماس به نام کارشناس مالک مخاطب ثبت می‌شود (created_by)، و اگر مخاطب
+    مالک نداشته باشد به نام creator_id. اول شماره مقصد (تماس خروجی) و بعد شماره مبدأ (ورودی) جست‌وجو می‌شود؛
+    داخلی‌ها (۳–۴ رقمی) نرمال نمی‌شوند و خودبه‌خود کنار می‌روند. تکراری = همان مخاطب در همان دقیقه.
+    خروجی: {rows, inserted, duplicates, unmatched, invalid, msgs}
+    """
+    phones = _phone_map()
+    report: Dict[str, Any] = {"rows": 0, "inserted": 0, "duplicates": 0, "unmatched": 0, "invalid": 0, "msgs": []}
+    msgs: List[str] = report["msgs"]
+    matched = 0
+    seen: Dict[str, str] = {}  # شماره خام → E.164؛ داخلی‌ها و شماره‌های پرتکرار یک بار نرمال می‌شوند
+    batch: List[Tuple[int, str, str, str, Optional[int]]] = []
+    pending = None  # حداکثر یک دسته در صف نویسنده، تا خواندن فایل و نوشتن هم‌پوشانی داشته باشند
+
+    def flush():
+        nonlocal pending, batch
+        fut = db_writer().submit(_insert_batch(batch), priority=PRIORITY_BULK, transactional=False)
+        batch = []
+        if pending is not None:
+            report["inserted"] += pending.result()
+        pending = fut
+
+    f, close = _open_text(source)
+    try:
+        for line_no, rec in iter_cdr_rows(f):
+            report["rows"] += 1
+            call_dt = parse_cdr_datetime(rec.get("start", ""))
+            if call_dt is None:
+                report["invalid"] += 1
+                if len(msgs) < CDR_MAX_MESSAGES:
+                    msgs.append(f"ردیف {line_no}: زمان تماس نامعتبر ({rec.get('start', '')!r}).")
+                continue
+            hit, direction = None, None
+            for side, label in (("dst", "out"), ("src", "in")):
+                raw = rec.get(side, "")
+                phone = seen.get(raw)
+                if phone is None:
+                    phone = seen[raw] = normalize_phone(raw) or ""
+                if phone in phones:
+                    hit, direction = phones[phone], label
+                    break
+            if hit is None:
+                report["unmatched"] += 1
+                continue
+            seconds = _parse_seconds(rec.get("duration", ""))
+            desc = f"CDR: تماس {DIRECTION_LABELS[direction]}"
+            if seconds is not None:
+                desc += f"، مدت {seconds // 60}:{seconds % 60:02d}"
+            user_id, owner_id = hit
+            batch.append((user_id, call_dt, cdr_status(rec.get("disposition", ""), seconds), desc,
+                          owner_id or creator_id))
+            matched += 1
+            if len(batch) >= batch_rows:
+                flush()
+    finally:
+        if close:
+            f.close()
+        elif isinstance(f, io.TextIOWrapper):
+            f.detach()  # فایل باینری صدازننده باز می‌ماند
+    if batch:
+        flush()
+    if pending is not None:
+        report["inserted"] += pending.result()
+    report["duplicates"] = matched - report["inserted"]
+    return report
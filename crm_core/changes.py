@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""فید تغییرات (change_log) برای به‌روزرسانی افزایشی جدول‌های کش‌شده."""
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import config
+from .db import _ensure_trigger, shared_resource
+
+# ====================== فید تغییرات (change_log) ======================
+# هر درج/ویرایش/حذف روی جداول اصلی با تریگر در change_log ثبت می‌شود (seq یکنوا و فقط‌افزایشی).
+# هر نشست آخرین seq دیده‌شده را نگه می‌دارد و فقط ردیف‌های تغییرکرده را در DataFrame کش‌شده وصله می‌کند؛
+# چون فید داخل خود فایل دیتابیس است، چند پروسه Streamlit روی یک DB هم از روی آن کش را باطل می‌کنند.
+#   parent_id → برای users: شرکت؛ برای calls/followups/orders: کاربر (ردیف‌هایی که ستون‌های تجمیعی‌شان عوض می‌شود)
+CHANGE_LOG_TABLES = {"users": "company_id", "companies": None, "calls": "user_id",
+                     "followups": "user_id", "orders": "user_id", "products": None}
+CHANGE_LOG_KEEP = 20000
+# restore_db_file با هر بازیابی یک مقدار تازه در app_meta می‌نویسد؛ بازیابی روی همان فایل است (inode عوض نمی‌شود)
+# و seqها ممکن است عقب بروند، پس فید پروسه‌های دیگر از روی همین کلید می‌فهمند که باید از نو شروع کنند.
+RESTORE_GENERATION_KEY = "restore_generation"
+
+def _change_log_triggers() -> List[Tuple[str, str]]:
+    trg = []
+    for t, parent in CHANGE_LOG_TABLES.items():
+        def log(ref, op):
+            parent_sql = f"{ref}.{parent}" if parent else "NULL"
+            return (f"INSERT INTO change_log (tbl, row_id, op, parent_id) "
+                    f"VALUES ('{t}', {ref}.id, '{op}', {parent_sql});")
+        trg.append((f"trg_log_{t}_ins", f"CREATE TRIGGER trg_log_{t}_ins AFTER INSERT ON {t} BEGIN {log('NEW', 'I')} END"))
+        trg.append((f"trg_log_{t}_upd", f"CREATE TRIGGER trg_log_{t}_upd AFTER UPDATE ON {t} BEGIN {log('NEW', 'U')} END"))
+        trg.append((f"trg_log_{t}_del", f"CREATE TRIGGER trg_log_{t}_del AFTER DELETE ON {t} BEGIN {log('OLD', 'D')} END"))
+        if parent:
+            # جابه‌جایی بین والدها (مثلاً تغییر شرکت کاربر): والد قبلی هم باید وصله شود
+            trg.append((f"trg_log_{t}_move",
+                        f"CREATE TRIGGER trg_log_{t}_move AFTER UPDATE OF {parent} ON {t} "
+                        f"WHEN OLD.{parent} IS NOT NEW.{parent} BEGIN {log('OLD', 'U')} END"))
+    return trg
+
+def ensure_change_log(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK(op IN ('I','U','D')),
+            parent_id INTEGER,
+            changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    for name, sql in _change_log_triggers():
+        _ensure_trigger(conn, name, sql)
+    # هرس: فقط وقتی فید خیلی بزرگ شده (init_db در هر rerun اجرا می‌شود؛ حالت عادی فقط یک خواندن است)
+    lo, hi = conn.execute("SELECT MIN(seq), MAX(seq) FROM change_log;").fetchone()
+    if lo is not None and hi - lo > 2 * CHANGE_LOG_KEEP:
+        conn.execute("DELETE FROM change_log WHERE seq <= ?;", (hi - CHANGE_LOG_KEEP,))
+
+class ChangeFeed:
+    """
+    پایش ارزان change_log روی یک connection فقط‌خواندنی: PRAGMA data_version فقط وقتی connection دیگری
+    (همین پروسه یا پروسه دیگر) commit کرده باشد عوض می‌شود؛ تنها در آن صورت MAX(seq) خوانده می‌شود.
+    نسخه هر جدول (آخرین seq آن) هم افزایشی نگه داشته می‌شود: فقط ردیف‌های بعد از head قبلی گروه‌بندی می‌شوند.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.epoch = 0  # بعد از بازیابی بکاپ seqها قابل مقایسه نیستند؛ کش نشست‌ها با epoch باطل می‌شود
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._head = 0
+        self._versions: Dict[str, int] = {}
+        self._restore: Optional[Tuple[str]] = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA query_only=ON;")
+        return self._conn
+
+    def head(self) -> int:
+        with self._lock:
+            conn = self._get_conn()
+            dv = conn.execute("PRAGMA data_version;").fetchone()[0]
+            if dv != self._data_version:
+                restore = conn.execute("SELECT value FROM app_meta WHERE key=?;", (RESTORE_GENERATION_KEY,)).fetchone()
+                if self._data_version is not None and restore != self._restore:
+                    # بازیابی بکاپ در پروسه دیگر: head فقط جلو می‌رود، پس بدون این تغییرات بعدی دیده نمی‌شوند
+                    self._data_version, self._head, self._versions = None, 0, {}
+                    self.epoch += 1
+                self._restore = restore
+                if self._data_version is None:
+                    rows = conn.execute("SELECT tbl, MAX(seq) FROM change_log GROUP BY tbl;").fetchall()
+                else:
+                    rows = conn.execute("SELECT tbl, MAX(seq) FROM change_log WHERE seq > ? GROUP BY tbl;",
+                                        (self._head,)).fetchall()
+                self._versions.update(rows)
+                self._head = max([self._head] + [v for _, v in rows])
+                self._data_version = dv
+            return self._head
+
+    def table_versions(self, tables: Iterable[str]) -> Dict[str, int]:
+        """آخرین seq هر جدول (۰ یعنی تغییری در فید باقی‌مانده ثبت نشده)؛ برای ETag پاسخ‌های API."""
+        self.head()
+        with self._lock:
+            return {t: self._versions.get(t, 0) for t in tables}
+
+    def since(self, seq: int, tables: Optional[List[str]] = None,
+              limit: int = 1000) -> Optional[List[Tuple[int, str, int, str, Optional[int]]]]:
+        """
+        تغییرات بعد از seq (حداکثر limit+1 ردیف تا معلوم شود از سقف گذشته یا نه).
+        None یعنی «بارگذاری کامل»: ردیف‌های بعد از seq هرس شده‌اند (ensure_change_log) و فیلتر جدول نمی‌تواند
+        بگوید تغییرات از دست‌رفته به این جدول‌ها مربوط بوده یا نه.
+        """
+        sql, params = "SELECT seq, tbl, row_id, op, parent_id FROM change_log WHERE seq > ?", [seq]
+        if tables:
+            sql += " AND tbl IN (" + ",".join(["?"] * len(tables)) + ")"; params += list(tables)
+        sql += " ORDER BY seq LIMIT ?;"; params.append(limit + 1)
+        with self._lock:
+            conn = self._get_conn()
+            oldest = conn.execute("SELECT MIN(seq) FROM change_log;").fetchone()[0]
+            if oldest is not None and seq + 1 < oldest:
+                return None
+            return conn.execute(sql, params).fetchall()
+
+    def reset(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn, self._data_version, self._head = None, None, 0
+            self._versions = {}
+            self.epoch += 1
+
+@shared_resource
+def change_feed() -> ChangeFeed:
+    return ChangeFeed(config.DB_PATH)
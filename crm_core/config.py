@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""ثوابت برنامه و مسیر دیتابیس (CRM_DB_PATH) و فایل بایگانی (CRM_ARCHIVE_PATH)."""
+import os
+
+DB_PATH = os.environ.get("CRM_DB_PATH", "crm.db")
+ARCHIVE_DB_PATH = os.environ.get("CRM_ARCHIVE_PATH")
+CALL_STATUSES = ["ناموفق", "موفق", "خاموش", "رد تماس"]
+TASK_STATUSES = ["در حال انجام", "پایان یافته"]
+# 🔧 1- اضافه کردن وضعیت "لغو" به وضعیت‌های کاربر
+USER_STATUSES = ["بدون وضعیت", "در حال پیگیری", "پیش فاکتور", "مشتری شد", "لغو"]
+COMPANY_STATUSES = ["بدون وضعیت", "در حال پیگیری", "پیش فاکتور", "مشتری شد"]
+LEVELS = ["هیچکدام", "طلایی", "نقره‌ای", "برنز"]
+ORDER_STATUSES = ["در حال پیگیری", "تایید شده", "کنسل شده", "رد شده"]
+
+
+def set_db_path(path: str):
+    """مسیر دیتابیس برای اجرای بدون رابط (بنچمارک‌ها، اسکریپت‌ها)؛ قبل از ساخت اولین connection صدا زده شود."""
+    global DB_PATH
+    DB_PATH = path
+
+
+def archive_db_path() -> str:
+    """فایل بایگانی تماس‌ها/پیگیری‌های قدیمی؛ پیش‌فرض crm_archive.db کنار دیتابیس اصلی"""
+    return ARCHIVE_DB_PATH or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "crm_archive.db")
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""نشست‌ها، ورود، و ایجاد/ویرایش/جست‌وجوی شرکت‌ها، مخاطبین، تماس‌ها، پیگیری‌ها، محصولات و سفارش‌ها."""
+from __future__ import annotations
+
+import io
+import sqlite3
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import LEVELS, USER_STATUSES
+from .db import get_conn, sha256
+from .dedupe import COMPANY_STOPWORDS, normalize_name
+from .lazy import LazyModule
+from .phones import normalize_phone, phone_search_prefix
+from .profiling import profiled
+from .workers import PRIORITY_BULK, run_write, submit_write
+
+pd = LazyModule("pandas")
+
+# ====================== ابزار نشست پایدار ======================
+def create_session(app_user_id: int, days_valid: int = 30) -> str:
+    token = uuid.uuid4().hex
+    expires = (datetime.utcnow() + timedelta(days=days_valid)).strftime("%Y-%m-%d %H:%M:%S")
+    run_write(lambda conn: conn.execute("INSERT INTO sessions (token, app_user_id, expires_at) VALUES (?,?,?);",
+                                        (token, app_user_id, expires)).rowcount)
+    return token
+
+def get_session_user(token: str):
+    if not token:
+        return None
+    conn = get_conn()
+    row = conn.execute("""
+        SELECT au.id, au.username, au.role, au.linked_user_id
+        FROM sessions s
+        JOIN app_users au ON au.id = s.app_user_id
+        WHERE s.token=? AND (s.expires_at IS NULL OR s.expires_at >= datetime('now'));
+    """, (token,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    uid, uname, role, linked_user_id = row
+    return {"id": uid, "username": uname, "role": role, "linked_user_id": linked_user_id}
+
+def delete_session(token: str):
+    if not token: return
+    run_write(lambda conn: conn.execute("DELETE FROM sessions WHERE token=?;", (token,)).rowcount)
+
+def auth_check(username: str, password: str):
+    conn = get_conn()
+    row = conn.execute("SELECT id, username, password_sha256, role, linked_user_id FROM app_users WHERE username=?;",
+                       ((username or "").strip(),)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    uid, uname, pwh, role, linked_user_id = row
+    return {"id": uid, "username": uname, "role": role, "linked_user_id": linked_user_id} if sha256(password) == pwh else None
+
+# ====================== CRUD ======================
+@profiled("query")
+def list_companies(_: Optional[int]) -> List[Tuple[int, str]]:
+    conn = get_conn()
+    rows = conn.execute("SELECT id, name FROM companies ORDER BY name COLLATE NOCASE;").fetchall()
+    conn.close(); return rows
+
+@profiled("query")
+def list_sales_accounts_including_admins() -> List[Tuple[int, str, str]]:
+    conn = get_conn()
+    rows = conn.execute("SELECT id, username, role FROM app_users WHERE role IN ('agent','admin') ORDER BY role DESC, username;").fetchall()
+    conn.close(); return rows
+
+@profiled("query")
+def list_users_basic(only_owner_appuser: Optional[int]) -> List[Tuple[int, str, Optional[int]]]:
+    conn = get_conn()
+    if only_owner_appuser:
+        rows = conn.execute(
+            "SELECT id, full_name, company_id FROM users WHERE owner_id=? ORDER BY full_name COLLATE NOCASE;",
+            (only_owner_appuser,)
+        ).fetchall()
+    else:
+        rows = conn.execute("SELECT id, full_name, company_id FROM users ORDER BY full_name COLLATE NOCASE;").fetchall()
+    conn.close(); return rows
+
+# ======= 🔎 جستجوی پیشوندی برای انتخابگرهای تایپ‌شونده =======
+PICKER_LIMIT = 20
+
+def _like_prefix(q: str) -> str:
+    """الگوی LIKE پیشوندی با escape کاراکترهای % و _ (برای استفاده از ایندکس NOCASE)"""
+    q = (q or "").strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return q + "%"
+
+def _glob_prefix(q: str) -> str:
+    q = (q or "").strip()
+    for ch in "[*?":
+        q = q.replace(ch, f"[{ch}]")
+    return q + "*"
+
+@profiled("query")
+def search_users_basic(query: str, only_owner_appuser: Optional[int],
+                       limit: int = PICKER_LIMIT) -> List[Tuple[int, str, Optional[int]]]:
+    """جستجوی مخاطبین با پیشوند نام/نام خانوادگی یا شماره تلفن؛ فقط `limit` ردیف از ایندکس خوانده می‌شود."""
+    q = (query or "").strip()
+    owner_sql, owner_params = ("AND owner_id=?", [only_owner_appuser]) if only_owner_appuser else ("", [])
+    conn = get_conn()
+    if not q:
+        rows = conn.execute(f"""
+            SELECT id, full_name, company_id FROM users
+            WHERE 1=1 {owner_sql}
+            ORDER BY full_name COLLATE NOCASE LIMIT ?;""", owner_params + [limit]).fetchall()
+    elif phone_search_prefix(q):
+        # پیشوند نرمال‌شده روی ایندکس phone_e164: ۰۹۱۲… و ‎+98912… همان مخاطبان را پیدا می‌کنند
+        rows = conn.execute(f"""
+            SELECT id, full_name, company_id FROM users INDEXED BY idx_users_phone_e164
+            WHERE phone_e164 GLOB ? {owner_sql}
+            ORDER BY phone_e164 LIMIT ?;""", [_glob_prefix(phone_search_prefix(q))] + owner_params + [limit]).fetchall()
+    else:
+        pat = _like_prefix(q)
+        rows = conn.execute(f"""
+            SELECT * FROM (
+              SELECT id, full_name, company_id FROM users
+              WHERE full_name LIKE ? ESCAPE '\\' {owner_sql}
+              ORDER BY full_name COLLATE NOCASE LIMIT ?)
+            UNION
+            SELECT * FROM (
+              SELECT id, full_name, company_id FROM users
+              WHERE last_name LIKE ? ESCAPE '\\' {owner_sql}
+              ORDER BY last_name COLLATE NOCASE LIMIT ?)
+            ORDER BY 2 COLLATE NOCASE LIMIT ?;""",
+            [pat] + owner_params + [limit, pat] + owner_params + [limit, limit]).fetchall()
+    conn.close(); return rows
+
+@profiled("query")
+def search_companies(query: str, limit: int = PICKER_LIMIT) -> List[Tuple[int, str]]:
+    """جستجوی پیشوندی نام شرکت با سقف تعداد"""
+    conn = get_conn()
+    rows = conn.execute("""
+        SELECT id, name FROM companies
+        WHERE name LIKE ? ESCAPE '\\'
+        ORDER BY name COLLATE NOCASE LIMIT ?;""", (_like_prefix(query), limit)).fetchall()
+    conn.close(); return rows
+
+def get_user_name(user_id: Optional[int]) -> Optional[str]:
+    if not user_id:
+        return None
+    conn = get_conn()
+    row = conn.execute("SELECT full_name FROM users WHERE id=?;", (user_id,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def get_company_name(company_id: Optional[int]) -> Optional[str]:
+    if not company_id:
+        return None
+    conn = get_conn()
+    row = conn.execute("SELECT name FROM companies WHERE id=?;", (company_id,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def phone_exists(phone: str, ignore_user_id: Optional[int] = None,
+                 conn: Optional[sqlite3.Connection] = None) -> bool:
+    """تکراری بودن شماره؛ قالب‌های مختلف یک شماره (0912… / ‎+98912…) با phone_e164 یکی حساب می‌شوند."""
+    ph = (phone or "").strip()
+    if not ph:
+        return False
+    own = conn is None
+    conn = conn or get_conn()
+    e164 = normalize_phone(ph)
+    match_sql, params = ("(phone=? OR phone_e164=?)", [ph, e164]) if e164 else ("phone=?", [ph])
+    if ignore_user_id:
+        match_sql += " AND id<>?"; params.append(ignore_user_id)
+    row = conn.execute(f"SELECT 1 FROM users WHERE {match_sql};", params).fetchone()
+    if own:
+        conn.close()
+    return row is not None
+
+# همه نوشتن‌های زیر از طریق صف نویسنده (run_write) انجام می‌شوند؛ بدنه‌ها conn را از نخ نویسنده می‌گیرند
+# و commit نمی‌کنند. بررسی‌هایی مثل تکراری بودن تلفن داخل همان تراکنشِ نوشتن انجام می‌شود.
+def _insert_company(conn: sqlite3.Connection, name, phone, address, note, level, status, creator_id) -> int:
+    cur = conn.execute(
+        "INSERT INTO companies (name, phone, address, note, level, status, created_by) VALUES (?,?,?,?,?,?,?);",
+        ((name or "").strip(), (phone or "").strip(), (address or "").strip(), (note or "").strip(), level, status, creator_id)
+    )
+    return cur.lastrowid
+
+def create_company(name, phone, address, note, level, status, creator_id):
+    return run_write(lambda conn: _insert_company(conn, name, phone, address, note, level, status, creator_id))
+
+def _update_row(table: str, row_id: int, fields: Dict[str, Any]) -> Tuple[bool, str]:
+    sets, params = [], []
+    for k, v in fields.items():
+        sets.append(f"{k}=?"); params.append(v)
+    if not sets:
+        return True, "بدون تغییر"
+    params.append(row_id)
+    run_write(lambda conn: conn.execute(f"UPDATE {table} SET {', '.join(sets)} WHERE id=?;", params).rowcount)
+    return True, "ذخیره شد."
+
+def update_company(company_id: int, **fields):
+    return _update_row("companies", company_id, fields)
+
+def _insert_user(conn: sqlite3.Connection, first_name, last_name, phone, job_role, company_id, note,
+                 status, domain, province, level, owner_id, creator_id) -> Tuple[bool, str]:
+    if phone and phone_exists(phone, conn=conn):
+        return False, "شماره تماس تکراری است."
+    full_name = f"{(first_name or '').strip()} {(last_name or '').strip()}".strip()
+    if not full_name:
+        return False, "نام و نام خانوادگی اجباری است."
+    conn.execute("""INSERT INTO users
+        (first_name,last_name,full_name,phone,role,company_id,note,status,domain,province,level,owner_id,created_by)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?);""",
+        ((first_name or "").strip(),
+         (last_name or "").strip(),
+         full_name,
+         (phone or "").strip(),
+         (job_role or "").strip(),
+         company_id,
+         (note or "").strip(),
+         status,
+         (domain or "").strip(),
+         (province or "").strip(),
+         level,
+         owner_id,
+         creator_id))
+    return True, "کاربر ثبت شد."
+
+def create_user(first_name, last_name, phone, job_role, company_id, note,
+                status, domain, province, level, owner_id, creator_id) -> Tuple[bool, str]:
+    return run_write(lambda conn: _insert_user(conn, first_name, last_name, phone, job_role, company_id, note,
+                                               status, domain, province, level, owner_id, creator_id))
+
+def update_user(user_id: int, **fields):
+    sets, params = [], []
+    for k, v in fields.items():
+        sets.append(f"{k}=?"); params.append(v)
+    if not sets:
+        return True, "بدون تغییر"
+    params.append(user_id)
+
+    def _do(conn: sqlite3.Connection) -> Tuple[bool, str]:
+        if "phone" in fields and phone_exists(fields.get("phone"), ignore_user_id=user_id, conn=conn):
+            return False, "شماره تماس تکراری است."
+        conn.execute(f"UPDATE users SET {', '.join(sets)} WHERE id=?;", params)
+        return True, "ذخیره شد."
+    return run_write(_do)
+
+def _closed_at(status: str) -> Optional[str]:
+    return datetime.now().isoformat(timespec="minutes") if status == "پایان یافته" else None
+
+def update_followup_status(task_id: int, new_status: str):
+    # بدون تغییر وضعیت، زمان بستن قبلی می‌ماند
+    run_write(lambda conn: conn.execute(
+        "UPDATE followups SET closed_at=CASE WHEN status IS ? THEN closed_at ELSE ? END, status=? WHERE id=?;",
+        (new_status, _closed_at(new_status), new_status, task_id)).rowcount)
+
+def create_call(user_id, call_dt: datetime, status, description, creator_id):
+    return run_write(lambda conn: conn.execute(
+        "INSERT INTO calls (user_id, call_datetime, status, description, created_by) VALUES (?,?,?,?,?);",
+        (user_id, call_dt.isoformat(timespec="minutes"), status, (description or "").strip(), creator_id)).lastrowid)
+
+def create_followup(user_id, title, details, due_date_val: date, status, creator_id):
+    return run_write(lambda conn: conn.execute(
+        "INSERT INTO followups (user_id, title, details, due_date, status, created_by, closed_at) VALUES (?,?,?,?,?,?,?);",
+        (user_id, (title or "").strip(), (details or "").strip(), due_date_val.isoformat(), status, creator_id,
+         _closed_at(status))).lastrowid)
+
+# ======= 🧰 عملیات گروهی روی کاربران (Bulk) =======
+def bulk_update_users_owner(user_ids: List[int], new_owner_id: Optional[int]) -> int:
+    """owner_id را برای لیست user_ids به‌صورت گروهی تغییر می‌دهد. مقدار برگشتی تعداد ردیف‌های تغییر کرده است."""
+    if not user_ids:
+        return 0
+    placeholders = ",".join(["?"] * len(user_ids))
+    params: List = [new_owner_id] + [int(x) for x in user_ids]
+    return run_write(lambda conn: conn.execute(f"UPDATE users SET owner_id=? WHERE id IN ({placeholders});", params).rowcount,
+                     priority=PRIORITY_BULK)
+
+# ====================== توابع کمکی ایمپورت اکسل ======================
+def get_company_id_by_name(name: str, conn: Optional[sqlite3.Connection] = None) -> Optional[int]:
+    if not (name or "").strip():
+        return None
+    own = conn is None
+    conn = conn or get_conn()
+    row = conn.execute("SELECT id FROM companies WHERE name=?;", ((name or "").strip(),)).fetchone()
+    if own:
+        conn.close()
+    return row[0] if row else None
+
+def _get_or_create_company(conn: sqlite3.Connection, name: str, creator_id: Optional[int]) -> Optional[int]:
+    if not (name or "").strip():
+        return None
+    cid = get_company_id_by_name(name, conn=conn)
+    if cid:
+        return cid
+    return _insert_company(conn, name, "", "", "", "هیچکدام", "بدون وضعیت", creator_id)
+
+def get_or_create_company(name: str, creator_id: Optional[int]) -> Optional[int]:
+    if not (name or "").strip():
+        return None
+    return run_write(lambda conn: _get_or_create_company(conn, name, creator_id))
+
+def get_app_user_id_by_username(username: str) -> Optional[int]:
+    if not (username or "").strip():
+        return None
+    conn = get_conn()
+    row = conn.execute("SELECT id FROM app_users WHERE username=?;", ((username or "").strip(),)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+IMPORT_CHUNK_ROWS = 200
+IMPORT_TEMPLATE_ROW = {
+    "FirstName": "علی", "LastName": "محمدی", "Phone": "09120000000", "Role": "مدیر خرید",
+    "Company": "شرکت نمونه", "Status": "بدون وضعیت", "Level": "هیچکدام",
+    "Domain": "صنعتی", "Province": "تهران", "OwnerUsername": "admin", "Note": "",
+}
+
+def import_template_xlsx() -> bytes:
+    """فایل اکسل الگوی ایمپورت مخاطبین (نیاز به openpyxl)"""
+    buf = io.BytesIO()
+    pd.DataFrame([IMPORT_TEMPLATE_ROW]).to_excel(buf, index=False, engine="openpyxl")
+    return buf.getvalue()
+
+def import_contacts_df(df_imp: pd.DataFrame, creator_id: Optional[int],
+                       chunk_size: int = IMPORT_CHUNK_ROWS) -> Tuple[int, int, List[str]]:
+    """
+    ایمپورت مخاطبین از DataFrame اکسل. ردیف‌ها در تکه‌های chunk_size تایی به صف نویسنده با اولویت
+    «حجیم» سپرده می‌شوند تا ثبت تماس/پیگیری کاربران دیگر پشت یک ایمپورت طولانی نماند.
+    خروجی: (تعداد موفق، تعداد ناموفق، پیام‌ها)
+    """
+    cols = {str(c).strip().lower(): c for c in df_imp.columns}
+    def col(name): return cols.get(name.lower())
+
+    ok_cnt, skip_cnt = 0, 0
+    msgs: List[str] = []
+    rows: List[Tuple[int, dict]] = []
+    for idx, row in df_imp.iterrows():
+        def getv(key):
+            cc = col(key)
+            if cc is None: return ""
+            v = row.get(cc)
+            return "" if (pd.isna(v) or v is None) else str(v).strip()
+
+        rec = {k: getv(k) for k in ["FirstName", "LastName", "Phone", "Role", "Company", "Status",
+                                     "Level", "Domain", "Province", "OwnerUsername", "Note"]}
+        if not rec["FirstName"] or not rec["LastName"] or not rec["Phone"]:
+            skip_cnt += 1; msgs.append(f"رد شد ردیف {idx+2}: فیلد الزامی خالی.")
+            continue
+        rec["Status"] = rec["Status"] if rec["Status"] in USER_STATUSES else "بدون وضعیت"
+        rec["Level"]  = rec["Level"]  if rec["Level"]  in LEVELS        else "هیچکدام"
+        rows.append((idx, rec))
+
+    # «شركت نمونه» همان «شرکت نمونه» است (نام نرمال‌شده، قدیمی‌ترین شرکت)، نه یک شرکت تازه. نگاشت یک بار برای کل
+    # ایمپورت (در اولین تکه‌ای که شرکت دارد) ساخته و شرکت‌های تازه به آن اضافه می‌شوند؛ تکه‌ها روی تک نخ نویسنده
+    # یکی‌یکی اجرا می‌شوند، پس دیکشنری مشترک امن است
+    companies: Dict[str, int] = {}
+    companies_loaded = False
+
+    def _chunk_job(chunk: List[Tuple[int, dict]]):
+        def _do(conn: sqlite3.Connection) -> List[Tuple[int, bool, str]]:
+            nonlocal companies_loaded
+            owners = dict(conn.execute("SELECT username, id FROM app_users;").fetchall())
+            if not companies_loaded and any(r["Company"] for _, r in chunk):
+                for cid, name in conn.execute("SELECT id, name FROM companies ORDER BY id DESC;"):
+                    companies[normalize_name(name, COMPANY_STOPWORDS)] = cid
+                companies_loaded = True
+            out = []
+            for idx, r in chunk:
+                try:
+                    company_id = None
+                    if r["Company"]:
+                        key = normalize_name(r["Company"], COMPANY_STOPWORDS)
+                        company_id = companies.get(key) if key else None
+                        if company_id is None:
+                            company_id = _get_or_create_company(conn, r["Company"], creator_id)
+                            if key:
+                                companies[key] = company_id
+                    ok, msg = _insert_user(conn, r["FirstName"], r["LastName"], r["Phone"], r["Role"], company_id,
+                                           r["Note"], r["Status"], r["Domain"], r["Province"], r["Level"],
+                                           owners.get(r["OwnerUsername"]), creator_id)
+                except sqlite3.Error as e:
+                    ok, msg = False, str(e)
+                out.append((idx, ok, msg))
+            return out
+        return _do
+
+    futures = [submit_write(_chunk_job(rows[i:i + chunk_size]), priority=PRIORITY_BULK)
+               for i in range(0, len(rows), chunk_size)]
+    for fut in futures:
+        for idx, ok, msg in fut.result():
+            if ok:
+                ok_cnt += 1
+            else:
+                skip_cnt += 1
+                msgs.append(f"ردیف {idx+2}: {msg}")
+    return ok_cnt, skip_cnt, msgs
+
+# ====================== توابع جدید برای سفارشات و محصولات ======================
+@profiled("query")
+def list_products(conn: Optional[sqlite3.Connection] = None) -> List[Tuple[int, str, str]]:
+    """لیست تمام محصولات (با conn بیرونی، برای اجرا روی استخر خواننده‌ها)"""
+    own = conn is None
+    conn = conn or get_conn()
+    rows = conn.execute("SELECT id, category, name FROM products ORDER BY category, name;").fetchall()
+    if own:
+        conn.close()
+    return rows
+
+def create_product(category: str, name: str):
+    """ایجاد محصول جدید"""
+    return run_write(lambda conn: conn.execute("INSERT INTO products (category, name) VALUES (?, ?);",
+                                               (category.strip(), name.strip())).lastrowid)
+
+def update_product(product_id: int, category: str, name: str):
+    """ویرایش محصول"""
+    run_write(lambda conn: conn.execute("UPDATE products SET category=?, name=? WHERE id=?;",
+                                        (category.strip(), name.strip(), product_id)).rowcount)
+
+def create_order(user_id: Optional[int], company_id: Optional[int], product_id: int, 
+                order_date: date, status: str, total_amount: float):
+    """ایجاد سفارش جدید"""
+    return run_write(lambda conn: conn.execute("""
+        INSERT INTO orders (user_id, company_id, product_id, order_date, status, total_amount)
+        VALUES (?, ?, ?, ?, ?, ?);
+    """, (user_id, company_id, product_id, order_date.isoformat(), status, total_amount)).lastrowid)
+
+def update_order_status(order_id: int, new_status: str):
+    """به‌روزرسانی وضعیت سفارش"""
+    run_write(lambda conn: conn.execute("UPDATE orders SET status=? WHERE id=?;", (new_status, order_id)).rowcount)
+
+def update_order(order_id: int, **fields):
+    """به‌روزرسانی سفارش"""
+    return _update_row("orders", order_id, fields)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""تبدیل و قالب‌بندی تاریخ‌ها (شمسی با persiantools در صورت نصب بودن، میلادی با روز هفته)."""
+from __future__ import annotations
+
+import functools
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+from .lazy import LazyModule
+from .profiling import profiled
+
+pd = LazyModule("pandas")
+
+# ====================== تاریخ شمسی ======================
+@functools.lru_cache(maxsize=None)
+def _jalali() -> Tuple[Optional[type], Optional[type]]:
+    """(JalaliDate، JalaliDateTime)؛ persiantools در اولین تبدیل شمسی import می‌شود، نه هنگام بارگذاری برنامه."""
+    try:
+        from persiantools.jdatetime import JalaliDate, JalaliDateTime
+    except Exception:
+        return None, None
+    return JalaliDate, JalaliDateTime
+
+def _jalali_supported() -> bool:
+    return _jalali()[0] is not None
+
+def today_jalali_str() -> str:
+    return _jalali()[0].today().strftime("%Y/%m/%d") if _jalali_supported() else ""
+
+def jalali_str_to_date(s: str) -> Optional[date]:
+    if not s or not _jalali_supported():
+        return None
+    try:
+        g = _jalali()[0].strptime(s.strip(), "%Y/%m/%d").to_gregorian()
+        return date(g.year, g.month, g.day)
+    except Exception:
+        return None
+
+def date_to_jalali_str(d: date) -> str:
+    if not d or not _jalali_supported():
+        return ""
+    try:
+        return _jalali()[0].fromgregorian(date=d).strftime("%Y/%m/%d")
+    except Exception:
+        return ""
+
+@functools.lru_cache(maxsize=8192)
+def jalali_month(day_iso: str) -> str:
+    """'YYYY-MM-DD…' → ماه شمسی 'YYYY/MM' برای گروه‌بندی گزارش‌ها (بدون persiantools: ماه میلادی 'YYYY-MM')"""
+    if _jalali_supported():
+        try:
+            return _jalali()[0].fromgregorian(date=date.fromisoformat(day_iso[:10])).strftime("%Y/%m")
+        except Exception:
+            pass
+    return day_iso[:7]
+
+@functools.lru_cache(maxsize=8192)
+def jalali_week(day_iso: str) -> str:
+    """'YYYY-MM-DD…' → شنبه همان هفته (شروع هفته شمسی) به شکل 'YYYY/MM/DD' شمسی (یا میلادی بدون persiantools)"""
+    d = date.fromisoformat(day_iso[:10])
+    saturday = d - timedelta(days=(d.weekday() - 5) % 7)
+    return date_to_jalali_str(saturday) or saturday.isoformat()
+
+def dt_to_jalali_str(dt_iso_or_none: Optional[str]) -> str:
+    """yyyy-mm-dd[ hh:mm[:ss]] → 'YYYY/MM/DD HH:MM' شمسی"""
+    if not dt_iso_or_none or not _jalali_supported():
+        return dt_iso_or_none or ""
+    try:
+        if "T" in dt_iso_or_none:
+            gdt = datetime.fromisoformat(dt_iso_or_none)
+        else:
+            try:
+                gdt = datetime.strptime(dt_iso_or_none, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                try:
+                    gdt = datetime.strptime(dt_iso_or_none, "%Y-%m-%d %H:%M")
+                except ValueError:
+                    gdt = datetime.strptime(dt_iso_or_none, "%Y-%m-%d")
+        jdt = _jalali()[1].fromgregorian(datetime=gdt)
+        return jdt.strftime("%Y/%m/%d %H:%M")
+    except Exception:
+        return dt_iso_or_none
+
+def plain_date_to_jalali_str(maybe_date: str) -> str:
+    """
+    🛠️ مبدل مقاوم برای تاریخ‌های ستونی (مانند due_date):
+    - 'YYYY-MM-DD' → 'YYYY/MM/DD' (شمسی)
+    - اگر فرمت دیگری بود، همان را برمی‌گرداند
+    """
+    if not maybe_date:
+        return ""
+    try:
+        d = datetime.strptime(str(maybe_date).strip(), "%Y-%m-%d").date()
+        return date_to_jalali_str(d)
+    except Exception:
+        return str(maybe_date)
+
+# ====================== فرمت تاریخ میلادی با روز هفته ======================
+def format_gregorian_with_weekday(dt_str: str) -> str:
+    """تبدیل رشته تاریخ به فرمت میلادی با روز هفته"""
+    if not dt_str:
+        return ""
+    
+    try:
+        # تبدیل رشته به datetime
+        if "T" in dt_str:
+            dt = datetime.fromisoformat(dt_str)
+        else:
+            try:
+                dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                try:
+                    dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
+                except ValueError:
+                    dt = datetime.strptime(dt_str, "%Y-%m-%d")
+        
+        # نام روزهای هفته به فارسی
+        weekdays = {
+            0: "دوشنبه",
+            1: "سه‌شنبه", 
+            2: "چهارشنبه",
+            3: "پنجشنبه",
+            4: "جمعه",
+            5: "شنبه",
+            6: "یکشنبه"
+        }
+        
+        weekday = weekdays[dt.weekday()]
+        return f"{dt.strftime('%Y-%m-%d')} ({weekday})"
+    
+    except Exception:
+        return dt_str
+
+def format_date_only_with_weekday(date_str: str) -> str:
+    """تبدیل تاریخ فقط (بدون زمان) به فرمت میلادی با روز هفته"""
+    if not date_str:
+        return ""
+    
+    try:
+        dt = datetime.strptime(str(date_str).strip(), "%Y-%m-%d")
+        
+        # نام روزهای هفته به فارسی
+        weekdays = {
+            0: "دوشنبه",
+            1: "سه‌شنبه", 
+            2: "چهارشنبه",
+            3: "پنجشنبه",
+            4: "جمعه",
+            5: "شنبه",
+            6: "یکشنبه"
+        }
+        
+        weekday = weekdays[dt.weekday()]
+        return f"{dt.strftime('%Y-%m-%d')} ({weekday})"
+    
+    except Exception:
+        return date_str
+
+@profiled("transform")
+def format_dates_with_weekday(s: pd.Series) -> pd.Series:
+    """نسخه ستونی: فقط روی روزهای یکتا (۱۰ نویسه اول) محاسبه و بعد نگاشت می‌شود."""
+    day = s.fillna("").astype(str).str[:10]
+    return day.map({d: format_date_only_with_weekday(d) for d in day.unique()})
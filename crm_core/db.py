@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""ساخت connection (با پایش کوئری در صورت فعال بودن) و ابزار مشترک لایه داده."""
+import functools
+import hashlib
+import sqlite3
+import threading
+from typing import Callable, Optional, TypeVar
+
+from . import config
+from .monitor import QUERY_STATS, InstrumentedConnection
+
+T = TypeVar("T")
+
+def connect_db(db_path: Optional[str] = None, **kwargs) -> sqlite3.Connection:
+    """کارخانه واحد connection؛ فقط وقتی پایش فعال است نسخه ابزارگذاری‌شده ساخته می‌شود."""
+    if QUERY_STATS.enabled:
+        kwargs["factory"] = InstrumentedConnection
+    return sqlite3.connect(db_path or config.DB_PATH, **kwargs)
+
+def get_conn() -> sqlite3.Connection:
+    conn = connect_db(config.DB_PATH, check_same_thread=False, timeout=10)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute("PRAGMA journal_mode=WAL;")
+    return conn
+
+def sha256(txt: str) -> str:
+    return hashlib.sha256((txt or "").encode("utf-8")).hexdigest()
+
+def _column_exists(conn: sqlite3.Connection, table: str, col: str) -> bool:
+    # table_xinfo ستون‌های تولیدی (GENERATED) را هم فهرست می‌کند
+    rows = conn.execute(f"PRAGMA table_xinfo({table});").fetchall()
+    return any(r[1] == col for r in rows)
+
+def _ensure_trigger(conn: sqlite3.Connection, name: str, sql: str):
+    """تریگر را فقط وقتی تعریفش عوض شده دوباره می‌سازد (init_db در هر rerun اجرا می‌شود)."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?;", (name,)).fetchone()
+    if row and row[0] == sql:
+        return
+    conn.execute(f"DROP TRIGGER IF EXISTS {name};")
+    conn.execute(sql)
+
+def shared_resource(factory: Callable[[], T]) -> Callable[[], T]:
+    """یک نمونه برای کل پروسه، با ساخت تنبل در اولین صدا زدن (معادل st.cache_resource بدون Streamlit)."""
+    lock = threading.Lock()
+    box: list = []
+
+    @functools.wraps(factory)
+    def get() -> T:
+        if not box:
+            with lock:
+                if not box:
+                    box.append(factory())
+        return box[0]
+    return get
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+پیدا کردن مخاطبین و شرکت‌های تکراری و ادغام آن‌ها.
+
+مقایسه دوبه‌دو (n²) در ۱۰۰ هزار مخاطب عملی نیست؛ به‌جایش هر رکورد با «کلید بلوک» فقط با رکوردهای هم‌کلید مقایسه
+می‌شود: شماره E.164 (مستقیم از idx_*_phone_e164 با GROUP BY)، نام نرمال‌شده (ي/ك عربی، نیم‌فاصله، ارقام فارسی،
+کلمه‌هایی مثل «شرکت»)، و سه‌حرفی‌های نام (trigram) با ایندکس معکوس. سه‌حرفی‌های خیلی پرتکرار نامزد نمی‌سازند،
+پس هزینه تقریباً خطی است. زوج‌های مشابه با union-find به خوشه تبدیل می‌شوند. ادغام هر خوشه یک تراکنش در صف
+نویسنده است: تماس‌ها، پیگیری‌ها، سفارش‌ها و users.company_id به رکورد ماندنی منتقل و بقیه حذف می‌شوند.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Any, Collection, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from .archive import archive_reassign_users, with_archive
+from .db import get_conn
+from .lazy import LazyModule
+from .phones import ARABIC_DIGITS, PERSIAN_DIGITS
+from .profiling import profiled
+from .workers import PRIORITY_BULK, db_writer, run_write, submit_write
+
+pd = LazyModule("pandas")
+
+# ====================== نرمال‌سازی نام ======================
+_NAME_TRANS = {ord(a): b for a, b in {
+    "ي": "ی", "ى": "ی", "ئ": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه", "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ؤ": "و",
+    "ـ": "", "‌": " ", "‍": "", "‎": "", "‏": "",
+}.items()}
+_NAME_TRANS.update({ord(ch): str(i) for digits in (PERSIAN_DIGITS, ARABIC_DIGITS) for i, ch in enumerate(digits)})
+_NAME_TRANS.update({cp: None for cp in [*range(0x064B, 0x0660), 0x0670]})  # اعراب (فتحه، تشدید، ...)
+_NAME_TOKEN_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d+")
+# کلمه‌هایی که در نام شرکت تمایزی ایجاد نمی‌کنند
+COMPANY_STOPWORDS = {"شرکت", "موسسه", "مسسه", "گروه", "سهامی", "خاص", "عام", "تعاونی", "با", "مسیولیت", "محدود",
+                     "co", "company", "ltd", "inc", "group"}
+DEDUPE_THRESHOLD = 0.7
+DEDUPE_MAX_POSTING = 200
+
+def normalize_name(name: Optional[str], stopwords: Collection[str] = ()) -> str:
+    """نام برای مقایسه: حروف عربی/فارسی یکسان، بدون اعراب و نیم‌فاصله و فاصله، ارقام ASCII، حروف کوچک"""
+    s = name or ""
+    if any(ch >= "\ufb50" for ch in s):  # شکل‌های نمایشی عربی (ﻙ، ﯼ، ...)
+        s = unicodedata.normalize("NFKC", s)
+    tokens = _NAME_TOKEN_RE.findall(s.translate(_NAME_TRANS).lower())
+    return "".join(t for t in tokens if t not in stopwords) if stopwords else "".join(tokens)
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"#{key}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# ====================== خوشه‌بندی ======================
+class _DisjointSet:
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+        self.reasons: Dict[int, Set[str]] = defaultdict(set)
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        root = parent.setdefault(x, x)
+        while root != parent[root]:
+            root = parent[root]
+        while x != root:  # فشرده‌سازی مسیر
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a: int, b: int, reason: str):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            ra, rb = min(ra, rb), max(ra, rb)
+            self.parent[rb] = ra
+            self.reasons[ra] |= self.reasons.pop(rb, set())
+        self.reasons[ra].add(reason)
+
+    def clusters(self) -> List[Dict[str, Any]]:
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for x in list(self.parent):
+            groups[self.find(x)].append(x)
+        out = [{"ids": sorted(ids), "reasons": sorted(self.reasons[root])}
+               for root, ids in groups.items() if len(ids) > 1]
+        out.sort(key=lambda c: (-len(c["ids"]), c["ids"][0]))
+        return out
+
+def _similar(g: Set[str], og: Set[str], threshold: float, shared: Optional[int] = None) -> bool:
+    n, m = len(g), len(og)
+    if min(n, m) < threshold * max(n, m):  # اختلاف طول زیاد: بدون محاسبه اشتراک
+        return False
+    k = len(g & og) if shared is None else shared
+    return k / (n + m - k) >= threshold
+
+def _name_pairs(ds: _DisjointSet, records: Iterable[Tuple[int, Hashable, str]], threshold: float, max_posting: int):
+    """
+    records: (id، کلید بلوک، نام نرمال‌شده). هم‌نام‌های دقیق هم‌بلوک مستقیم وصل می‌شوند؛ بقیه فقط با رکوردهایی
+    مقایسه می‌شوند که حداقل یک سه‌حرفی کم‌تکرار مشترک در همان بلوک دارند (شباهت جاکارد ≥ threshold).
+    بلوک‌های کوچک (مثل مخاطبان یک شرکت) مستقیم دوبه‌دو مقایسه می‌شوند. عددهای داخل نام باید یکی باشند
+    («فولاد ۲» تکراری «فولاد ۳» نیست).
+    """
+    blocks: Dict[Hashable, Dict[str, int]] = defaultdict(dict)
+    for rid, block, key in records:
+        if not key:
+            continue
+        first = blocks[block].setdefault(key, rid)
+        if first != rid:
+            ds.union(first, rid, "name")
+    for members in blocks.values():
+        items = [(rid, _trigrams(key), _DIGITS_RE.findall(key)) for key, rid in members.items()]
+        if len(items) <= max_posting // 4:
+            for i, (rid, g, digits) in enumerate(items):
+                for other, og, odigits in items[i + 1:]:
+                    if odigits == digits and _similar(g, og, threshold):
+                        ds.union(rid, other, "name")
+            continue
+        index: Dict[str, List[int]] = defaultdict(list)
+        for pos, (_, g, _) in enumerate(items):
+            for t in g:
+                index[t].append(pos)
+        for pos, (rid, g, digits) in enumerate(items):
+            shared: Dict[int, int] = defaultdict(int)
+            skipped = 0
+            for t in g:
+                posting = index[t]
+                if len(posting) > max_posting:
+                    skipped += 1
+                    continue
+                for other in posting:
+                    if other > pos:
+                        shared[other] += 1
+            for other, k in shared.items():
+                orid, og, odigits = items[other]
+                # سه‌حرفی‌های پرتکرار شمرده نشده‌اند؛ اگر با آن‌ها هم به آستانه نمی‌رسد، اشتراک دقیق لازم نیست
+                if odigits == digits and _similar(g, og, threshold, None if skipped else k):
+                    ds.union(rid, orid, "name")
+
+def _phone_pairs(ds: _DisjointSet, conn: sqlite3.Connection, table: str):
+    """هم‌شماره‌ها فقط از روی ایندکس (بدون محاسبه ستون VIRTUAL برای هر ردیف)"""
+    for (ids,) in conn.execute(f"""
+            SELECT group_concat(id) FROM {table} INDEXED BY idx_{table}_phone_e164
+            WHERE phone_e164 > '' GROUP BY phone_e164 HAVING COUNT(*) > 1;"""):
+        first, *rest = (int(x) for x in ids.split(","))
+        for rid in rest:
+            ds.union(first, rid, "phone")
+
+@profiled("query")
+def find_duplicate_contacts(threshold: float = DEDUPE_THRESHOLD,
+                            max_posting: int = DEDUPE_MAX_POSTING) -> List[Dict[str, Any]]:
+    """
+    خوشه‌های مخاطب تکراری: هم‌شماره (E.164)، یا نام مشابه در همان شرکت (نام تنها برای اشخاص کافی نیست).
+    خروجی: [{ids: [...], reasons: ['name'|'phone', ...]}] از بزرگ‌ترین خوشه
+    """
+    ds = _DisjointSet()
+    conn = get_conn()
+    try:
+        _phone_pairs(ds, conn, "users")
+        rows = conn.execute("SELECT id, company_id, full_name FROM users WHERE company_id IS NOT NULL;").fetchall()
+    finally:
+        conn.close()
+    _name_pairs(ds, ((rid, cid, normalize_name(name)) for rid, cid, name in rows), threshold, max_posting)
+    return ds.clusters()
+
+@profiled("query")
+def find_duplicate_companies(threshold: float = DEDUPE_THRESHOLD,
+                             max_posting: int = DEDUPE_MAX_POSTING) -> List[Dict[str, Any]]:
+    """خوشه‌های شرکت تکراری: هم‌شماره یا نام مشابه (بدون «شرکت»، «گروه» و ...)"""
+    ds = _DisjointSet()
+    conn = get_conn()
+    try:
+        _phone_pairs(ds, conn, "companies")
+        rows = conn.execute("SELECT id, name FROM companies;").fetchall()
+    finally:
+        conn.close()
+    _name_pairs(ds, ((rid, None, normalize_name(name, COMPANY_STOPWORDS)) for rid, name in rows),
+                threshold, max_posting)
+    return ds.clusters()
+
+# ====================== نمایش خوشه ======================
+@profiled("query")
+def df_duplicate_contacts(ids: List[int]) -> pd.DataFrame:
+    """ردیف‌های یک خوشه مخاطب با تعداد سوابق هرکدام (برای انتخاب رکورد ماندنی)"""
+    conn = get_conn()
+    ph = ",".join(["?"] * len(ids))
+    df = pd.read_sql_query(f"""
+        SELECT u.id AS ID, u.full_name AS نام, u.phone AS تلفن, c.name AS شرکت, au.username AS "کارشناس فروش",
+               u.status AS وضعیت,
+               (SELECT COUNT(*) FROM calls WHERE user_id=u.id) AS تماس‌ها,
+               (SELECT COUNT(*) FROM followups WHERE user_id=u.id) AS پیگیری‌ها,
+               (SELECT COUNT(*) FROM orders WHERE user_id=u.id) AS سفارش‌ها,
+               u.created_at AS "تاریخ ایجاد"
+        FROM users u
+        LEFT JOIN companies c ON c.id=u.company_id
+        LEFT JOIN app_users au ON au.id=u.owner_id
+        WHERE u.id IN ({ph}) ORDER BY u.id;""", conn, params=list(ids))
+    conn.close()
+    return df
+
+@profiled("query")
+def df_duplicate_companies(ids: List[int]) -> pd.DataFrame:
+    conn = get_conn()
+    ph = ",".join(["?"] * len(ids))
+    df = pd.read_sql_query(f"""
+        SELECT c.id AS ID, c.name AS نام, c.phone AS تلفن, c.status AS وضعیت,
+               (SELECT COUNT(*) FROM users WHERE company_id=c.id) AS مخاطبین,
+               (SELECT COUNT(*) FROM orders WHERE company_id=c.id) AS سفارش‌ها,
+               c.created_at AS "تاریخ ایجاد"
+        FROM companies c WHERE c.id IN ({ph}) ORDER BY c.id;""", conn, params=list(ids))
+    conn.close()
+    return df
+
+# ====================== ادغام ======================
+# ستون‌هایی که اگر در رکورد ماندنی خالی باشند از اولین رکورد تکراری پر می‌شوند؛ یادداشت‌ها به هم اضافه می‌شوند
+USER_FILL_COLUMNS = ["first_name", "last_name", "phone", "role", "company_id", "domain", "province", "owner_id"]
+COMPANY_FILL_COLUMNS = ["phone", "address"]
+# ارجاع‌های دیگر جدول‌ها: (جدول، ستون)؛ تماس/پیگیری بایگانی‌شده با archive_reassign_users
+USER_REFERENCES = [("calls", "user_id"), ("followups", "user_id"), ("orders", "user_id"),
+                   ("app_users", "linked_user_id")]
+COMPANY_REFERENCES = [("users", "company_id"), ("orders", "company_id")]
+
+def _merge_job(table: str, keep_id: int, merge_ids: List[int], references: List[Tuple[str, str]],
+               fill_columns: List[str]):
+    merge_ids = sorted({int(x) for x in merge_ids} - {int(keep_id)})
+
+    def _do(conn: sqlite3.Connection) -> int:
+        if not merge_ids:
+            return 0
+        ph = ",".join(["?"] * len(merge_ids))
+        cols = fill_columns + ["note"]
+        keep = conn.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE id=?;", (keep_id,)).fetchone()
+        if keep is None:
+            raise ValueError(f"رکورد {keep_id} وجود ندارد.")
+        dups = conn.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE id IN ({ph}) ORDER BY id;",
+                            merge_ids).fetchall()
+        for ref_table, ref_col in references:
+            conn.execute(f"UPDATE {ref_table} SET {ref_col}=? WHERE {ref_col} IN ({ph});", [keep_id] + merge_ids)
+        # اول حذف تکراری‌ها تا شماره یکتا (users.phone) به رکورد ماندنی منتقل شود
+        deleted = conn.execute(f"DELETE FROM {table} WHERE id IN ({ph});", merge_ids).rowcount
+        fields: Dict[str, Any] = {}
+        for i, col in enumerate(fill_columns):
+            if keep[i] in (None, ""):
+                fields[col] = next((d[i] for d in dups if d[i] not in (None, "")), keep[i])
+        notes = [keep[-1]] + [d[-1] for d in dups]
+        merged_note = "\n".join(dict.fromkeys(n.strip() for n in notes if n and n.strip()))
+        if merged_note != (keep[-1] or ""):
+            fields["note"] = merged_note
+        fields = {k: v for k, v in fields.items() if v != keep[cols.index(k)]}
+        if fields:
+            sets = ", ".join(f"{k}=?" for k in fields)
+            conn.execute(f"UPDATE {table} SET {sets} WHERE id=?;", list(fields.values()) + [keep_id])
+        return deleted
+    return _do
+
+def _submit_contact_merge(keep_id: int, merge_ids: List[int]) -> Future:
+    """
+    ادغام مخاطب تماس‌ها و پیگیری‌های بایگانی‌شده را هم به keep_id منتقل می‌کند (بایگانی FK ندارد و بدون این
+    ردیف‌هایش به مخاطب حذف‌شده اشاره می‌کنند)؛ ATTACH بیرون از تراکنش است، پس کار «غیرتراکنشی» سپرده می‌شود.
+    """
+    merge = _merge_job("users", keep_id, merge_ids, USER_REFERENCES, USER_FILL_COLUMNS)
+    dup_ids = sorted({int(x) for x in merge_ids} - {int(keep_id)})
+
+    def _do(conn: sqlite3.Connection, archive_tables: Tuple[str, ...]) -> int:
+        if dup_ids:
+            archive_reassign_users(conn, archive_tables, dup_ids, int(keep_id))
+        return merge(conn)
+    return db_writer().submit(with_archive(_do), priority=PRIORITY_BULK, transactional=False)
+
+def merge_contacts(keep_id: int, merge_ids: List[int]) -> int:
+    """ادغام مخاطبین merge_ids در keep_id در یک تراکنش؛ خروجی: تعداد رکوردهای حذف‌شده"""
+    return _submit_contact_merge(keep_id, merge_ids).result()
+
+def merge_companies(keep_id: int, merge_ids: List[int]) -> int:
+    return run_write(_merge_job("companies", keep_id, merge_ids, COMPANY_REFERENCES, COMPANY_FILL_COLUMNS),
+                     priority=PRIORITY_BULK)
+
+@profiled("actions")
+def merge_clusters(kind: str, clusters: List[Dict[str, Any]]) -> Tuple[int, List[str]]:
+    """
+    ادغام گروهی؛ در هر خوشه قدیمی‌ترین رکورد (کمترین id) می‌ماند. هر خوشه تراکنش خودش را دارد تا خطای یکی
+    بقیه را برنگرداند. kind: 'contacts' یا 'companies'. خروجی: (تعداد رکوردهای حذف‌شده، پیام خطاها)
+    """
+    if kind == "contacts":
+        futures = [(c, _submit_contact_merge(c["ids"][0], c["ids"][1:])) for c in clusters]
+    else:
+        futures = [(c, submit_write(_merge_job("companies", c["ids"][0], c["ids"][1:], COMPANY_REFERENCES,
+                                               COMPANY_FILL_COLUMNS), priority=PRIORITY_BULK)) for c in clusters]
+    merged, msgs = 0, []
+    for c, fut in futures:
+        try:
+            merged += fut.result()
+        except (sqlite3.Error, ValueError) as e:
+            msgs.append(f"خوشه {c['ids']}: {e}")
+    return merged, msgs
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+تاریخچه تغییر وضعیت (status_history) و گزارش قیف/سرعت فروش روی آن.
+
+وضعیت مخاطب، شرکت و سفارش در جای خود بازنویسی می‌شود؛ تریگرها هر درج و هر تغییر وضعیت را با کارشناس همان
+لحظه در status_history ثبت می‌کنند (ویرایش‌هایی که وضعیت را عوض نمی‌کنند ردیفی نمی‌سازند). گزارش فقط از همین
+جدول و با توابع پنجره‌ای (LEAD / FIRST_VALUE روی PARTITION BY entity_id ORDER BY id) ساخته می‌شود که ترتیبشان را ایندکس
+پوششی idx_status_history_entity می‌دهد؛ یعنی بدون اسکن جداول اصلی و بدون مرتب‌سازی. خروجی SQL به ازای
+(کارشناس، روز، مرحله) تجمیع شده و ماه شمسی در پایتون روی روزهای یکتا حساب می‌شود.
+"""
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from .config import COMPANY_STATUSES, ORDER_STATUSES, USER_STATUSES
+from .dates import jalali_month
+from .db import _ensure_trigger, get_conn
+from .lazy import LazyModule
+from .profiling import profiled
+
+pd = LazyModule("pandas")
+
+# موجودیت → (کارشناس مسئول در لحظه تغییر، مراحل به ترتیب قیف)
+STATUS_HISTORY_ENTITIES: Dict[str, Tuple[str, List[str]]] = {
+    "users": ("{ref}.owner_id", USER_STATUSES),
+    "companies": ("{ref}.created_by", COMPANY_STATUSES),
+    "orders": ("(SELECT owner_id FROM users WHERE id={ref}.user_id)", ORDER_STATUSES),
+}
+
+# changed_at به وقت محلی (مثل closed_at و تاریخ تماس‌ها) تا روز گزارش‌ها با روز کاری کاربر یکی باشد؛
+# CURRENT_TIMESTAMP و created_at جدول‌ها UTC هستند
+_NOW_LOCAL = "datetime('now','localtime')"
+
+def _status_history_triggers() -> List[Tuple[str, str]]:
+    trg = []
+    for t, (owner_sql, _) in STATUS_HISTORY_ENTITIES.items():
+        def log(from_sql):
+            return (f"INSERT INTO status_history (entity, entity_id, from_status, to_status, owner_id, changed_at) "
+                    f"VALUES ('{t}', NEW.id, {from_sql}, NEW.status, {owner_sql.format(ref='NEW')}, {_NOW_LOCAL});")
+        trg.append((f"trg_hist_{t}_ins", f"CREATE TRIGGER trg_hist_{t}_ins AFTER INSERT ON {t} BEGIN {log('NULL')} END"))
+        trg.append((f"trg_hist_{t}_upd",
+                    f"CREATE TRIGGER trg_hist_{t}_upd AFTER UPDATE OF status ON {t} "
+                    f"WHEN OLD.status IS NOT NEW.status BEGIN {log('OLD.status')} END"))
+        # رکورد حذف‌شده (یا ادغام‌شده در رکورد دیگر) از قیف بیرون می‌رود
+        trg.append((f"trg_hist_{t}_del",
+                    f"CREATE TRIGGER trg_hist_{t}_del AFTER DELETE ON {t} "
+                    f"BEGIN DELETE FROM status_history WHERE entity='{t}' AND entity_id=OLD.id; END"))
+    return trg
+
+def ensure_status_history(conn: sqlite3.Connection):
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='status_history';").fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS status_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            from_status TEXT,
+            to_status TEXT NOT NULL,
+            owner_id INTEGER,
+            changed_at TEXT NOT NULL DEFAULT (datetime('now','localtime'))
+        );
+    """)
+    # پوششی و به ترتیب پنجره گزارش؛ id (ترتیب درج) همان ترتیب زمانی است و هم‌زمانی در یک ثانیه را هم جدا می‌کند
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_status_history_entity "
+                 "ON status_history(entity, entity_id, id, changed_at, to_status, owner_id);")
+    for name, sql in _status_history_triggers():
+        _ensure_trigger(conn, name, sql)
+    if not existed:
+        rebuild_status_history(conn)
+
+def rebuild_status_history(conn: sqlite3.Connection):
+    """
+    مهاجرت (و datagen که بدون تریگر درج می‌کند): وضعیت فعلی هر رکورد به‌عنوان ورود اولیه در روز ایجادش؛
+    تاریخچه قبل از این در دسترس نیست.
+    """
+    conn.execute("DELETE FROM status_history;")
+    for t, (owner_sql, _) in STATUS_HISTORY_ENTITIES.items():
+        conn.execute(f"""
+            INSERT INTO status_history (entity, entity_id, from_status, to_status, owner_id, changed_at)
+            SELECT '{t}', x.id, NULL, x.status, {owner_sql.format(ref='x')},
+                   COALESCE(datetime(x.created_at,'localtime'), {_NOW_LOCAL})
+            FROM {t} x;
+        """)
+
+# ====================== گزارش قیف و سرعت ======================
+# هر ردیف: یک دوره ماندن در یک مرحله؛ ورودی (cohort) هر رکورد = روز و کارشناسِ اولین ردیفش
+_STAGES_SQL = """
+    SELECT owner_id, date(changed_at) AS day, to_status AS stage,
+           COALESCE(LEAD(to_status) OVER w, '') AS next_stage,
+           julianday(LEAD(changed_at) OVER w) - julianday(changed_at) AS days_in_stage,
+           date(FIRST_VALUE(changed_at) OVER w) AS cohort_day,
+           FIRST_VALUE(owner_id) OVER w AS cohort_owner,
+           entity_id
+    FROM status_history
+    WHERE entity=?
+    WINDOW w AS (PARTITION BY entity_id ORDER BY id)
+"""
+
+@profiled("query")
+def funnel_data(entity: str) -> Dict[str, "pd.DataFrame"]:
+    """
+    دو جدول خام (بدون فیلتر؛ برای کش روزانه و فیلتر کارشناس/ماه در حافظه):
+      transitions: owner_id, month, stage, next_stage ('' = هنوز در این مرحله), n, days_sum
+      reached:     owner_id, cohort_month, stage, entities  (چند رکورد از هر ماه ورود، حداقل یک بار به مرحله رسیدند؛
+                   stage='' = کل رکوردهای آن ورودی)
+    """
+    conn = get_conn()
+    try:
+        # پنجره فقط یک بار حساب می‌شود (MATERIALIZED)؛ هر دو تجمیع در یک کوئری با ستون kind
+        df = pd.read_sql_query(f"""
+            WITH s AS MATERIALIZED ({_STAGES_SQL})
+            SELECT 't' AS kind, owner_id, day, stage, next_stage, COUNT(*) AS n,
+                   COALESCE(SUM(days_in_stage), 0) AS days_sum
+            FROM s GROUP BY owner_id, day, stage, next_stage
+            UNION ALL
+            SELECT 'r', cohort_owner, cohort_day, stage, NULL, COUNT(DISTINCT entity_id), NULL
+            FROM s GROUP BY cohort_owner, cohort_day, stage
+            UNION ALL
+            SELECT 'r', cohort_owner, cohort_day, '', NULL, COUNT(DISTINCT entity_id), NULL
+            FROM s GROUP BY cohort_owner, cohort_day;
+        """, conn, params=(entity,))
+    finally:
+        conn.close()
+    transitions = df[df["kind"] == "t"].drop(columns="kind")
+    reached = (df[df["kind"] == "r"][["owner_id", "day", "stage", "n"]]
+               .rename(columns={"day": "cohort_day", "n": "entities"}))
+    transitions["month"] = transitions["day"].map({d: jalali_month(d) for d in transitions["day"].unique()})
+    reached["cohort_month"] = reached["cohort_day"].map({d: jalali_month(d) for d in reached["cohort_day"].unique()})
+    for df in (transitions, reached):
+        df["owner_id"] = df["owner_id"].fillna(0).astype(int)
+    return {
+        "transitions": transitions.groupby(["owner_id", "month", "stage", "next_stage"], as_index=False)[["n", "days_sum"]].sum(),
+        "reached": reached.groupby(["owner_id", "cohort_month", "stage"], as_index=False)["entities"].sum(),
+    }
+
+def _stage_order(entity: str, present) -> List[str]:
+    stages = list(STATUS_HISTORY_ENTITIES[entity][1])
+    return stages + sorted(set(present) - set(stages))
+
+def funnel_report(entity: str, data: Dict[str, "pd.DataFrame"], owner_ids: Optional[List[int]] = None,
+                  months: Optional[List[str]] = None, owner_names: Optional[Dict[int, str]] = None
+                  ) -> Dict[str, "pd.DataFrame"]:
+    """
+    جدول‌های نمایشی از خروجی funnel_data (فقط pandas روی داده کوچک تجمیعی):
+      stages      هر مرحله: ورود، هنوز در مرحله، خروج، میانگین روز تا خروج
+      conversion  درصد رفتن از هر مرحله به مرحله بعدی (سطر: از، ستون: به)
+      by_agent    برای هر کارشناس: تعداد ورودی و درصد رسیدن به هر مرحله
+      by_month    همان برای هر ماه ورود (شمسی)
+    """
+    tr, rc = data["transitions"], data["reached"]
+    if owner_ids:
+        tr, rc = tr[tr["owner_id"].isin(owner_ids)], rc[rc["owner_id"].isin(owner_ids)]
+    if months:
+        tr, rc = tr[tr["month"].isin(months)], rc[rc["cohort_month"].isin(months)]
+    order = _stage_order(entity, set(tr["stage"]) | set(rc["stage"]) - {""})
+
+    left = tr[tr["next_stage"] != ""]
+    stages = pd.DataFrame({
+        "ورود": tr.groupby("stage")["n"].sum(),
+        "هنوز_در_مرحله": tr[tr["next_stage"] == ""].groupby("stage")["n"].sum(),
+        "خروج": left.groupby("stage")["n"].sum(),
+        "میانگین_روز_در_مرحله": left.groupby("stage")["days_sum"].sum() / left.groupby("stage")["n"].sum(),
+    }).reindex([s for s in order if s in set(tr["stage"])]).fillna(0)
+    stages["میانگین_روز_در_مرحله"] = stages["میانگین_روز_در_مرحله"].round(1)
+    for col in ("ورود", "هنوز_در_مرحله", "خروج"):
+        stages[col] = stages[col].astype(int)
+
+    moves = left.pivot_table(index="stage", columns="next_stage", values="n", aggfunc="sum", fill_value=0)
+    conversion = (moves.div(moves.sum(axis=1), axis=0) * 100).round(1)
+    conversion = conversion.reindex(index=[s for s in order if s in moves.index],
+                                    columns=[s for s in order if s in moves.columns])
+
+    def reach_table(key: str) -> "pd.DataFrame":
+        total = rc[rc["stage"] == ""].groupby(key)["entities"].sum()
+        piv = rc[rc["stage"] != ""].pivot_table(index=key, columns="stage", values="entities", aggfunc="sum",
+                                                fill_value=0)
+        piv = piv.reindex(index=total.index, columns=[s for s in order if s in piv.columns]).fillna(0)
+        out = (piv.div(total.where(total > 0), axis=0) * 100).round(1)
+        out.insert(0, "ورودی", total.astype(int))
+        return out
+
+    by_agent = reach_table("owner_id")
+    if owner_names:
+        by_agent.index = [owner_names.get(i, "—" if i == 0 else f"#{i}") for i in by_agent.index]
+    by_month = reach_table("cohort_month").sort_index(ascending=False)
+    return {"stages": stages, "conversion": conversion, "by_agent": by_agent, "by_month": by_month}
@@ -0,0 +1,555 @@
+# -*- coding: utf-8 -*-
+"""
+DataFrameهای جدول‌ها و دیالوگ‌ها. دامنه دسترسی صریح است: enforce_owner (کارشناس فقط مخاطبین خودش) و
+owner_ids_filter (فیلتر کارشناس) از بیرون داده می‌شوند و این لایه از نشست کاربر خبری ندارد.
+"""
+from __future__ import annotations
+
+import sqlite3
+from datetime import date, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .archive import attach_archive, attach_archive_for, history_source, reaches_archive
+from .config import CALL_STATUSES, COMPANY_STATUSES, LEVELS, ORDER_STATUSES, TASK_STATUSES, USER_STATUSES
+from .dates import format_date_only_with_weekday, format_dates_with_weekday, format_gregorian_with_weekday
+from .db import get_conn
+from .lazy import LazyModule
+from .profiling import profiled
+
+pd = LazyModule("pandas")
+
+# ====================== مشخصات ستون‌های جدول‌ها (projection) ======================
+# هر جدول صفحه فهرستی از ستون‌های قابل‌نمایش دارد (نام ستون → عبارت SQL، JOIN لازم، قالب‌بندی ستونی).
+# کوئری فقط ستون‌های فهرست صفحه را SELECT می‌کند و JOINها هم فقط وقتی ستونی به آن‌ها نیاز دارد اضافه می‌شوند.
+# متن‌های بلند (توضیحات/جزئیات/یادداشت) در جدول فقط پیش‌نمایش کوتاه‌اند؛ متن کامل در دیالوگ جزئیات خوانده می‌شود.
+GRID_PREVIEW_CHARS = 60
+
+# نوع داده ستون‌ها: مقادیر شمارشی (وضعیت/سطح/کارشناس/استان) → category؛ بقیه متن‌ها → رشته Arrow.
+# هم حافظه کمتر و هم تبدیل سریع‌تر به Arrow در هر rerun (benchmarks/grid_payload.py).
+GRID_STRING_DTYPE = "string[pyarrow]"
+
+class GridCol(NamedTuple):
+    sql: str
+    join: Optional[str] = None
+    fmt: Optional[Callable[[pd.Series], pd.Series]] = None
+
+def as_category(values: Optional[List[str]] = None) -> Callable[[pd.Series], pd.Series]:
+    """قالب‌بند ستونی دسته‌ای؛ دسته‌ها = مقادیر ثابت + مقادیر دیده‌شده (مقدار قدیمی/ناشناخته NaN نمی‌شود)"""
+    def _fmt(s: pd.Series) -> pd.Series:
+        seen = sorted(str(v) for v in s.dropna().unique())
+        return s.astype(pd.CategoricalDtype(list(dict.fromkeys(list(values or []) + seen))))
+    return _fmt
+
+def text_preview_sql(expr: str, n: int = GRID_PREVIEW_CHARS) -> str:
+    return f"CASE WHEN length({expr}) > {n} THEN substr({expr}, 1, {n}) || '…' ELSE COALESCE({expr}, '') END"
+
+def _grid_select(catalog: Dict[str, GridCol], columns: List[str], joins: Dict[str, str],
+                 extra_joins: Tuple[str, ...] = ()) -> Tuple[str, str]:
+    """(فهرست SELECT، JOINهای لازم) برای ستون‌های خواسته‌شده؛ ترتیب JOINها همان ترتیب joins است."""
+    select = ",\n        ".join(f"{catalog[c].sql} AS {c}" for c in columns)
+    needed = {catalog[c].join for c in columns if catalog[c].join} | set(extra_joins)
+    return select, "\n".join(sql for alias, sql in joins.items() if alias in needed)
+
+def day_range_sql(col: str, start: Optional[date], end: Optional[date], where: List[str], params: list):
+    """
+    فیلتر روز روی ستون متنی ISO بدون date() روی ستون، تا ایندکس آن ستون استفاده شود:
+    date(col) >= start ⇔ col >= 'start' و date(col) <= end ⇔ col < 'end+1' (برای هر دو شکل 'T' و فاصله).
+    """
+    if start:
+        where.append(f"{col} >= ?"); params.append(start.isoformat())
+    if end:
+        where.append(f"{col} < ?"); params.append((end + timedelta(days=1)).isoformat())
+
+@profiled("transform")
+def _grid_format(df: pd.DataFrame, catalog: Dict[str, GridCol]) -> pd.DataFrame:
+    for c in df.columns:
+        if catalog[c].fmt:
+            df[c] = catalog[c].fmt(df[c])
+        if df[c].dtype == object:
+            df[c] = df[c].astype(GRID_STRING_DTYPE)
+    return df
+
+@profiled("transform")
+def grid_restore_dtypes(df: pd.DataFrame, like: pd.DataFrame) -> pd.DataFrame:
+    """بعد از concat، ستون‌های category که دسته‌هایشان فرق داشته object می‌شوند؛ برگرداندن به category"""
+    for c in df.columns:
+        if c in like.columns and isinstance(like[c].dtype, pd.CategoricalDtype) \
+                and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = as_category(list(like[c].cat.categories))(df[c])
+    return df
+
+def _open_followup_label(s: pd.Series) -> pd.Series:
+    return format_dates_with_weekday(s).replace("", "ندارد")
+
+COMPANY_JOINS: Dict[str, str] = {}
+# EXISTS تودرتو تا SQLite از کاربران همان شرکت (idx_users_company) شروع کند و بعد (status, user_id) را بگردد؛
+# با JOIN ساده، برای هر شرکت همه پیگیری‌های باز پیمایش می‌شد.
+COMPANY_HAS_OPEN_SQL = ("EXISTS (SELECT 1 FROM users u WHERE u.company_id=c.id AND EXISTS ("
+                        "SELECT 1 FROM followups f WHERE f.user_id=u.id AND f.status='در حال انجام'))")
+COMPANY_COLUMNS: Dict[str, GridCol] = {
+    "ID": GridCol("c.id"),
+    "_created_at": GridCol("c.created_at"),
+    "نام_شرکت": GridCol("c.name"),
+    "تلفن": GridCol("COALESCE(c.phone,'')"),
+    "وضعیت_شرکت": GridCol("COALESCE(c.status,'')", fmt=as_category(COMPANY_STATUSES)),
+    "سطح_شرکت": GridCol("COALESCE(c.level,'')", fmt=as_category(LEVELS)),
+    "آدرس": GridCol(text_preview_sql("c.address")),
+    "یادداشت": GridCol(text_preview_sql("c.note")),
+    "تاریخ_ایجاد": GridCol("c.created_at", fmt=format_dates_with_weekday),
+    "پیگیری_باز_دارد": GridCol(COMPANY_HAS_OPEN_SQL,
+                               fmt=lambda s: s.map({1: "دارد", 0: "ندارد"}).astype(pd.CategoricalDtype(["دارد", "ندارد"]))),
+    # 🚑 DISTINCT داخل زیربرگزیده تا با جداکننده سفارشی GROUP_CONCAT سازگار باشد
+    "کارشناس_فروش": GridCol("(SELECT GROUP_CONCAT(username, '، ') FROM ("
+                            "SELECT DISTINCT au.username AS username FROM users u "
+                            "LEFT JOIN app_users au ON au.id=u.owner_id "
+                            "WHERE u.company_id=c.id AND au.username IS NOT NULL) AS d)", fmt=as_category()),
+}
+COMPANIES_GRID = ["ID", "_created_at", "نام_شرکت", "تلفن", "وضعیت_شرکت", "سطح_شرکت",
+                  "تاریخ_ایجاد", "پیگیری_باز_دارد", "کارشناس_فروش"]
+
+USER_JOINS = {"c": "LEFT JOIN companies c ON c.id=u.company_id",
+              "au": "LEFT JOIN app_users au ON au.id=u.owner_id"}
+USER_COLUMNS: Dict[str, GridCol] = {
+    "ID": GridCol("u.id"),
+    "_created_at": GridCol("u.created_at"),
+    "نام": GridCol("u.first_name"),
+    "نام_خانوادگی": GridCol("u.last_name"),
+    "نام_کامل": GridCol("u.full_name"),
+    "شرکت": GridCol("COALESCE(c.name,'')", "c"),
+    "تلفن": GridCol("COALESCE(u.phone,'')"),
+    "وضعیت_کاربر": GridCol("COALESCE(u.status,'')", fmt=as_category(USER_STATUSES)),
+    "سطح_کاربر": GridCol("COALESCE(u.level,'')", fmt=as_category(LEVELS)),
+    "حوزه_فعالیت": GridCol("COALESCE(u.domain,'')", fmt=as_category()),
+    "استان": GridCol("COALESCE(u.province,'')", fmt=as_category()),
+    "یادداشت": GridCol(text_preview_sql("u.note")),
+    "تاریخ_ایجاد": GridCol("u.created_at", fmt=format_dates_with_weekday),
+    "آخرین_تماس": GridCol("(SELECT MAX(call_datetime) FROM calls cl WHERE cl.user_id=u.id)",
+                          fmt=format_dates_with_weekday),
+    # «ندارد» یا تاریخ آخرین پیگیری باز
+    "وضعیت_پیگیری_باز": GridCol("(SELECT MAX(f2.due_date) FROM followups f2 "
+                                "WHERE f2.user_id=u.id AND f2.status='در حال انجام')",
+                                fmt=_open_followup_label),
+    "کارشناس_فروش": GridCol("COALESCE(au.username,'')", "au", fmt=as_category()),
+}
+# ✅ (5) ستون‌های «تاریخ_ایجاد» و «حوزه_فعالیت» در جدول کاربران نمایش داده نمی‌شوند
+USERS_GRID = ["ID", "_created_at", "نام", "نام_خانوادگی", "شرکت", "تلفن", "وضعیت_کاربر", "سطح_کاربر",
+              "آخرین_تماس", "استان", "وضعیت_پیگیری_باز", "کارشناس_فروش"]
+
+CALL_COLUMNS: Dict[str, GridCol] = {
+    "ID": GridCol("cl.id"),
+    "نام_کاربر": GridCol("u.full_name"),
+    "شرکت": GridCol("COALESCE(c.name,'')", "c"),
+    "تاریخ_و_زمان": GridCol("cl.call_datetime", fmt=format_dates_with_weekday),
+    "وضعیت": GridCol("cl.status", fmt=as_category(CALL_STATUSES)),
+    "توضیحات": GridCol(text_preview_sql("cl.description")),
+    "کارشناس_فروش": GridCol("COALESCE(au.username,'')", "au", fmt=as_category()),
+}
+CALLS_GRID = list(CALL_COLUMNS)
+
+FOLLOWUP_COLUMNS: Dict[str, GridCol] = {
+    "ID": GridCol("f.id"),
+    "نام_کاربر": GridCol("u.full_name"),
+    "شرکت": GridCol("COALESCE(c.name,'')", "c"),
+    "عنوان": GridCol("f.title"),
+    "جزئیات": GridCol(text_preview_sql("f.details")),
+    "تاریخ_پیگیری": GridCol("f.due_date", fmt=format_dates_with_weekday),
+    "وضعیت": GridCol("f.status", fmt=as_category(TASK_STATUSES)),
+    "کارشناس_فروش": GridCol("COALESCE(au.username,'')", "au", fmt=as_category()),
+}
+FOLLOWUPS_GRID = list(FOLLOWUP_COLUMNS)
+
+ORDER_JOINS = {"u": "LEFT JOIN users u ON u.id = o.user_id",
+               "c": "LEFT JOIN companies c ON c.id = o.company_id",
+               "p": "LEFT JOIN products p ON p.id = o.product_id"}
+ORDER_COLUMNS: Dict[str, GridCol] = {
+    "ID": GridCol("o.id"),
+    "کاربر": GridCol("COALESCE(u.full_name, '—')", "u"),
+    "شرکت": GridCol("COALESCE(c.name, '—')", "c"),
+    "محصول": GridCol("p.name", "p", fmt=as_category()),
+    "دسته_بندی": GridCol("p.category", "p", fmt=as_category()),
+    "تاریخ_سفارش": GridCol("o.order_date", fmt=format_dates_with_weekday),
+    # 🔧 4- عدد می‌ماند؛ جداکننده هزارگان با column_config در صفحه سفارشات
+    "مبلغ_کل": GridCol("o.total_amount"),
+    "وضعیت": GridCol("o.status", fmt=as_category(ORDER_STATUSES)),
+    "تاریخ_ایجاد": GridCol("o.created_at", fmt=format_dates_with_weekday),
+}
+ORDERS_GRID = list(ORDER_COLUMNS)
+
+# ====================== DataFrames برای صفحات ======================
+def companies_query(q_name, f_status, f_level, created_from, created_to,
+                    has_open_task, owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int],
+                    only_ids: Optional[List[int]] = None, columns: Optional[List[str]] = None) -> Tuple[str, list]:
+    """SQL و پارامترهای جدول شرکت‌ها (مرتب‌شده؛ API با LIMIT/OFFSET صفحه‌بندی‌اش می‌کند)"""
+    params, where = [], []
+    if only_ids is not None:
+        where.append("c.id IN (" + ",".join(["?"]*len(only_ids)) + ")"); params += [int(x) for x in only_ids]
+    
+    if q_name: 
+        where.append("c.name LIKE ?"); params.append(f"%{q_name.strip()}%")
+    if f_status: 
+        where.append("c.status IN (" + ",".join(["?"]*len(f_status)) + ")"); params += f_status
+    if f_level: 
+        where.append("c.level IN (" + ",".join(["?"]*len(f_level)) + ")"); params += f_level
+    day_range_sql("c.created_at", created_from, created_to, where, params)
+    if has_open_task is not None:
+        where.append(("" if has_open_task else "NOT ") + COMPANY_HAS_OPEN_SQL)
+    
+    # فیلتر کارشناس فروش: زیرپرس‌وجوی غیرهمبسته (یک بار با idx_users_owner) به جای EXISTS برای هر شرکت
+    if enforce_owner:
+        where.append("c.id IN (SELECT company_id FROM users WHERE owner_id=?)")
+        params.append(enforce_owner)
+    if owner_ids_filter:
+        placeholders = ",".join(["?"]*len(owner_ids_filter))
+        where.append(f"c.id IN (SELECT company_id FROM users WHERE owner_id IN ({placeholders}))")
+        params += owner_ids_filter
+
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    select_sql, join_sql = _grid_select(COMPANY_COLUMNS, columns or COMPANIES_GRID, COMPANY_JOINS)
+
+    return f"""
+      SELECT
+        {select_sql}
+      FROM companies c
+      {join_sql}
+      {where_sql}
+      ORDER BY c.created_at DESC, c.id DESC
+    """, params
+
+@profiled("query")
+def df_companies_advanced(q_name, f_status, f_level, created_from, created_to,
+                         has_open_task, owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int],
+                         only_ids: Optional[List[int]] = None, columns: Optional[List[str]] = None):
+    """تابع جدید برای فیلتر کردن شرکت‌ها (only_ids: فقط همین شرکت‌ها — برای وصله افزایشی جدول)"""
+    sql, params = companies_query(q_name, f_status, f_level, created_from, created_to,
+                                  has_open_task, owner_ids_filter, enforce_owner, only_ids, columns)
+    conn = get_conn()
+    df = pd.read_sql_query(sql, conn, params=params)
+    conn.close(); return _grid_format(df, COMPANY_COLUMNS)
+
+def users_query(first_q, last_q, domain_q, created_from, created_to,
+                has_open_task, last_call_from, last_call_to,
+                statuses, owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int],
+                only_ids: Optional[List[int]] = None, columns: Optional[List[str]] = None) -> Tuple[str, list]:
+    params, where = [], []
+    if only_ids is not None:
+        where.append("u.id IN (" + ",".join(["?"]*len(only_ids)) + ")"); params += [int(x) for x in only_ids]
+    if first_q: where.append("u.first_name LIKE ?"); params.append(f"%{first_q.strip()}%")
+    if last_q:  where.append("u.last_name  LIKE ?"); params.append(f"%{last_q.strip()}%")
+    # 🔧 2- اضافه کردن فیلتر حوزه فعالیت
+    if domain_q: where.append("u.domain LIKE ?"); params.append(f"%{domain_q.strip()}%")
+    day_range_sql("u.created_at", created_from, created_to, where, params)
+    if statuses: where.append("u.status IN (" + ",".join(["?"]*len(statuses)) + ")"); params += statuses
+    # فیلترهای فعالیت داخل SQL تا فقط ردیف‌های لازم خوانده شوند:
+    #   پیگیری باز → idx_followups_status_user ؛ بازه آخرین تماس → idx_calls_datetime و idx_calls_user_datetime
+    if has_open_task is not None:
+        where.append(("" if has_open_task else "NOT ") +
+                     "EXISTS (SELECT 1 FROM followups f WHERE f.user_id=u.id AND f.status='در حال انجام')")
+    # «آخرین تماس» (ستون و فیلتر «تا») روی همه تاریخچه است؛ اگر بایگانی هست، تماس‌های بایگانی‌شده هم حساب‌اند
+    all_calls = history_source("calls", reaches_archive("calls", date.min))
+    if last_call_from:
+        # MAX(call_datetime) >= from  ⇔  حداقل یک تماس از آن روز به بعد
+        calls = history_source("calls", reaches_archive("calls", last_call_from))
+        where.append(f"u.id IN (SELECT user_id FROM {calls} WHERE call_datetime >= ?)")
+        params.append(last_call_from.isoformat())
+    if last_call_to:
+        # MAX(call_datetime) <= to  ⇔  تماسی تا آن روز هست و هیچ تماسی بعد از آن روز نیست
+        day_after = (last_call_to + timedelta(days=1)).isoformat()
+        where.append(f"u.id IN (SELECT user_id FROM {all_calls} WHERE call_datetime < ?)")
+        where.append(f"NOT EXISTS (SELECT 1 FROM {all_calls} cl2 WHERE cl2.user_id=u.id AND cl2.call_datetime >= ?)")
+        params += [day_after, day_after]
+    if enforce_owner:
+        where.append("u.owner_id=?"); params.append(enforce_owner)
+    if owner_ids_filter:
+        where.append("u.owner_id IN (" + ",".join(["?"]*len(owner_ids_filter)) + ")"); params += owner_ids_filter
+
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    catalog = USER_COLUMNS
+    if all_calls != "calls":
+        catalog = {**USER_COLUMNS, "آخرین_تماس": USER_COLUMNS["آخرین_تماس"]._replace(
+            sql=f"(SELECT MAX(call_datetime) FROM {all_calls} cl WHERE cl.user_id=u.id)")}
+    select_sql, join_sql = _grid_select(catalog, columns or USERS_GRID, USER_JOINS)
+
+    return f"""
+      SELECT
+        {select_sql}
+      FROM users u
+      {join_sql}
+      {where_sql}
+      ORDER BY u.created_at DESC, u.id DESC
+    """, params
+
+@profiled("query")
+def df_users_advanced(first_q, last_q, domain_q, created_from, created_to,
+                      has_open_task, last_call_from, last_call_to,
+                      statuses, owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int],
+                      only_ids: Optional[List[int]] = None, columns: Optional[List[str]] = None):
+    sql, params = users_query(first_q, last_q, domain_q, created_from, created_to, has_open_task,
+                              last_call_from, last_call_to, statuses, owner_ids_filter, enforce_owner, only_ids, columns)
+    conn = get_conn()
+    attach_archive_for(conn, sql)
+    df = pd.read_sql_query(sql, conn, params=params)
+    conn.close(); return _grid_format(df, USER_COLUMNS)
+
+def calls_query(name_query, statuses, start, end,
+                owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int]) -> Tuple[str, list]:
+    params, where = [], ["1=1"]
+    if name_query:
+        where.append("(u.full_name LIKE ? OR c.name LIKE ?)"); q=f"%{name_query.strip()}%"; params += [q,q]
+    if statuses: where.append("cl.status IN (" + ",".join(["?"]*len(statuses)) + ")"); params += statuses
+    day_range_sql("cl.call_datetime", start, end, where, params)
+    if enforce_owner: where.append("u.owner_id=?"); params.append(enforce_owner)
+    if owner_ids_filter: where.append("u.owner_id IN (" + ",".join(["?"]*len(owner_ids_filter)) + ")"); params += owner_ids_filter
+
+    select_sql, join_sql = _grid_select(CALL_COLUMNS, CALLS_GRID, USER_JOINS,
+                                        extra_joins=("c",) if name_query else ())
+    return f"""
+        SELECT {select_sql}
+        FROM {history_source("calls", reaches_archive("calls", start))} cl
+        JOIN users u ON u.id=cl.user_id
+        {join_sql}
+        WHERE {' AND '.join(where)}
+        ORDER BY cl.call_datetime DESC, cl.id DESC
+    """, params
+
+@profiled("query")
+def df_calls_by_filters(name_query, statuses, start, end,
+                        owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int]):
+    sql, params = calls_query(name_query, statuses, start, end, owner_ids_filter, enforce_owner)
+    conn = get_conn()
+    attach_archive_for(conn, sql)
+    df = pd.read_sql_query(sql, conn, params=params)
+    conn.close(); return _grid_format(df, CALL_COLUMNS)
+
+def followups_query(name_query, statuses, start, end,
+                    owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int]) -> Tuple[str, list]:
+    params, where = [], ["1=1"]
+    if name_query:
+        where.append("(u.full_name LIKE ? OR c.name LIKE ?)"); q=f"%{name_query.strip()}%"; params += [q,q]
+    if statuses: where.append("f.status IN (" + ",".join(["?"]*len(statuses)) + ")"); params += statuses
+    day_range_sql("f.due_date", start, end, where, params)
+    if enforce_owner: where.append("u.owner_id=?"); params.append(enforce_owner)
+    if owner_ids_filter: where.append("u.owner_id IN (" + ",".join(["?"]*len(owner_ids_filter)) + ")"); params += owner_ids_filter
+
+    select_sql, join_sql = _grid_select(FOLLOWUP_COLUMNS, FOLLOWUPS_GRID, USER_JOINS,
+                                        extra_joins=("c",) if name_query else ())
+    return f"""
+        SELECT {select_sql}
+        FROM {history_source("followups", reaches_archive("followups", start))} f
+        JOIN users u ON u.id=f.user_id
+        {join_sql}
+        WHERE {' AND '.join(where)}
+        ORDER BY f.due_date DESC, f.id DESC
+    """, params
+
+@profiled("query")
+def df_followups_by_filters(name_query, statuses, start, end,
+                            owner_ids_filter: Optional[List[int]], enforce_owner: Optional[int]):
+    sql, params = followups_query(name_query, statuses, start, end, owner_ids_filter, enforce_owner)
+    conn = get_conn()
+    attach_archive_for(conn, sql)
+    df = pd.read_sql_query(sql, conn, params=params)
+    conn.close(); return _grid_format(df, FOLLOWUP_COLUMNS)
+
+def orders_query(user_filter: Optional[int] = None, company_filter: Optional[int] = None,
+                 product_filter: Optional[int] = None, status_filter: Optional[str] = None) -> Tuple[str, list]:
+    params, where = [], ["1=1"]
+    
+    if user_filter:
+        where.append("o.user_id = ?"); params.append(user_filter)
+    if company_filter:
+        where.append("o.company_id = ?"); params.append(company_filter)
+    if product_filter:
+        where.append("o.product_id = ?"); params.append(product_filter)
+    if status_filter and status_filter != "همه":
+        where.append("o.status = ?"); params.append(status_filter)
+
+    where_sql = "WHERE " + " AND ".join(where)
+    select_sql, join_sql = _grid_select(ORDER_COLUMNS, ORDERS_GRID, ORDER_JOINS)
+
+    return f"""
+        SELECT 
+            {select_sql}
+        FROM orders o
+        {join_sql}
+        {where_sql}
+        ORDER BY o.created_at DESC, o.id DESC
+    """, params
+
+@profiled("query")
+def df_orders_by_filters(user_filter: Optional[int] = None, company_filter: Optional[int] = None,
+                        product_filter: Optional[int] = None, status_filter: Optional[str] = None):
+    """فیلتر کردن سفارشات"""
+    sql, params = orders_query(user_filter, company_filter, product_filter, status_filter)
+    conn = get_conn()
+    df = pd.read_sql_query(sql, conn, params=params)
+    conn.close(); return _grid_format(df, ORDER_COLUMNS)
+
+# ====================== جدول‌های زنده (وصله افزایشی) ======================
+LIVE_PATCH_MAX = 500
+LIVE_POLL_SECONDS = 10
+
+def _ids_of(changes, tbl: str, col: int) -> set:
+    return {r[col] for r in changes if r[1] == tbl and r[col] is not None}
+
+def _users_of_companies(company_ids: set) -> set:
+    if not company_ids:
+        return set()
+    conn = get_conn()
+    rows = conn.execute("SELECT id FROM users WHERE company_id IN (" + ",".join(["?"] * len(company_ids)) + ");",
+                        list(company_ids)).fetchall()
+    conn.close()
+    return {r[0] for r in rows}
+
+def _companies_of_users(user_ids: set) -> set:
+    if not user_ids:
+        return set()
+    conn = get_conn()
+    rows = conn.execute("SELECT DISTINCT company_id FROM users WHERE company_id IS NOT NULL AND id IN ("
+                        + ",".join(["?"] * len(user_ids)) + ");", list(user_ids)).fetchall()
+    conn.close()
+    return {r[0] for r in rows}
+
+def users_grid_affected(changes) -> set:
+    """ردیف‌های جدول کاربران: خود کاربر، کاربرِ تماس/پیگیری، و کاربرانِ شرکتِ ویرایش‌شده (نام شرکت)"""
+    ids = _ids_of(changes, "users", 2) | _ids_of(changes, "calls", 4) | _ids_of(changes, "followups", 4)
+    return ids | _users_of_companies(_ids_of(changes, "companies", 2))
+
+def companies_grid_affected(changes) -> set:
+    """ردیف‌های جدول شرکت‌ها: خود شرکت، شرکتِ کاربر (کارشناس فروش) و شرکتِ کاربرِ پیگیری"""
+    ids = _ids_of(changes, "companies", 2) | _ids_of(changes, "users", 4)
+    return ids | _companies_of_users(_ids_of(changes, "followups", 4))
+
+LIVE_GRIDS = {
+    "users": (["users", "companies", "calls", "followups"], users_grid_affected),
+    "companies": (["companies", "users", "followups"], companies_grid_affected),
+}
+
+# ====================== DataFrames دیالوگ‌های پروفایل (بارگذاری تنبل) ======================
+# هر تب فقط وقتی انتخاب شود خوانده می‌شود، با سقف ردیف (limit)؛ connection از بیرون داده می‌شود
+# تا این توابع روی استخر خواننده‌ها (ReadExecutor) هم‌زمان اجرا شوند.
+# یک ردیف بیشتر از limit خوانده می‌شود تا معلوم شود «نمایش بیشتر» لازم است یا نه.
+PROFILE_PAGE_SIZE = 50
+
+def profile_user_header(conn: sqlite3.Connection, user_id: int):
+    return conn.execute("""
+      SELECT u.id, u.first_name, u.last_name, COALESCE(u.full_name,''), COALESCE(c.name,''), COALESCE(u.phone,''),
+             COALESCE(u.role,''), COALESCE(u.status,''), COALESCE(u.level,''), COALESCE(u.domain,''), COALESCE(u.province,''),
+             COALESCE(u.note,''), u.created_at, u.company_id, COALESCE(au.username,'') AS sales_user
+      FROM users u
+      LEFT JOIN companies c ON c.id=u.company_id
+      LEFT JOIN app_users au ON au.id=u.owner_id
+      WHERE u.id=?;
+    """, (user_id,)).fetchone()
+
+def profile_company_header(conn: sqlite3.Connection, company_id: int):
+    # کارشناسان مرتبط در همان کوئری (زیربرگزیده) تا یک رفت‌وبرگشت کمتر شود
+    return conn.execute("""
+       SELECT c.id, c.name, COALESCE(c.phone,''), COALESCE(c.address,''), COALESCE(c.note,''),
+              COALESCE(c.level,''), COALESCE(c.status,''), c.created_at,
+              (SELECT GROUP_CONCAT(x.username, '، ')
+               FROM (SELECT DISTINCT au.username AS username
+                     FROM users ux
+                     LEFT JOIN app_users au ON au.id=ux.owner_id
+                     WHERE ux.company_id=c.id AND au.username IS NOT NULL) AS x) AS experts
+       FROM companies c WHERE c.id=?;
+    """, (company_id,)).fetchone()
+
+def df_profile_calls(conn: sqlite3.Connection, user_id: Optional[int] = None,
+                     company_id: Optional[int] = None, limit: int = PROFILE_PAGE_SIZE) -> pd.DataFrame:
+    """
+    آخرین تماس‌های یک کاربر یا همه کاربران یک شرکت (حداکثر limit+1 ردیف).
+    اگر داده داغ کمتر از یک صفحه باشد، تماس‌های بایگانی‌شده هم (در صورت وجود) اضافه می‌شوند.
+    """
+    where, param = ("cl.user_id=?", user_id) if user_id is not None else ("u.company_id=?", company_id)
+    def _read(source: str) -> pd.DataFrame:
+        return pd.read_sql_query(f"""
+           SELECT cl.id AS ID, u.full_name AS نام_کاربر,
+                  cl.call_datetime AS تاریخ_و_زمان,
+                  cl.status AS وضعیت,
+                  COALESCE(cl.description,'') AS توضیحات,
+                  COALESCE(au.username,'') AS کارشناس_فروش
+           FROM {source} cl
+           JOIN users u ON u.id=cl.user_id
+           LEFT JOIN app_users au ON au.id=u.owner_id
+           WHERE {where}
+           ORDER BY cl.call_datetime DESC, cl.id DESC
+           LIMIT ?;
+        """, conn, params=(param, limit + 1))
+    df = _read("calls")
+    if len(df) <= limit and reaches_archive("calls", date.min) and attach_archive(conn):
+        df = _read(history_source("calls", True))
+    if "تاریخ_و_زمان" in df.columns:
+        df["تاریخ_و_زمان"] = df["تاریخ_و_زمان"].apply(format_gregorian_with_weekday)
+    return df
+
+def df_profile_followups(conn: sqlite3.Connection, user_id: Optional[int] = None,
+                         company_id: Optional[int] = None, limit: int = PROFILE_PAGE_SIZE) -> pd.DataFrame:
+    """آخرین پیگیری‌های یک کاربر یا همه کاربران یک شرکت (حداکثر limit+1 ردیف؛ بایگانی مثل df_profile_calls)"""
+    where, param = ("f.user_id=?", user_id) if user_id is not None else ("u.company_id=?", company_id)
+    def _read(source: str) -> pd.DataFrame:
+        return pd.read_sql_query(f"""
+           SELECT f.id AS ID, u.full_name AS نام_کاربر, f.title AS عنوان, COALESCE(f.details,'') AS جزئیات,
+                  f.due_date AS تاریخ_پیگیری, f.status AS وضعیت,
+                  COALESCE(au.username,'') AS کارشناس_فروش
+           FROM {source} f
+           JOIN users u ON u.id=f.user_id
+           LEFT JOIN app_users au ON au.id=u.owner_id
+           WHERE {where}
+           ORDER BY f.due_date DESC, f.id DESC
+           LIMIT ?;
+        """, conn, params=(param, limit + 1))
+    df = _read("followups")
+    if len(df) <= limit and reaches_archive("followups", date.min) and attach_archive(conn):
+        df = _read(history_source("followups", True))
+    if "تاریخ_پیگیری" in df.columns:
+        df["تاریخ_پیگیری"] = df["تاریخ_پیگیری"].apply(format_date_only_with_weekday)
+    return df
+
+def df_company_members(conn: sqlite3.Connection, company_id: Optional[int] = None,
+                       limit: int = PROFILE_PAGE_SIZE, of_user_id: Optional[int] = None) -> pd.DataFrame:
+    """کاربران (رابط‌های) یک شرکت، یا هم‌شرکتی‌های یک کاربر با of_user_id (حداکثر limit+1 ردیف)"""
+    if of_user_id is not None:
+        where, param = "uu.company_id=(SELECT company_id FROM users WHERE id=?)", of_user_id
+    else:
+        where, param = "uu.company_id=?", company_id
+    return pd.read_sql_query(f"""
+        SELECT uu.id AS ID, uu.full_name AS نام_کامل, COALESCE(uu.phone,'') AS تلفن,
+               COALESCE(uu.role,'') AS سمت, COALESCE(au.username,'') AS کارشناس_فروش
+        FROM users uu
+        LEFT JOIN app_users au ON au.id=uu.owner_id
+        WHERE {where}
+        ORDER BY uu.full_name
+        LIMIT ?;
+    """, conn, params=(param, limit + 1))
+
+def call_detail(conn: sqlite3.Connection, call_id: int):
+    """متن کامل یک تماس (در جدول فقط پیش‌نمایش توضیحات هست)؛ اگر در جدول داغ نبود، از بایگانی"""
+    sql = """
+       SELECT cl.id, u.full_name, COALESCE(c.name,''), cl.call_datetime, cl.status,
+              COALESCE(cl.description,''), COALESCE(au.username,'')
+       FROM {}.calls cl
+       JOIN users u ON u.id=cl.user_id
+       LEFT JOIN companies c ON c.id=u.company_id
+       LEFT JOIN app_users au ON au.id=cl.created_by
+       WHERE cl.id=?;
+    """
+    row = conn.execute(sql.format("main"), (call_id,)).fetchone()
+    if row is None and attach_archive(conn):
+        row = conn.execute(sql.format("archive"), (call_id,)).fetchone()
+    return row
+
+def followup_detail(conn: sqlite3.Connection, task_id: int):
+    """متن کامل یک پیگیری (در جدول فقط پیش‌نمایش جزئیات هست)؛ اگر در جدول داغ نبود، از بایگانی"""
+    sql = """
+       SELECT f.id, u.full_name, COALESCE(c.name,''), f.title, COALESCE(f.details,''), f.due_date, f.status,
+              COALESCE(au.username,'')
+       FROM {}.followups f
+       JOIN users u ON u.id=f.user_id
+       LEFT JOIN companies c ON c.id=u.company_id
+       LEFT JOIN app_users au ON au.id=f.created_by
+       WHERE f.id=?;
+    """
+    row = conn.execute(sql.format("main"), (task_id,)).fetchone()
+    if row is None and attach_archive(conn):
+        row = conn.execute(sql.format("archive"), (task_id,)).fetchone()
+    return row
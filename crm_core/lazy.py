@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""بارگذاری تنبل ماژول‌های سنگین (pandas و ...) تا شروع سرد و صفحه‌هایی که به آن‌ها نیاز ندارند سریع بمانند."""
+import importlib
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    جانشین «import x as y»: ماژول در اولین دسترسی به یک صفت import می‌شود (importlib خودش قفل دارد،
+    پس دسترسی هم‌زمان از نخ‌های خواننده امن است). ماژول‌هایی که از آن استفاده می‌کنند
+    from __future__ import annotations دارند تا نوع‌نویسی‌ها (pd.DataFrame) هنگام تعریف تابع ارزیابی نشوند.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
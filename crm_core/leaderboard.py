@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+جدول عملکرد کارشناسان فروش: تماس در روز، نرخ موفقیت، پیگیری‌های بسته‌شده به‌موقع / با تأخیر و عقب‌افتاده،
+مخاطبان «مشتری شد» و فروش سفارش‌ها.
+
+هیچ‌کدام روی جداول اصلی حساب نمی‌شود: تریگرهای daily_stats (stats.py) با هر نوشتن، شمارنده‌های روزانه هر
+کارشناس را به‌روز می‌کنند و این‌جا فقط بازه‌ای از کلید اصلی daily_stats (metric, day, …) خوانده و در pandas به
+هفته/ماه شمسی جمع می‌شود؛ چند سال داده یعنی چند ده هزار ردیف کوچک، نه میلیون‌ها تماس.
+"""
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from .dates import jalali_month, jalali_week
+from .db import get_conn
+from .lazy import LazyModule
+from .profiling import profiled
+
+pd = LazyModule("pandas")
+
+LEADERBOARD_METRICS = ("calls", "open_followups", "followups_closed", "converted", "orders", "revenue")
+# فروش = جمع مبلغ سفارش‌های تأییدشده؛ تعداد سفارش همه وضعیت‌ها را می‌شمارد
+REVENUE_STATUS = "تایید شده"
+LEADERBOARD_PERIODS = {"week": jalali_week, "month": jalali_month}
+
+_COUNT_COLS = ["تماس", "روز_فعال", "تماس_موفق", "پیگیری_به‌موقع", "پیگیری_با_تأخیر", "پیگیری_بسته‌شده",
+               "پیگیری_عقب‌افتاده", "مشتری_شده", "سفارش", "فروش"]
+
+@profiled("query")
+def agent_daily_stats(start: date, end: date) -> "pd.DataFrame":
+    """ردیف‌های روزانه (metric, day, owner_id, status, n) بازه [start, end]؛ فقط اسکن بازه روی کلید اصلی daily_stats"""
+    conn = get_conn()
+    try:
+        return pd.read_sql_query(f"""
+            SELECT metric, day, owner_id, status, n FROM daily_stats
+            WHERE metric IN ({",".join("?" * len(LEADERBOARD_METRICS))}) AND day BETWEEN ? AND ?;
+        """, conn, params=list(LEADERBOARD_METRICS) + [start.isoformat(), end.isoformat()])
+    finally:
+        conn.close()
+
+def _with_rates(df: "pd.DataFrame") -> "pd.DataFrame":
+    df["تماس_در_روز"] = (df["تماس"] / df["روز_فعال"].where(df["روز_فعال"] > 0)).round(1)
+    df["نرخ_موفقیت٪"] = (df["تماس_موفق"] / df["تماس"].where(df["تماس"] > 0) * 100).round(1)
+    timed = df["پیگیری_به‌موقع"] + df["پیگیری_با_تأخیر"]
+    df["به‌موقع٪"] = (df["پیگیری_به‌موقع"] / timed.where(timed > 0) * 100).round(1)
+    return df
+
+@profiled("transform")
+def agent_performance(daily: "pd.DataFrame", today: date, period: str = "week") -> "pd.DataFrame":
+    """
+    خروجی agent_daily_stats → یک ردیف به ازای (owner_id, period) با همه شاخص‌ها.
+    period: 'week' (برچسب = شنبه اول هفته) یا 'month' (ماه شمسی). پیگیری عقب‌افتاده = باز با سررسید قبل از today.
+    """
+    d = daily.copy()
+    to_period = LEADERBOARD_PERIODS[period]
+    d["period"] = d["day"].map({x: to_period(x) for x in d["day"].unique() if x})
+    d = d[d["period"].notna()]
+    key = ["owner_id", "period"]
+    metric, status = d["metric"], d["status"]
+
+    def total(mask, name):
+        return d[mask].groupby(key)["n"].sum().rename(name)
+    calls = metric == "calls"
+    closed = metric == "followups_closed"
+    parts = [
+        total(calls, "تماس"),
+        d[calls & (d["n"] > 0)].groupby(key)["day"].nunique().rename("روز_فعال"),
+        total(calls & (status == "موفق"), "تماس_موفق"),
+        total(closed & (status == "on_time"), "پیگیری_به‌موقع"),
+        total(closed & (status == "late"), "پیگیری_با_تأخیر"),
+        total(closed, "پیگیری_بسته‌شده"),
+        total((metric == "open_followups") & (d["day"] < today.isoformat()), "پیگیری_عقب‌افتاده"),
+        total(metric == "converted", "مشتری_شده"),
+        total(metric == "orders", "سفارش"),
+        total((metric == "revenue") & (status == REVENUE_STATUS), "فروش"),
+    ]
+    out = pd.concat(parts, axis=1).reindex(columns=_COUNT_COLS).fillna(0)
+    out = out.astype({c: "int64" for c in _COUNT_COLS if c != "فروش"})
+    return _with_rates(out).reset_index()
+
+def leaderboard(perf: "pd.DataFrame", periods: Optional[Iterable[str]] = None,
+                accounts: Optional[Dict[int, str]] = None) -> "pd.DataFrame":
+    """
+    جمع شاخص‌ها برای دوره‌های انتخابی (همه دوره‌ها اگر None)؛ یک ردیف برای هر حساب فروش (حتی بدون فعالیت)،
+    مرتب بر اساس فروش و بعد تماس. نرخ‌ها بعد از جمع دوباره حساب می‌شوند.
+    """
+    if periods is not None:
+        perf = perf[perf["period"].isin(list(periods))]
+    df = perf.groupby("owner_id")[_COUNT_COLS].sum()
+    if accounts:
+        df = df.reindex(sorted(set(accounts) | set(df.index)), fill_value=0)
+    df = _with_rates(df).sort_values(["فروش", "تماس"], ascending=False)
+    names = accounts or {}
+    df.index = [names.get(i, "— بدون کارشناس —" if i == 0 else f"#{i}") for i in df.index]
+    df.index.name = "کارشناس"
+    return df
+
+def agent_trend(perf: "pd.DataFrame", column: str, accounts: Optional[Dict[int, str]] = None) -> "pd.DataFrame":
+    """یک شاخص در طول زمان: سطر = دوره (جدیدترین بالا)، ستون = کارشناس"""
+    piv = perf.pivot_table(index="period", columns="owner_id", values=column, aggfunc="sum", fill_value=0)
+    names = accounts or {}
+    piv.columns = [names.get(i, "— بدون کارشناس —" if i == 0 else f"#{i}") for i in piv.columns]
+    return piv.sort_index(ascending=False)
+
+def period_labels(perf: "pd.DataFrame") -> List[str]:
+    return sorted(perf["period"].unique(), reverse=True)
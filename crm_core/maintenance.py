@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+نگه‌داری دوره‌ای دیتابیس: آمار برنامه‌ریز کوئری (ANALYZE / PRAGMA optimize)، wal_checkpoint(TRUNCATE) و
+incremental_vacuum، به‌علاوه مهاجرت یک‌باره به auto_vacuum=INCREMENTAL.
+
+هر کار از صف نویسنده (غیرتراکنشی، اولویت «حجیم») اجرا می‌شود تا با نوشتن‌های برنامه رقابت قفل نداشته باشد، و
+مدت و اثرش (اندازه فایل/WAL و صفحات آزاد قبل و بعد) در maintenance_log ثبت می‌شود. زمان‌بند پس‌زمینه هر
+MAINTENANCE_TICK_SECONDS کارهای «سررسیده» را فقط وقتی صف نویسنده مدتی بیکار بوده اجرا می‌کند؛ تنها استثنا
+checkpoint است وقتی WAL از سقف اضطراری بزرگ‌تر شده. زمان آخرین اجرا از خود جدول خوانده می‌شود، پس چند پروسه
+روی یک دیتابیس کار تکراری نمی‌کنند (جز در لحظه هم‌زمانی، که بی‌ضرر است).
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from . import config
+from .db import shared_resource
+from .workers import PRIORITY_BULK, db_writer, read_pool
+
+MAINTENANCE_TICK_SECONDS = 30
+MAINTENANCE_IDLE_SECONDS = 60
+MAINTENANCE_LOG_KEEP = 500
+MAINTENANCE_WAL_BYTES = 32 * 1024 * 1024        # بالاتر از این، checkpoint سررسیده است (در بیکاری)
+MAINTENANCE_WAL_FORCE_BYTES = 256 * 1024 * 1024  # بالاتر از این، checkpoint بدون انتظار برای بیکاری
+MAINTENANCE_FREELIST_RATIO = 0.10                # صفحات آزاد بیش از ۱۰٪ → incremental_vacuum سررسیده است
+ANALYSIS_LIMIT = 1000                            # ANALYZE تقریبی (نمونه‌برداری از هر ایندکس): چند میلی‌ثانیه
+CHECKPOINT_BUSY_MS = 500                         # صبر برای خواننده‌های باز؛ نویسنده بیش از این معطل نمی‌ماند
+AUTO_VACUUM_MODES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+
+log = logging.getLogger("crm.maintenance")
+
+def ensure_maintenance_log(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT NOT NULL,
+            reason TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            duration_ms REAL NOT NULL,
+            db_bytes_before INTEGER, db_bytes_after INTEGER,
+            wal_bytes_before INTEGER, wal_bytes_after INTEGER,
+            freelist_before INTEGER, freelist_after INTEGER,
+            detail TEXT,
+            error TEXT
+        );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_log_task ON maintenance_log(task, started_at);")
+
+# ====================== وضعیت فایل ======================
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def db_file_stats() -> Dict[str, Any]:
+    """اندازه فایل دیتابیس و WAL، تعداد صفحات و صفحات آزاد، حالت auto_vacuum"""
+    with read_pool().connection() as conn:
+        page_size = conn.execute("PRAGMA page_size;").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count;").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+    return {
+        "db_bytes": _file_size(config.DB_PATH),
+        "wal_bytes": _file_size(config.DB_PATH + "-wal"),
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_count": freelist,
+        "freelist_ratio": freelist / page_count if page_count else 0.0,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+    }
+
+# ====================== کارها ======================
+def _analyze(conn: sqlite3.Connection) -> str:
+    # ANALYZE تقریبی کل دیتابیس و بعد optimize (برای اتصال‌های طولانی‌عمر توصیه‌شده)
+    conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT};")
+    conn.execute("ANALYZE;")
+    conn.execute("PRAGMA optimize;")
+    n = conn.execute("SELECT COUNT(*) FROM sqlite_stat1;").fetchone()[0]
+    return f"sqlite_stat1: {n} ردیف"
+
+def _checkpoint(conn: sqlite3.Connection) -> str:
+    conn.execute(f"PRAGMA busy_timeout={CHECKPOINT_BUSY_MS};")
+    try:
+        busy, wal_frames, done = conn.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone()
+    finally:
+        conn.execute("PRAGMA busy_timeout=10000;")
+    if busy:
+        return f"ناقص (خواننده باز): {done}/{wal_frames} فریم"
+    return f"{done} فریم منتقل و فایل WAL کوتاه شد"
+
+def _vacuum(conn: sqlite3.Connection) -> str:
+    mode = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+    if mode != 2:
+        # مهاجرت یک‌باره: تغییر auto_vacuum فقط با بازسازی کامل فایل (VACUUM) اعمال می‌شود
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("VACUUM;")
+        # VACUUM کل فایل را در WAL می‌نویسد؛ بدون checkpoint، WAL هم‌اندازه خود دیتابیس می‌ماند
+        return (f"مهاجرت auto_vacuum: {AUTO_VACUUM_MODES.get(mode, mode)} → INCREMENTAL (VACUUM کامل)؛ "
+                f"checkpoint: {_checkpoint(conn)}")
+    freed = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    conn.execute("PRAGMA incremental_vacuum;")
+    return f"{freed} صفحه آزاد به سیستم‌عامل برگشت"
+
+class MaintenanceTask(NamedTuple):
+    label: str
+    interval: timedelta
+    run: Callable[[sqlite3.Connection], str]
+
+MAINTENANCE_TASKS: Dict[str, MaintenanceTask] = {
+    # به همین ترتیب اجرا می‌شوند: checkpoint آخر، تا WAL نوشته‌شده توسط دو کار قبلی هم خالی شود
+    "analyze": MaintenanceTask("آمار برنامه‌ریز (ANALYZE)", timedelta(hours=24), _analyze),
+    "vacuum": MaintenanceTask("incremental vacuum", timedelta(hours=24), _vacuum),
+    "checkpoint": MaintenanceTask("checkpoint ‏WAL", timedelta(minutes=15), _checkpoint),
+}
+
+def _task_job(task: str, reason: str):
+    def _do(conn: sqlite3.Connection) -> Dict[str, Any]:
+        def snap():
+            return (_file_size(config.DB_PATH), _file_size(config.DB_PATH + "-wal"),
+                    conn.execute("PRAGMA freelist_count;").fetchone()[0])
+        before = snap()
+        started = datetime.now().isoformat(timespec="seconds")
+        t0 = time.perf_counter()
+        detail, error = None, None
+        try:
+            detail = MAINTENANCE_TASKS[task].run(conn)
+        except sqlite3.Error as e:
+            error = str(e)
+        ms = (time.perf_counter() - t0) * 1000
+        after = snap()
+        row = {"task": task, "reason": reason, "started_at": started, "duration_ms": round(ms, 1),
+               "db_bytes_before": before[0], "db_bytes_after": after[0],
+               "wal_bytes_before": before[1], "wal_bytes_after": after[1],
+               "freelist_before": before[2], "freelist_after": after[2], "detail": detail, "error": error}
+        conn.execute(f"INSERT INTO maintenance_log ({', '.join(row)}) VALUES ({', '.join('?' * len(row))});",
+                     list(row.values()))
+        conn.execute("DELETE FROM maintenance_log WHERE id <= (SELECT MAX(id) FROM maintenance_log) - ?;",
+                     (MAINTENANCE_LOG_KEEP,))
+        return row
+    return _do
+
+def run_maintenance(tasks: Optional[List[str]] = None, reason: str = "manual") -> List[Dict[str, Any]]:
+    """کارهای داده‌شده (پیش‌فرض همه) را پشت سر هم از صف نویسنده اجرا می‌کند؛ خروجی: ردیف‌های ثبت‌شده در لاگ"""
+    writer = db_writer()
+    out = []
+    for task in tasks or list(MAINTENANCE_TASKS):
+        row = writer.submit(_task_job(task, reason), priority=PRIORITY_BULK, transactional=False).result()
+        if row["error"]:
+            log.warning("maintenance %s failed: %s", task, row["error"])
+        out.append(row)
+    return out
+
+def recent_maintenance(limit: int = 20) -> List[Dict[str, Any]]:
+    with read_pool().connection() as conn:
+        cur = conn.execute("SELECT * FROM maintenance_log ORDER BY id DESC LIMIT ?;", (limit,))
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+def due_tasks(now: Optional[datetime] = None, stats: Optional[Dict[str, Any]] = None) -> List[str]:
+    """کارهایی که فاصله زمانی‌شان گذشته یا وضعیت فایل (WAL بزرگ، صفحات آزاد زیاد، auto_vacuum قدیمی) لازمشان کرده"""
+    now = now or datetime.now()
+    stats = stats or db_file_stats()
+    with read_pool().connection() as conn:
+        last = dict(conn.execute("SELECT task, MAX(started_at) FROM maintenance_log GROUP BY task;").fetchall())
+    due = []
+    for name, task in MAINTENANCE_TASKS.items():
+        ran = last.get(name)
+        if ran is None or now - datetime.fromisoformat(ran) >= task.interval:
+            due.append(name)
+        elif name == "checkpoint" and stats["wal_bytes"] >= MAINTENANCE_WAL_BYTES:
+            due.append(name)
+        elif name == "vacuum" and (stats["auto_vacuum"] != "INCREMENTAL"
+                                   or stats["freelist_ratio"] >= MAINTENANCE_FREELIST_RATIO):
+            due.append(name)
+    return due
+
+# ====================== زمان‌بند پس‌زمینه ======================
+class MaintenanceScheduler:
+    """نخ پس‌زمینه؛ start() چندباره بی‌اثر است (crm.py در هر rerun صدا می‌زند)."""
+
+    def __init__(self, tick_seconds: float = MAINTENANCE_TICK_SECONDS, idle_seconds: float = MAINTENANCE_IDLE_SECONDS):
+        self.tick_seconds = tick_seconds
+        self.idle_seconds = idle_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name="crm-maintenance", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.tick_seconds):
+            try:
+                self.tick()
+            except Exception as e:  # نخ پس‌زمینه نباید با یک خطا (مثلاً حین بازیابی بکاپ) از کار بیفتد
+                log.warning("maintenance tick failed: %s", e)
+
+    def tick(self) -> List[Dict[str, Any]]:
+        stats = db_file_stats()
+        due = due_tasks(stats=stats)
+        if not due:
+            return []
+        if db_writer().idle_seconds() >= self.idle_seconds:
+            return run_maintenance(due, reason="idle")
+        if "checkpoint" in due and stats["wal_bytes"] >= MAINTENANCE_WAL_FORCE_BYTES:
+            return run_maintenance(["checkpoint"], reason="wal")
+        return []
+
+@shared_resource
+def maintenance_scheduler() -> MaintenanceScheduler:
+    return MaintenanceScheduler()
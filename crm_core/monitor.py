@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""پایش کوئری‌ها: زمان هر شکل SQL، p95 و لاگ کوئری‌های کند با EXPLAIN QUERY PLAN."""
+import contextvars
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# ====================== پایش کوئری‌ها (زمان‌سنجی، لاگ کوئری کند، EXPLAIN) ======================
+# وقتی فعال است، همه connectionها با InstrumentedConnection ساخته می‌شوند: هر دستور با «شکل» SQL
+# (فاصله‌ها فشرده و لیست‌های ? یکی)، تعداد پارامتر، تعداد ردیف و مدت (اجرا + fetch) ثبت می‌شود.
+# دستورهای کندتر از آستانه با EXPLAIN QUERY PLAN، صفحه و تابع صدازننده در لاگ کند نگه داشته می‌شوند.
+# وقتی غیرفعال است connectionها همان sqlite3.Connection معمولی‌اند (بدون هیچ هزینه اضافه).
+log_slow = logging.getLogger("crm.slow_query")
+_SQL_WS = re.compile(r"\s+")
+_SQL_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_NO_PLAN_PREFIXES = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA", "CREATE", "DROP", "ALTER")
+
+def sql_shape(sql: str) -> str:
+    return _SQL_PLACEHOLDER_LIST.sub("?…", _SQL_WS.sub(" ", sql).strip())
+
+class QueryStats:
+    def __init__(self, enabled: bool = False, slow_ms: float = 200.0, samples: int = 200):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self._samples = samples
+        self._lock = threading.Lock()
+        self.by_shape: Dict[str, Dict[str, Any]] = {}
+        self.slow: deque = deque(maxlen=100)
+        # صفحه جاری؛ لایه رابط کاربری در هر rerun تنظیمش می‌کند
+        self.page: contextvars.ContextVar = contextvars.ContextVar("crm_query_page", default="")
+
+    def record(self, conn: sqlite3.Connection, sql: str, params, rows: int, ms: float):
+        shape = sql_shape(sql)
+        with self._lock:
+            s = self.by_shape.get(shape)
+            if s is None:
+                s = self.by_shape[shape] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+                                            "params": 0, "recent": deque(maxlen=self._samples)}
+            s["calls"] += 1; s["total_ms"] += ms; s["rows"] += max(rows, 0)
+            s["max_ms"] = max(s["max_ms"], ms); s["recent"].append(ms)
+            s["params"] = len(params) if hasattr(params, "__len__") else 0
+        if ms >= self.slow_ms:
+            self._record_slow(conn, sql, params, shape, rows, ms)
+
+    def _record_slow(self, conn: sqlite3.Connection, sql: str, params, shape: str, rows: int, ms: float):
+        plan = ""
+        if not shape.upper().startswith(_NO_PLAN_PREFIXES):
+            try:
+                plan = "\n".join(f"{r[0]}|{r[1]}| {r[3]}" for r in
+                                 sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params or ()))
+            except sqlite3.Error as e:
+                plan = f"(EXPLAIN ناموفق: {e})"
+        entry = {"at": datetime.now().strftime("%H:%M:%S"), "ms": round(ms, 1), "rows": max(rows, 0),
+                 "page": self.page.get(), "caller": _query_caller(), "sql": shape, "plan": plan}
+        self.slow.append(entry)
+        log_slow.warning("slow query %.1fms rows=%d page=%s caller=%s\n%s\n%s",
+                         ms, entry["rows"], entry["page"], entry["caller"], shape, plan)
+
+    def top(self, n: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(k, dict(v), sorted(v["recent"])) for k, v in self.by_shape.items()]
+        out = []
+        for shape, v, lat in sorted(items, key=lambda x: -x[1]["total_ms"])[:n]:
+            out.append({"sql": shape[:300], "calls": v["calls"], "total_ms": round(v["total_ms"], 1),
+                        "avg_ms": round(v["total_ms"] / v["calls"], 2), "p95_ms": round(lat[int(0.95 * (len(lat) - 1))], 2),
+                        "max_ms": round(v["max_ms"], 1), "rows": v["rows"], "params": v["params"]})
+        return out
+
+    def reset(self):
+        with self._lock:
+            self.by_shape.clear(); self.slow.clear()
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _query_caller() -> str:
+    """اولین تابع کد برنامه در پشته که جزو لایه پایش نیست (فقط برای کوئری‌های کند صدا زده می‌شود)."""
+    f = sys._getframe(1)
+    skip = {"_query_caller", "_record_slow", "record", "_finish", "execute", "executemany",
+            "fetchone", "fetchmany", "fetchall", "_fetched", "close", "__del__", "__next__", "_timed"}
+    while f is not None:
+        fname = f.f_code.co_filename
+        if fname.startswith(_APP_DIR) and fname != __file__ and f.f_code.co_name not in skip:
+            return f"{f.f_code.co_name}:{f.f_lineno}"
+        f = f.f_back
+    return ""
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """زمان execute و همه fetchها جمع می‌شود؛ رکورد با تمام شدن ردیف‌ها، close یا execute بعدی بسته می‌شود."""
+    _rec: Optional[list] = None
+
+    def execute(self, sql, params=()):
+        self._finish()
+        t0 = time.perf_counter()
+        super().execute(sql, params)
+        self._rec = [sql, params, time.perf_counter() - t0, 0]
+        if self.description is None:  # دستور بدون خروجی (DML/DDL)
+            self._rec[3] = self.rowcount
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq):
+        self._finish()
+        t0 = time.perf_counter()
+        super().executemany(sql, seq)
+        self._rec = [sql, (), time.perf_counter() - t0, self.rowcount]
+        self._finish()
+        return self
+
+    def _fetched(self, t0: float, n: int, done: bool):
+        if self._rec is not None:
+            self._rec[2] += time.perf_counter() - t0
+            self._rec[3] += n
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(t0, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size: int = None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size if size is not None else self.arraysize)
+        self._fetched(t0, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(t0, len(rows), True)
+        return rows
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(t0, 0, True)
+            raise
+        self._fetched(t0, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        rec, self._rec = self._rec, None
+        if rec is not None:
+            QUERY_STATS.record(self.connection, rec[0], rec[1], rec[3], rec[2] * 1000)
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+QUERY_STATS = QueryStats(enabled=os.environ.get("CRM_QUERY_PROFILING", "").lower() in ("1", "true", "yes"),
+                         slow_ms=float(os.environ.get("CRM_SLOW_QUERY_MS", "200")))
+
+def query_stats() -> QueryStats:
+    return QUERY_STATS
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""شماره تلفن نرمال‌شده (E.164) برای مخاطبین و شرکت‌ها و شناسایی تماس‌گیرنده (caller-ID) با نگاشت درون‌حافظه‌ای."""
+import sqlite3
+import threading
+from datetime import date
+from typing import Any, Dict, Optional, Set
+
+from .archive import attach_archive, history_source, reaches_archive
+from .changes import change_feed
+from .db import _column_exists, shared_resource
+from .workers import read_pool
+
+# ====================== نرمال‌سازی شماره (E.164) ======================
+# هر قالبی که کارشناس وارد کرده (0912…، ‎+98912…، 98912…، 912…، با فاصله/خط تیره/ارقام فارسی) به ‎+98912… می‌رسد.
+# همین قواعد یک بار به پایتون (برای ورودی جست‌وجو) و یک بار به SQL (ستون تولیدی phone_e164) ترجمه شده‌اند؛
+# ستون VIRTUAL است، پس برای هر نویسنده‌ای (UI، ایمپورت، اسکریپت بیرونی) بدون تریگر درست می‌ماند و فقط ایندکس جا می‌گیرد.
+PHONE_COUNTRY_CODE = "98"
+PERSIAN_DIGITS = "۰۱۲۳۴۵۶۷۸۹"
+ARABIC_DIGITS = "٠١٢٣٤٥٦٧٨٩"
+PHONE_SEPARATORS = " -()./\t\u00a0\u200c\u200e\u200f"
+PHONE_TABLES = ("users", "companies")
+
+_PHONE_TRANS = {ord(ch): None for ch in PHONE_SEPARATORS}
+_PHONE_TRANS.update({ord(ch): str(i) for digits in (PERSIAN_DIGITS, ARABIC_DIGITS) for i, ch in enumerate(digits)})
+
+def normalize_phone(raw: Any) -> Optional[str]:
+    """شماره به قالب E.164 (مثل ‎+989121234567) یا None اگر قابل تشخیص نباشد؛ هم‌ارز phone_e164_sql."""
+    if raw is None:
+        return None
+    d = str(raw)
+    if len(d) > 2 and d.endswith(".0") and d[-3] in "0123456789":  # عدد اعشاری اکسل (9121234567.0)
+        d = d[:-2]
+    d = d.translate(_PHONE_TRANS)
+    body = d[1:] if d.startswith("+") else d
+    if not body or any(ch not in "0123456789" for ch in body):
+        return None
+    cc = PHONE_COUNTRY_CODE
+    if d.startswith("+"):
+        n = d[1:]
+    elif d.startswith("00"):
+        n = d[2:]
+    elif d.startswith("0"):
+        n = cc + d[1:]
+    elif len(d) == 12 and d.startswith(cc):
+        n = d
+    elif len(d) == 10 and d.startswith("9"):
+        n = cc + d
+    else:
+        return None
+    if n.startswith(cc + "0"):  # ‎+98 0912… (صفر اضافه بعد از کد کشور)
+        n = cc + n[len(cc) + 1:]
+    if not 10 <= len(n) <= 15 or n.startswith("0"):
+        return None
+    return "+" + n
+
+def phone_search_prefix(raw: Any) -> Optional[str]:
+    """
+    پیشوند E.164 برای جست‌وجوی شماره نیمه‌کاره (۰۹۱۲…، ‎+98912…، 0098…، 912…) با همان قواعد normalize_phone
+    بدون شرط طول؛ None اگر ورودی شبیه شماره نباشد.
+    """
+    d = str(raw or "").translate(_PHONE_TRANS)
+    body = d[1:] if d.startswith("+") else d
+    if not body or any(ch not in "0123456789" for ch in body):
+        return None
+    cc = PHONE_COUNTRY_CODE
+    if d.startswith("+"):
+        n = d[1:]
+    elif d.startswith("00"):
+        n = d[2:]
+    elif d.startswith("0"):
+        n = cc + d[1:]
+    elif d.startswith(cc) or cc.startswith(d):
+        n = d
+    elif d.startswith("9"):
+        n = cc + d
+    else:
+        return None
+    if n.startswith(cc + "0"):
+        n = cc + n[len(cc) + 1:]
+    return "+" + n
+
+# ستون‌های VIRTUAL ذخیره نمی‌شوند و هر ارجاع به آن‌ها کل عبارت را دوباره حساب می‌کند؛ پس هر مرحله به مرحله قبل
+# فقط یکی دو بار ارجاع می‌دهد و شماره‌های تمیز ASCII (حالت رایج) از زنجیره replace رد نمی‌شوند. پارسر SQLite هم
+# بیش از حدود ۲۸ replace تودرتو را نمی‌پذیرد، برای همین حذف جداکننده‌ها و تبدیل ارقام دو ستون جدا هستند.
+# char() تا نویسه‌های نامرئی مستقیم در اسکیما نیایند.
+def phone_stripped_sql(col: str) -> str:
+    expr = f"(CASE WHEN {col} GLOB '*[0-9].0' THEN substr({col},1,length({col})-2) ELSE {col} END)"
+    for ch in PHONE_SEPARATORS:
+        expr = f"replace({expr},char({ord(ch)}),'')"
+    return f"CASE WHEN {col} GLOB '*[^0-9+]*' THEN {expr} ELSE {col} END"
+
+def phone_digits_sql(col: str) -> str:
+    expr = col
+    for digits in (PERSIAN_DIGITS, ARABIC_DIGITS):
+        for i, ch in enumerate(digits):
+            expr = f"replace({expr},char({ord(ch)}),'{i}')"
+    return f"CASE WHEN {col} GLOB '*[^0-9+]*' THEN {expr} ELSE {col} END"
+
+def phone_e164_sql(d: str) -> str:
+    """
+    همان قواعد normalize_phone روی ستون ارقام تمیزشده d، با نشانه‌گذاری ابتدای رشته: طول + '#' + d تا قواعد
+    وابسته به طول هم با replace لنگردار اجرا شوند (ltrim پیشوند طول را برمی‌دارد)؛ '#I' یعنی «بعد از این، کد کشور».
+    """
+    cc = PHONE_COUNTRY_CODE
+    tagged = f"ltrim(replace(replace(length({d})||'#'||{d},'12#{cc}','#I{cc}'),'10#9','#I{cc}9'),'0123456789')"
+    n = f"replace(replace(replace(replace({tagged},'#+','#I'),'#00','#I'),'#0','#I{cc}'),'#I{cc}0','#I{cc}')"
+    return (f"CASE WHEN {n} GLOB '#I[1-9]*' AND {n} NOT GLOB '#I*[^0-9]*' AND length({n}) BETWEEN 12 AND 17 "
+            f"THEN '+'||substr({n},3) END")
+
+def ensure_phone_index(conn: sqlite3.Connection):
+    """ستون‌های تولیدی و ایندکس؛ اگر تعریف عبارت‌ها عوض شده باشد (مثل _ensure_trigger) دوباره ساخته می‌شوند."""
+    columns = [("phone_stripped", phone_stripped_sql("phone")), ("phone_digits", phone_digits_sql("phone_stripped")),
+               ("phone_e164", phone_e164_sql("phone_digits"))]
+    for t in PHONE_TABLES:
+        table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?;", (t,)).fetchone()[0]
+        if not all(f"{col} TEXT GENERATED ALWAYS AS ({expr}) VIRTUAL" in table_sql for col, expr in columns):
+            conn.execute(f"DROP INDEX IF EXISTS idx_{t}_phone_e164;")
+            for col, _ in reversed(columns):
+                if _column_exists(conn, t, col):
+                    conn.execute(f"ALTER TABLE {t} DROP COLUMN {col};")
+            for col, expr in columns:
+                conn.execute(f"ALTER TABLE {t} ADD COLUMN {col} TEXT GENERATED ALWAYS AS ({expr}) VIRTUAL;")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{t}_phone_e164 ON {t}(phone_e164);")
+
+# ====================== شناسایی تماس‌گیرنده (caller-ID) ======================
+# یکپارچه‌سازی تلفنی در هر زنگ صدا می‌زند. مجموعه شماره‌های E.164 موجود در حافظه است و با change_log افزایشی تازه
+# می‌شود (در حالت عادی فقط PRAGMA data_version)؛ شماره ناشناس بدون هیچ کوئری جواب می‌گیرد و برای شماره شناخته‌شده
+# یک کوئری روی idx_users_phone_e164 مخاطب، شرکت، کارشناس و آخرین تماس (idx_calls_user_datetime) را با هم می‌آورد.
+# شماره‌های کهنه (عوض‌شده/حذف‌شده) از مجموعه پاک نمی‌شوند؛ فقط یک کوئری بی‌نتیجه می‌دهند تا بارگذاری کامل بعدی.
+# خواندن phone_e164 همیشه از ایندکس است (phone_e164 > ''، INDEXED BY حتی با فیلتر کارشناس)؛ محاسبه دوباره ستون
+# VIRTUAL برای هر ردیف گران است.
+PHONE_REFRESH_LIMIT = 2000
+
+class PhoneDirectory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phones: Dict[str, Set[str]] = {t: set() for t in PHONE_TABLES}
+        self._seq: Optional[int] = None
+        self._epoch: Optional[int] = None
+        self.stats = {"full_loads": 0, "incremental": 0}
+
+    def _full_load(self, conn: sqlite3.Connection):
+        self._phones = {t: {r[0] for r in conn.execute(f"SELECT phone_e164 FROM {t} WHERE phone_e164 > '';")}
+                        for t in PHONE_TABLES}
+        self.stats["full_loads"] += 1
+
+    def refresh(self):
+        feed = change_feed()
+        head = feed.head()
+        with self._lock:
+            if self._epoch == feed.epoch and self._seq == head:
+                return
+            with read_pool().connection() as conn:
+                changes = None
+                if self._epoch == feed.epoch and self._seq is not None:
+                    changes = feed.since(self._seq, list(PHONE_TABLES), limit=PHONE_REFRESH_LIMIT)
+                if changes is None or len(changes) > PHONE_REFRESH_LIMIT:
+                    self._full_load(conn)
+                else:
+                    for t in PHONE_TABLES:
+                        ids = sorted({row_id for _, tbl, row_id, op, _ in changes if tbl == t and op != "D"})
+                        if ids:
+                            # شماره خام + نرمال‌سازی پایتون (هم‌ارز ستون) ارزان‌تر از محاسبه ستون VIRTUAL برای هر ردیف است
+                            rows = conn.execute(f"SELECT phone FROM {t} WHERE id IN ({','.join(['?'] * len(ids))});",
+                                                ids).fetchall()
+                            self._phones[t].update(p for p in map(normalize_phone, (r[0] for r in rows)) if p)
+                    self.stats["incremental"] += 1
+            self._seq, self._epoch = head, feed.epoch
+
+    def known(self, phone: str) -> Dict[str, bool]:
+        """در کدام جدول‌ها ممکن است این شماره باشد (بعد از تازه‌سازی افزایشی)"""
+        self.refresh()
+        return {t: phone in self._phones[t] for t in PHONE_TABLES}
+
+    def size(self) -> Dict[str, int]:
+        return {t: len(p) for t, p in self._phones.items()}
+
+@shared_resource
+def phone_directory() -> PhoneDirectory:
+    return PhoneDirectory()
+
+def caller_lookup(raw_phone: str, only_owner_appuser: Optional[int] = None) -> Dict[str, Any]:
+    """
+    مخاطب(ها)ی با این شماره همراه شرکت، کارشناس فروش و آخرین تماس، و شرکت‌های با همین شماره.
+    only_owner_appuser: دامنه کارشناس (مثل جدول‌های UI) — فقط مخاطبان خودش و شرکت‌هایی که مخاطبی در آن‌ها دارد.
+    """
+    phone = normalize_phone(raw_phone)
+    out: Dict[str, Any] = {"phone": phone, "contacts": [], "companies": []}
+    if phone is None:
+        return out
+    known = phone_directory().known(phone)
+    if not any(known.values()):
+        return out
+
+    with read_pool().connection() as conn:
+        if known["users"]:
+            owner_sql, owner_params = ("AND u.owner_id=?", [only_owner_appuser]) if only_owner_appuser else ("", [])
+            rows = conn.execute(f"""
+                SELECT u.id, u.full_name, u.phone, u.status, u.level, c.id, c.name, au.id, au.username,
+                       cl.call_datetime, cl.status, cl.description
+                FROM users u INDEXED BY idx_users_phone_e164
+                LEFT JOIN companies c ON c.id=u.company_id
+                LEFT JOIN app_users au ON au.id=u.owner_id
+                LEFT JOIN calls cl ON cl.id=(SELECT id FROM calls WHERE user_id=u.id
+                                             ORDER BY call_datetime DESC, id DESC LIMIT 1)
+                WHERE u.phone_e164=? {owner_sql}
+                ORDER BY u.id;""", [phone] + owner_params).fetchall()
+            if rows and reaches_archive("calls", date.min) and attach_archive(conn):
+                # آخرین تماس روی همه تاریخچه؛ یک کوئری با user_id ثابت برای هر مخاطب تا فیلتر به هر دو شاخه
+                # UNION ALL برسد (زیرپرس‌وجوی همبسته روی history_source هر دو جدول را کامل اسکن می‌کند)
+                calls = history_source("calls", True)
+                rows = [r[:9] + (conn.execute(f"""
+                    SELECT call_datetime, status, description FROM {calls} cl WHERE user_id=?
+                    ORDER BY call_datetime DESC, id DESC LIMIT 1;""", (r[0],)).fetchone() or (None,) * 3)
+                        for r in rows]
+            out["contacts"] = [{
+                "id": r[0], "name": r[1], "phone": r[2], "status": r[3], "level": r[4],
+                "company": {"id": r[5], "name": r[6]} if r[5] is not None else None,
+                "owner": {"id": r[7], "username": r[8]} if r[7] is not None else None,
+                "last_call": {"at": r[9], "status": r[10], "description": r[11]} if r[9] is not None else None,
+            } for r in rows]
+        if known["companies"]:
+            owner_sql, owner_params = (("AND c.id IN (SELECT company_id FROM users WHERE owner_id=?)",
+                                        [only_owner_appuser]) if only_owner_appuser else ("", []))
+            rows = conn.execute(f"""
+                SELECT c.id, c.name, c.phone, c.status, c.level FROM companies c INDEXED BY idx_companies_phone_e164
+                WHERE c.phone_e164=? {owner_sql}
+                ORDER BY c.id;""", [phone] + owner_params).fetchall()
+            out["companies"] = [{"id": r[0], "name": r[1], "phone": r[2], "status": r[3], "level": r[4]}
+                                for r in rows]
+    return out
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""زمان‌سنجی مرحله‌های اجرای صفحه (query / transform / render / actions) و اوج حافظه."""
+import contextvars
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Optional
+
+# ====================== پروفایل رندر صفحه‌ها (query / transform / render / actions) ======================
+# اختیاری (نوار کناری مدیر یا CRM_PAGE_PROFILING=1): زمان هر rerun صفحه بین چهار مرحله تقسیم می‌شود.
+# توابع داده با @profiled("query") و پردازش pandas با @profiled("transform") علامت خورده‌اند، نوشتن‌ها «actions»
+# و باقی زمان (ساخت ویجت‌ها، سریال‌سازی جدول، دیالوگ‌ها) «render» حساب می‌شود. مراحل تودرتو از هم کم می‌شوند.
+# اوج حافظه با tracemalloc (سراسری پروسه است؛ با چند نشست هم‌زمان تقریبی است). هر اجرا به فایل JSONL هم اضافه می‌شود.
+PROFILE_PHASES = ("query", "transform", "render", "actions")
+PROFILE_LOG_PATH = os.environ.get("CRM_PROFILE_LOG", "page_profile.jsonl")
+PROFILE_KEEP = 30
+_page_prof: contextvars.ContextVar = contextvars.ContextVar("crm_page_profile", default=None)
+
+class PageProfile:
+    def __init__(self, page: str):
+        self.page = page
+        self.thread = threading.get_ident()
+        self.phases = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self._stack = ["render"]
+        self.t0 = self._mark = time.perf_counter()
+        self.total_ms: Optional[float] = None
+        self.peak_kb: Optional[float] = None
+
+    def _lap(self):
+        now = time.perf_counter()
+        self.phases[self._stack[-1]] += now - self._mark
+        self._mark = now
+
+    def enter(self, phase: str):
+        self._lap(); self._stack.append(phase)
+
+    def leave(self):
+        self._lap(); self._stack.pop()
+
+    def total(self) -> float:
+        self._lap()
+        return time.perf_counter() - self.t0
+
+def _active_profile() -> Optional[PageProfile]:
+    prof = _page_prof.get()
+    # کارهای استخر خواننده‌ها هم‌زمان‌اند؛ فقط نخ اجرای صفحه زمان مراحل را جمع می‌کند
+    return prof if prof is not None and prof.thread == threading.get_ident() else None
+
+@contextmanager
+def prof_phase(phase: str):
+    prof = _active_profile()
+    if prof is None:
+        yield
+        return
+    prof.enter(phase)
+    try:
+        yield
+    finally:
+        prof.leave()
+
+def profiled(phase: str):
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            prof = _active_profile()
+            if prof is None:
+                return fn(*args, **kwargs)
+            prof.enter(phase)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                prof.leave()
+        return wrapper
+    return deco
+
+@contextmanager
+def profile_run(page: str):
+    """
+    یک اجرای کامل صفحه را پروفایل می‌کند و PageProfile را برمی‌گرداند؛ بعد از خروج total_ms و
+    peak_kb (اگر tracemalloc روشن باشد، وگرنه None) روی آن پر شده‌اند.
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        mem0 = tracemalloc.get_traced_memory()[0]
+    prof = PageProfile(page)
+    token = _page_prof.set(prof)
+    try:
+        yield prof
+    finally:
+        _page_prof.reset(token)
+        prof.total_ms = round(prof.total() * 1000, 1)
+        prof.peak_kb = round((tracemalloc.get_traced_memory()[1] - mem0) / 1024, 1) if tracing else None
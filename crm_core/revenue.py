@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+تحلیل فروش سفارش‌ها روی مکعب تجمیعی order_stats.
+
+order_stats به ازای (روز سفارش، وضعیت، کارشناس، محصول، شرکت) تعداد و جمع مبلغ را نگه می‌دارد و مثل daily_stats با
+تریگر به‌صورت افزایشی به‌روز می‌شود؛ گزارش فقط بازه‌ای از کلید اصلی آن را می‌خواند (بدون اسکن orders و بدون
+تبدیل مبلغ به رشته نمایشی). دسته (products.category) و نام‌ها هنگام خواندن از جدول‌های کوچک اضافه می‌شوند، پس تغییر
+دسته یا نام محصول نیازی به بازسازی ندارد. ماه شمسی در pandas روی روزهای یکتا حساب می‌شود.
+کارشناس سفارش = کارشناس فعلی مخاطب (همان تعریف جدول عملکرد کارشناسان).
+"""
+import sqlite3
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from .dates import jalali_month
+from .db import _ensure_trigger, get_conn
+from .lazy import LazyModule
+from .profiling import profiled
+
+pd = LazyModule("pandas")
+
+# بعد گزارش → ستون نام در خروجی order_cube
+REVENUE_DIMENSIONS: Dict[str, str] = {"product": "محصول", "category": "دسته", "company": "شرکت", "owner": "کارشناس"}
+_CUBE_COLS = "day, status, owner_id, product_id, company_id, n, amount"
+_UPSERT = ("ON CONFLICT(day, status, owner_id, product_id, company_id) "
+           "DO UPDATE SET n = n + excluded.n, amount = amount + excluded.amount;")
+
+# ====================== مکعب order_stats (نگه‌داری با تریگر) ======================
+def _order_bump(ref: str, sign: str) -> str:
+    return (f"INSERT INTO order_stats ({_CUBE_COLS}) VALUES (COALESCE(date({ref}.order_date),''), {ref}.status, "
+            f"COALESCE((SELECT owner_id FROM users WHERE id={ref}.user_id),0), COALESCE({ref}.product_id,0), "
+            f"COALESCE({ref}.company_id,0), {sign}1, {sign}{ref}.total_amount) {_UPSERT}")
+
+def _user_orders(owner_sql: str, sign: str) -> str:
+    return (f"INSERT INTO order_stats ({_CUBE_COLS}) SELECT COALESCE(date(order_date),''), status, {owner_sql}, "
+            f"COALESCE(product_id,0), COALESCE(company_id,0), {sign}COUNT(*), {sign}SUM(total_amount) "
+            f"FROM orders WHERE user_id=OLD.id GROUP BY 1, 2, 4, 5 {_UPSERT}")
+
+def _order_stats_triggers() -> List[Tuple[str, str]]:
+    return [
+        ("trg_cube_orders_ins", f"CREATE TRIGGER trg_cube_orders_ins AFTER INSERT ON orders BEGIN {_order_bump('NEW', '')} END"),
+        ("trg_cube_orders_del", f"CREATE TRIGGER trg_cube_orders_del AFTER DELETE ON orders BEGIN {_order_bump('OLD', '-')} END"),
+        ("trg_cube_orders_upd",
+         f"CREATE TRIGGER trg_cube_orders_upd AFTER UPDATE OF order_date, status, total_amount, user_id, product_id, "
+         f"company_id ON orders BEGIN {_order_bump('OLD', '-')} {_order_bump('NEW', '')} END"),
+        ("trg_cube_users_owner",
+         f"CREATE TRIGGER trg_cube_users_owner AFTER UPDATE OF owner_id ON users WHEN OLD.owner_id IS NOT NEW.owner_id "
+         f"BEGIN {_user_orders('COALESCE(OLD.owner_id,0)', '-')} {_user_orders('COALESCE(NEW.owner_id,0)', '')} END"),
+        # مثل trg_stats_sales_user_del: قبل از حذف، چون UPDATE ناشی از SET NULL کارشناس قبلی را نمی‌بیند
+        ("trg_cube_users_del",
+         f"CREATE TRIGGER trg_cube_users_del BEFORE DELETE ON users WHEN OLD.owner_id IS NOT NULL "
+         f"BEGIN {_user_orders('OLD.owner_id', '-')} {_user_orders('0', '')} END"),
+    ]
+
+def rebuild_order_stats(conn: sqlite3.Connection):
+    """بازسازی کامل order_stats از orders (مهاجرت اولیه، datagen)"""
+    conn.execute("DELETE FROM order_stats;")
+    conn.execute(f"""
+        INSERT INTO order_stats ({_CUBE_COLS})
+        SELECT COALESCE(date(o.order_date),''), o.status, COALESCE(u.owner_id,0), COALESCE(o.product_id,0),
+               COALESCE(o.company_id,0), COUNT(*), SUM(o.total_amount)
+        FROM orders o LEFT JOIN users u ON u.id=o.user_id
+        GROUP BY 1, 2, 3, 4, 5;
+    """)
+
+def ensure_order_stats(conn: sqlite3.Connection):
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='order_stats';").fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS order_stats (
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            owner_id INTEGER NOT NULL DEFAULT 0,
+            product_id INTEGER NOT NULL DEFAULT 0,
+            company_id INTEGER NOT NULL DEFAULT 0,
+            n INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, status, owner_id, product_id, company_id)
+        ) WITHOUT ROWID;
+    """)
+    for name, sql in _order_stats_triggers():
+        _ensure_trigger(conn, name, sql)
+    if not existed:
+        rebuild_order_stats(conn)
+
+# ====================== خواندن و گزارش ======================
+@profiled("query")
+def order_cube(start: date, end: date) -> "pd.DataFrame":
+    """
+    ردیف‌های مکعب در بازه [start, end] با ستون‌های month (شمسی) و نام هر بعد (REVENUE_DIMENSIONS).
+    فیلتر وضعیت در حافظه است تا یک کش برای همه ترکیب‌های وضعیت کافی باشد.
+    """
+    params = (start.isoformat(), end.isoformat())
+    conn = get_conn()
+    try:
+        cube = pd.read_sql_query(f"SELECT {_CUBE_COLS} FROM order_stats WHERE day BETWEEN ? AND ? AND n != 0;",
+                                 conn, params=params)
+        products = pd.read_sql_query("SELECT id, name, category FROM products;", conn).set_index("id")
+        owners = dict(conn.execute("SELECT id, username FROM app_users;").fetchall())
+        companies = dict(conn.execute("""
+            SELECT id, name FROM companies
+            WHERE id IN (SELECT DISTINCT company_id FROM order_stats WHERE day BETWEEN ? AND ?);
+        """, params).fetchall())
+    finally:
+        conn.close()
+    # بازه بدون سفارش: read_sql_query ستون‌های خالی را object می‌سازد و جمع/nlargest روی آن‌ها خطا می‌دهد
+    cube = cube.astype({"n": "int64", "amount": "float64"})
+    cube["month"] = cube["day"].map({d: jalali_month(d) for d in cube["day"].unique()})
+    missing = "— نامشخص —"
+    cube["محصول"] = cube["product_id"].map(products["name"]).fillna(missing)
+    cube["دسته"] = cube["product_id"].map(products["category"]).fillna(missing)
+    cube["شرکت"] = cube["company_id"].map(companies).fillna(missing)
+    cube["کارشناس"] = cube["owner_id"].map(owners).fillna("— بدون کارشناس —")
+    return cube
+
+def _filtered(cube: "pd.DataFrame", statuses: Optional[List[str]], months: Optional[List[str]]) -> "pd.DataFrame":
+    if statuses:
+        cube = cube[cube["status"].isin(statuses)]
+    if months:
+        cube = cube[cube["month"].isin(months)]
+    return cube
+
+def revenue_totals(cube: "pd.DataFrame", statuses: Optional[List[str]] = None,
+                   months: Optional[List[str]] = None) -> Dict[str, float]:
+    c = _filtered(cube, statuses, months)
+    n, amount = int(c["n"].sum()), float(c["amount"].sum())
+    return {"orders": n, "revenue": amount, "avg": amount / n if n else 0.0}
+
+def revenue_breakdown(cube: "pd.DataFrame", dim: str, statuses: Optional[List[str]] = None,
+                      months: Optional[List[str]] = None) -> "pd.DataFrame":
+    """جمع فروش و تعداد سفارش به ازای هر مقدار بعد dim، با سهم از کل و میانگین هر سفارش؛ مرتب بر اساس فروش"""
+    c = _filtered(cube, statuses, months)
+    out = c.groupby(REVENUE_DIMENSIONS[dim]).agg(سفارش=("n", "sum"), فروش=("amount", "sum"))
+    out = out[out["سفارش"] != 0].sort_values("فروش", ascending=False)
+    total = out["فروش"].sum()
+    out["سهم٪"] = (out["فروش"] / total * 100).round(1) if total else 0.0
+    out["میانگین_سفارش"] = (out["فروش"] / out["سفارش"]).round(0)
+    return out
+
+def revenue_trend(cube: "pd.DataFrame", dim: Optional[str] = None, statuses: Optional[List[str]] = None,
+                  top: int = 8) -> "pd.DataFrame":
+    """فروش هر ماه شمسی (سطر، به ترتیب زمان)؛ با dim، ستون‌ها = top مقدار پرفروش آن بعد + «سایر»"""
+    c = _filtered(cube, statuses, None)
+    if dim is None:
+        return c.groupby("month")[["amount", "n"]].sum().rename(columns={"amount": "فروش", "n": "سفارش"}).sort_index()
+    col = REVENUE_DIMENSIONS[dim]
+    leaders = c.groupby(col)["amount"].sum().nlargest(top).index
+    series = c[col].where(c[col].isin(leaders), "سایر")
+    piv = c.assign(**{col: series}).pivot_table(index="month", columns=col, values="amount", aggfunc="sum",
+                                                fill_value=0)
+    return piv.reindex(columns=[v for v in list(leaders) + ["سایر"] if v in piv.columns]).sort_index()
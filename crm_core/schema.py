@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""ساخت و مهاجرت اسکیمای دیتابیس (جدول‌ها، ایندکس‌ها، تریگرها)."""
+from .changes import ensure_change_log
+from .db import _column_exists, get_conn, sha256
+from .funnel import ensure_status_history
+from .maintenance import ensure_maintenance_log
+from .phones import ensure_phone_index
+from .revenue import ensure_order_stats
+from .stats import ensure_daily_stats
+
+def init_db():
+    conn = get_conn(); cur = conn.cursor()
+    # دیتابیس تازه از ابتدا با auto_vacuum=INCREMENTAL ساخته می‌شود (دیتابیس‌های قدیمی را maintenance مهاجرت می‌دهد)
+    if not cur.execute("SELECT 1 FROM sqlite_master LIMIT 1;").fetchone():
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        cur.execute("VACUUM;")
+
+    # ---- companies ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS companies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT,
+            address TEXT,
+            note TEXT,
+            level TEXT NOT NULL DEFAULT 'هیچکدام',
+            status TEXT NOT NULL DEFAULT 'بدون وضعیت',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER
+        );
+    """)
+    if not _column_exists(conn, "companies", "status"):
+        cur.execute("ALTER TABLE companies ADD COLUMN status TEXT NOT NULL DEFAULT 'بدون وضعیت';")
+    if not _column_exists(conn, "companies", "level"):
+        cur.execute("ALTER TABLE companies ADD COLUMN level TEXT NOT NULL DEFAULT 'هیچکدام';")
+
+    # ---- users ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT,
+            last_name TEXT,
+            full_name TEXT NOT NULL,
+            phone TEXT UNIQUE,
+            role TEXT,
+            company_id INTEGER,
+            note TEXT,
+            status TEXT NOT NULL DEFAULT 'بدون وضعیت',
+            domain TEXT,
+            province TEXT,
+            level TEXT NOT NULL DEFAULT 'هیچکدام',
+            owner_id INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER,
+            FOREIGN KEY(company_id) REFERENCES companies(id) ON DELETE SET NULL
+        );
+    """)
+    for col, default in [
+        ("first_name", None), ("last_name", None), ("domain", None), ("province", None),
+        ("level", "'هیچکدام'"), ("owner_id", None)
+    ]:
+        if not _column_exists(conn, "users", col):
+            cur.execute(f"ALTER TABLE users ADD COLUMN {col} TEXT" + (f" DEFAULT {default}" if default else "") + ";")
+
+    # ---- calls ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            call_datetime TEXT NOT NULL,
+            status TEXT NOT NULL CHECK(status IN ('ناموفق','موفق','خاموش','رد تماس')),
+            description TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+    """)
+
+    # ---- followups ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS followups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            details TEXT,
+            due_date TEXT NOT NULL,
+            status TEXT NOT NULL CHECK(status IN ('در حال انجام','پایان یافته')) DEFAULT 'در حال انجام',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+    """)
+
+    # زمان بستن پیگیری (برای «به‌موقع / با تأخیر» در عملکرد کارشناسان)
+    if not _column_exists(conn, "followups", "closed_at"):
+        cur.execute("ALTER TABLE followups ADD COLUMN closed_at TEXT;")
+
+    # ---- app_users ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS app_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_sha256 TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('admin','agent')) DEFAULT 'agent',
+            linked_user_id INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(linked_user_id) REFERENCES users(id) ON DELETE SET NULL
+        );
+    """)
+
+    # ---- sessions (برای لاگین پایدار) ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            token TEXT PRIMARY KEY,
+            app_user_id INTEGER NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            expires_at TEXT,
+            FOREIGN KEY(app_user_id) REFERENCES app_users(id) ON DELETE CASCADE
+        );
+    """)
+
+    # ---- products ----
+    cur.execute(""" 
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            name TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    # ---- orders ----
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            company_id INTEGER,
+            product_id INTEGER,
+            order_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'در حال پیگیری',
+            total_amount REAL NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE SET NULL,
+            FOREIGN KEY(company_id) REFERENCES companies(id) ON DELETE SET NULL,
+            FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE SET NULL
+        );
+    """)
+
+    # Indexes
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_company ON users(company_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_owner ON users(owner_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_full_name ON users(full_name COLLATE NOCASE);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_last_name ON users(last_name COLLATE NOCASE);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_companies_name ON companies(name COLLATE NOCASE);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_calls_user_datetime ON calls(user_id, call_datetime);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_followups_user_due ON followups(user_id, due_date);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_calls_datetime ON calls(call_datetime);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_followups_status_user ON followups(status, user_id);")
+    # فیلتر بازه تاریخ و ترتیب پیش‌فرض جدول‌ها (benchmarks/plan_check.py استفاده از این‌ها را بررسی می‌کند)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_followups_due ON followups(due_date);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_companies_created ON companies(created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(app_user_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_company ON orders(company_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_product ON orders(product_id);")
+
+    # ---- شماره نرمال‌شده E.164 (ستون تولیدی + ایندکس) ----
+    ensure_phone_index(conn)
+
+    # ---- تنظیمات/وضعیت داخلی برنامه (افق بایگانی و ...) ----
+    cur.execute("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;")
+
+    # ---- لاگ نگه‌داری دیتابیس ----
+    ensure_maintenance_log(conn)
+
+    # ---- تاریخچه تغییر وضعیت (قیف فروش) ----
+    ensure_status_history(conn)
+
+    # ---- آمار روزانه (جدول + تریگرها؛ «مشتری شد» از status_history) ----
+    ensure_daily_stats(conn)
+
+    # ---- مکعب فروش سفارش‌ها (تحلیل فروش) ----
+    ensure_order_stats(conn)
+
+    # ---- فید تغییرات (change_log + تریگرها) ----
+    ensure_change_log(conn)
+
+    # Seed admin
+    if cur.execute("SELECT COUNT(*) FROM app_users;").fetchone()[0] == 0:
+        cur.execute("INSERT INTO app_users (username, password_sha256, role) VALUES (?,?,?);",
+                    ("admin", sha256("admin123"), "admin"))
+    conn.commit(); conn.close()
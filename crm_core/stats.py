@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""جدول تجمیعی daily_stats (نگه‌داری با تریگر) و شاخص‌های داشبورد."""
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .db import _ensure_trigger, get_conn
+
+# ====================== آمار روزانه (daily_stats) ======================
+# جدول کوچک و تجمیعی که با تریگرها به‌صورت افزایشی نگه‌داری می‌شود؛ داشبورد به جای COUNT(*) روی
+# جداول اصلی، با یک کوئری روی کلید اصلی همین جدول کار می‌کند.
+#   metric='calls'          → day=تاریخ تماس، owner_id=ثبت‌کننده، status=وضعیت تماس
+#   metric='open_followups' → day=تاریخ پیگیری (فقط پیگیری‌های باز)، owner_id=ثبت‌کننده
+#   metric='entity'         → day=''، status=نام جدول (تعداد کل ردیف‌ها)
+# و برای جدول عملکرد کارشناسان (leaderboard.py):
+#   metric='followups_closed' → day=تاریخ پیگیری، owner_id=ثبت‌کننده، status='on_time' | 'late' | ''
+#                               ('' = بسته‌شده قبل از ثبت closed_at، زمان بستن نامعلوم)
+#   metric='converted'        → day=روز رسیدن مخاطب به «مشتری شد» (از status_history)، owner_id=کارشناس همان لحظه
+#   metric='orders'/'revenue' → day=تاریخ سفارش، owner_id=کارشناس فعلی مخاطب، status=وضعیت سفارش؛
+#                               n=تعداد / جمع مبلغ
+ENTITY_TABLES = ["companies", "users", "orders", "products"]
+# با تغییر تعریف متریک‌ها بالا می‌رود؛ دیتابیس قدیمی‌تر یک بار بازسازی می‌شود (app_meta.daily_stats_version)
+DAILY_STATS_VERSION = 2
+FOLLOWUP_DONE = "پایان یافته"
+CONVERTED_STATUS = "مشتری شد"
+# کلیدی در app_meta که فقط داخل تراکنش بایگانی (archive.py) وجود دارد: حذف تماس برای انتقال به بایگانی
+# از آمار کم نمی‌شود، چون تماس هنوز (در فایل بایگانی) هست.
+ARCHIVING_FLAG = "archiving"
+
+def _stats_bump(metric: str, day_sql: str, owner_sql: str, status_sql: str, delta: int) -> str:
+    return (f"INSERT INTO daily_stats (metric, day, owner_id, status, n) "
+            f"VALUES ('{metric}', {day_sql}, {owner_sql}, {status_sql}, {delta}) "
+            f"ON CONFLICT(metric, day, owner_id, status) DO UPDATE SET n = n + ({delta});")
+
+def _daily_stats_triggers() -> List[Tuple[str, str]]:
+    open_fu = "'در حال انجام'"
+    def call_bump(ref, delta):
+        return _stats_bump("calls", f"COALESCE(date({ref}.call_datetime),'')",
+                           f"COALESCE({ref}.created_by,0)", f"{ref}.status", delta)
+    def fu_bump(ref, delta):
+        return _stats_bump("open_followups", f"COALESCE(date({ref}.due_date),'')",
+                           f"COALESCE({ref}.created_by,0)", "''", delta)
+    trg = [
+        ("trg_stats_calls_ins", f"CREATE TRIGGER trg_stats_calls_ins AFTER INSERT ON calls BEGIN {call_bump('NEW', 1)} END"),
+        ("trg_stats_calls_del",
+         f"CREATE TRIGGER trg_stats_calls_del AFTER DELETE ON calls "
+         f"WHEN NOT EXISTS (SELECT 1 FROM app_meta WHERE key='{ARCHIVING_FLAG}') BEGIN {call_bump('OLD', -1)} END"),
+        ("trg_stats_calls_upd",
+         f"CREATE TRIGGER trg_stats_calls_upd AFTER UPDATE OF call_datetime, status, created_by ON calls "
+         f"BEGIN {call_bump('OLD', -1)} {call_bump('NEW', 1)} END"),
+        ("trg_stats_fu_ins",
+         f"CREATE TRIGGER trg_stats_fu_ins AFTER INSERT ON followups WHEN NEW.status={open_fu} BEGIN {fu_bump('NEW', 1)} END"),
+        ("trg_stats_fu_del",
+         f"CREATE TRIGGER trg_stats_fu_del AFTER DELETE ON followups WHEN OLD.status={open_fu} BEGIN {fu_bump('OLD', -1)} END"),
+        ("trg_stats_fu_upd_old",
+         f"CREATE TRIGGER trg_stats_fu_upd_old AFTER UPDATE OF status, due_date, created_by ON followups "
+         f"WHEN OLD.status={open_fu} BEGIN {fu_bump('OLD', -1)} END"),
+        ("trg_stats_fu_upd_new",
+         f"CREATE TRIGGER trg_stats_fu_upd_new AFTER UPDATE OF status, due_date, created_by ON followups "
+         f"WHEN NEW.status={open_fu} BEGIN {fu_bump('NEW', 1)} END"),
+    ]
+    for t in ENTITY_TABLES:
+        inc = _stats_bump("entity", "''", "0", f"'{t}'", 1)
+        dec = _stats_bump("entity", "''", "0", f"'{t}'", -1)
+        trg.append((f"trg_stats_{t}_ins", f"CREATE TRIGGER trg_stats_{t}_ins AFTER INSERT ON {t} BEGIN {inc} END"))
+        trg.append((f"trg_stats_{t}_del", f"CREATE TRIGGER trg_stats_{t}_del AFTER DELETE ON {t} BEGIN {dec} END"))
+    return trg + _leaderboard_triggers()
+
+def _stats_move(metric: str, day_sql: str, owner_sql: str, status_sql: str, n_sql: str, from_sql: str) -> str:
+    """نسخه مجموعه‌ای _stats_bump: تجمیع n_sql روی ردیف‌های from_sql (مثل سفارش‌های یک مخاطب)"""
+    return (f"INSERT INTO daily_stats (metric, day, owner_id, status, n) "
+            f"SELECT '{metric}', {day_sql}, {owner_sql}, {status_sql}, {n_sql} {from_sql} GROUP BY 2, 3, 4 "
+            f"ON CONFLICT(metric, day, owner_id, status) DO UPDATE SET n = n + excluded.n;")
+
+def _leaderboard_triggers() -> List[Tuple[str, str]]:
+    done = f"'{FOLLOWUP_DONE}'"
+    not_archiving = f"NOT EXISTS (SELECT 1 FROM app_meta WHERE key='{ARCHIVING_FLAG}')"
+    def closed_bump(ref, delta):
+        timing = (f"CASE WHEN {ref}.closed_at IS NULL THEN '' "
+                  f"WHEN date({ref}.closed_at) <= date({ref}.due_date) THEN 'on_time' ELSE 'late' END")
+        return _stats_bump("followups_closed", f"COALESCE(date({ref}.due_date),'')",
+                           f"COALESCE({ref}.created_by,0)", timing, delta)
+    def converted_bump(ref, delta):
+        return _stats_bump("converted", f"COALESCE(date({ref}.changed_at),'')", f"COALESCE({ref}.owner_id,0)", "''",
+                           delta)
+    def order_bump(ref, delta):
+        day, owner = f"COALESCE(date({ref}.order_date),'')", f"COALESCE((SELECT owner_id FROM users WHERE id={ref}.user_id),0)"
+        return (_stats_bump("orders", day, owner, f"{ref}.status", delta) + " "
+                + _stats_bump("revenue", day, owner, f"{ref}.status", f"{delta} * {ref}.total_amount"))
+    def user_orders(owner_sql, sign):
+        src, day = "FROM orders WHERE user_id=OLD.id", "COALESCE(date(order_date),'')"
+        return (_stats_move("orders", day, owner_sql, "status", f"{sign}COUNT(*)", src) + " "
+                + _stats_move("revenue", day, owner_sql, "status", f"{sign}SUM(total_amount)", src))
+    converted = f"entity='users' AND {{ref}}.to_status='{CONVERTED_STATUS}'"
+    return [
+        ("trg_stats_fu_closed_ins",
+         f"CREATE TRIGGER trg_stats_fu_closed_ins AFTER INSERT ON followups WHEN NEW.status={done} "
+         f"BEGIN {closed_bump('NEW', 1)} END"),
+        ("trg_stats_fu_closed_del",
+         f"CREATE TRIGGER trg_stats_fu_closed_del AFTER DELETE ON followups "
+         f"WHEN OLD.status={done} AND {not_archiving} BEGIN {closed_bump('OLD', -1)} END"),
+        ("trg_stats_fu_closed_upd_old",
+         f"CREATE TRIGGER trg_stats_fu_closed_upd_old AFTER UPDATE OF status, due_date, created_by, closed_at "
+         f"ON followups WHEN OLD.status={done} BEGIN {closed_bump('OLD', -1)} END"),
+        ("trg_stats_fu_closed_upd_new",
+         f"CREATE TRIGGER trg_stats_fu_closed_upd_new AFTER UPDATE OF status, due_date, created_by, closed_at "
+         f"ON followups WHEN NEW.status={done} BEGIN {closed_bump('NEW', 1)} END"),
+        # تبدیل مخاطب از ردیف‌های status_history خوانده می‌شود (کارشناس همان لحظه؛ حذف مخاطب تاریخچه‌اش را می‌برد)
+        ("trg_stats_converted_ins",
+         f"CREATE TRIGGER trg_stats_converted_ins AFTER INSERT ON status_history "
+         f"WHEN NEW.{converted.format(ref='NEW')} BEGIN {converted_bump('NEW', 1)} END"),
+        ("trg_stats_converted_del",
+         f"CREATE TRIGGER trg_stats_converted_del AFTER DELETE ON status_history "
+         f"WHEN OLD.{converted.format(ref='OLD')} BEGIN {converted_bump('OLD', -1)} END"),
+        ("trg_stats_sales_ins",
+         f"CREATE TRIGGER trg_stats_sales_ins AFTER INSERT ON orders BEGIN {order_bump('NEW', 1)} END"),
+        ("trg_stats_sales_del",
+         f"CREATE TRIGGER trg_stats_sales_del AFTER DELETE ON orders BEGIN {order_bump('OLD', -1)} END"),
+        ("trg_stats_sales_upd",
+         f"CREATE TRIGGER trg_stats_sales_upd AFTER UPDATE OF order_date, status, total_amount, user_id ON orders "
+         f"BEGIN {order_bump('OLD', -1)} {order_bump('NEW', 1)} END"),
+        # فروش به کارشناس فعلی مخاطب تعلق دارد: با عوض شدن مسئول، سفارش‌های مخاطب جابه‌جا می‌شوند
+        ("trg_stats_sales_owner",
+         f"CREATE TRIGGER trg_stats_sales_owner AFTER UPDATE OF owner_id ON users "
+         f"WHEN OLD.owner_id IS NOT NEW.owner_id "
+         f"BEGIN {user_orders('COALESCE(OLD.owner_id,0)', '-')} {user_orders('COALESCE(NEW.owner_id,0)', '')} END"),
+        # حذف مخاطب: سفارش‌ها (با ON DELETE SET NULL) بی‌کارشناس می‌شوند. این تریگر قبل از حذف اجرا می‌شود، چون
+        # در تریگر UPDATE ناشی از SET NULL، ردیف مخاطب دیگر نیست و کارشناس قبلی قابل خواندن نیست.
+        ("trg_stats_sales_user_del",
+         f"CREATE TRIGGER trg_stats_sales_user_del BEFORE DELETE ON users WHEN OLD.owner_id IS NOT NULL "
+         f"BEGIN {user_orders('OLD.owner_id', '-')} {user_orders('0', '')} END"),
+    ]
+
+def rebuild_daily_stats(conn: sqlite3.Connection, metrics: Optional[Iterable[str]] = None):
+    """
+    بازسازی daily_stats از روی جداول اصلی (برای مهاجرت اولیه یا بعد از بازیابی بکاپ قدیمی)؛ metrics فقط همان
+    متریک‌ها را بازسازی می‌کند (مهاجرت نسخه). اگر بایگانی روی conn ATTACH شده باشد، تماس‌ها و پیگیری‌های
+    بسته‌شده بایگانی‌شده هم شمرده می‌شوند (closed_at پیگیری‌هایی که قبل از ثبت آن بایگانی شده‌اند NULL است).
+    «مشتری شد» از status_history خوانده می‌شود، پس آن جدول باید قبل از این ساخته شده باشد.
+    """
+    calls = "calls"
+    followups = "followups"
+    if any(r[1] == "archive" for r in conn.execute("PRAGMA database_list;")):
+        calls = ("(SELECT call_datetime, created_by, status FROM main.calls UNION ALL "
+                 "SELECT call_datetime, created_by, status FROM archive.calls a "
+                 "WHERE NOT EXISTS (SELECT 1 FROM main.calls h WHERE h.id=a.id))")
+        followups = ("(SELECT due_date, created_by, status, closed_at FROM main.followups UNION ALL "
+                     "SELECT due_date, created_by, status, closed_at FROM archive.followups a "
+                     "WHERE NOT EXISTS (SELECT 1 FROM main.followups h WHERE h.id=a.id))")
+    day_order = "COALESCE(date(order_date),''), COALESCE(u.owner_id,0), o.status"
+    sql = {
+        "calls": [f"""
+            SELECT 'calls', COALESCE(date(call_datetime),''), COALESCE(created_by,0), status, COUNT(*)
+            FROM {calls} GROUP BY 2, 3, 4;"""],
+        "open_followups": ["""
+            SELECT 'open_followups', COALESCE(date(due_date),''), COALESCE(created_by,0), '', COUNT(*)
+            FROM followups WHERE status='در حال انجام' GROUP BY 2, 3;"""],
+        "entity": [f"SELECT 'entity', '', 0, '{t}', COUNT(*) FROM {t};" for t in ENTITY_TABLES],
+        "followups_closed": [f"""
+            SELECT 'followups_closed', COALESCE(date(due_date),''), COALESCE(created_by,0),
+                   CASE WHEN closed_at IS NULL THEN '' WHEN date(closed_at) <= date(due_date) THEN 'on_time'
+                        ELSE 'late' END, COUNT(*)
+            FROM {followups} WHERE status='{FOLLOWUP_DONE}' GROUP BY 2, 3, 4;"""],
+        "converted": [f"""
+            SELECT 'converted', COALESCE(date(changed_at),''), COALESCE(owner_id,0), '', COUNT(*)
+            FROM status_history WHERE entity='users' AND to_status='{CONVERTED_STATUS}' GROUP BY 2, 3;"""],
+        "orders": [f"SELECT 'orders', {day_order}, COUNT(*) "
+                   f"FROM orders o LEFT JOIN users u ON u.id=o.user_id GROUP BY 2, 3, 4;"],
+        "revenue": [f"SELECT 'revenue', {day_order}, SUM(o.total_amount) "
+                    f"FROM orders o LEFT JOIN users u ON u.id=o.user_id GROUP BY 2, 3, 4;"],
+    }
+    metrics = list(metrics or sql)
+    conn.execute(f"DELETE FROM daily_stats WHERE metric IN ({','.join('?' * len(metrics))});", metrics)
+    for m in metrics:
+        for select in sql[m]:
+            conn.execute("INSERT INTO daily_stats (metric, day, owner_id, status, n) " + select)
+
+def ensure_daily_stats(conn: sqlite3.Connection):
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_stats';").fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            metric TEXT NOT NULL,
+            day TEXT NOT NULL,
+            owner_id INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT '',
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, day, owner_id, status)
+        ) WITHOUT ROWID;
+    """)
+    for name, sql in _daily_stats_triggers():
+        _ensure_trigger(conn, name, sql)
+    version = conn.execute("SELECT value FROM app_meta WHERE key='daily_stats_version';").fetchone()
+    if not existed:
+        rebuild_daily_stats(conn)
+    elif int(version[0] if version else 1) < DAILY_STATS_VERSION:
+        # فقط متریک‌های جدید؛ آمار تماس‌ها (که شامل تماس‌های بایگانی‌شده هم هست) دست نمی‌خورد
+        rebuild_daily_stats(conn, ("followups_closed", "converted", "orders", "revenue"))
+    if not version or int(version[0]) != DAILY_STATS_VERSION:
+        conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('daily_stats_version', ?);",
+                     (str(DAILY_STATS_VERSION),))
+
+def dashboard_metrics(today: date, owner_ids: Optional[List[int]] = None) -> Dict[str, int]:
+    """
+    همه کاشی‌های داشبورد با یک کوئری روی کلید اصلی daily_stats.
+    owner_ids (اختیاری) تماس‌ها و پیگیری‌ها را به ثبت‌کننده‌های مشخص محدود می‌کند (داشبورد هر کارشناس).
+    """
+    t, d7 = today.isoformat(), (today - timedelta(days=7)).isoformat()
+    owner_sql, owner_params = "", []
+    if owner_ids:
+        owner_sql = " AND owner_id IN (" + ",".join(["?"] * len(owner_ids)) + ")"
+        owner_params = [int(x) for x in owner_ids]
+    entity_cols = ",\n".join(
+        f"COALESCE(SUM(CASE WHEN metric='entity' AND status='{e}' THEN n END),0) AS total_{e}" for e in ENTITY_TABLES)
+    conn = get_conn()
+    cur = conn.execute(f"""
+        SELECT
+          COALESCE(SUM(CASE WHEN metric='calls' AND day=? THEN n END),0) AS calls_today,
+          COALESCE(SUM(CASE WHEN metric='calls' AND day=? AND status='موفق' THEN n END),0) AS calls_success_today,
+          COALESCE(SUM(CASE WHEN metric='calls' THEN n END),0) AS calls_last7,
+          COALESCE(SUM(CASE WHEN metric='open_followups' THEN n END),0) AS overdue_followups,
+          {entity_cols}
+        FROM daily_stats
+        WHERE (metric='calls' AND day>=?{owner_sql})
+           OR (metric='open_followups' AND day>'' AND day<?{owner_sql})
+           OR metric='entity';
+    """, [t, t, d7] + owner_params + [t] + owner_params)
+    row = cur.fetchone()
+    names = [c[0] for c in cur.description]
+    conn.close()
+    return dict(zip(names, row))
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""استخر خواننده‌های هم‌زمان و صف نویسنده واحد."""
+import contextvars
+import functools
+import itertools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from . import config
+from .db import connect_db, shared_resource
+from .monitor import QUERY_STATS
+from .profiling import profiled
+
+# ====================== اجرای موازی کوئری‌های خواندنی ======================
+# خواننده‌های SQLite در حالت WAL همدیگر را بلاک نمی‌کنند و sqlite3 هنگام اجرای کوئری GIL را آزاد می‌کند؛
+# پس کوئری‌های مستقل یک صفحه/دیالوگ می‌توانند هم‌زمان روی چند connection فقط‌خواندنی اجرا شوند.
+log_reads = logging.getLogger("crm.read_executor")
+
+class ReadExecutor:
+    """استخر نخ با یک connection فقط‌خواندنی (query_only) برای هر نخ + آمار زمان‌بندی."""
+
+    def __init__(self, db_path: str, max_workers: int = 4):
+        self.db_path = db_path
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crm-read")
+        self._local = threading.local()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.totals = {"batches": 0, "queries": 0, "wall_ms": 0.0, "serial_ms": 0.0}
+        self.recent: deque = deque(maxlen=50)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.generation != self._generation:
+            if conn is not None:
+                conn.close()
+            conn = connect_db(self.db_path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA query_only=ON;")
+            self._local.conn, self._local.generation = conn, self._generation
+        return conn
+
+    def _timed(self, fn: Callable, args, kwargs):
+        t0 = time.perf_counter()
+        result = fn(self._conn(), *args, **kwargs)
+        return result, (time.perf_counter() - t0) * 1000
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """fn(conn, *args, **kwargs) را در پس‌زمینه اجرا می‌کند؛ نتیجه: Future با خروجی (result, ms)."""
+        # contextvars (مثل صفحه جاری برای لاگ کوئری کند) به نخ خواننده هم می‌رسد
+        return self._pool.submit(contextvars.copy_context().run, self._timed, fn, args, kwargs)
+
+    def gather(self, jobs: Dict[str, tuple], label: str = "") -> Dict[str, Any]:
+        """
+        jobs: {نام: (fn, *args)} — همه هم‌زمان اجرا و نتایج با همان نام‌ها برگردانده می‌شوند.
+        زمان دیواری دسته و مجموع زمان تک‌تک کوئری‌ها (اجرای سریالی فرضی) ثبت می‌شود.
+        """
+        t0 = time.perf_counter()
+        futures = {name: self.submit(job[0], *job[1:]) for name, job in jobs.items()}
+        results, serial_ms = {}, 0.0
+        for name, fut in futures.items():
+            results[name], ms = fut.result()
+            serial_ms += ms
+        wall_ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.totals["batches"] += 1
+            self.totals["queries"] += len(jobs)
+            self.totals["wall_ms"] += wall_ms
+            self.totals["serial_ms"] += serial_ms
+            self.recent.append({"label": label, "queries": len(jobs),
+                                "wall_ms": round(wall_ms, 2), "serial_ms": round(serial_ms, 2)})
+        log_reads.debug("gather %s: %d queries, wall %.1fms, serial %.1fms", label, len(jobs), wall_ms, serial_ms)
+        return results
+
+    def reset(self):
+        """بعد از جایگزینی فایل دیتابیس (بازیابی بکاپ)، connectionهای نخ‌ها دوباره باز می‌شوند."""
+        self._generation += 1
+
+@shared_resource
+def read_executor() -> ReadExecutor:
+    return ReadExecutor(config.DB_PATH)
+
+class ReadPool:
+    """
+    مجموعه connectionهای فقط‌خواندنی که به نخ خاصی بسته نیستند (برای API که یک کوئری جریانی ممکن است
+    روی چند نخ استخر ASGI ادامه پیدا کند). LIFO تا connectionهای گرم (کش صفحه SQLite) دوباره استفاده شوند.
+    """
+
+    def __init__(self, db_path: str, max_idle: int = 8):
+        self.db_path = db_path
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=max_idle)
+        self._generation = 0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = connect_db(self.db_path, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA query_only=ON;")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        generation = self._generation
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if generation != self._generation:
+                conn.close()
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+
+    def reset(self):
+        """بعد از جایگزینی فایل دیتابیس، connectionهای بیکار بسته و بقیه بعد از پس دادن دور ریخته می‌شوند."""
+        self._generation += 1
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+@shared_resource
+def read_pool() -> ReadPool:
+    return ReadPool(config.DB_PATH)
+
+# ====================== صف نویسنده واحد (Single writer) ======================
+# همه نوشتن‌ها از یک نخ و یک connection انجام می‌شوند تا کاربران هم‌زمان برای قفل نوشتن WAL رقابت نکنند
+# (خطای «database is locked»). نوشتن‌های کوتاه تعاملی جلوتر از کارهای حجیم (ایمپورت/تغییر گروهی) اجرا می‌شوند
+# و نوشتن‌های کوچکی که در چند میلی‌ثانیه پشت سر هم می‌رسند در یک تراکنش commit می‌شوند (group commit).
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+log_writes = logging.getLogger("crm.writer")
+
+class _WriteJob:
+    __slots__ = ("priority", "seq", "fn", "future", "enqueued", "transactional")
+
+    def __init__(self, priority: int, seq: int, fn: Callable, transactional: bool):
+        self.priority, self.seq, self.fn, self.transactional = priority, seq, fn, transactional
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+    def __lt__(self, other: "_WriteJob") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class DBWriter:
+    """
+    نخ نویسنده اختصاصی با صف اولویت‌دار.
+    submit(fn) → Future ؛ fn(conn) داخل تراکنش (SAVEPOINT مخصوص خودش) اجرا می‌شود و نباید commit کند.
+    """
+
+    def __init__(self, db_path: str, group_window_ms: float = 3.0, max_group: int = 64):
+        self.db_path = db_path
+        self.group_window = group_window_ms / 1000.0
+        self.max_group = max_group
+        self._q: "queue.PriorityQueue[_WriteJob]" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._generation = 0
+        self._conn_generation = -1
+        self._lock = threading.Lock()
+        self.metrics = {"jobs": 0, "batches": 0, "errors": 0, "busy_errors": 0,
+                        "lock_wait_ms_total": 0.0, "lock_wait_ms_max": 0.0, "max_queue_depth": 0}
+        self.latencies_ms: deque = deque(maxlen=500)
+        self.last_activity = time.monotonic()  # پایان آخرین دسته (زمان‌بند نگه‌داری فقط در بیکاری کار می‌کند)
+        self._busy = False
+        self._thread = threading.Thread(target=self._loop, name="crm-writer", daemon=True)
+        self._thread.start()
+
+    # ---- API ----
+    def submit(self, fn: Callable[[sqlite3.Connection], Any], priority: int = PRIORITY_INTERACTIVE,
+               transactional: bool = True) -> Future:
+        if QUERY_STATS.enabled:  # صفحه صدازننده برای لاگ کوئری کند
+            fn = functools.partial(contextvars.copy_context().run, fn)
+        job = _WriteJob(priority, next(self._seq), fn, transactional)
+        self._q.put(job)
+        depth = self._q.qsize()
+        if depth > self.metrics["max_queue_depth"]:
+            self.metrics["max_queue_depth"] = depth
+        return job.future
+
+    def queue_depth(self) -> int:
+        return self._q.qsize()
+
+    def idle_seconds(self) -> float:
+        """چند ثانیه است که صف خالی است و کاری اجرا نشده (۰ اگر کاری در صف است)"""
+        if self._busy or self._q.qsize():
+            return 0.0
+        return time.monotonic() - self.last_activity
+
+    def reset(self):
+        """بعد از جایگزینی فایل دیتابیس، connection نویسنده دوباره باز می‌شود."""
+        self._generation += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            m = dict(self.metrics)
+            lat = sorted(self.latencies_ms)
+        m["queue_depth"] = self.queue_depth()
+        m["idle_s"] = round(self.idle_seconds(), 1)
+        m["avg_batch_size"] = round(m["jobs"] / m["batches"], 2) if m["batches"] else 0.0
+        m["avg_lock_wait_ms"] = round(m["lock_wait_ms_total"] / m["batches"], 2) if m["batches"] else 0.0
+        m["p95_latency_ms"] = round(lat[int(0.95 * (len(lat) - 1))], 2) if lat else 0.0
+        return m
+
+    # ---- نخ نویسنده ----
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_generation != self._generation:
+            if self._conn is not None:
+                self._conn.close()
+            # isolation_level=None: کنترل تراکنش دستی (BEGIN IMMEDIATE / SAVEPOINT)
+            self._conn = connect_db(self.db_path, timeout=10, isolation_level=None)
+            self._conn.execute("PRAGMA foreign_keys = ON;")
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            self._conn_generation = self._generation
+        return self._conn
+
+    def _collect(self, first: _WriteJob) -> List[_WriteJob]:
+        batch = [first]
+        if first.priority != PRIORITY_INTERACTIVE or not first.transactional:
+            return batch
+        deadline = time.perf_counter() + self.group_window
+        while len(batch) < self.max_group:
+            remaining = deadline - time.perf_counter()
+            try:
+                nxt = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            if nxt.priority != PRIORITY_INTERACTIVE or not nxt.transactional:
+                self._q.put(nxt)
+                break
+            batch.append(nxt)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._q.get()
+            self._busy = True
+            batch = self._collect(first)
+            try:
+                self._run(batch)
+            except Exception as e:  # خطای خود تراکنش (BEGIN/COMMIT) به همه کارهای دسته برمی‌گردد
+                if isinstance(e, sqlite3.OperationalError) and "locked" in str(e):
+                    self.metrics["busy_errors"] += 1
+                self.metrics["errors"] += len(batch)
+                log_writes.warning("write batch failed: %s", e)
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            finally:
+                self._busy = False
+
+    def _run(self, batch: List[_WriteJob]):
+        conn = self._get_conn()
+        if not batch[0].transactional:
+            job = batch[0]
+            try:
+                result = job.fn(conn)
+            except Exception as e:
+                self.metrics["errors"] += 1
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+            self._record(batch, 0.0)
+            return
+
+        t0 = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE;")
+        lock_wait_ms = (time.perf_counter() - t0) * 1000
+        outcomes = []
+        try:
+            for job in batch:
+                conn.execute("SAVEPOINT job;")
+                try:
+                    result = job.fn(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job;")
+                    conn.execute("RELEASE job;")
+                    outcomes.append((job, None, e))
+                else:
+                    conn.execute("RELEASE job;")
+                    outcomes.append((job, result, None))
+            conn.execute("COMMIT;")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK;")
+            raise
+        for job, result, err in outcomes:
+            if err is not None:
+                self.metrics["errors"] += 1
+                job.future.set_exception(err)
+            else:
+                job.future.set_result(result)
+        self._record(batch, lock_wait_ms)
+
+    def _record(self, batch: List[_WriteJob], lock_wait_ms: float):
+        done = time.perf_counter()
+        self.last_activity = time.monotonic()
+        with self._lock:
+            self.metrics["jobs"] += len(batch)
+            self.metrics["batches"] += 1
+            self.metrics["lock_wait_ms_total"] += lock_wait_ms
+            self.metrics["lock_wait_ms_max"] = max(self.metrics["lock_wait_ms_max"], lock_wait_ms)
+            for job in batch:
+                self.latencies_ms.append((done - job.enqueued) * 1000)
+
+@shared_resource
+def db_writer() -> DBWriter:
+    return DBWriter(config.DB_PATH)
+
+def submit_write(fn: Callable[[sqlite3.Connection], Any], priority: int = PRIORITY_INTERACTIVE) -> Future:
+    return db_writer().submit(fn, priority)
+
+@profiled("actions")
+def run_write(fn: Callable[[sqlite3.Connection], Any], priority: int = PRIORITY_INTERACTIVE):
+    """نوشتن از طریق صف و منتظر ماندن برای نتیجه (خطای fn همان‌جا دوباره raise می‌شود)."""
+    return submit_write(fn, priority).result()